@@ -0,0 +1,120 @@
+"""
+Версионный кэш секций карточки компании (ui company_detail).
+
+Карточку весь день открывают одни и те же менеджеры, а меняется она редко.
+Поэтому данные секций (контакты, заметки, сделки, задачи, лента…) лежат в
+кэше под ключом (company_id, версия, профиль прав), а повторный просмотр
+неизменной карточки стоит одного чтения версии и проверок прав.
+
+- companies:card:version:{company_id} — версия карточки (Redis INCR).
+  Её сдвигают сигналы companies/signals.py на любую запись, которая видна в
+  карточке: сама компания (и её головная — для блока «Организация»),
+  телефоны/почта, контакты, заметки, сделки, заявки на удаление, история,
+  задачи, звонки, ActivityEvent (log_event — почти любое действие в UI).
+  Массовые update()/bulk_update() в обход сигналов вызывают bump_company_cards
+  явно. Сдвиг — сразу и ещё раз после коммита: просмотр между записью и
+  коммитом не закрепит в кэше старые данные.
+- Пропавшая версия (вытеснение, рестарт Redis) заводится заново значением
+  time.time_ns() — секции прошлых версий с ней не совпадут.
+- Секции живут SECTION_TTL: страховка для путей, которые меняют данные
+  карточки без сигналов (переименование пользователя, update() в командах).
+"""
+
+from __future__ import annotations
+
+import logging
+import time
+from collections.abc import Callable, Iterable
+from typing import Any
+
+from django.core.cache import cache
+from django.db import transaction
+
+logger = logging.getLogger(__name__)
+
+VERSION_KEY = "companies:card:version:{company_id}"
+VERSION_TTL = 7 * 24 * 3600
+SECTION_KEY = "companies:card:{company_id}:{version}:{profile}:{section}"
+SECTION_TTL = 10 * 60
+
+
+def _version_key(company_id) -> str:
+    return VERSION_KEY.format(company_id=company_id)
+
+
+def _bump_now(keys: list[str]) -> None:
+    for key in keys:
+        try:
+            cache.incr(key)
+        except ValueError:
+            pass  # Версии нет — заведётся при следующем просмотре
+        except Exception:
+            logger.warning("company card version bump failed for %s", key)
+
+
+def bump_company_cards(company_ids: Iterable) -> None:
+    """Карточки изменились: сдвинуть версии сразу и ещё раз после коммита."""
+    keys = [_version_key(company_id) for company_id in set(company_ids) if company_id]
+    if not keys:
+        return
+    _bump_now(keys)
+    transaction.on_commit(lambda: _bump_now(keys))
+
+
+def card_version(company_id) -> int | None:
+    """Текущая версия карточки (None — кэш недоступен, читать из БД)."""
+    key = _version_key(company_id)
+    try:
+        version = cache.get(key)
+        if version is None:
+            cache.add(key, time.time_ns(), timeout=VERSION_TTL)
+            version = cache.get(key)
+    except Exception:
+        logger.warning("company card version read failed for %s", company_id)
+        return None
+    return version
+
+
+def card_sections(
+    company_id,
+    version: int | None,
+    profile: str,
+    builders: dict[str, Callable[[], Any]],
+    *,
+    is_fresh: Callable[[str, Any], bool] | None = None,
+) -> dict[str, Any]:
+    """
+    Данные секций карточки: одним get_many из кэша, недостающие — builders.
+
+    is_fresh(section, value) позволяет отбросить закэшированную секцию, которая
+    устарела не из-за записи, а со временем (порядок просроченных задач).
+    """
+    if version is None:
+        return {name: build() for name, build in builders.items()}
+
+    keys = {
+        name: SECTION_KEY.format(
+            company_id=company_id, version=version, profile=profile, section=name
+        )
+        for name in builders
+    }
+    try:
+        cached = cache.get_many(list(keys.values()))
+    except Exception:
+        cached = {}
+
+    result: dict[str, Any] = {}
+    missing: dict[str, Any] = {}
+    for name, build in builders.items():
+        key = keys[name]
+        if key in cached and (is_fresh is None or is_fresh(name, cached[key])):
+            result[name] = cached[key]
+            continue
+        result[name] = build()
+        missing[key] = result[name]
+    if missing:
+        try:
+            cache.set_many(missing, timeout=SECTION_TTL)
+        except Exception:
+            logger.warning("company card cache write failed for %s", company_id)
+    return result
@@ -0,0 +1,186 @@
+"""
+CompanyContactKey: точечный поиск компании по хвосту телефона и домену почты.
+
+- rebuild_company_contact_keys() — пересобрать ключи пачки компаний (вызывается
+  из drain_search_index_queue вместе с перестройкой CompanySearchIndex);
+- company_ids_by_phone_tail() / company_ids_by_email_domain() — индексные
+  поиски для messenger autolink и проверки дублей при создании компании
+  (компании, ещё ждущие drain, проверяются по живым телефонам/почте).
+"""
+
+from __future__ import annotations
+
+import re
+from typing import Iterable
+from uuid import UUID
+
+from django.db import transaction
+from django.db.models import Q
+
+from companies.models import Company, CompanyContactKey, CompanySearchIndexDirty
+
+# Публичные почтовые домены, которые нельзя использовать как признак
+# принадлежности к компании (их ключи не храним).
+PUBLIC_EMAIL_DOMAINS: frozenset[str] = frozenset(
+    {
+        "gmail.com",
+        "yahoo.com",
+        "yahoo.ru",
+        "outlook.com",
+        "hotmail.com",
+        "live.com",
+        "mail.ru",
+        "internet.ru",
+        "yandex.ru",
+        "yandex.com",
+        "ya.ru",
+        "bk.ru",
+        "list.ru",
+        "inbox.ru",
+        "icloud.com",
+        "me.com",
+        "rambler.ru",
+        "protonmail.com",
+        "proton.me",
+        "gmx.com",
+        "aol.com",
+    }
+)
+
+# Хвост, по которому сопоставляем номера (без кода страны/8 в начале)
+PHONE_TAIL_DIGITS = 10
+_MAX_PHONE_DIGITS = 15  # E.164
+
+_NON_DIGIT_RE = re.compile(r"\D+")
+
+KEYS_PREFETCH = ("phones", "emails", "contacts__phones", "contacts__emails")
+
+
+def phone_digits(phone: str | None) -> str:
+    """Цифры нормализованного номера или '', если номер короче PHONE_TAIL_DIGITS."""
+    if not phone:
+        return ""
+    try:
+        from companies.normalizers import normalize_phone
+
+        normalized = normalize_phone(str(phone))
+    except Exception:
+        normalized = str(phone)
+    digits = _NON_DIGIT_RE.sub("", normalized or "")
+    if len(digits) < PHONE_TAIL_DIGITS:
+        return ""
+    return digits[-_MAX_PHONE_DIGITS:]
+
+
+def phone_tail(phone: str | None) -> str:
+    """Последние PHONE_TAIL_DIGITS цифр нормализованного номера или ''."""
+    return phone_digits(phone)[-PHONE_TAIL_DIGITS:]
+
+
+def email_domain(email: str | None) -> str:
+    """Домен адреса в нижнем регистре ('' — нет домена)."""
+    if not email:
+        return ""
+    email = str(email).strip().lower()
+    if "@" not in email:
+        return ""
+    return email.rsplit("@", 1)[1].strip().rstrip(".")
+
+
+def is_corporate_domain(domain: str) -> bool:
+    return bool(domain) and domain not in PUBLIC_EMAIL_DOMAINS
+
+
+def build_company_contact_keys(company: Company) -> set[tuple[str, str]]:
+    """Ключи (kind, value) компании; связи должны быть prefetch'нуты (KEYS_PREFETCH)."""
+    phones = [company.phone]
+    emails = [company.email]
+    phones += [p.value for p in company.phones.all()]
+    emails += [e.value for e in company.emails.all()]
+    for contact in company.contacts.all():
+        phones += [p.value for p in contact.phones.all()]
+        emails += [e.value for e in contact.emails.all()]
+
+    keys: set[tuple[str, str]] = set()
+    for phone in phones:
+        digits = phone_digits(phone)
+        if digits:
+            keys.add((CompanyContactKey.Kind.PHONE, digits[::-1]))
+    for email in emails:
+        domain = email_domain(email)
+        if is_corporate_domain(domain):
+            keys.add((CompanyContactKey.Kind.EMAIL_DOMAIN, domain[:255]))
+    return keys
+
+
+def rebuild_company_contact_keys(company_ids: Iterable[UUID]) -> int:
+    """
+    Пересобрать ключи пачки компаний: 5 запросов на чтение + delete/insert.
+    Удалённые компании просто теряют ключи. Возвращает число записанных строк.
+    """
+    ids = list(company_ids)
+    if not ids:
+        return 0
+    companies = Company.objects.filter(id__in=ids).prefetch_related(*KEYS_PREFETCH)
+    rows = [
+        CompanyContactKey(company_id=company.id, kind=kind, value=value)
+        for company in companies
+        for kind, value in sorted(build_company_contact_keys(company))
+    ]
+    with transaction.atomic():
+        CompanyContactKey.objects.filter(company_id__in=ids).delete()
+        CompanyContactKey.objects.bulk_create(rows, batch_size=1000)
+    return len(rows)
+
+
+def _lookup(qs, live_match: Q, limit: int) -> set:
+    """
+    Точечный поиск по ключам + «наложение» очереди: у компаний, ещё не пересобранных
+    drain_search_index_queue (debounce), ключи могут быть устаревшими — они исключаются
+    из выборки по ключам и проверяются по живым телефонам/почте. Живая проверка
+    ограничена компаниями из очереди (JOIN по company_id), а не грузит их в Python,
+    так что и тысячи меток после импорта ей не мешают.
+    """
+    pending = CompanySearchIndexDirty.objects.values("company_id")
+    ids = set(
+        qs.exclude(company_id__in=pending).values_list("company_id", flat=True).distinct()[:limit]
+    )
+    ids.update(
+        Company.objects.filter(id__in=pending)
+        .filter(live_match)
+        .values_list("id", flat=True)
+        .distinct()[:limit]
+    )
+    return set(sorted(ids, key=str)[:limit])
+
+
+def company_ids_by_phone_tail(tail: str, *, limit: int = 5) -> set:
+    """Компании с номером, оканчивающимся на tail (префиксный поиск по перевёрнутым цифрам)."""
+    tail = _NON_DIGIT_RE.sub("", tail or "")
+    if not tail:
+        return set()
+    qs = CompanyContactKey.objects.filter(
+        kind=CompanyContactKey.Kind.PHONE, value__startswith=tail[::-1]
+    )
+    # Живые номера хранятся нормализованными (normalize_phone в save), как и раньше в autolink
+    live_match = (
+        Q(phone__endswith=tail)
+        | Q(phones__value__endswith=tail)
+        | Q(contacts__phones__value__endswith=tail)
+    )
+    return _lookup(qs, live_match, limit)
+
+
+def company_ids_by_email_domain(domain: str, *, limit: int = 5) -> set:
+    """Компании с корпоративной почтой на домене domain (публичные домены — пусто)."""
+    domain = (domain or "").strip().lower().rstrip(".")
+    if not is_corporate_domain(domain):
+        return set()
+    qs = CompanyContactKey.objects.filter(kind=CompanyContactKey.Kind.EMAIL_DOMAIN, value=domain)
+    suffix = f"@{domain}"
+    live_match = (
+        Q(email__iendswith=suffix)
+        | Q(emails__value__iendswith=suffix)
+        | Q(contacts__emails__value__iendswith=suffix)
+    )
+    return _lookup(qs, live_match, limit)
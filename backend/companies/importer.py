@@ -2,14 +2,27 @@ from __future__ import annotations
 
 import csv
 import datetime as dt
+import hashlib
 import html
+import logging
 import re
-from dataclasses import dataclass
+import sys
+import time
+import uuid
+from collections import deque
+from dataclasses import dataclass, field
+from itertools import islice
 from pathlib import Path
 
+from django.core.cache import cache
+from django.core.exceptions import ValidationError
+from django.core.validators import validate_email
 from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
 
 from accounts.models import User
+from companies.inn_utils import parse_inns
 from companies.models import (
     Company,
     CompanyNote,
@@ -19,6 +32,9 @@ from companies.models import (
     ContactEmail,
     ContactPhone,
 )
+from companies.normalizers import normalize_phone
+
+logger = logging.getLogger(__name__)
 
 
 def _clean_str(v) -> str:
@@ -187,6 +203,81 @@ def _pick_first(*vals: str) -> str:
     return ""
 
 
+def _snapshot_value(v):
+    """Значение поля для снимка raw_fields["amo_values"] (JSON не умеет time)."""
+    if isinstance(v, dt.time):
+        return v.isoformat()
+    return v
+
+
+def _peak_memory_mb() -> float:
+    """Пиковый RSS процесса в МБ (0 — платформа без модуля resource)."""
+    try:
+        import resource
+    except ImportError:
+        return 0.0
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux отдаёт килобайты, macOS — байты
+    return round(peak / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+
+def _file_digest(path: Path, options: tuple) -> str:
+    """sha256 содержимого файла и опций импорта — ключ чекпоинта."""
+    digest = hashlib.sha256(repr(options).encode())
+    with path.open("rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+# Строк компаний в пачке: одна транзакция и один набор bulk-запросов на пачку
+CHUNK_SIZE = 500
+# Чекпоинт незавершённого импорта: ключ — sha256 файла и опций, хранится неделю
+CHECKPOINT_KEY = "companies:amo_import:checkpoint:{digest}"
+CHECKPOINT_TTL = 7 * 24 * 3600
+_CHECKPOINT_COUNTERS = ("created_companies", "updated_companies", "company_rows", "skipped_rows")
+
+# Поля, которые импорт меняет у существующей компании (bulk_update / save(update_fields))
+_COMPANY_UPDATE_FIELDS = [
+    "name",
+    "legal_name",
+    "inn",
+    "kpp",
+    "address",
+    "website",
+    "phone",
+    "email",
+    "contact_name",
+    "contact_position",
+    "activity_kind",
+    "employees_count",
+    "workday_start",
+    "workday_end",
+    "work_timezone",
+    "responsible",
+    "branch",
+    "amocrm_company_id",
+    "status",
+    "raw_fields",
+    "updated_at",
+]
+
+# Обрезаем значения до max_length перед установкой
+_FIELD_MAX_LENGTHS = {
+    "name": 255,
+    "legal_name": 255,
+    "inn": 255,
+    "kpp": 20,
+    "address": 500,
+    "website": 255,
+    "phone": 50,
+    "email": 254,
+    "contact_name": 255,
+    "contact_position": 255,
+    "activity_kind": 255,
+}
+
+
 @dataclass
 class ImportResult:
     created_companies: int = 0
@@ -195,6 +286,615 @@ class ImportResult:
     skipped_rows: int = 0
     preview_companies: list[dict] | None = None
     preview_updates: list[dict] | None = None
+    # Прогресс: строк CSV прочитано в этом запуске, записано пачек, с какой строки продолжили
+    rows_read: int = 0
+    chunks: int = 0
+    resumed_from_row: int = 0
+    seconds: float = 0.0
+    peak_memory_mb: float = 0.0
+
+    @property
+    def rows_per_sec(self) -> float:
+        return self.rows_read / self.seconds if self.seconds > 0 else 0.0
+
+
+@dataclass
+class _AmoCompanyRow:
+    """Строка компании из CSV, разобранная до обращений к БД."""
+
+    row: dict
+    amo_id: str
+    name: str
+    legal_name: str
+    inn_list: list[str]
+    inn: str
+    kpp: str
+    address: str
+    website: str
+    status_name: str
+    spheres_raw: str
+    employees_count: int | None
+    workday_start: dt.time | None
+    workday_end: dt.time | None
+    timezone_raw: str
+    phone_work: str
+    phone_work_direct: str
+    phone_mobile: str
+    phone_other: str
+    phone: str
+    email_work: str
+    email_personal: str
+    email_other: str
+    email: str
+    contact_person_raw: str
+    contact_position: str
+    activity_raw: str
+    activity_short: str
+    responsible_raw: str
+
+
+def _parse_company_row(row: dict) -> _AmoCompanyRow:
+    name = _unescape(_get(row, "Название компании", "Компания", "Наименование"))
+    legal_name = _unescape(
+        _get(row, "Юридическое название компании", "Юридическое название компании (компания)")
+    )
+    # ИНН: в базе встречаются компании с несколькими ИНН — поддерживаем ввод через любые разделители.
+    inn_list = parse_inns(_get(row, "ИНН", "ИНН (компания)"))
+    region = _unescape(_get(row, "Область"))
+    address = _unescape(_get(row, "Адрес", "Адрес (компания)"))
+    if region and address and region.lower() not in address.lower():
+        address = f"{region}, {address}"
+
+    # Доп. поля карточки
+    employees_count_raw = _unescape(
+        _get(row, "Численность сотрудников", "Численность сотрудников (Скайнет)", "Сотрудников")
+    )
+    worktime_raw = _unescape(_get(row, "Рабочее время", "Рабочее время (Скайнет)", "Часы работы"))
+    workday_start, workday_end = _parse_worktime(worktime_raw)
+
+    # Телефоны/почта компании (основные)
+    phone_work = _unescape(_get(row, "Рабочий телефон"))
+    phone_work_direct = _unescape(_get(row, "Рабочий прямой телефон"))
+    phone_mobile = _unescape(_get(row, "Мобильный телефон"))
+    phone_other = _unescape(_get(row, "Другой телефон"))
+    email_work = _unescape(_get(row, "Рабочий email"))
+    email_personal = _unescape(_get(row, "Личный email"))
+    email_other = _unescape(_get(row, "Другой email"))
+
+    # Вид деятельности: в CSV встречается очень длинное описание — в поле кладём коротко,
+    # полную версию (если длиннее) сохраняем в заметку/сырые поля.
+    activity_raw = _unescape(_get(row, "Вид деятельности (Скайнет)"))
+
+    return _AmoCompanyRow(
+        row=row,
+        amo_id=_get(row, "ID"),
+        name=name,
+        legal_name=legal_name,
+        inn_list=inn_list,
+        inn=", ".join(inn_list),
+        kpp=_digits_only(_get(row, "КПП", "КПП (компания)")),
+        address=address,
+        website=_unescape(_get(row, "Web", "Web (компания)")),
+        # Статус: в файле встречаются 2 колонки ("Статус" и "Статус из Скайнет") — берём более "живую".
+        status_name=_unescape(
+            _get(row, "Статус", "Статус из Скайнет", "Статус из Скайнет (компания)")
+        ),
+        spheres_raw=_get(row, "Сферы деятельности", "Сферы деятельности (компания)"),
+        employees_count=_parse_int(employees_count_raw),
+        workday_start=workday_start,
+        workday_end=workday_end,
+        timezone_raw=_unescape(
+            _get(row, "Часовой пояс", "Часовой пояс (Скайнет)", "Таймзона", "Timezone")
+        ),
+        phone_work=phone_work,
+        phone_work_direct=phone_work_direct,
+        phone_mobile=phone_mobile,
+        phone_other=phone_other,
+        phone=_pick_first(phone_work, phone_work_direct, phone_mobile, phone_other),
+        email_work=email_work,
+        email_personal=email_personal,
+        email_other=email_other,
+        email=_pick_first(email_work, email_personal, email_other),
+        # Контакт (из CSV это обычно руководитель организации)
+        contact_person_raw=_unescape(_get(row, "Руководитель")),
+        contact_position=_unescape(_get(row, "Должность")),
+        activity_raw=activity_raw,
+        activity_short=(activity_raw or "")[:255],
+        responsible_raw=_unescape(_get(row, "Ответственный")),
+    )
+
+
+@dataclass
+class _Chunk:
+    """Запланированные записи одной пачки (пишутся одной транзакцией)."""
+
+    created: dict = field(default_factory=dict)  # Company.id -> Company (новые)
+    updated: dict = field(default_factory=dict)  # Company.id -> Company (существующие)
+    spheres: dict = field(default_factory=dict)  # Company.id -> [CompanySphere.id]
+    notes: list = field(default_factory=list)
+    contacts: list = field(default_factory=list)  # (Contact, [ContactPhone], [ContactEmail])
+
+
+class _AmoImporter:
+    """
+    Состояние потокового импорта: справочники и карты дедупа строятся один раз,
+    дальше каждая пачка строк планируется в памяти и пишется bulk-запросами.
+    """
+
+    def __init__(
+        self,
+        *,
+        result: ImportResult,
+        dry_run: bool,
+        companies_only: bool,
+        limit_companies: int,
+        actor: User | None,
+        import_notes: bool,
+        import_contacts: bool,
+        set_responsible: bool,
+        chunk_size: int,
+    ):
+        self.result = result
+        self.dry_run = dry_run
+        self.companies_only = companies_only
+        self.limit_companies = limit_companies
+        self.actor = actor
+        self.import_notes = import_notes
+        self.import_contacts = import_contacts
+        self.set_responsible = set_responsible
+        self.chunk_size = chunk_size
+
+        # Компании текущей пачки (в dry-run — и созданные «в памяти» в прошлых пачках)
+        self.objects: dict = {}
+        # responsible_id существующих компаний на момент загрузки из БД
+        self.db_responsible: dict = {}
+        self.affected_responsibles: set[int] = set()
+
+        self._load_users()
+        self._load_companies()
+        self.status_by_name = {s.name: s for s in CompanyStatus.objects.all()}
+        self.sphere_by_name = {s.name: s for s in CompanySphere.objects.all()}
+
+    def _load_users(self) -> None:
+        # Важно: __str__ у нас = "Фамилия Имя", а get_full_name() у Django = "Имя Фамилия".
+        # Плюс в CSV часто есть префиксы вида "(ЕКБ)" и отчества — делаем устойчивое сопоставление.
+        users = list(User.objects.select_related("branch"))
+        self.user_by_name: dict[str, User] = {}
+        self.user_by_last_first: dict[tuple[str, str], User] = {}
+        for u in users:
+            candidates = [
+                _norm_spaces(u.get_full_name()),
+                _norm_spaces(str(u)),
+                _norm_spaces(f"{u.last_name} {u.first_name}"),
+                _norm_spaces(f"{u.first_name} {u.last_name}"),
+            ]
+            for c in candidates:
+                if c:
+                    self.user_by_name.setdefault(c, u)
+            if u.is_active:
+                self.user_by_last_first.setdefault(
+                    (u.last_name.strip().lower(), u.first_name.strip().lower()), u
+                )
+        self.user_by_username: dict[str, User] = {u.username.strip(): u for u in users}
+
+    def _load_companies(self) -> None:
+        # Карты дедупа: ИНН (учитываем, что ИНН может быть множественным) и
+        # нормализованные название+адрес -> Company.id. Объекты грузятся по пачкам.
+        self.company_by_inn: dict[str, uuid.UUID] = {}
+        self.company_by_name_addr: dict[tuple[str, str], uuid.UUID] = {}
+        rows = Company.objects.values_list("id", "name", "address", "inn")
+        for company_id, name, address, inn in rows.iterator(chunk_size=5000):
+            for x in parse_inns(inn):
+                self.company_by_inn.setdefault(x, company_id)
+            key = (_norm_name(name), _norm_name(address))
+            if key != ("", ""):
+                self.company_by_name_addr.setdefault(key, company_id)
+
+    def _remember(self, company: Company) -> None:
+        for x in parse_inns(company.inn):
+            self.company_by_inn[x] = company.id
+        self.company_by_name_addr[(_norm_name(company.name), _norm_name(company.address))] = (
+            company.id
+        )
+
+    def _find_company_id(self, r: _AmoCompanyRow):
+        for x in r.inn_list:
+            company_id = self.company_by_inn.get(x)
+            if company_id is not None:
+                return company_id
+        key = (_norm_name(r.name), _norm_name(r.address))
+        if key == ("", ""):
+            return None
+        return self.company_by_name_addr.get(key)
+
+    def _load_existing(self, ids) -> None:
+        qs = Company.objects.select_related("responsible__branch")
+        for company in qs.filter(id__in=ids):
+            self.objects[company.id] = company
+            self.db_responsible[company.id] = company.responsible_id
+
+    def _responsible(self, raw: str) -> User | None:
+        key = _strip_branch_prefix(raw)
+        if not self.set_responsible or not key:
+            return None
+        responsible = (
+            self.user_by_name.get(_norm_spaces(key))
+            or self.user_by_name.get(_norm_spaces(raw))
+            or self.user_by_username.get(key)
+            or self.user_by_username.get(raw)
+        )
+        if responsible is None:
+            # fallback: "Фамилия Имя Отчество" -> ищем по "Фамилия Имя"
+            ln, fn = _parse_person_name(key)
+            if ln and fn:
+                responsible = self.user_by_last_first.get((ln.lower(), fn.lower()))
+        return responsible
+
+    def _status(self, name: str) -> CompanyStatus | None:
+        if not name:
+            return None
+        status = self.status_by_name.get(name)
+        if status is None and not self.dry_run:
+            status, _ = CompanyStatus.objects.get_or_create(name=name)
+            self.status_by_name[name] = status
+        return status
+
+    def _sphere_ids(self, spheres_raw: str) -> list[int]:
+        ids: list[int] = []
+        seen = set()
+        for sname in _split_multi(spheres_raw):
+            canon = _canon_sphere_name(sname)
+            if not canon or canon.lower() in seen:
+                continue
+            seen.add(canon.lower())
+            sphere = self.sphere_by_name.get(canon)
+            if sphere is None:
+                sphere, _ = CompanySphere.objects.get_or_create(name=canon)
+                self.sphere_by_name[canon] = sphere
+            ids.append(sphere.id)
+        return ids
+
+    def process_chunk(self, rows: list[_AmoCompanyRow]) -> bool:
+        """Спланировать и записать пачку; True — достигнут limit_companies."""
+        ids = {self._find_company_id(r) for r in rows} - {None} - self.objects.keys()
+        if ids:
+            self._load_existing(ids)
+
+        chunk = _Chunk()
+        stop = False
+        for r in rows:
+            self._plan_row(r, chunk)
+            if (
+                self.companies_only
+                and self.limit_companies
+                and self.result.created_companies + self.result.updated_companies
+                >= self.limit_companies
+            ):
+                # Быстрый выход: не читаем дальше файл
+                stop = True
+                break
+
+        if not self.dry_run:
+            self._write(chunk)
+            self.objects.clear()
+            self.db_responsible.clear()
+        self.result.chunks += 1
+        return stop
+
+    def _plan_row(self, r: _AmoCompanyRow, chunk: _Chunk) -> None:
+        result = self.result
+        result.company_rows += 1
+        responsible = self._responsible(r.responsible_raw)
+
+        company_id = self._find_company_id(r)
+        company = self.objects.get(company_id) if company_id is not None else None
+
+        created = company is None
+        if created:
+            company = Company(
+                name=(r.name or "(без названия)")[:255],
+                legal_name=r.legal_name[:255],
+                inn=r.inn[:255],
+                kpp=r.kpp[:20],
+                address=r.address[:500],
+                website=r.website[:255],
+                responsible=responsible,
+                phone=r.phone[:50],
+                email=r.email[:254],
+                contact_name=r.contact_person_raw[:255],
+                contact_position=r.contact_position[:255],
+                activity_kind=r.activity_short,
+                employees_count=r.employees_count,
+                workday_start=r.workday_start,
+                workday_end=r.workday_end,
+                work_timezone=(r.timezone_raw or "")[:64],
+                amocrm_company_id=int(r.amo_id) if str(r.amo_id).isdigit() else None,
+                raw_fields={"source": "amo_import", "amo_row": r.row},
+            )
+            self.objects[company.id] = company
+            chunk.created[company.id] = company
+            result.created_companies += 1
+            dirty = True
+        else:
+            dirty = self._apply_update(company, r, responsible)
+
+        # статус/сферы (создаём справочники при необходимости)
+        status = self._status(r.status_name)
+        if status is not None and company.status_id != status.id:
+            company.status = status
+            dirty = True
+        if dirty and company.id not in chunk.created:
+            chunk.updated[company.id] = company
+
+        if not self.dry_run:
+            sphere_ids = self._sphere_ids(r.spheres_raw)
+            if sphere_ids:
+                chunk.spheres[company.id] = sphere_ids
+            # Заметка и контакт — только при создании, чтобы не плодить дубли при повторном импорте
+            if created and self.import_notes:
+                self._plan_note(company, r, responsible, chunk)
+            if created and self.import_contacts:
+                self._plan_contact(company, r, chunk)
+
+        # кеш для дедупа
+        self._remember(company)
+
+        # превью
+        if result.preview_companies is not None and len(result.preview_companies) < max(
+            20, self.limit_companies
+        ):
+            result.preview_companies.append(
+                {
+                    "name": company.name,
+                    "inn": company.inn,
+                    "address": company.address,
+                    "status": r.status_name,
+                }
+            )
+
+    def _apply_update(self, company: Company, r: _AmoCompanyRow, responsible) -> bool:
+        """Мягкое обновление существующей компании; True — что-то изменилось."""
+        changed = False
+        # Мягкий режим "обновить, но не перезаписать": если поле уже меняли руками,
+        # не трогаем. Сравниваем с последним импортированным значением из raw_fields.
+        try:
+            rf = dict(company.raw_fields or {})
+        except Exception:
+            rf = {}
+        prev = rf.get("amo_values") or {}
+        if not isinstance(prev, dict):
+            prev = {}
+
+        def can_update(field_name: str) -> bool:
+            cur = getattr(company, field_name)
+            if cur in ("", None):
+                return True
+            # если ранее импортировали и текущее значение равно "как было импортировано",
+            # значит пользователь не менял — можно обновлять.
+            return field_name in prev and prev.get(field_name) == _snapshot_value(cur)
+
+        for field_name, value in (
+            ("name", r.name),
+            ("legal_name", r.legal_name),
+            ("inn", r.inn),
+            ("kpp", r.kpp),
+            ("address", r.address),
+            ("website", r.website),
+            ("phone", r.phone),
+            ("email", r.email),
+            ("contact_name", r.contact_person_raw),
+            ("contact_position", r.contact_position),
+            ("activity_kind", r.activity_short),
+        ):
+            if value and can_update(field_name):
+                value_truncated = str(value).strip()[: _FIELD_MAX_LENGTHS[field_name]]
+                if getattr(company, field_name) != value_truncated:
+                    setattr(company, field_name, value_truncated)
+                    changed = True
+
+        # новые поля (работаем только если можно обновлять)
+        for field_name, value in (
+            ("employees_count", r.employees_count),
+            ("workday_start", r.workday_start),
+            ("workday_end", r.workday_end),
+            ("work_timezone", (r.timezone_raw or "").strip()[:64]),
+        ):
+            if value not in ("", None) and can_update(field_name):
+                if getattr(company, field_name) != value:
+                    setattr(company, field_name, value)
+                    changed = True
+        if responsible and company.responsible_id != responsible.id:
+            company.responsible = responsible
+            changed = True
+        if str(r.amo_id).isdigit() and company.amocrm_company_id != int(r.amo_id):
+            company.amocrm_company_id = int(r.amo_id)
+            changed = True
+
+        if changed:
+            self.result.updated_companies += 1
+            # обновляем снимок импортированных значений
+            prev.update(
+                {
+                    name: _snapshot_value(getattr(company, name))
+                    for name in (
+                        "activity_kind",
+                        "employees_count",
+                        "workday_start",
+                        "workday_end",
+                        "work_timezone",
+                    )
+                }
+            )
+            rf["amo_values"] = prev
+            company.raw_fields = rf
+        return changed
+
+    def _plan_note(self, company: Company, r: _AmoCompanyRow, responsible, chunk: _Chunk) -> None:
+        # Примечания/комментарии -> одна заметка
+        row = r.row
+        note_parts = []
+        for k in ("Примечание 1", "Примечание 2", "Примечание 3", "Примечание 4", "Примечание 5"):
+            v = _unescape(_get(row, k))
+            if v:
+                note_parts.append(f"{k}: {v}")
+        last_comment = _unescape(_get(row, "Последний комментарий (Скайнет)"))
+        if last_comment:
+            note_parts.append(f"Последний комментарий (Скайнет): {last_comment}")
+        note2 = _unescape(_get(row, "Примечание"))
+        if note2:
+            note_parts.append(f"Примечание: {note2}")
+        if r.activity_raw and len(r.activity_raw) > 255:
+            note_parts.append(f"Вид деятельности (полный текст): {r.activity_raw}")
+        if note_parts:
+            chunk.notes.append(
+                CompanyNote(
+                    company=company,
+                    author=self.actor or responsible,
+                    text="Импорт из amo:\n" + "\n\n".join(note_parts),
+                )
+            )
+
+    def _plan_contact(self, company: Company, r: _AmoCompanyRow, chunk: _Chunk) -> None:
+        # Доп. контакты/телефоны/email: один контакт на компанию
+        phones = []
+        if r.phone_work:
+            phones.append((ContactPhone.PhoneType.WORK, r.phone_work))
+        if r.phone_work_direct:
+            phones.append((ContactPhone.PhoneType.WORK_DIRECT, r.phone_work_direct))
+        if r.phone_mobile:
+            phones.append((ContactPhone.PhoneType.MOBILE, r.phone_mobile))
+        if r.phone_other:
+            phones.append((ContactPhone.PhoneType.OTHER, r.phone_other))
+        # "Список телефонов (Скайнет)" — часто много номеров в одной ячейке
+        for pval in _split_multi(_unescape(_get(r.row, "Список телефонов (Скайнет)"))):
+            phones.append((ContactPhone.PhoneType.OTHER, pval))
+
+        emails = []
+        if r.email_work:
+            emails.append((ContactEmail.EmailType.WORK, r.email_work))
+        if r.email_personal:
+            emails.append((ContactEmail.EmailType.PERSONAL, r.email_personal))
+        if r.email_other:
+            emails.append((ContactEmail.EmailType.OTHER, r.email_other))
+
+        # Создаём контакт только если есть хоть какие-то каналы связи или имя
+        if not (phones or emails or r.contact_person_raw):
+            return
+        ln, fn = _parse_person_name(r.contact_person_raw)
+        contact = Contact(
+            company=company,
+            last_name=ln,
+            first_name=fn,
+            position=r.contact_position,
+            status=_unescape(_get(r.row, "Статус"))[:120],
+            note=_unescape(_get(r.row, "Примечание")),
+            raw_fields={"source": "amo_import", "amo_company_id": r.amo_id},
+        )
+        # дедуп на уровне контакта; bulk_create обходит save() — нормализуем телефон сами
+        contact_phones = []
+        seen_p = set()
+        for tpe, v in phones:
+            v = _norm_spaces(v)
+            if not v or v in seen_p:
+                continue
+            seen_p.add(v)
+            contact_phones.append(
+                ContactPhone(contact=contact, type=tpe, value=normalize_phone(v[:50])[:50])
+            )
+        contact_emails = []
+        seen_e = set()
+        for tpe, v in emails:
+            v = _norm_spaces(v).lower()
+            if not v or v in seen_e:
+                continue
+            seen_e.add(v)
+            try:
+                validate_email(v)
+            except ValidationError:
+                # если email невалиден — не роняем импорт
+                continue
+            contact_emails.append(ContactEmail(contact=contact, type=tpe, value=v))
+        chunk.contacts.append((contact, contact_phones, contact_emails))
+
+    @transaction.atomic
+    def _write(self, chunk: _Chunk) -> None:
+        """Записать пачку: bulk-запросы без post_save на строку, метки индекса — одной вставкой."""
+        from companies.card_cache import bump_company_cards
+        from companies.search_index_queue import mark_companies_dirty
+
+        now = timezone.now()
+        batch_size = self.chunk_size
+        created = list(chunk.created.values())
+        for company in created:
+            company.normalize_fields()
+        Company.objects.bulk_create(created, batch_size=batch_size)
+
+        bulk = []
+        for company in chunk.updated.values():
+            if company.responsible_id != self.db_responsible.get(company.id):
+                # Смена ответственного — через save(): сигналы переносят отметки
+                # холодных звонков и напоминания по договорам к новому ответственному.
+                company.save(update_fields=_COMPANY_UPDATE_FIELDS)
+                continue
+            company.normalize_fields()
+            company.updated_at = now
+            bulk.append(company)
+        if bulk:
+            Company.objects.bulk_update(bulk, _COMPANY_UPDATE_FIELDS, batch_size=batch_size)
+        self.affected_responsibles.update(c.responsible_id for c in created + bulk)
+
+        self._write_spheres(chunk.spheres)
+        CompanyNote.objects.bulk_create(chunk.notes, batch_size=batch_size)
+        Contact.objects.bulk_create([c for c, _, _ in chunk.contacts], batch_size=batch_size)
+        ContactPhone.objects.bulk_create(
+            [p for _, phones, _ in chunk.contacts for p in phones], batch_size=batch_size
+        )
+        ContactEmail.objects.bulk_create(
+            [e for _, _, emails in chunk.contacts for e in emails], batch_size=batch_size
+        )
+        # Метки перестройки поиска — в транзакции пачки: переживают падение импорта
+        mark_companies_dirty([*chunk.created, *chunk.updated, *chunk.spheres])
+        # bulk_update обходит post_save — версии кэша карточек сдвигаем сами
+        bump_company_cards(chunk.updated)
+
+    def _write_spheres(self, spheres: dict) -> None:
+        """company.spheres.set() для всей пачки: одно чтение, одно удаление, одна вставка."""
+        if not spheres:
+            return
+        through = Company.spheres.through
+        current: dict = {}
+        for company_id, sphere_id in through.objects.filter(company_id__in=spheres).values_list(
+            "company_id", "companysphere_id"
+        ):
+            current.setdefault(company_id, set()).add(sphere_id)
+        stale = Q()
+        new_rows = []
+        for company_id, wanted in spheres.items():
+            have = current.get(company_id, set())
+            if have - set(wanted):
+                stale |= Q(company_id=company_id, companysphere_id__in=have - set(wanted))
+            new_rows += [
+                through(company_id=company_id, companysphere_id=sphere_id)
+                for sphere_id in wanted
+                if sphere_id not in have
+            ]
+        if stale:
+            through.objects.filter(stale).delete()
+        through.objects.bulk_create(new_rows, batch_size=self.chunk_size)
+
+    def finish(self) -> None:
+        """После всех пачек: одна пакетная перестройка поиска и сброс кэшей дашборда."""
+        from companies.search_index_queue import flush_search_index_queue
+        from ui.signals import invalidate_dashboard_cache
+
+        try:
+            flush_search_index_queue()
+        except Exception:
+            # Метки остаются в очереди — их доберёт Celery (drain_search_index_queue)
+            logger.exception("amo import: search index flush failed")
+        for user_id in self.affected_responsibles:
+            invalidate_dashboard_cache(user_id)
+        cache.delete("companies_total_count")
 
 
 def import_amo_csv(
@@ -208,444 +908,103 @@ def import_amo_csv(
     import_notes: bool = True,
     import_contacts: bool = True,
     set_responsible: bool = True,
+    chunk_size: int = CHUNK_SIZE,
+    resume: bool = True,
+    progress=None,
 ) -> ImportResult:
     """
     Импорт из CSV в формате amo/base.csv.
     Для твоего запроса: companies_only=True и limit_companies=20.
+
+    Файл читается потоково, пачками по chunk_size строк компаний. Каждая пачка пишется
+    bulk-запросами в своей транзакции (без сигналов на каждую строку), её компании
+    помечаются для перестройки поиска; в конце очередь сливается одной пакетной
+    перестройкой. После каждой пачки сохраняется чекпоинт: повторный запуск на том же
+    файле с теми же опциями (resume=True) продолжит с первой незаписанной пачки.
+    dry_run ничего не пишет и чекпоинт не ведёт. progress(result) вызывается после каждой пачки.
     """
     csv_path = Path(csv_path)
     result = ImportResult(preview_companies=[], preview_updates=[])
-
-    # Кеш пользователей
-    # Важно: __str__ у нас = "Фамилия Имя", а get_full_name() у Django = "Имя Фамилия".
-    # Плюс в CSV часто есть префиксы вида "(ЕКБ)" и отчества — делаем устойчивое сопоставление.
-    user_by_name: dict[str, User] = {}
-    for u in User.objects.all():
-        candidates = [
-            _norm_spaces(u.get_full_name()),
-            _norm_spaces(str(u)),
-            _norm_spaces(f"{u.last_name} {u.first_name}"),
-            _norm_spaces(f"{u.first_name} {u.last_name}"),
-        ]
-        for c in candidates:
-            if c:
-                user_by_name.setdefault(c, u)
-    user_by_username: dict[str, User] = {u.username.strip(): u for u in User.objects.all()}
-
-    # Кеш компаний для дедупа (учитываем, что ИНН может быть множественным)
-    from companies.inn_utils import parse_inns
-
-    company_by_inn: dict[str, Company] = {}
-    for c in Company.objects.exclude(inn=""):
-        for x in parse_inns(c.inn):
-            company_by_inn.setdefault(x, c)
-    company_by_name_addr: dict[tuple[str, str], Company] = {}
-
-    @transaction.atomic
-    def _run():
-        with csv_path.open("r", encoding=encoding, newline="") as f:
-            reader = csv.DictReader(f)
-            if not reader.fieldnames:
-                raise ValueError("CSV has no header row")
-
-            for row in reader:
-                row_id = _get(row, "ID")
-                if not row_id:
-                    result.skipped_rows += 1
-                    continue
-
-                t = _get(row, "Тип").lower()
-                is_company_row = "компан" in t
-                if companies_only and not is_company_row:
-                    continue
-
-                if is_company_row:
-                    result.company_rows += 1
-
-                    amo_id = _get(row, "ID")
-
-                    name = _unescape(_get(row, "Название компании", "Компания", "Наименование"))
-                    legal_name = _unescape(
-                        _get(
-                            row,
-                            "Юридическое название компании",
-                            "Юридическое название компании (компания)",
-                        )
-                    )
-                    # ИНН: в базе встречаются компании с несколькими ИНН — поддерживаем ввод через любые разделители.
-                    inn_raw = _get(row, "ИНН", "ИНН (компания)")
-                    inn_list = parse_inns(inn_raw)
-                    inn = ", ".join(inn_list)
-                    kpp = _digits_only(_get(row, "КПП", "КПП (компания)"))
-                    region = _unescape(_get(row, "Область"))
-                    address = _unescape(_get(row, "Адрес", "Адрес (компания)"))
-                    if region and address and region.lower() not in address.lower():
-                        address = f"{region}, {address}"
-
-                    website = _unescape(_get(row, "Web", "Web (компания)"))
-
-                    # Статус: в файле встречаются 2 колонки ("Статус" и "Статус из Скайнет") — берём более "живую".
-                    status_name = _unescape(
-                        _get(row, "Статус", "Статус из Скайнет", "Статус из Скайнет (компания)")
-                    )
-                    spheres_raw = _get(row, "Сферы деятельности", "Сферы деятельности (компания)")
-
-                    # Доп. поля карточки
-                    employees_count_raw = _unescape(
-                        _get(
-                            row,
-                            "Численность сотрудников",
-                            "Численность сотрудников (Скайнет)",
-                            "Сотрудников",
-                        )
-                    )
-                    worktime_raw = _unescape(
-                        _get(row, "Рабочее время", "Рабочее время (Скайнет)", "Часы работы")
-                    )
-                    timezone_raw = _unescape(
-                        _get(row, "Часовой пояс", "Часовой пояс (Скайнет)", "Таймзона", "Timezone")
-                    )
-                    employees_count = _parse_int(employees_count_raw)
-                    workday_start, workday_end = _parse_worktime(worktime_raw)
-
-                    # Телефоны/почта компании (основные)
-                    phone_work = _unescape(_get(row, "Рабочий телефон"))
-                    phone_work_direct = _unescape(_get(row, "Рабочий прямой телефон"))
-                    phone_mobile = _unescape(_get(row, "Мобильный телефон"))
-                    phone_other = _unescape(_get(row, "Другой телефон"))
-                    phone = _pick_first(phone_work, phone_work_direct, phone_mobile, phone_other)
-
-                    email_work = _unescape(_get(row, "Рабочий email"))
-                    email_personal = _unescape(_get(row, "Личный email"))
-                    email_other = _unescape(_get(row, "Другой email"))
-                    email = _pick_first(email_work, email_personal, email_other)
-
-                    # Контакт (из CSV это обычно руководитель организации)
-                    contact_person_raw = _unescape(_get(row, "Руководитель"))
-                    contact_position = _unescape(_get(row, "Должность"))
-
-                    # Вид деятельности: в CSV встречается очень длинное описание — в поле кладём коротко,
-                    # полную версию (если длиннее) сохраняем в заметку/сырые поля.
-                    activity_raw = _unescape(_get(row, "Вид деятельности (Скайнет)"))
-                    activity_short = (activity_raw or "")[:255]
-
-                    is_cold_flag = _bool_yes(_get(row, "Холодный звонок"))
-
-                    responsible_raw = _unescape(_get(row, "Ответственный"))
-                    responsible_key = _strip_branch_prefix(responsible_raw)
-                    responsible = None
-                    if set_responsible and responsible_key:
-                        responsible = (
-                            user_by_name.get(_norm_spaces(responsible_key))
-                            or user_by_name.get(_norm_spaces(responsible_raw))
-                            or user_by_username.get(responsible_key)
-                            or user_by_username.get(responsible_raw)
-                        )
-                        if responsible is None:
-                            # fallback: "Фамилия Имя Отчество" -> ищем по "Фамилия Имя"
-                            ln, fn = _parse_person_name(responsible_key)
-                            if ln and fn:
-                                responsible = User.objects.filter(
-                                    last_name__iexact=ln, first_name__iexact=fn, is_active=True
-                                ).first()
-
-                    company = None
-                    if inn_list:
-                        for x in inn_list:
-                            company = company_by_inn.get(x)
-                            if company is not None:
-                                break
-
-                    if company is None:
-                        key = (_norm_name(name), _norm_name(address))
-                        company = company_by_name_addr.get(key)
-                        if company is None and key != ("", ""):
-                            company = Company.objects.filter(
-                                name__iexact=name, address__iexact=address
-                            ).first()
-
-                    created = False
-                    if company is None:
-                        # Обрезаем значения до max_length перед созданием
-                        company = Company(
-                            name=(name or "(без названия)")[:255],
-                            legal_name=legal_name[:255] if legal_name else "",
-                            inn=inn[:255] if inn else "",
-                            kpp=kpp[:20] if kpp else "",
-                            address=address[:500] if address else "",
-                            website=website[:255] if website else "",
-                            responsible=responsible,
-                            phone=phone[:50] if phone else "",
-                            email=email[:254] if email else "",
-                            contact_name=contact_person_raw[:255] if contact_person_raw else "",
-                            contact_position=contact_position[:255] if contact_position else "",
-                            activity_kind=activity_short[:255] if activity_short else "",
-                            employees_count=employees_count,
-                            workday_start=workday_start,
-                            workday_end=workday_end,
-                            work_timezone=(timezone_raw or "")[:64],
-                            amocrm_company_id=int(amo_id) if str(amo_id).isdigit() else None,
-                            raw_fields={"source": "amo_import", "amo_row": row},
-                        )
-                        result.created_companies += 1
-                        created = True
-                    else:
-                        changed = False
-                        # Мягкий режим "обновить, но не перезаписать": если поле уже меняли руками,
-                        # не трогаем. Сравниваем с последним импортированным значением из raw_fields.
-                        try:
-                            rf = dict(company.raw_fields or {})
-                        except Exception:
-                            rf = {}
-                        prev = rf.get("amo_values") or {}
-                        if not isinstance(prev, dict):
-                            prev = {}
-
-                        def can_update(field: str) -> bool:
-                            cur = getattr(company, field)
-                            if cur in ("", None):
-                                return True
-                            # если ранее импортировали и текущее значение равно "как было импортировано",
-                            # значит пользователь не менял — можно обновлять.
-                            if field in prev and prev.get(field) == cur:
-                                return True
-                            return False
-
-                        # Обрезаем значения до max_length перед установкой
-                        field_max_lengths = {
-                            "name": 255,
-                            "legal_name": 255,
-                            "inn": 255,
-                            "kpp": 20,
-                            "address": 500,
-                            "website": 255,
-                            "phone": 50,
-                            "email": 254,
-                            "contact_name": 255,
-                            "contact_position": 255,
-                            "activity_kind": 255,
-                        }
-                        for field, value in (
-                            ("name", name),
-                            ("legal_name", legal_name),
-                            ("inn", inn),
-                            ("kpp", kpp),
-                            ("address", address),
-                            ("website", website),
-                            ("phone", phone),
-                            ("email", email),
-                            ("contact_name", contact_person_raw),
-                            ("contact_position", contact_position),
-                            ("activity_kind", activity_short),
-                        ):
-                            if value and can_update(field):
-                                # Обрезаем значение до max_length
-                                max_len = field_max_lengths.get(field, 255)
-                                value_truncated = str(value).strip()[:max_len]
-                                if getattr(company, field) != value_truncated:
-                                    setattr(company, field, value_truncated)
-                                    changed = True
-
-                        # новые поля (работаем только если можно обновлять)
-                        if (
-                            employees_count is not None
-                            and can_update("employees_count")
-                            and company.employees_count != employees_count
-                        ):
-                            company.employees_count = employees_count
-                            changed = True
-                        if (
-                            workday_start
-                            and can_update("workday_start")
-                            and company.workday_start != workday_start
-                        ):
-                            company.workday_start = workday_start
-                            changed = True
-                        if (
-                            workday_end
-                            and can_update("workday_end")
-                            and company.workday_end != workday_end
-                        ):
-                            company.workday_end = workday_end
-                            changed = True
-                        if timezone_raw and can_update("work_timezone"):
-                            tzv = (timezone_raw or "").strip()[:64]
-                            if company.work_timezone != tzv:
-                                company.work_timezone = tzv
-                                changed = True
-                        if (
-                            responsible
-                            and company.responsible_id != responsible.id
-                            and set_responsible
-                        ):
-                            company.responsible = responsible
-                            changed = True
-                        if str(amo_id).isdigit() and company.amocrm_company_id != int(amo_id):
-                            company.amocrm_company_id = int(amo_id)
-                            changed = True
-                        if changed:
-                            result.updated_companies += 1
-                            # обновляем снимок импортированных значений
-                            prev.update(
-                                {
-                                    "activity_kind": company.activity_kind,
-                                    "employees_count": company.employees_count,
-                                    "workday_start": company.workday_start,
-                                    "workday_end": company.workday_end,
-                                    "work_timezone": company.work_timezone,
-                                }
-                            )
-                            rf["amo_values"] = prev
-                            company.raw_fields = rf
-
-                    # статус/сферы (создаём справочники при необходимости)
-                    status_obj = None
-                    if status_name:
-                        status_obj, _ = CompanyStatus.objects.get_or_create(name=status_name)
-                        if company.status_id != status_obj.id:
-                            company.status = status_obj
-                            if not created:
-                                result.updated_companies += 0  # уже учли по changed; статус — доп.
-
-                    if not dry_run:
-                        company.save()
-
-                        # spheres m2m — только после save
-                        spheres: list[CompanySphere] = []
-                        seen = set()
-                        for sname in _split_multi(spheres_raw):
-                            canon = _canon_sphere_name(sname)
-                            if not canon:
-                                continue
-                            if canon.lower() in seen:
-                                continue
-                            seen.add(canon.lower())
-                            obj, _ = CompanySphere.objects.get_or_create(name=canon)
-                            spheres.append(obj)
-                        if spheres:
-                            company.spheres.set(spheres)
-
-                        # Примечания/комментарии -> одна заметка (только при создании, чтобы не плодить дубли при повторном импорте)
-                        if created and import_notes:
-                            note_parts = []
-                            for k in (
-                                "Примечание 1",
-                                "Примечание 2",
-                                "Примечание 3",
-                                "Примечание 4",
-                                "Примечание 5",
-                            ):
-                                v = _unescape(_get(row, k))
-                                if v:
-                                    note_parts.append(f"{k}: {v}")
-                            last_comment = _unescape(_get(row, "Последний комментарий (Скайнет)"))
-                            if last_comment:
-                                note_parts.append(
-                                    f"Последний комментарий (Скайнет): {last_comment}"
-                                )
-                            note2 = _unescape(_get(row, "Примечание"))
-                            if note2:
-                                note_parts.append(f"Примечание: {note2}")
-                            if activity_raw and len(activity_raw) > 255:
-                                note_parts.append(
-                                    f"Вид деятельности (полный текст): {activity_raw}"
-                                )
-
-                            if note_parts:
-                                CompanyNote.objects.create(
-                                    company=company,
-                                    author=actor or responsible,
-                                    text="Импорт из amo:\n" + "\n\n".join(note_parts),
-                                )
-
-                        # Доп. контакты/телефоны/email: создаём один контакт на компанию (только при создании)
-                        if created and import_contacts:
-                            phones = []
-                            if phone_work:
-                                phones.append((ContactPhone.PhoneType.WORK, phone_work))
-                            if phone_work_direct:
-                                phones.append(
-                                    (ContactPhone.PhoneType.WORK_DIRECT, phone_work_direct)
-                                )
-                            if phone_mobile:
-                                phones.append((ContactPhone.PhoneType.MOBILE, phone_mobile))
-                            if phone_other:
-                                phones.append((ContactPhone.PhoneType.OTHER, phone_other))
-                            # "Список телефонов (Скайнет)" — часто много номеров в одной ячейке
-                            phone_list = _unescape(_get(row, "Список телефонов (Скайнет)"))
-                            for pval in _split_multi(phone_list):
-                                phones.append((ContactPhone.PhoneType.OTHER, pval))
-
-                            emails = []
-                            if email_work:
-                                emails.append((ContactEmail.EmailType.WORK, email_work))
-                            if email_personal:
-                                emails.append((ContactEmail.EmailType.PERSONAL, email_personal))
-                            if email_other:
-                                emails.append((ContactEmail.EmailType.OTHER, email_other))
-
-                            # Создаём контакт только если есть хоть какие-то каналы связи или имя
-                            if phones or emails or contact_person_raw:
-                                ln, fn = _parse_person_name(contact_person_raw)
-                                c = Contact.objects.create(
-                                    company=company,
-                                    last_name=ln,
-                                    first_name=fn,
-                                    position=contact_position,
-                                    status=_unescape(_get(row, "Статус"))[:120],
-                                    note=_unescape(_get(row, "Примечание")),
-                                    raw_fields={"source": "amo_import", "amo_company_id": amo_id},
-                                )
-                                # дедуп на уровне контакта
-                                seen_p = set()
-                                for tpe, v in phones:
-                                    v = _norm_spaces(v)
-                                    if not v or v in seen_p:
-                                        continue
-                                    seen_p.add(v)
-                                    ContactPhone.objects.create(contact=c, type=tpe, value=v[:50])
-                                seen_e = set()
-                                for tpe, v in emails:
-                                    v = _norm_spaces(v).lower()
-                                    if not v or v in seen_e:
-                                        continue
-                                    seen_e.add(v)
-                                    try:
-                                        ContactEmail.objects.create(contact=c, type=tpe, value=v)
-                                    except Exception:
-                                        # если email невалиден — не роняем импорт
-                                        pass
-
-                    # кеш для дедупа
-                    if inn:
-                        company_by_inn[inn] = company
-                    company_by_name_addr[
-                        (_norm_name(company.name), _norm_name(company.address))
-                    ] = company
-
-                    # превью
-                    if result.preview_companies is not None and len(result.preview_companies) < max(
-                        20, limit_companies
-                    ):
-                        result.preview_companies.append(
-                            {
-                                "name": company.name,
-                                "inn": company.inn,
-                                "address": company.address,
-                                "status": status_name,
-                            }
-                        )
-
-                    if (
-                        companies_only
-                        and limit_companies
-                        and result.created_companies + result.updated_companies >= limit_companies
-                    ):
-                        # Быстрый выход: не читаем дальше файл
-                        break
-
-        if dry_run:
-            transaction.set_rollback(True)
-
-    _run()
+    chunk_size = max(1, int(chunk_size or CHUNK_SIZE))
+    started = time.monotonic()
+
+    checkpoint_key = None
+    if not dry_run:
+        options = (companies_only, limit_companies, import_notes, import_contacts, set_responsible)
+        checkpoint_key = CHECKPOINT_KEY.format(digest=_file_digest(csv_path, options))
+        state = cache.get(checkpoint_key) if resume else None
+        if state:
+            result.resumed_from_row = int(state.get("rows") or 0)
+            for name in _CHECKPOINT_COUNTERS:
+                setattr(result, name, int(state.get(name) or 0))
+
+    importer = _AmoImporter(
+        result=result,
+        dry_run=dry_run,
+        companies_only=companies_only,
+        limit_companies=limit_companies,
+        actor=actor,
+        import_notes=import_notes,
+        import_contacts=import_contacts,
+        set_responsible=set_responsible,
+        chunk_size=chunk_size,
+    )
+
+    def _flush(batch: list[_AmoCompanyRow], position: int) -> bool:
+        stop = importer.process_chunk(batch)
+        if checkpoint_key is not None:
+            state = {name: getattr(result, name) for name in _CHECKPOINT_COUNTERS}
+            cache.set(checkpoint_key, {"rows": position, **state}, CHECKPOINT_TTL)
+        result.seconds = time.monotonic() - started
+        if progress is not None:
+            progress(result)
+        return stop
+
+    with csv_path.open("r", encoding=encoding, newline="") as f:
+        reader = csv.DictReader(f)
+        if not reader.fieldnames:
+            raise ValueError("CSV has no header row")
+        position = result.resumed_from_row
+        # Строки уже записанных пачек только пропускаем (DictReader учитывает многострочные ячейки)
+        deque(islice(reader, position), maxlen=0)
+
+        batch: list[_AmoCompanyRow] = []
+        stop = False
+        for row in reader:
+            position += 1
+            result.rows_read += 1
+            if not _get(row, "ID"):
+                result.skipped_rows += 1
+                continue
+            is_company_row = "компан" in _get(row, "Тип").lower()
+            if not is_company_row:
+                continue
+            batch.append(_parse_company_row(row))
+            if len(batch) >= chunk_size:
+                stop = _flush(batch, position)
+                batch = []
+                if stop:
+                    break
+        if batch and not stop:
+            _flush(batch, position)
+
+    if checkpoint_key is not None:
+        cache.delete(checkpoint_key)
+        importer.finish()
+
+    result.seconds = time.monotonic() - started
+    result.peak_memory_mb = _peak_memory_mb()
+    logger.info(
+        "amo import %s: rows=%s created=%s updated=%s chunks=%s resumed_from=%s "
+        "%.0f rows/s peak_rss=%.1fMB dry_run=%s",
+        csv_path.name,
+        result.rows_read,
+        result.created_companies,
+        result.updated_companies,
+        result.chunks,
+        result.resumed_from_row,
+        result.rows_per_sec,
+        result.peak_memory_mb,
+        dry_run,
+    )
     return result
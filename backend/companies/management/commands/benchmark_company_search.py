@@ -0,0 +1,129 @@
+from __future__ import annotations
+
+import json
+from pathlib import Path
+
+from django.core.management.base import BaseCommand, CommandError
+
+from companies.models import Company
+from companies.search_benchmark import (
+    CORPUS_SIZES,
+    CORPUS_SOURCE,
+    build_query_log,
+    compare_top_k,
+    delete_corpus,
+    generate_corpus,
+    read_query_log,
+    run_benchmark,
+    save_top_k,
+)
+
+
+class Command(BaseCommand):
+    help = (
+        "Бенчмарк поиска компаний на синтетическом корпусе: p50/p95 по фазам "
+        "и стабильность top-k выдачи относительно снимка."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--size",
+            type=int,
+            default=CORPUS_SIZES[0],
+            help=f"Размер корпуса (типовые: {', '.join(map(str, CORPUS_SIZES))}).",
+        )
+        parser.add_argument("--seed", type=int, default=42, help="Seed генератора корпуса.")
+        parser.add_argument(
+            "--queries",
+            type=str,
+            default="",
+            help="Файл журнала запросов («запрос» или «тип<TAB>запрос» построчно).",
+        )
+        parser.add_argument(
+            "--query-count", type=int, default=200, help="Запросов в генерируемом журнале."
+        )
+        parser.add_argument("--top-k", type=int, default=10, help="Глубина сравнения выдачи.")
+        parser.add_argument("--snapshot", type=str, default="", help="Сохранить top-k в файл.")
+        parser.add_argument("--compare", type=str, default="", help="Сравнить top-k со снимком.")
+        parser.add_argument(
+            "--fail-on-diff",
+            action="store_true",
+            help="Код ошибки, если top-k разошёлся со снимком (для CI).",
+        )
+        parser.add_argument(
+            "--no-explain", action="store_true", help="Не замерять explain()/сниппеты."
+        )
+        parser.add_argument("--cleanup", action="store_true", help="Удалить корпус после прогона.")
+        parser.add_argument("--json", action="store_true", help="Вывести отчёт в JSON.")
+
+    def handle(self, *args, **options):
+        size = int(options["size"])
+        seed = int(options["seed"])
+        top_k = max(1, int(options["top_k"]))
+        if size <= 0:
+            raise CommandError("--size должен быть > 0.")
+
+        corpus = Company.objects.filter(raw_fields__source=CORPUS_SOURCE)
+        existing = corpus.count()
+        if existing and (existing != size or corpus.filter(raw_fields__seed=seed).count() != size):
+            self.stdout.write(f"Пересоздаём корпус (было {existing} компаний).")
+            delete_corpus()
+            existing = 0
+        if not existing:
+            self.stdout.write(f"Генерация корпуса: {size} компаний (seed={seed})…")
+            generate_corpus(size, seed=seed)
+
+        if options["queries"]:
+            try:
+                queries = read_query_log(options["queries"])
+            except OSError as exc:
+                raise CommandError(f"Не удалось прочитать --queries: {exc}")
+        else:
+            queries = build_query_log(size, seed=seed, count=int(options["query_count"]))
+
+        try:
+            report = run_benchmark(
+                queries,
+                qs=Company.objects.filter(raw_fields__source=CORPUS_SOURCE),
+                top_k=top_k,
+                size=size,
+                with_explain=not options["no_explain"],
+            )
+            diff = None
+            if options["compare"]:
+                try:
+                    baseline = json.loads(Path(options["compare"]).read_text(encoding="utf-8"))
+                except (OSError, ValueError) as exc:
+                    raise CommandError(f"Не удалось прочитать --compare: {exc}")
+                diff = compare_top_k(baseline, report.top_k)
+            if options["snapshot"]:
+                save_top_k(report, options["snapshot"])
+        finally:
+            if options["cleanup"]:
+                delete_corpus()
+
+        summary = report.summary()
+        if options["json"]:
+            payload = {"size": size, "seed": seed, "queries": report.queries, "phases": summary}
+            if diff is not None:
+                payload["top_k"] = diff
+            self.stdout.write(json.dumps(payload, ensure_ascii=False, indent=2))
+        else:
+            self.stdout.write(f"Корпус: {size}, запросов: {report.queries}")
+            for phase, row in summary.items():
+                self.stdout.write(
+                    f"  {phase:<11} n={row['count']:<5} "
+                    f"p50={row['p50_ms']:.2f} мс  p95={row['p95_ms']:.2f} мс"
+                )
+            if diff is not None:
+                self.stdout.write(
+                    f"top-{top_k}: сравнено {diff['compared']}, overlap={diff['overlap']:.3f}, "
+                    f"изменилось {len(diff['changed'])}, порядок {len(diff['order_changed'])}"
+                )
+                for q in diff["changed"][:20]:
+                    self.stdout.write(f"  ≠ {q}")
+
+        if options["fail_on_diff"] and diff is not None and diff["changed"]:
+            raise CommandError(
+                f"Выдача top-{top_k} изменилась для {len(diff['changed'])} запросов."
+            )
@@ -0,0 +1,77 @@
+"""
+Импорт компаний из CSV-выгрузки amoCRM (companies.importer.import_amo_csv).
+
+Для больших файлов: пишет пачками по --chunk-size строк компаний, печатает прогресс
+(строк/с) и пиковую память. Если импорт упал, повторный запуск с тем же файлом и
+опциями продолжит с первой незаписанной пачки (--no-resume — начать заново):
+  python manage.py import_amo_companies amo/base.csv --chunk-size 1000
+"""
+
+from __future__ import annotations
+
+from pathlib import Path
+
+from django.core.management.base import BaseCommand, CommandError
+
+from companies.importer import CHUNK_SIZE, import_amo_csv
+
+
+class Command(BaseCommand):
+    help = "Импорт компаний из CSV amoCRM пачками, с продолжением после сбоя."
+
+    def add_arguments(self, parser):
+        parser.add_argument("csv_path", help="Путь к CSV-выгрузке amoCRM.")
+        parser.add_argument("--encoding", default="utf-8-sig")
+        parser.add_argument(
+            "--chunk-size", type=int, default=CHUNK_SIZE, help="Строк компаний в пачке."
+        )
+        parser.add_argument(
+            "--limit", type=int, default=0, help="Остановиться после N компаний (0 — все)."
+        )
+        parser.add_argument("--dry-run", action="store_true", help="Только проверить, без записи.")
+        parser.add_argument("--no-resume", action="store_true", help="Игнорировать чекпоинт.")
+        parser.add_argument("--no-notes", action="store_true", help="Не создавать заметки.")
+        parser.add_argument("--no-contacts", action="store_true", help="Не создавать контакты.")
+        parser.add_argument(
+            "--no-responsible", action="store_true", help="Не назначать ответственных."
+        )
+
+    def handle(self, *args, **options):
+        csv_path = Path(options["csv_path"])
+        if not csv_path.is_file():
+            raise CommandError(f"Файл не найден: {csv_path}")
+        if options["chunk_size"] <= 0:
+            raise CommandError("--chunk-size должен быть > 0.")
+
+        def _progress(result):
+            self.stdout.write(
+                f"Пачка {result.chunks}: строк {result.resumed_from_row + result.rows_read}, "
+                f"добавлено {result.created_companies}, обновлено {result.updated_companies} "
+                f"({result.rows_per_sec:.0f} строк/с)"
+            )
+
+        result = import_amo_csv(
+            csv_path=csv_path,
+            encoding=options["encoding"],
+            dry_run=options["dry_run"],
+            limit_companies=max(0, options["limit"]),
+            import_notes=not options["no_notes"],
+            import_contacts=not options["no_contacts"],
+            set_responsible=not options["no_responsible"],
+            chunk_size=options["chunk_size"],
+            resume=not options["no_resume"],
+            progress=_progress,
+        )
+        if result.resumed_from_row:
+            self.stdout.write(f"Продолжено с чекпоинта: строка {result.resumed_from_row}")
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Готово{' (dry-run)' if options['dry_run'] else ''}: "
+                f"добавлено {result.created_companies}, обновлено {result.updated_companies}, "
+                f"строк компаний {result.company_rows}, пропущено {result.skipped_rows}"
+            )
+        )
+        self.stdout.write(
+            f"  {result.rows_read} строк за {result.seconds:.1f} с "
+            f"({result.rows_per_sec:.0f} строк/с), пик памяти {result.peak_memory_mb} МБ"
+        )
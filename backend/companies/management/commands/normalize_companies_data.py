@@ -17,13 +17,16 @@ from __future__ import annotations
 
 Сохраняем объект ТОЛЬКО если значение реально изменилось.
 После успешной нормализации (без необработанных исключений) дополнительно
-запускается rebuild_company_search_index (для PostgreSQL).
+перестраивается CompanySearchIndex (для PostgreSQL) — только для компаний,
+у которых что-то исправили: bulk_update не шлёт сигналов, а меток времени
+у телефонов/почт нет, так что инкрементальный --since их бы не увидел.
 """
 
 from typing import Any, Callable, Dict, Tuple
 
-from django.core.management import BaseCommand, call_command
+from django.core.management import BaseCommand
 from django.db import models
+from django.db.models import F
 
 from companies.models import (
     Company,
@@ -67,11 +70,14 @@ class Command(BaseCommand):
         self.stdout.write(f"normalize_companies_data: старт (batch_size={batch_size})")
 
         total_fixed: dict[str, int] = {}
+        touched: set = set()  # ID компаний с исправленными значениями
 
         # Телефоны
         fixed, scanned = self._normalize_queryset_field(
             qs=Company.objects.all(),
             field_name="phone",
+            owner_field="pk",
+            touched=touched,
             normalizer=normalize_phone,
             batch_size=batch_size,
         )
@@ -81,6 +87,8 @@ class Command(BaseCommand):
         fixed, scanned = self._normalize_queryset_field(
             qs=CompanyPhone.objects.all(),
             field_name="value",
+            owner_field="company_id",
+            touched=touched,
             normalizer=normalize_phone,
             batch_size=batch_size,
         )
@@ -90,6 +98,8 @@ class Command(BaseCommand):
         fixed, scanned = self._normalize_queryset_field(
             qs=ContactPhone.objects.all(),
             field_name="value",
+            owner_field="contact__company_id",
+            touched=touched,
             normalizer=normalize_phone,
             batch_size=batch_size,
         )
@@ -100,6 +110,8 @@ class Command(BaseCommand):
         fixed, scanned = self._normalize_queryset_field(
             qs=Company.objects.all(),
             field_name="email",
+            owner_field="pk",
+            touched=touched,
             normalizer=_normalize_email,
             batch_size=batch_size,
         )
@@ -109,6 +121,8 @@ class Command(BaseCommand):
         fixed, scanned = self._normalize_queryset_field(
             qs=CompanyEmail.objects.all(),
             field_name="value",
+            owner_field="company_id",
+            touched=touched,
             normalizer=_normalize_email,
             batch_size=batch_size,
         )
@@ -118,6 +132,8 @@ class Command(BaseCommand):
         fixed, scanned = self._normalize_queryset_field(
             qs=ContactEmail.objects.all(),
             field_name="value",
+            owner_field="contact__company_id",
+            touched=touched,
             normalizer=_normalize_email,
             batch_size=batch_size,
         )
@@ -135,11 +151,17 @@ class Command(BaseCommand):
         from django.db import connection
 
         if connection.vendor == "postgresql":
-            self.stdout.write("normalize_companies_data: запускаем rebuild_company_search_index...")
-            call_command("rebuild_company_search_index", chunk=batch_size)
+            from companies.search_index import bulk_rebuild_company_search_index
+
+            touched.discard(None)
+            self.stdout.write(
+                f"normalize_companies_data: переиндексация затронутых компаний ({len(touched)})..."
+            )
+            stats = bulk_rebuild_company_search_index(sorted(touched), chunk_size=batch_size)
             self.stdout.write(
                 self.style.SUCCESS(
-                    "normalize_companies_data: rebuild_company_search_index завершён."
+                    f"normalize_companies_data: индекс обновлён: {stats.rows} строк "
+                    f"({stats.rows_per_sec:.0f} строк/с)."
                 )
             )
         else:
@@ -155,9 +177,12 @@ class Command(BaseCommand):
         field_name: str,
         normalizer: Callable[[Any], Any],
         batch_size: int,
+        owner_field: str = "pk",
+        touched: set | None = None,
     ) -> tuple[int, int]:
         """
         Нормализует одно поле в queryset'е, сохраняя только реально изменившиеся записи.
+        ID компаний исправленных записей (owner_field) добавляются в touched.
 
         Возвращает (кол-во_исправленных, кол-во_просмотренных).
         """
@@ -169,7 +194,12 @@ class Command(BaseCommand):
         scanned_count = 0
         buffer: list[models.Model] = []
 
-        it = qs.only("pk", field_name).iterator(chunk_size=batch_size)
+        # contact__company_id нельзя передать в only() — тянем его аннотацией.
+        it = (
+            qs.only("pk", field_name)
+            .annotate(owner_company_id=F(owner_field))
+            .iterator(chunk_size=batch_size)
+        )
         for obj in it:
             scanned_count += 1
             old_value = getattr(obj, field_name)
@@ -178,6 +208,8 @@ class Command(BaseCommand):
                 continue
             setattr(obj, field_name, new_value)
             buffer.append(obj)
+            if touched is not None:
+                touched.add(obj.owner_company_id)
             if len(buffer) >= batch_size:
                 model.objects.bulk_update(buffer, [field_name])
                 updated_count += len(buffer)
@@ -0,0 +1,32 @@
+from __future__ import annotations
+
+from django.core.management.base import BaseCommand
+
+from companies.contact_keys import rebuild_company_contact_keys
+from companies.models import Company
+
+
+class Command(BaseCommand):
+    help = (
+        "Пересобрать CompanyContactKey (хвосты телефонов и домены почты) — "
+        "для autolink диалогов и проверки дублей."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--chunk", type=int, default=500, help="Размер чанка (по умолчанию 500)."
+        )
+
+    def handle(self, *args, **options):
+        chunk = int(options.get("chunk") or 500)
+        if chunk <= 0:
+            chunk = 500
+
+        ids = list(Company.objects.order_by("id").values_list("id", flat=True))
+        total = len(ids)
+        self.stdout.write(f"Компаний: {total}")
+        rows = 0
+        for start in range(0, total, chunk):
+            rows += rebuild_company_contact_keys(ids[start : start + chunk])
+            self.stdout.write(f"Готово: {min(start + chunk, total)}/{total}")
+        self.stdout.write(self.style.SUCCESS(f"Ключей записано: {rows}"))
@@ -1,12 +1,28 @@
 from __future__ import annotations
 
+from datetime import datetime, time
 from uuid import UUID
 
-from django.core.management.base import BaseCommand
-from django.db import connection, transaction
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
 
-from companies.models import Company, CompanySearchIndex
-from companies.search_index import build_company_index_payload
+from companies.models import Company
+from companies.search_index import bulk_rebuild_company_search_index, companies_changed_since
+
+
+def parse_since(value: str) -> datetime:
+    """ISO-дата или дата-время; без tz — в текущей таймзоне проекта."""
+    dt = parse_datetime(value)
+    if dt is None:
+        d = parse_date(value)
+        if d is None:
+            raise CommandError("Некорректный --since (ожидается YYYY-MM-DD или ISO datetime).")
+        dt = datetime.combine(d, time.min)
+    if timezone.is_naive(dt):
+        dt = timezone.make_aware(dt)
+    return dt
 
 
 class Command(BaseCommand):
@@ -19,6 +35,18 @@ class Command(BaseCommand):
         parser.add_argument(
             "--chunk", type=int, default=200, help="Размер чанка (по умолчанию 200)."
         )
+        parser.add_argument(
+            "--since",
+            type=str,
+            default="",
+            help="Только компании, изменённые с этого момента (YYYY-MM-DD или ISO datetime).",
+        )
+        parser.add_argument(
+            "--workers",
+            type=int,
+            default=0,
+            help="Процессов для построения payload'ов (0/1 — в текущем процессе).",
+        )
 
     def handle(self, *args, **options):
         if connection.vendor != "postgresql":
@@ -26,76 +54,37 @@ class Command(BaseCommand):
             return
 
         company_id_raw = (options.get("company_id") or "").strip()
+        since_raw = (options.get("since") or "").strip()
         chunk = int(options.get("chunk") or 200)
         if chunk <= 0:
             chunk = 200
+        workers = max(0, int(options.get("workers") or 0))
 
-        qs = Company.objects.all().order_by("id")
         if company_id_raw:
             try:
                 cid = UUID(company_id_raw)
             except Exception:
                 raise SystemExit("Некорректный --company-id (ожидается UUID).")
-            qs = qs.filter(id=cid)
+            ids = list(Company.objects.filter(id=cid).values_list("id", flat=True))
+        elif since_raw:
+            ids = companies_changed_since(parse_since(since_raw))
+        else:
+            ids = list(Company.objects.order_by("id").values_list("id", flat=True))
 
-        total = qs.order_by().count()
+        total = len(ids)
         self.stdout.write(f"Компаний к индексации: {total}")
 
-        idx = 0
-        ids_buffer: list[UUID] = []
-        for company_id in qs.values_list("id", flat=True).iterator(chunk_size=2000):
-            ids_buffer.append(company_id)
-            if len(ids_buffer) >= chunk:
-                idx += self._process_chunk(ids_buffer)
-                ids_buffer = []
-                self.stdout.write(f"Готово: {idx}/{total}")
+        def _progress(stats):
+            self.stdout.write(
+                f"Готово: {stats.rows + stats.deleted}/{total} ({stats.rows_per_sec:.0f} строк/с)"
+            )
 
-        if ids_buffer:
-            idx += self._process_chunk(ids_buffer)
-            self.stdout.write(f"Готово: {idx}/{total}")
-
-        self.stdout.write(self.style.SUCCESS("OK"))
-
-    def _process_chunk(self, ids: list[UUID]) -> int:
-        companies = Company.objects.filter(id__in=ids).prefetch_related(
-            "phones",
-            "emails",
-            "contacts__phones",
-            "contacts__emails",
-            "notes",
-            "tasks",
+        stats = bulk_rebuild_company_search_index(
+            ids, chunk_size=chunk, workers=workers, progress=_progress
+        )
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"OK: {stats.rows} строк за {stats.seconds:.1f} с "
+                f"({stats.rows_per_sec:.0f} строк/с), удалено {stats.deleted}"
+            )
         )
-        companies_by_id = {c.id: c for c in companies}
-
-        with transaction.atomic():
-            for cid in ids:
-                c = companies_by_id.get(cid)
-                if not c:
-                    CompanySearchIndex.objects.filter(company_id=cid).delete()
-                    continue
-                payload = build_company_index_payload(c)
-                obj, _ = CompanySearchIndex.objects.get_or_create(company=c)
-                obj.t_ident = payload["t_ident"]
-                obj.t_name = payload["t_name"]
-                obj.t_contacts = payload["t_contacts"]
-                obj.t_other = payload["t_other"]
-                obj.plain_text = payload["plain_text"]
-                obj.digits = payload["digits"]
-                obj.normalized_phones = payload.get("normalized_phones", [])
-                obj.normalized_emails = payload.get("normalized_emails", [])
-                obj.normalized_inns = payload.get("normalized_inns", [])
-                obj.save(
-                    update_fields=[
-                        "t_ident",
-                        "t_name",
-                        "t_contacts",
-                        "t_other",
-                        "plain_text",
-                        "digits",
-                        "normalized_phones",
-                        "normalized_emails",
-                        "normalized_inns",
-                    ]
-                )
-
-        return len(ids)
@@ -0,0 +1,25 @@
+"""CompanySearchIndexDirty: очередь перестройки поискового индекса.
+
+Сигналы помечают компанию, Celery-задача drain_search_index_queue
+перестраивает индекс пачками с debounce (companies/search_index_queue.py).
+"""
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("companies", "0054_contract_type_amount_thresholds"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="CompanySearchIndexDirty",
+            fields=[
+                ("company_id", models.UUIDField(primary_key=True, serialize=False)),
+                ("marked_at", models.DateTimeField(db_index=True)),
+                ("first_marked_at", models.DateTimeField(db_index=True)),
+            ],
+        ),
+    ]
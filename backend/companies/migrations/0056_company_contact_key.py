@@ -0,0 +1,93 @@
+"""CompanyContactKey: перевёрнутые цифры телефонов и домены почты компаний.
+
+Точечный (индексный) поиск для messenger autolink и проверки дублей вместо
+endswith по JOIN'ам. Заполняется drain_search_index_queue; существующие компании
+заполняются здесь же пачками (autolink и дубли читают таблицу сразу после деплоя).
+Ручная пересборка — manage.py rebuild_company_contact_keys.
+"""
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+BACKFILL_CHUNK = 500
+
+
+def backfill_contact_keys(apps, schema_editor):
+    """Ключи всех существующих компаний — тем же build_company_contact_keys, что и drain."""
+    from companies.contact_keys import KEYS_PREFETCH, build_company_contact_keys
+
+    Company = apps.get_model("companies", "Company")
+    CompanyContactKey = apps.get_model("companies", "CompanyContactKey")
+
+    ids = list(Company.objects.order_by("id").values_list("id", flat=True))
+    for start in range(0, len(ids), BACKFILL_CHUNK):
+        companies = Company.objects.filter(
+            id__in=ids[start : start + BACKFILL_CHUNK]
+        ).prefetch_related(*KEYS_PREFETCH)
+        CompanyContactKey.objects.bulk_create(
+            [
+                CompanyContactKey(company_id=company.id, kind=kind, value=value)
+                for company in companies
+                for kind, value in sorted(build_company_contact_keys(company))
+            ],
+            batch_size=1000,
+            ignore_conflicts=True,
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("companies", "0055_company_search_index_dirty"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="CompanyContactKey",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True, primary_key=True, serialize=False, verbose_name="ID"
+                    ),
+                ),
+                (
+                    "kind",
+                    models.CharField(
+                        choices=[
+                            ("phone", "Телефон (цифры в обратном порядке)"),
+                            ("email_domain", "Домен почты"),
+                        ],
+                        max_length=16,
+                        verbose_name="Тип",
+                    ),
+                ),
+                ("value", models.CharField(max_length=255, verbose_name="Значение")),
+                (
+                    "company",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="contact_keys",
+                        to="companies.company",
+                        verbose_name="Компания",
+                    ),
+                ),
+            ],
+            options={
+                "indexes": [
+                    models.Index(
+                        fields=["kind", "value"],
+                        name="cmp_ckey_kind_value_idx",
+                        opclasses=["varchar_pattern_ops", "varchar_pattern_ops"],
+                    )
+                ],
+                "constraints": [
+                    models.UniqueConstraint(
+                        fields=("kind", "value", "company"),
+                        name="cmp_ckey_kind_value_company_uniq",
+                    )
+                ],
+            },
+        ),
+        migrations.RunPython(backfill_contact_keys, migrations.RunPython.noop),
+    ]
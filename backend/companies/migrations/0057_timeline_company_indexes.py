@@ -0,0 +1,32 @@
+"""Индексы (company, дата) для ленты карточки компании.
+
+Лента читается keyset-выборками по каждому источнику (заметки, заявки на
+удаление и решения по ним) — каждой нужен индекс по компании и своей дате.
+"""
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0017_w2_admin_totp'),
+        ('companies', '0056_company_contact_key'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='companydeletionrequest',
+            index=models.Index(fields=['company', 'created_at'], name='cmp_delreq_company_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='companydeletionrequest',
+            index=models.Index(fields=['company', 'decided_at'], name='cmp_delreq_company_decided_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='companynote',
+            index=models.Index(fields=['company', 'created_at'], name='cmp_note_company_created_idx'),
+        ),
+    ]
@@ -315,6 +315,16 @@ class Company(models.Model):
 
         save() здесь - это "последняя линия обороны", а не единственный путь нормализации.
         """
+        self.normalize_fields()
+        super().save(*args, **kwargs)
+
+    def normalize_fields(self) -> None:
+        """
+        Нормализация полей, которую применяет save().
+
+        Вынесена отдельно для массовой записи (bulk_create/bulk_update в импорте amoCRM):
+        такие операции save() не вызывают, поэтому вызывают нормализацию сами.
+        """
         # Подразделение компании = подразделению ответственного, если у ответственного задано подразделение.
         # Не только при пустом branch: исправляем и ошибочные (подразделение не ответственного).
         if self.responsible_id is not None:
@@ -358,7 +368,6 @@ class Company(models.Model):
             normalized = normalize_work_schedule(self.work_schedule)
             # TextField не имеет ограничения по длине в БД, но обрезаем до разумного лимита (5000 символов)
             self.work_schedule = normalized[:5000] if normalized else ""
-        super().save(*args, **kwargs)
 
     def __str__(self) -> str:
         return self.name
@@ -417,6 +426,12 @@ class CompanyNote(models.Model):
         "Внешний UID", max_length=120, blank=True, default="", db_index=True
     )
 
+    class Meta:
+        indexes = [
+            # Лента карточки: keyset-выборка заметок компании по дате
+            models.Index(fields=["company", "created_at"], name="cmp_note_company_created_idx"),
+        ]
+
     def __str__(self) -> str:
         return f"Note({self.company_id})"
 
@@ -826,6 +841,9 @@ class CompanyDeletionRequest(models.Model):
         indexes = [
             models.Index(fields=["company_id_snapshot", "status"]),
             models.Index(fields=["status", "created_at"]),
+            # Лента карточки: заявки и решения по ним
+            models.Index(fields=["company", "created_at"], name="cmp_delreq_company_created_idx"),
+            models.Index(fields=["company", "decided_at"], name="cmp_delreq_company_decided_idx"),
         ]
 
     def __str__(self) -> str:
@@ -910,6 +928,74 @@ class CompanySearchIndex(models.Model):
         ]
 
 
+class CompanySearchIndexDirty(models.Model):
+    """
+    Очередь «грязных» компаний для CompanySearchIndex.
+
+    Сигналы (companies/signals.py) только помечают компанию — в той же транзакции,
+    что и само изменение. Перестраивает индекс Celery-задача
+    companies.tasks.drain_search_index_queue пачками, с debounce:
+    десять правок карточки за пару секунд → одна перестройка.
+
+    FK на Company нет намеренно: метка удалённой компании просто дочищает её индекс.
+    """
+
+    company_id = models.UUIDField(primary_key=True)
+    # Последняя пометка — для debounce (ждём тишины).
+    marked_at = models.DateTimeField(db_index=True)
+    # Первая пометка с момента последней перестройки — для лага и защиты от «вечного» debounce.
+    first_marked_at = models.DateTimeField(db_index=True)
+
+    def __str__(self) -> str:
+        return f"CompanySearchIndexDirty({self.company_id})"
+
+
+class CompanyContactKey(models.Model):
+    """
+    Таблица точечного поиска компании по телефону/домену почты.
+
+    Раньше messenger autolink и проверка дублей искали хвост телефона и домен
+    через endswith/iendswith по JOIN'ам Company/CompanyPhone/ContactPhone/... —
+    B-tree индексы при этом не работают, и каждый новый диалог сканировал таблицы.
+
+    Здесь на каждую компанию хранятся:
+    - phone: цифры нормализованного номера в обратном порядке — поиск по хвосту
+      превращается в префиксный (value LIKE 'хвост%'), который идёт по индексу;
+    - email_domain: домен корпоративной почты (публичные домены не храним).
+
+    Строки пересобираются тем же путём, что и CompanySearchIndex (сигналы →
+    CompanySearchIndexDirty → drain_search_index_queue), см. companies/contact_keys.py.
+    """
+
+    class Kind(models.TextChoices):
+        PHONE = "phone", "Телефон (цифры в обратном порядке)"
+        EMAIL_DOMAIN = "email_domain", "Домен почты"
+
+    company = models.ForeignKey(
+        Company, verbose_name="Компания", on_delete=models.CASCADE, related_name="contact_keys"
+    )
+    kind = models.CharField("Тип", max_length=16, choices=Kind.choices)
+    value = models.CharField("Значение", max_length=255)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["kind", "value", "company"], name="cmp_ckey_kind_value_company_uniq"
+            ),
+        ]
+        indexes = [
+            # pattern_ops — чтобы LIKE 'префикс%' (хвост телефона) шёл по B-tree в любой локали.
+            models.Index(
+                fields=["kind", "value"],
+                name="cmp_ckey_kind_value_idx",
+                opclasses=["varchar_pattern_ops", "varchar_pattern_ops"],
+            ),
+        ]
+
+    def __str__(self) -> str:
+        return f"{self.kind}:{self.value} → {self.company_id}"
+
+
 class CompanyHistoryEvent(models.Model):
     """
     История передвижений карточки компании.
@@ -0,0 +1,382 @@
+"""
+Бенчмарк и регрессия релевантности поиска компаний (CompanySearchService).
+
+- generate_corpus() — детерминированный (по seed) синтетический корпус:
+  компании с ОПФ, ИНН, адресами, телефонами, email, контактами и заметками;
+- build_query_log() — журнал запросов по корпусу (ИНН, хвосты телефонов,
+  названия с ОПФ, адреса, ФИО, email), read_query_log() — свой журнал из файла;
+- run_benchmark() — прогон журнала: p50/p95 по фазам поиска (exact, phase15,
+  fts, similarity, explain) и top-k выдача по каждому запросу;
+- compare_top_k() — сравнение top-k со снимком (стабильность выдачи между версиями).
+
+Корпус помечается raw_fields["source"] = CORPUS_SOURCE и удаляется delete_corpus().
+Используется командой benchmark_company_search.
+"""
+
+from __future__ import annotations
+
+import json
+import math
+import random
+import time
+import uuid
+from dataclasses import dataclass, field
+from itertools import islice
+from pathlib import Path
+
+from django.db import connection, transaction
+
+from companies.models import (
+    Company,
+    CompanyEmail,
+    CompanyNote,
+    CompanyPhone,
+    Contact,
+    ContactEmail,
+    ContactPhone,
+)
+
+CORPUS_SOURCE = "search_benchmark"
+CORPUS_SIZES = (10_000, 50_000, 200_000)
+INSERT_BATCH_SIZE = 2000
+
+# Порядок фаз в отчёте; "total" — apply() + материализация первой страницы.
+PHASES = ("exact", "phase15", "fts", "similarity", "explain", "total")
+
+_OPF = ("ООО", "АО", "ПАО", "ИП", "ЗАО", "МУП", "ГБУ", "ФГУП")
+_NAME_ROOTS = (
+    "Ромашка",
+    "Вектор",
+    "Альянс",
+    "Гранит",
+    "Сибирь",
+    "Техносфера",
+    "Янтарь",
+    "Меридиан",
+    "Прогресс",
+    "Северсталь",
+    "Стройресурс",
+    "Энергия",
+    "Горизонт",
+    "Лидер",
+    "Профиль",
+    "Магистраль",
+    "Кристалл",
+    "Фортуна",
+    "Импульс",
+    "Омега",
+)
+_NAME_SUFFIXES = ("", "", "Плюс", "Групп", "Сервис", "Трейд", "Строй", "Урал", "Логистик")
+_CITIES = (
+    "Москва",
+    "Санкт-Петербург",
+    "Екатеринбург",
+    "Новосибирск",
+    "Казань",
+    "Тюмень",
+    "Пермь",
+    "Самара",
+    "Краснодар",
+    "Омск",
+)
+_STREETS = ("Ленина", "Мира", "Советская", "Гагарина", "Садовая", "Лесная", "Заводская")
+_FIRST_NAMES = ("Иван", "Пётр", "Анна", "Мария", "Сергей", "Ольга", "Дмитрий", "Елена")
+_LAST_NAMES = ("Иванов", "Петров", "Сидоров", "Смирнов", "Кузнецов", "Попов", "Соколов")
+_POSITIONS = ("Директор", "Главный бухгалтер", "Менеджер по закупкам", "Инженер")
+_NOTE_TEXTS = (
+    "Звонили, просили перезвонить после обеда",
+    "Отправили коммерческое предложение",
+    "Договор на согласовании у юристов",
+    "Интересуются обучением по охране труда",
+)
+_EMAIL_DOMAINS = ("mail.ru", "yandex.ru", "gmail.com", "bk.ru", "inbox.ru")
+
+
+@dataclass(frozen=True)
+class QueryCase:
+    kind: str
+    q: str
+
+
+@dataclass
+class BenchmarkReport:
+    size: int
+    queries: int
+    timings: dict[str, list[float]] = field(default_factory=dict)
+    top_k: dict[str, list[str]] = field(default_factory=dict)
+
+    def summary(self) -> dict[str, dict[str, float]]:
+        """{фаза: {count, p50_ms, p95_ms}} в порядке PHASES."""
+        out: dict[str, dict[str, float]] = {}
+        for phase in PHASES:
+            values = self.timings.get(phase) or []
+            if not values:
+                continue
+            out[phase] = {
+                "count": len(values),
+                "p50_ms": round(percentile(values, 50) * 1000, 3),
+                "p95_ms": round(percentile(values, 95) * 1000, 3),
+            }
+        return out
+
+
+def percentile(values, pct: float) -> float:
+    """Перцентиль по методу ближайшего ранга (как в отчётах нагрузочных тестов)."""
+    ordered = sorted(values)
+    if not ordered:
+        return 0.0
+    rank = max(1, math.ceil(pct / 100 * len(ordered)))
+    return ordered[min(rank, len(ordered)) - 1]
+
+
+def _uuid(rng: random.Random) -> uuid.UUID:
+    return uuid.UUID(int=rng.getrandbits(128), version=4)
+
+
+def _phone(rng: random.Random) -> str:
+    return "+79" + "".join(str(rng.randrange(10)) for _ in range(9))
+
+
+def _company_name(rng: random.Random) -> tuple[str, str]:
+    root = rng.choice(_NAME_ROOTS)
+    suffix = rng.choice(_NAME_SUFFIXES)
+    base = f"{root}-{suffix}" if suffix else root
+    return rng.choice(_OPF), base
+
+
+_TRANSLIT = dict(
+    zip(
+        "абвгдеёжзийклмнопрстуфхцчшщъыьэюя",
+        "a b v g d e e zh z i i k l m n o p r s t u f h c ch sh sch _ y _ e yu ya".split(),
+        strict=True,
+    )
+)
+
+
+def _translit(value: str) -> str:
+    out = "".join(_TRANSLIT.get(ch, ch) for ch in value.lower()).replace("_", "")
+    return "".join(ch for ch in out if ch.isascii() and ch.isalnum())
+
+
+def iter_corpus_rows(size: int, seed: int):
+    """
+    Детерминированные строки корпуса: по одному dict на компанию.
+    Одинаковые (size, seed) дают одинаковые id и значения на любой машине.
+    """
+    rng = random.Random(seed)
+    for i in range(size):
+        opf, base = _company_name(rng)
+        city = rng.choice(_CITIES)
+        inn = str(rng.randrange(10**9, 10**10))
+        contacts = []
+        for _ in range(rng.randint(0, 2)):
+            contacts.append(
+                {
+                    "id": _uuid(rng),
+                    "first_name": rng.choice(_FIRST_NAMES),
+                    "last_name": rng.choice(_LAST_NAMES),
+                    "position": rng.choice(_POSITIONS),
+                    "phones": [_phone(rng) for _ in range(rng.randint(0, 2))],
+                    "emails": [f"c{i}.{rng.randrange(1000)}@{rng.choice(_EMAIL_DOMAINS)}"],
+                }
+            )
+        yield {
+            "id": _uuid(rng),
+            "name": f"{opf} «{base}»",
+            "name_base": base,
+            "opf": opf,
+            "legal_name": f"{opf} {base} {city}",
+            "inn": inn,
+            "address": f"г. {city}, ул. {rng.choice(_STREETS)}, д. {rng.randint(1, 150)}",
+            "phones": [_phone(rng) for _ in range(rng.randint(1, 3))],
+            "emails": [f"info{i}@{_translit(base) or 'firm'}.ru"],
+            "contacts": contacts,
+            "notes": [rng.choice(_NOTE_TEXTS) for _ in range(rng.randint(0, 2))],
+        }
+
+
+def generate_corpus(
+    size: int, *, seed: int = 42, batch_size: int = INSERT_BATCH_SIZE, build_index: bool = True
+) -> int:
+    """
+    Залить корпус пачками bulk_create и (на PostgreSQL) построить CompanySearchIndex.
+    Возвращает число созданных компаний. Существующий корпус не трогает — см. delete_corpus().
+    """
+    raw = {"source": CORPUS_SOURCE, "seed": seed}
+    created = 0
+    company_ids = []
+    rows = iter_corpus_rows(size, seed)
+    while True:
+        batch = list(islice(rows, batch_size))
+        if not batch:
+            break
+        companies, phones, emails, contacts, cphones, cemails, notes = [], [], [], [], [], [], []
+        for row in batch:
+            companies.append(
+                Company(
+                    id=row["id"],
+                    name=row["name"],
+                    legal_name=row["legal_name"],
+                    inn=row["inn"],
+                    address=row["address"],
+                    phone=row["phones"][0],
+                    email=row["emails"][0],
+                    raw_fields=raw,
+                )
+            )
+            for order, value in enumerate(row["phones"][1:]):
+                phones.append(CompanyPhone(company_id=row["id"], value=value, order=order))
+            for order, value in enumerate(row["emails"][1:]):
+                emails.append(CompanyEmail(company_id=row["id"], value=value, order=order))
+            for c in row["contacts"]:
+                contacts.append(
+                    Contact(
+                        id=c["id"],
+                        company_id=row["id"],
+                        first_name=c["first_name"],
+                        last_name=c["last_name"],
+                        position=c["position"],
+                        raw_fields=raw,
+                    )
+                )
+                cphones.extend(ContactPhone(contact_id=c["id"], value=v) for v in c["phones"])
+                cemails.extend(ContactEmail(contact_id=c["id"], value=v) for v in c["emails"])
+            notes.extend(CompanyNote(company_id=row["id"], text=t) for t in row["notes"])
+        with transaction.atomic():
+            Company.objects.bulk_create(companies)
+            CompanyPhone.objects.bulk_create(phones)
+            CompanyEmail.objects.bulk_create(emails)
+            Contact.objects.bulk_create(contacts)
+            ContactPhone.objects.bulk_create(cphones)
+            ContactEmail.objects.bulk_create(cemails)
+            CompanyNote.objects.bulk_create(notes)
+        company_ids.extend(row["id"] for row in batch)
+        created += len(batch)
+
+    if build_index and connection.vendor == "postgresql":
+        from companies.search_index import bulk_rebuild_company_search_index
+
+        bulk_rebuild_company_search_index(company_ids)
+    return created
+
+
+def delete_corpus() -> int:
+    """Удалить синтетический корпус (компании + осиротевшие контакты)."""
+    Contact.objects.filter(raw_fields__source=CORPUS_SOURCE).delete()
+    deleted, _ = Company.objects.filter(raw_fields__source=CORPUS_SOURCE).delete()
+    return deleted
+
+
+def build_query_log(size: int, *, seed: int = 42, count: int = 200) -> list[QueryCase]:
+    """
+    Журнал запросов по корпусу (size, seed): типовые запросы менеджеров —
+    ИНН, фрагменты и полные телефоны, названия с ОПФ и без, адреса, ФИО, email.
+    """
+    rng = random.Random(seed ^ 0x5EA)
+    picks = sorted(rng.sample(range(size), min(count, size)))
+    wanted = dict.fromkeys(picks)
+    for i, row in enumerate(iter_corpus_rows(max(picks) + 1 if picks else 0, seed)):
+        if i in wanted:
+            wanted[i] = row
+
+    kinds = ("inn", "phone_tail", "phone", "name_opf", "name", "address", "person", "email")
+    cases: list[QueryCase] = []
+    for n, row in enumerate(wanted.values()):
+        kind = kinds[n % len(kinds)]
+        if kind == "inn":
+            q = row["inn"]
+        elif kind == "phone_tail":
+            q = row["phones"][0][-rng.choice((4, 6, 7)) :]
+        elif kind == "phone":
+            digits = row["phones"][0][1:]
+            q = f"8 ({digits[1:4]}) {digits[4:7]}-{digits[7:9]}-{digits[9:]}"
+        elif kind == "name_opf":
+            q = f"{row['opf']} {row['name_base']}"
+        elif kind == "name":
+            q = row["name_base"].split("-")[0].lower()
+        elif kind == "address":
+            q = row["address"].split(", ", 1)[1]
+        elif kind == "person" and row["contacts"]:
+            c = row["contacts"][0]
+            q = f"{c['last_name']} {c['first_name']}"
+        elif kind == "email":
+            q = row["emails"][0]
+        else:
+            kind, q = "name_opf", f"{row['opf']} {row['name_base']}"
+        cases.append(QueryCase(kind=kind, q=q))
+    return cases
+
+
+def read_query_log(path: str | Path) -> list[QueryCase]:
+    """Журнал из файла: строка «запрос» или «тип<TAB>запрос»; пустые и #-строки пропускаются."""
+    cases = []
+    for line in Path(path).read_text(encoding="utf-8").splitlines():
+        line = line.strip()
+        if not line or line.startswith("#"):
+            continue
+        kind, sep, q = line.partition("\t")
+        cases.append(QueryCase(kind=kind, q=q) if sep else QueryCase(kind="custom", q=kind))
+    return cases
+
+
+def run_benchmark(
+    queries: list[QueryCase],
+    *,
+    qs=None,
+    top_k: int = 10,
+    size: int = 0,
+    with_explain: bool = True,
+) -> BenchmarkReport:
+    """
+    Прогнать журнал через CompanySearchService (кэш выдачи отключается на время замера).
+    Фазы exact/phase15/fts/similarity пишет сам сервис, explain и total — здесь.
+    """
+    from companies.search_service import CompanySearchService
+
+    report = BenchmarkReport(size=size, queries=len(queries))
+    service = CompanySearchService(phase_timings=report.timings)
+    base_qs = qs if qs is not None else Company.objects.all()
+    for case in queries:
+        started = time.perf_counter()
+        page = list(service.apply(qs=base_qs, query=case.q)[:top_k])
+        report.timings.setdefault("total", []).append(time.perf_counter() - started)
+        report.top_k[case.q] = [str(c.id) for c in page]
+        if with_explain and page:
+            started = time.perf_counter()
+            service.explain(companies=page, query=case.q)
+            report.timings.setdefault("explain", []).append(time.perf_counter() - started)
+    return report
+
+
+def save_top_k(report: BenchmarkReport, path: str | Path) -> None:
+    Path(path).write_text(
+        json.dumps(report.top_k, ensure_ascii=False, indent=2, sort_keys=True), encoding="utf-8"
+    )
+
+
+def compare_top_k(
+    baseline: dict[str, list[str]], current: dict[str, list[str]]
+) -> dict[str, object]:
+    """
+    Стабильность top-k относительно снимка.
+
+    overlap — средняя доля общих id (порядок не важен), order_changed — запросы
+    с тем же набором, но другим порядком, changed — запросы, где набор разошёлся.
+    Запросы, которых нет в обоих журналах, не сравниваются.
+    """
+    common = [q for q in current if q in baseline]
+    overlaps, changed, order_changed = [], [], []
+    for q in common:
+        old, new = baseline[q], current[q]
+        denom = max(len(old), len(new))
+        overlaps.append(len(set(old) & set(new)) / denom if denom else 1.0)
+        if set(old) != set(new):
+            changed.append(q)
+        elif old != new:
+            order_changed.append(q)
+    return {
+        "compared": len(common),
+        "overlap": round(sum(overlaps) / len(overlaps), 4) if overlaps else 1.0,
+        "changed": changed,
+        "order_changed": order_changed,
+    }
@@ -2,11 +2,14 @@ from __future__ import annotations
 
 import json
 import re
+import time
 from dataclasses import dataclass
 from typing import Iterable
 from uuid import UUID
 
+from django.core.cache import cache
 from django.db import connection, transaction
+from django.db.models import Q
 from django.utils import timezone
 
 from companies.models import (
@@ -554,6 +557,203 @@ def build_company_index_payload(company: Company) -> dict[str, str | list[str]]:
     }
 
 
+# Поколение поисковых данных: кэш выдачи CompanySearchService (search_service.py)
+# включает его в ключ. Сдвигается, когда переписываются строки индекса (upsert/удаление),
+# а не на каждую правку карточки — правки копятся в очереди и попадают в выдачу со сливом.
+SEARCH_GENERATION_CACHE_KEY = "companies:search:generation"
+
+
+def get_search_generation() -> int:
+    generation = cache.get(SEARCH_GENERATION_CACHE_KEY)
+    if generation is None:
+        # Сид от времени: после потери ключа не совпадём с поколением старых записей кэша.
+        cache.add(SEARCH_GENERATION_CACHE_KEY, time.time_ns(), None)
+        generation = cache.get(SEARCH_GENERATION_CACHE_KEY) or 0
+    return generation
+
+
+def bump_search_generation() -> None:
+    try:
+        cache.incr(SEARCH_GENERATION_CACHE_KEY)
+    except ValueError:
+        cache.set(SEARCH_GENERATION_CACHE_KEY, time.time_ns(), None)
+    except Exception:
+        # Кэш недоступен — кэш выдачи тоже, инвалидировать нечего.
+        pass
+
+
+# Поля CompanySearchIndex, которые пишет индексатор (vector_* заполняет БД-триггер).
+INDEX_PAYLOAD_FIELDS = (
+    "t_ident",
+    "t_name",
+    "t_contacts",
+    "t_other",
+    "plain_text",
+    "digits",
+    "normalized_phones",
+    "normalized_emails",
+    "normalized_inns",
+)
+
+# Связи, которые читает build_company_index_payload (иначе N+1 на каждую компанию).
+INDEX_PREFETCH = (
+    "phones",
+    "emails",
+    "contacts__phones",
+    "contacts__emails",
+    "notes",
+    "tasks",
+)
+
+
+def build_index_payloads(company_ids: Iterable[UUID]) -> list[tuple[UUID, dict]]:
+    """
+    Payload'ы для пачки компаний: 7 запросов на пачку (компании + prefetch), не на компанию.
+    Удалённых компаний в результате нет — их индекс удаляет вызывающий код.
+    """
+    companies = Company.objects.filter(id__in=list(company_ids)).prefetch_related(*INDEX_PREFETCH)
+    return [(c.id, build_company_index_payload(c)) for c in companies]
+
+
+def upsert_index_payloads(payloads: list[tuple[UUID, dict]]) -> int:
+    """
+    Записывает payload'ы одним многострочным INSERT ... ON CONFLICT (company_id) DO UPDATE.
+    Триггер tsvector срабатывает и на INSERT, и на UPDATE — вектора остаются консистентны.
+    """
+    if not payloads:
+        return 0
+    now = timezone.now()
+    rows = [
+        CompanySearchIndex(
+            company_id=company_id,
+            updated_at=now,
+            **{
+                f: payload.get(f, [] if f.startswith("normalized_") else "")
+                for f in INDEX_PAYLOAD_FIELDS
+            },
+        )
+        for company_id, payload in payloads
+    ]
+    CompanySearchIndex.objects.bulk_create(
+        rows,
+        update_conflicts=True,
+        unique_fields=["company"],
+        update_fields=[*INDEX_PAYLOAD_FIELDS, "updated_at"],
+    )
+    bump_search_generation()
+    return len(rows)
+
+
+def companies_changed_since(since) -> list[UUID]:
+    """
+    ID компаний, чей индекс мог устареть с момента since.
+
+    Company.updated_at + метки связанных строк (контакты, заметки, задачи) и компании
+    без строки индекса. Телефоны/почты своих меток не имеют — они переиндексируются
+    сигналами сразу при сохранении (companies/signals.py).
+    Отдельные запросы по таблицам вместо OR по JOIN'ам — без размножения строк.
+    """
+    ids: set[UUID] = set(Company.objects.filter(updated_at__gte=since).values_list("id", flat=True))
+    ids.update(Company.objects.filter(search_index__isnull=True).values_list("id", flat=True))
+    related = (
+        Contact.objects.filter(updated_at__gte=since),
+        CompanyNote.objects.filter(Q(created_at__gte=since) | Q(edited_at__gte=since)),
+        Task.objects.filter(updated_at__gte=since),
+    )
+    for qs in related:
+        ids.update(qs.filter(company_id__isnull=False).values_list("company_id", flat=True))
+    return sorted(ids)
+
+
+@dataclass
+class BulkReindexStats:
+    rows: int = 0
+    deleted: int = 0
+    seconds: float = 0.0
+
+    @property
+    def rows_per_sec(self) -> float:
+        return self.rows / self.seconds if self.seconds > 0 else 0.0
+
+
+def _init_index_worker() -> None:
+    """Инициализация процесса пула: Django (для spawn/forkserver) без унаследованных соединений."""
+    import django
+    from django.db import connections
+
+    django.setup()
+    connections.close_all()
+
+
+def _chunked(items: Iterable[UUID], size: int) -> Iterable[list[UUID]]:
+    chunk: list[UUID] = []
+    for item in items:
+        chunk.append(item)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def bulk_rebuild_company_search_index(
+    company_ids: Iterable[UUID],
+    *,
+    chunk_size: int = 500,
+    workers: int = 0,
+    progress=None,
+) -> BulkReindexStats:
+    """
+    Пакетная перестройка индекса: payload'ы строятся пачками (опционально в пуле процессов),
+    запись — одним upsert'ом на пачку в своей транзакции.
+
+    progress(stats) вызывается после каждой пачки (для вывода в management command).
+    """
+    stats = BulkReindexStats()
+    if connection.vendor != "postgresql":
+        return stats
+
+    started = time.monotonic()
+    chunks = _chunked(company_ids, max(1, chunk_size))
+
+    def _write(ids: list[UUID], payloads: list[tuple[UUID, dict]]) -> None:
+        found = {company_id for company_id, _ in payloads}
+        missing = [company_id for company_id in ids if company_id not in found]
+        with transaction.atomic():
+            stats.rows += upsert_index_payloads(payloads)
+            if missing:
+                stats.deleted += CompanySearchIndex.objects.filter(company_id__in=missing).delete()[
+                    0
+                ]
+        stats.seconds = time.monotonic() - started
+        if progress is not None:
+            progress(stats)
+
+    if workers and workers > 1:
+        from concurrent.futures import ProcessPoolExecutor
+
+        from django.db import connections
+
+        # Дочерние процессы откроют свои соединения; унаследованный сокет не делим.
+        connections.close_all()
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_index_worker) as pool:
+            pending = []
+            for ids in chunks:
+                pending.append((ids, pool.submit(build_index_payloads, ids)))
+                # Ограничиваем число пачек «в полёте», чтобы не держать весь индекс в памяти.
+                if len(pending) >= workers * 2:
+                    ids_done, future = pending.pop(0)
+                    _write(ids_done, future.result())
+            for ids_done, future in pending:
+                _write(ids_done, future.result())
+    else:
+        for ids in chunks:
+            _write(ids, build_index_payloads(ids))
+
+    stats.seconds = time.monotonic() - started
+    return stats
+
+
 def rebuild_company_search_index(company_id: UUID) -> None:
     """
     Перестраивает индекс для одной компании.
@@ -562,48 +762,8 @@ def rebuild_company_search_index(company_id: UUID) -> None:
     if connection.vendor != "postgresql":
         return
 
-    company = (
-        Company.objects.filter(id=company_id)
-        .prefetch_related(
-            "phones",
-            "emails",
-            "contacts__phones",
-            "contacts__emails",
-            "notes",
-            "tasks",
-        )
-        .first()
-    )
-    if not company:
+    payloads = build_index_payloads([company_id])
+    if not payloads:
         CompanySearchIndex.objects.filter(company_id=company_id).delete()
         return
-
-    payload = build_company_index_payload(company)
-    with transaction.atomic():
-        obj, _created = CompanySearchIndex.objects.select_for_update().get_or_create(
-            company=company
-        )
-        obj.t_ident = payload["t_ident"]
-        obj.t_name = payload["t_name"]
-        obj.t_contacts = payload["t_contacts"]
-        obj.t_other = payload["t_other"]
-        obj.plain_text = payload["plain_text"]
-        obj.digits = payload["digits"]
-        obj.normalized_phones = payload.get("normalized_phones", [])
-        obj.normalized_emails = payload.get("normalized_emails", [])
-        obj.normalized_inns = payload.get("normalized_inns", [])
-        obj.updated_at = timezone.now()
-        obj.save(
-            update_fields=[
-                "t_ident",
-                "t_name",
-                "t_contacts",
-                "t_other",
-                "plain_text",
-                "digits",
-                "normalized_phones",
-                "normalized_emails",
-                "normalized_inns",
-                "updated_at",
-            ]
-        )
+    upsert_index_payloads(payloads)
@@ -0,0 +1,166 @@
+"""
+Очередь перестройки CompanySearchIndex (CompanySearchIndexDirty).
+
+Раньше каждая правка телефона/почты/контакта перестраивала индекс синхронно
+в on_commit веб-запроса (7 prefetch + upsert в латентности запроса). Теперь:
+
+- mark_company_dirty() — один upsert метки в транзакции изменения (durable:
+  откат правки откатывает и метку);
+- drain_search_index_queue() — Celery-задача пачками перестраивает индекс
+  через bulk_rebuild_company_search_index (и ключи CompanyContactKey для
+  autolink/дублей), выдерживая debounce;
+- flush_search_index_queue() — синхронный слив без debounce (тесты, команды).
+"""
+
+from __future__ import annotations
+
+from datetime import timedelta
+from uuid import UUID
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Min, Q
+from django.utils import timezone
+
+from companies.models import CompanySearchIndexDirty
+
+DRAIN_BATCH_SIZE = 500
+
+
+def _debounce() -> timedelta:
+    return timedelta(seconds=getattr(settings, "SEARCH_INDEX_QUEUE_DEBOUNCE_SECONDS", 5.0))
+
+
+def _max_delay() -> timedelta:
+    return timedelta(seconds=getattr(settings, "SEARCH_INDEX_QUEUE_MAX_DELAY_SECONDS", 60.0))
+
+
+def _marked_in_transaction(company_id: UUID) -> bool:
+    """
+    Дедупликация меток внутри одной транзакции (AmoCRM import: 1 Company + десятки
+    телефонов/контактов → одна метка). Метка считается поставленной, пока жив
+    atomic-блок, в котором её ставили: откат savepoint'а не «теряет» компанию,
+    а после коммита/отката транзакции состояние сбрасывается.
+    """
+    conn = transaction.get_connection()
+    if not conn.in_atomic_block:
+        return False
+    outer = conn.atomic_blocks[0]
+    state = getattr(conn, "_search_index_dirty_marked", None)
+    if state is None or state[0] is not outer:
+        state = (outer, {})
+        conn._search_index_dirty_marked = state
+    block = state[1].get(company_id)
+    if block is not None and block in conn.atomic_blocks:
+        return True
+    state[1][company_id] = conn.atomic_blocks[-1]
+    return False
+
+
+def _forget_mark(company_id: UUID) -> None:
+    state = getattr(transaction.get_connection(), "_search_index_dirty_marked", None)
+    if state is not None:
+        state[1].pop(company_id, None)
+
+
+def mark_company_dirty(company_id: UUID | None) -> None:
+    """
+    Пометить компанию для перестройки индекса (без самой перестройки).
+
+    Upsert идёт в собственном savepoint: вызывающий код (сигналы) глотает ошибку
+    метки, а на PostgreSQL упавший запрос без savepoint'а обрывает всю транзакцию
+    бизнес-сохранения («current transaction is aborted»).
+    """
+    if not company_id or _marked_in_transaction(company_id):
+        return
+    try:
+        with transaction.atomic():
+            mark_companies_dirty([company_id])
+    except Exception:
+        _forget_mark(company_id)
+        raise
+
+
+def mark_companies_dirty(company_ids) -> int:
+    """Пометить пачку компаний одним INSERT ... ON CONFLICT (first_marked_at не трогаем)."""
+    ids = list(dict.fromkeys(cid for cid in company_ids if cid))
+    if not ids:
+        return 0
+    now = timezone.now()
+    CompanySearchIndexDirty.objects.bulk_create(
+        [
+            CompanySearchIndexDirty(company_id=cid, marked_at=now, first_marked_at=now)
+            for cid in ids
+        ],
+        update_conflicts=True,
+        unique_fields=["company_id"],
+        update_fields=["marked_at"],
+    )
+    # Поколение кэша выдачи здесь не сдвигаем: иначе любая правка любой карточки
+    # сбрасывала бы весь кэш. Его сдвигает слив очереди, когда переписывает строки
+    # индекса (upsert_index_payloads), — выдача отстаёт от правки не больше, чем индекс.
+    return len(ids)
+
+
+def drain_search_index_queue(
+    *, force: bool = False, batch_size: int = DRAIN_BATCH_SIZE, max_batches: int = 20
+) -> int:
+    """
+    Перестроить индекс для «созревших» меток; возвращает число обработанных компаний.
+
+    Созревшая метка — без новых правок дольше debounce, либо ждущая дольше max_delay
+    (карточку правят непрерывно). force=True — всё подряд, без debounce.
+    Метка удаляется, только если её не обновили во время перестройки
+    (иначе правка, пришедшая в процессе, потерялась бы).
+    """
+    from companies.contact_keys import rebuild_company_contact_keys
+    from companies.search_index import bulk_rebuild_company_search_index
+
+    processed = 0
+    for _ in range(max_batches):
+        qs = CompanySearchIndexDirty.objects.all()
+        if not force:
+            now = timezone.now()
+            qs = qs.filter(
+                Q(marked_at__lte=now - _debounce()) | Q(first_marked_at__lte=now - _max_delay())
+            )
+        rows = list(
+            qs.order_by("first_marked_at").values_list("company_id", "marked_at")[:batch_size]
+        )
+        if not rows:
+            break
+
+        ids = [cid for cid, _ in rows]
+        bulk_rebuild_company_search_index(ids, chunk_size=batch_size)
+        # Ключи телефон/домен (CompanyContactKey) — тем же путём, что и индекс.
+        rebuild_company_contact_keys(ids)
+
+        unchanged = Q()
+        for cid, marked_at in rows:
+            unchanged |= Q(company_id=cid, marked_at=marked_at)
+        CompanySearchIndexDirty.objects.filter(unchanged).delete()
+        # Слив в той же транзакции (тесты, команды): дальнейшие правки должны ставить метку заново.
+        transaction.get_connection()._search_index_dirty_marked = None
+
+        processed += len(rows)
+        if len(rows) < batch_size:
+            break
+    return processed
+
+
+def flush_search_index_queue() -> int:
+    """Синхронно слить всю очередь (без debounce) — для тестов и ручного запуска."""
+    total = 0
+    while True:
+        done = drain_search_index_queue(force=True)
+        total += done
+        if not done:
+            return total
+
+
+def queue_stats() -> dict[str, float]:
+    """Размер очереди и лаг (возраст самой старой метки, сек) — для /metrics и логов."""
+    agg = CompanySearchIndexDirty.objects.aggregate(oldest=Min("first_marked_at"))
+    oldest = agg["oldest"]
+    lag = (timezone.now() - oldest).total_seconds() if oldest else 0.0
+    return {"size": CompanySearchIndexDirty.objects.count(), "lag_seconds": max(lag, 0.0)}
@@ -1,13 +1,28 @@
 from __future__ import annotations
 
+import hashlib
+import time
+from contextlib import contextmanager
 from dataclasses import dataclass
 from typing import Any
 from uuid import UUID
 
 from django.conf import settings as django_settings
+from django.contrib.postgres.fields import ArrayField
 from django.contrib.postgres.search import SearchQuery, SearchRank, TrigramWordSimilarity
+from django.core.cache import cache
 from django.db import connection
-from django.db.models import Case, F, FloatField, IntegerField, Q, Value, When
+from django.db.models import (
+    Case,
+    F,
+    FloatField,
+    Func,
+    IntegerField,
+    Q,
+    UUIDField,
+    Value,
+    When,
+)
 from django.db.models.expressions import RawSQL
 from django.db.models.functions import Coalesce
 from django.utils.html import escape
@@ -32,6 +47,7 @@ from .search_index import (
     classify_text_query,
     filter_stop_tokens,
     fold_text,
+    get_search_generation,
     only_digits,
     parse_query,
 )
@@ -237,13 +253,114 @@ class CompanySearchService:
       fallback по Company.name и CompanySearchIndex.t_name (pg_trgm word_similarity).
     """
 
-    def __init__(self, *, max_results_cap: int = 5000):
+    def __init__(
+        self, *, max_results_cap: int = 5000, phase_timings: dict[str, list[float]] | None = None
+    ):
         self.max_results_cap = max_results_cap
+        # Бенчмарк (companies/search_benchmark.py): длительности фаз поиска, сек.
+        # Если задано — кэш выдачи не используется, чтобы мерить реальную работу.
+        self.phase_timings = phase_timings
+        # Фаза, которой закончился последний поиск (exact/phase15/fts/similarity).
+        self._final_phase = "fts"
+        # Последняя выдача apply() обрезана до max_results_cap лучших по релевантности.
+        self.truncated = False
+
+    @contextmanager
+    def _phase(self, name: str):
+        if self.phase_timings is None:
+            yield
+            return
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.phase_timings.setdefault(name, []).append(time.perf_counter() - started)
 
     def apply(self, *, qs, query: str):
         """
         Возвращает queryset компаний, отфильтрованный и (по умолчанию) отсортированный по релевантности.
+
+        Упорядоченный список ID выдачи (не больше max_results_cap) кэшируется по
+        (parse_query, отпечаток внешних фильтров qs, поколение индекса): пагинация и
+        повторные запросы (автокомплит на каждое нажатие) делают только выборку pk__in.
+        Внешние фильтры (права, филиал) применяются к выборке заново, так что
+        кэш не может показать лишнего.
+
+        Если совпадений больше max_results_cap, отдаются cap лучших по релевантности
+        (тот же список ID, без повторного поиска) и выставляется self.truncated.
         """
+        self.truncated = False
+        if connection.vendor != "postgresql":
+            return self._search(qs=qs, query=query)
+
+        pq: ParsedQuery = parse_query(query)
+        if not pq.raw:
+            return qs
+
+        ttl = int(getattr(django_settings, "SEARCH_RESULT_CACHE_TTL", 120) or 0)
+        if self.phase_timings is not None:
+            ttl = 0
+        key = self._result_cache_key(qs=qs, pq=pq) if ttl > 0 else None
+        ids = cache.get(key) if key else None
+        if ids is None:
+            result = self._search(qs=qs, query=query)
+            with self._phase(self._final_phase):
+                # cap + 1: лишний ID — признак обрезки, повторно поиск не запускаем
+                ids = list(
+                    dict.fromkeys(result.values_list("id", flat=True)[: self.max_results_cap + 1])
+                )
+            if key:
+                cache.set(key, ids, ttl)
+        if len(ids) > self.max_results_cap:
+            self.truncated = True
+            ids = ids[: self.max_results_cap]
+        return self._ordered_by_ids(qs=qs, ids=ids)
+
+    def _result_cache_key(self, *, qs, pq: ParsedQuery) -> str | None:
+        """
+        Ключ кэша выдачи. Отпечаток фильтров — SQL+параметры `qs` без сортировки и
+        select_related (только WHERE/JOIN), поэтому не зависит от того, какая
+        вьюха и в каком виде собрала фильтры.
+        """
+        try:
+            sql, params = qs.order_by().values("pk").query.sql_with_params()
+        except Exception:
+            # EmptyResultSet (qs.none()) и прочие несериализуемые случаи — без кэша.
+            return None
+        raw = repr(
+            (
+                get_search_generation(),
+                self.max_results_cap,
+                pq.raw.lower(),
+                pq.text_tokens,
+                pq.strong_digit_tokens,
+                pq.weak_digit_tokens,
+                sql,
+                params,
+            )
+        )
+        return "companies:search:ids:" + hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    @staticmethod
+    def _ordered_by_ids(*, qs, ids: list):
+        """Компании из ids в их порядке (array_position — без CASE на тысячи веток)."""
+        if not ids:
+            return qs.none()
+        return (
+            qs.filter(pk__in=ids)
+            .annotate(
+                search_position=Func(
+                    Value(ids, output_field=ArrayField(UUIDField())),
+                    F("pk"),
+                    function="array_position",
+                    output_field=IntegerField(),
+                )
+            )
+            .order_by("search_position")
+        )
+
+    def _search(self, *, qs, query: str):
+        """Собственно поиск (без кэша выдачи)."""
         if connection.vendor != "postgresql":
             # fallback: старый icontains (проект уже его использует)
             q = (query or "").strip()
@@ -270,9 +387,12 @@ class CompanySearchService:
 
         # ФАЗА A: exact‑first поиск по email / телефону / ИНН.
         # Если есть точные совпадения — возвращаем ТОЛЬКО их, без FTS/trigram fallback.
-        exact_qs = self._apply_exact_phase(base_qs=base_qs, pq=pq)
+        self._final_phase = "exact"
+        with self._phase("exact"):
+            exact_qs = self._apply_exact_phase(base_qs=base_qs, pq=pq)
         if exact_qs is not None:
             return exact_qs.order_by("-updated_at")
+        self._final_phase = "fts"
 
         # Защита от слишком коротких запросов (не exact-типа): не запускать heavy FTS/trigram.
         # Исключения: короткие ОПФ ("ип", "ооо") разрешены только если они часть большего запроса
@@ -324,8 +444,12 @@ class CompanySearchService:
                 | Q(search_index__plain_text__icontains=folded_raw)
                 | Q(search_index__t_name__icontains=folded_raw),
             ).distinct()
-            phase15_ids = list(phase15_qs.values_list("id", flat=True)[: exact_cutoff_limit + 1])
+            with self._phase("phase15"):
+                phase15_ids = list(
+                    phase15_qs.values_list("id", flat=True)[: exact_cutoff_limit + 1]
+                )
             if 1 <= len(phase15_ids) <= exact_cutoff_limit:
+                self._final_phase = "phase15"
                 return base_qs.filter(pk__in=phase15_ids).order_by("-updated_at")
 
         indexed = Q(search_index__isnull=False)
@@ -424,17 +548,19 @@ class CompanySearchService:
             if long_tokens:
                 if similarity_only_if_empty:
                     # Проверяем, дал ли FTS достаточно результатов (без similarity)
-                    ids_fts = list(
-                        base_qs.filter(
-                            (indexed & indexed_match) | fallback_match | email_direct_match
+                    with self._phase("fts"):
+                        ids_fts = list(
+                            base_qs.filter(
+                                (indexed & indexed_match) | fallback_match | email_direct_match
+                            )
+                            .distinct()
+                            .values_list("id", flat=True)[:10]
                         )
-                        .distinct()
-                        .values_list("id", flat=True)[:10]
-                    )
                     use_similarity = len(ids_fts) < 5
                 else:
                     use_similarity = True
                 if use_similarity:
+                    self._final_phase = "similarity"
                     token = max(long_tokens, key=len)
                     sim_name_ids = (
                         base_qs.annotate(sim=TrigramWordSimilarity(token, "name"))
@@ -546,7 +672,8 @@ class CompanySearchService:
             abs_min = getattr(django_settings, "SEARCH_TEXT_ABS_MIN_SCORE", 0.5)
             rel_factor = getattr(django_settings, "SEARCH_TEXT_RELATIVE_MIN_FACTOR", 0.15)
             ordered = qs.order_by("-search_score")
-            top = ordered.first()
+            with self._phase(self._final_phase):
+                top = ordered.first()
             if top is not None and getattr(top, "search_score", None) is not None:
                 try:
                     top_score = float(top.search_score)
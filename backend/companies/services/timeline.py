@@ -14,24 +14,201 @@ Timeline service — сборка единой ленты событий кар
 (см. refactoring-specialist plan 2026-04-20; Phase 0 — создание пакета
 `companies.services/` — уже завершён коммитом `2048f4ef`).
 
-Обе view-функции теперь вызывают `build_company_timeline()`.
+Лента читается потоково: каждый источник — keyset-выборка по своей колонке
+даты (индекс (company, дата)) небольшими порциями, источники сливаются
+k-way merge (heapq.merge). Страница из N событий — по одному запросу
+LIMIT N+1 на источник, независимо от возраста компании. Позиция в ленте —
+непрозрачный курсор (`company_timeline_page`), стабильный при появлении
+новых событий: порядок (дата ↓, вид, pk ↓) полный.
 """
 
 from __future__ import annotations
 
+import base64
+import heapq
+import json
+from collections.abc import Callable, Iterator
+from dataclasses import dataclass
+from datetime import datetime
+from itertools import islice
 from typing import Any
 
+from django.core.exceptions import ValidationError
+from django.db.models import Q, QuerySet
+
 from companies.models import Company, CompanyDeal, CompanyDeletionRequest, CompanyNote
 
+TIMELINE_PAGE_SIZE = 50
 
-def build_company_timeline(
+
+@dataclass(frozen=True)
+class _Source:
+    """Источник ленты: вид события, колонка даты и queryset компании."""
+
+    kind: str
+    date_field: str
+    queryset: Callable[[Company], QuerySet]
+
+
+def _sources() -> tuple[_Source, ...]:
+    # Ленивый импорт CallRequest / CampaignRecipient — избегаем циклов при
+    # старте приложения (phonebridge и mailer импортируют companies.*)
+    from mailer.models import CampaignRecipient
+    from phonebridge.models import CallRequest
+    from tasksapp.models import Task
+
+    return (
+        _Source(
+            "note",
+            "created_at",
+            lambda c: CompanyNote.objects.filter(company=c).select_related("author"),
+        ),
+        _Source(
+            "event",
+            "occurred_at",
+            lambda c: c.history_events.select_related("actor", "from_user", "to_user"),
+        ),
+        _Source(
+            "task_created",
+            "created_at",
+            lambda c: Task.objects.filter(company=c).select_related(
+                "created_by", "assigned_to", "type"
+            ),
+        ),
+        _Source(
+            "task_done",
+            "completed_at",
+            lambda c: Task.objects.filter(company=c, completed_at__isnull=False).select_related(
+                "created_by", "assigned_to", "type"
+            ),
+        ),
+        _Source(
+            "deal",
+            "created_at",
+            lambda c: CompanyDeal.objects.filter(company=c).select_related("created_by"),
+        ),
+        _Source(
+            "call",
+            "created_at",
+            lambda c: CallRequest.objects.filter(company=c).select_related("created_by"),
+        ),
+        _Source(
+            "mailing",
+            "updated_at",
+            lambda c: CampaignRecipient.objects.filter(company=c, status="sent").select_related(
+                "campaign"
+            ),
+        ),
+        _Source(
+            "delreq_created",
+            "created_at",
+            lambda c: CompanyDeletionRequest.objects.filter(company=c).select_related(
+                "requested_by", "decided_by"
+            ),
+        ),
+        _Source(
+            "delreq_decided",
+            "decided_at",
+            lambda c: CompanyDeletionRequest.objects.filter(
+                company=c, decided_at__isnull=False
+            ).select_related("requested_by", "decided_by"),
+        ),
+    )
+
+
+# Ранг вида — второй ключ сортировки при равных датах (совпадает с порядком _sources)
+KIND_RANK = {
+    kind: rank
+    for rank, kind in enumerate(
+        (
+            "note",
+            "event",
+            "task_created",
+            "task_done",
+            "deal",
+            "call",
+            "mailing",
+            "delreq_created",
+            "delreq_decided",
+        )
+    )
+}
+
+
+@dataclass(frozen=True)
+class TimelinePosition:
+    """Последнее выданное событие: лента продолжается строго после него."""
+
+    date: datetime
+    kind: str
+    pk: str
+
+
+def encode_cursor(position: TimelinePosition) -> str:
+    raw = json.dumps(
+        {"d": position.date.isoformat(), "k": position.kind, "p": position.pk},
+        separators=(",", ":"),
+    )
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str | None) -> TimelinePosition | None:
+    """Разобрать курсор; мусор → None (лента с начала)."""
+    if not cursor:
+        return None
+    try:
+        data = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+        position = TimelinePosition(
+            date=datetime.fromisoformat(data["d"]), kind=str(data["k"]), pk=str(data["p"])
+        )
+    except (ValueError, TypeError, KeyError):
+        return None
+    return position if position.kind in KIND_RANK else None
+
+
+def _after(source: _Source, position: TimelinePosition) -> Q:
+    """Keyset-условие «строго после position» для источника в порядке (дата ↓, вид, pk ↓)."""
+    date = source.date_field
+    rank, position_rank = KIND_RANK[source.kind], KIND_RANK[position.kind]
+    if rank > position_rank:
+        return Q(**{f"{date}__lte": position.date})
+    if rank < position_rank:
+        return Q(**{f"{date}__lt": position.date})
+    return Q(**{f"{date}__lt": position.date}) | Q(**{date: position.date, "pk__lt": position.pk})
+
+
+def _read_source(
+    source: _Source, company: Company, position: TimelinePosition | None, chunk: int
+) -> Iterator[dict[str, Any]]:
+    """События источника от новых к старым, порциями по chunk строк (keyset)."""
+    ordering = (f"-{source.date_field}", "-pk")
+    while True:
+        qs = source.queryset(company)
+        if position is not None:
+            qs = qs.filter(_after(source, position))
+        rows = list(qs.order_by(*ordering)[:chunk])
+        for obj in rows:
+            yield {"date": getattr(obj, source.date_field), "kind": source.kind, "obj": obj}
+        if len(rows) < chunk:
+            return
+        last = rows[-1]
+        position = TimelinePosition(getattr(last, source.date_field), source.kind, str(last.pk))
+
+
+def _merge_key(item: dict[str, Any]) -> tuple:
+    # heapq.merge(reverse=True): дата ↓, затем вид по рангу ↑, затем pk ↓
+    return (item["date"], -KIND_RANK[item["kind"]], item["obj"].pk)
+
+
+def iter_company_timeline(
     *,
     company: Company,
-) -> list[dict[str, Any]]:
-    """Собрать единую ленту из 7 источников событий карточки компании.
+    after: TimelinePosition | None = None,
+    chunk: int = TIMELINE_PAGE_SIZE + 1,
+) -> Iterator[dict[str, Any]]:
+    """Лента компании от новых к старым (генератор), начиная строго после `after`.
 
-    Каждый элемент списка — dict со structure:
-    ``{"date": datetime, "kind": str, "obj": model_instance}``.
+    Элементы — dict ``{"date": datetime, "kind": str, "obj": model_instance}``.
 
     Виды событий (поле ``kind``):
     - ``note`` — CompanyNote (включая заметки-комментарии звонков/писем);
@@ -42,78 +219,68 @@ def build_company_timeline(
     - ``mailing`` — CampaignRecipient (успешно отправленные рассылки);
     - ``delreq_created`` / ``delreq_decided`` — заявки на удаление карточки.
 
-    Сортировка: от новых к старым. Лимит — без отдельного, применяется
-    жёсткая обрезка на уровне SQL-подзапросов (2000 для заметок, 500 для
-    остальных, 100 для deletion requests) — предотвращает OOM на
-    "исторических" компаниях. Пагинация — на уровне вызывающего кода.
+    Запросы ленивые: первая порция каждого источника читается при первом
+    next(), следующие — только если страница ушла глубже порции.
+    """
+    streams = [_read_source(source, company, after, chunk) for source in _sources()]
+    return heapq.merge(*streams, key=_merge_key, reverse=True)
 
-    Args:
-        company: объект ``Company``, для которого строим ленту.
 
-    Returns:
-        Список dict-элементов, отсортированный от новых к старым.
-    """
-    # Ленивый импорт CallRequest / CampaignRecipient — избегаем циклов при
-    # старте приложения (phonebridge и mailer импортируют companies.*)
-    from mailer.models import CampaignRecipient
-    from phonebridge.models import CallRequest
-    from tasksapp.models import Task
+@dataclass
+class TimelinePage:
+    items: list[dict[str, Any]]
+    next_cursor: str | None
 
-    timeline_notes = list(
-        CompanyNote.objects.filter(company=company)
-        .select_related("author")
-        .order_by("-created_at")[:2000]
-    )
-    timeline_events = list(
-        company.history_events.select_related("actor", "from_user", "to_user").order_by(
-            "-occurred_at"
-        )[:500]
-    )
-    timeline_tasks = list(
-        Task.objects.filter(company=company)
-        .select_related("created_by", "assigned_to", "type")
-        .order_by("-created_at")[:500]
-    )
-    timeline_deals = list(
-        CompanyDeal.objects.filter(company=company)
-        .select_related("created_by")
-        .order_by("-created_at")[:500]
-    )
-    timeline_calls = list(
-        CallRequest.objects.filter(company=company)
-        .select_related("created_by")
-        .order_by("-created_at")[:500]
-    )
-    timeline_mailings = list(
-        CampaignRecipient.objects.filter(company=company, status="sent")
-        .select_related("campaign")
-        .order_by("-updated_at")[:500]
-    )
-    timeline_delreqs = list(
-        CompanyDeletionRequest.objects.filter(company=company)
-        .select_related("requested_by", "decided_by")
-        .order_by("-created_at")[:100]
-    )
+    @property
+    def has_more(self) -> bool:
+        return self.next_cursor is not None
 
-    all_items = sorted(
-        [{"date": n.created_at, "kind": "note", "obj": n} for n in timeline_notes]
-        + [{"date": e.occurred_at, "kind": "event", "obj": e} for e in timeline_events]
-        + [{"date": t.created_at, "kind": "task_created", "obj": t} for t in timeline_tasks]
-        + [
-            {"date": t.completed_at, "kind": "task_done", "obj": t}
-            for t in timeline_tasks
-            if t.completed_at
-        ]
-        + [{"date": d.created_at, "kind": "deal", "obj": d} for d in timeline_deals]
-        + [{"date": c.created_at, "kind": "call", "obj": c} for c in timeline_calls]
-        + [{"date": m.updated_at, "kind": "mailing", "obj": m} for m in timeline_mailings]
-        + [{"date": r.created_at, "kind": "delreq_created", "obj": r} for r in timeline_delreqs]
-        + [
-            {"date": r.decided_at, "kind": "delreq_decided", "obj": r}
-            for r in timeline_delreqs
-            if r.decided_at
-        ],
-        key=lambda x: x["date"],
-        reverse=True,
+
+def company_timeline_page(
+    *,
+    company: Company,
+    cursor: str | None = None,
+    limit: int = TIMELINE_PAGE_SIZE,
+    offset: int = 0,
+) -> TimelinePage:
+    """Страница ленты после курсора (None — с начала) и курсор следующей страницы.
+
+    offset — для старых клиентов без курсора: первые offset событий
+    проматываются потоково (порции растут вместе с offset).
+    """
+    chunk = min(offset + limit + 1, 500)
+    try:
+        timeline = iter_company_timeline(company=company, after=decode_cursor(cursor), chunk=chunk)
+        items = list(islice(timeline, offset, offset + limit + 1))
+    except (ValueError, ValidationError):
+        # Подделанный курсор (pk не того типа) — лента с начала
+        items = list(islice(iter_company_timeline(company=company, chunk=chunk), limit + 1))
+    if len(items) <= limit:
+        return TimelinePage(items=items, next_cursor=None)
+    items = items[:limit]
+    last = items[-1]
+    return TimelinePage(
+        items=items,
+        next_cursor=encode_cursor(
+            TimelinePosition(last["date"], last["kind"], str(last["obj"].pk))
+        ),
     )
-    return all_items
+
+
+def count_company_timeline(*, company: Company) -> int:
+    """Число событий ленты: COUNT по каждому источнику, без загрузки строк."""
+    return sum(source.queryset(company).order_by().count() for source in _sources())
+
+
+def build_company_timeline(
+    *,
+    company: Company,
+    limit: int | None = None,
+) -> list[dict[str, Any]]:
+    """Собрать ленту списком (от новых к старым), не более `limit` событий.
+
+    Для постраничного вывода используйте `company_timeline_page()` — этот
+    вариант материализует всю ленту, если limit не задан.
+    """
+    timeline = iter_company_timeline(company=company)
+    return list(islice(timeline, limit) if limit is not None else timeline)
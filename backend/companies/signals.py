@@ -2,7 +2,6 @@ from __future__ import annotations
 
 import logging
 
-from django.db import transaction
 from django.db.models.signals import post_delete, post_save, pre_delete
 from django.dispatch import receiver
 
@@ -10,10 +9,14 @@ logger = logging.getLogger(__name__)
 
 from .models import (
     Company,
+    CompanyDeal,
     CompanyDeletionRequest,
     CompanyEmail,
+    CompanyHistoryEvent,
     CompanyNote,
+    CompanyNoteAttachment,
     CompanyPhone,
+    CompanySearchIndex,
     Contact,
     ContactEmail,
     ContactPhone,
@@ -37,69 +40,34 @@ def _delete_company_note_attachment(sender, instance: CompanyNote, **kwargs):
         )
 
 
-def _rebuild_index_for_company(company_id):
+def _schedule_rebuild_index_for_company(company_id):
     """
-    Непосредственно перестроить индекс по компании.
-    Вызывать только ИЗВНЕ транзакции (или через on_commit), чтобы не ловить
-    race-состояния при удалении компании в той же транзакции.
+    Пометить компанию для перестройки CompanySearchIndex.
+
+    Сама перестройка — в Celery (companies.tasks.drain_search_index_queue) пачками
+    и с debounce, а не в on_commit веб-запроса. Метка пишется в той же транзакции,
+    что и изменение, и дедуплицируется в её пределах (см. companies/search_index_queue.py).
     """
+    if not company_id:
+        return
     try:
-        from companies.search_index import rebuild_company_search_index
+        from companies.search_index_queue import mark_company_dirty
 
-        rebuild_company_search_index(company_id)
+        mark_company_dirty(company_id)
     except Exception:
         # Индекс — вспомогательная штука: не ломаем бизнес-сохранение из-за проблем индекса
-        logger.exception("rebuild_company_search_index failed for company_id=%s", company_id)
+        logger.exception("mark_company_dirty failed for company_id=%s", company_id)
 
 
-def _schedule_rebuild_index_for_company(company_id):
-    """
-    Безопасно поставить перестроение индекса после текущей транзакции.
-    Если транзакции нет, on_commit выполнит колбэк сразу.
-
-    DEDUPLICATION (2026-04-20): сохраняем запланированные company_id в
-    request-level set'е на connection'е. Если в одной транзакции пришло
-    N сигналов от связанных объектов (AmoCRM import: 1 Company + 10 Phone
-    + 5 Email + 20 Contact × 2 phones = ~31 сигнал), on_commit будет
-    зарегистрирован **один раз на company_id**, а не 31.
-    Это снижает нагрузку FTS rebuild в ~20-30× при bulk-операциях.
-
-    Technically: храним set на атрибуте `_rebuild_pending_company_ids`
-    у текущего connection. Django не даёт атомарной dedup для on_commit
-    (`transaction.on_commit` просто append'ает callback в список), поэтому
-    проверяем наличие ID в set'е и регистрируем on_commit только в первый раз.
-    После commit'а колбэк сам очищает себя из set'а.
-    """
-    if not company_id:
-        return
-
+def _bump_company_card(*company_ids):
+    """Сдвинуть версию кэша карточки компании (companies/card_cache.py)."""
     try:
-        conn = transaction.get_connection()
-        pending = getattr(conn, "_rebuild_pending_company_ids", None)
-        if pending is None:
-            pending = set()
-            conn._rebuild_pending_company_ids = pending
-
-        if company_id in pending:
-            # Уже запланирован в этой транзакции — пропускаем.
-            return
-        pending.add(company_id)
-
-        def _commit_callback(cid=company_id, _conn=conn):
-            try:
-                _rebuild_index_for_company(cid)
-            finally:
-                _pending = getattr(_conn, "_rebuild_pending_company_ids", None)
-                if _pending is not None:
-                    _pending.discard(cid)
-
-        transaction.on_commit(_commit_callback)
+        from companies.card_cache import bump_company_cards
+
+        bump_company_cards(company_ids)
     except Exception:
-        # На всякий случай fallback, если нет менеджера транзакций.
-        logger.exception(
-            "transaction.on_commit недоступен, выполняем rebuild сразу (company_id=%s)", company_id
-        )
-        _rebuild_index_for_company(company_id)
+        # Кэш карточки — вспомогательный: его сбой не должен ломать сохранение
+        logger.exception("bump_company_cards failed for company_ids=%s", company_ids)
 
 
 @receiver(pre_delete, sender=Company)
@@ -114,21 +82,38 @@ def _auto_cancel_deletion_requests(sender, instance: Company, **kwargs):
     ).update(status=CompanyDeletionRequest.Status.CANCELLED)
 
 
+@receiver(post_delete, sender=CompanySearchIndex)
+def _search_index_deleted(sender, instance: CompanySearchIndex, **kwargs):
+    """Удаление строки индекса (в т.ч. каскадом от Company) — новое поколение кэша выдачи."""
+    from companies.search_index import bump_search_generation
+
+    bump_search_generation()
+
+
 @receiver(post_save, sender=Company)
 def _company_saved_rebuild_search_index(sender, instance: Company, **kwargs):
     _schedule_rebuild_index_for_company(instance.id)
+    # Головная карточка показывает филиалы, филиалы — головную (блок «Организация»)
+    _bump_company_card(instance.id, instance.head_company_id)
+
+
+@receiver(post_delete, sender=Company)
+def _company_deleted(sender, instance: Company, **kwargs):
+    _bump_company_card(instance.head_company_id)
 
 
 @receiver(post_save, sender=CompanyEmail)
 @receiver(post_delete, sender=CompanyEmail)
 def _company_email_changed(sender, instance: CompanyEmail, **kwargs):
     _schedule_rebuild_index_for_company(instance.company_id)
+    _bump_company_card(instance.company_id)
 
 
 @receiver(post_save, sender=CompanyPhone)
 @receiver(post_delete, sender=CompanyPhone)
 def _company_phone_changed(sender, instance: CompanyPhone, **kwargs):
     _schedule_rebuild_index_for_company(instance.company_id)
+    _bump_company_card(instance.company_id)
 
 
 @receiver(post_save, sender=Contact)
@@ -136,6 +121,7 @@ def _company_phone_changed(sender, instance: CompanyPhone, **kwargs):
 def _contact_changed(sender, instance: Contact, **kwargs):
     if instance.company_id:
         _schedule_rebuild_index_for_company(instance.company_id)
+        _bump_company_card(instance.company_id)
 
 
 @receiver(post_save, sender=ContactEmail)
@@ -150,6 +136,7 @@ def _contact_email_changed(sender, instance: ContactEmail, **kwargs):
         company_id = None
     if company_id:
         _schedule_rebuild_index_for_company(company_id)
+        _bump_company_card(company_id)
 
 
 @receiver(post_save, sender=ContactPhone)
@@ -164,12 +151,56 @@ def _contact_phone_changed(sender, instance: ContactPhone, **kwargs):
         company_id = None
     if company_id:
         _schedule_rebuild_index_for_company(company_id)
+        _bump_company_card(company_id)
 
 
 @receiver(post_save, sender=CompanyNote)
 @receiver(post_delete, sender=CompanyNote)
 def _company_note_changed(sender, instance: CompanyNote, **kwargs):
     _schedule_rebuild_index_for_company(instance.company_id)
+    _bump_company_card(instance.company_id)
+
+
+# Записи, которые видны только в карточке (не в поисковом индексе): сделки,
+# заявки на удаление, история, вложения заметок, задачи, звонки и ActivityEvent.
+# Чужие модели — строковым sender: без импорта tasksapp/phonebridge/audit отсюда.
+@receiver(post_save, sender=CompanyDeal)
+@receiver(post_delete, sender=CompanyDeal)
+@receiver(post_save, sender=CompanyDeletionRequest)
+@receiver(post_delete, sender=CompanyDeletionRequest)
+@receiver(post_save, sender=CompanyHistoryEvent)
+@receiver(post_delete, sender=CompanyHistoryEvent)
+@receiver(post_save, sender="tasksapp.Task")
+@receiver(post_delete, sender="tasksapp.Task")
+@receiver(post_save, sender="phonebridge.CallRequest")
+@receiver(post_delete, sender="phonebridge.CallRequest")
+def _company_card_record_changed(sender, instance, **kwargs):
+    _bump_company_card(instance.company_id)
+
+
+@receiver(post_save, sender=CompanyNoteAttachment)
+@receiver(post_delete, sender=CompanyNoteAttachment)
+def _company_note_attachment_changed(sender, instance: CompanyNoteAttachment, **kwargs):
+    try:
+        company_id = instance.note.company_id
+    except Exception:
+        company_id = None
+    _bump_company_card(company_id)
+
+
+@receiver(post_save, sender="audit.ActivityEvent")
+def _activity_event_created(sender, instance, created: bool, **kwargs):
+    """
+    log_event() сопровождает почти любое действие в UI, в том числе те, что
+    пишут через queryset.update() (а log_event ещё и обновляет updated_at
+    компании через update()).
+    """
+    if not created:
+        return
+    company_id = instance.company_id
+    if not company_id and instance.entity_type == "company":
+        company_id = instance.entity_id
+    _bump_company_card(company_id)
 
 
 # Task signal УДАЛЁН 2026-04-20: данные Task (title, status, due_at) НЕ входят
@@ -5,12 +5,21 @@ Celery-задачи для модуля companies (поиск, индексац
 from __future__ import annotations
 
 import logging
+from datetime import timedelta
 
 from celery import shared_task
+from django.core.cache import cache
 from django.core.management import call_command
+from django.utils import timezone
 
 logger = logging.getLogger(__name__)
 
+# Метки последних успешных переиндексаций (Redis, без TTL).
+REINDEX_LAST_RUN_CACHE_KEY = "companies:search_index:last_reindex_at"
+REINDEX_LAST_FULL_CACHE_KEY = "companies:search_index:last_full_reindex_at"
+# Полная перестройка раз в неделю — страховка от путей, обошедших сигналы и метки времени.
+FULL_REINDEX_EVERY = timedelta(days=7)
+
 
 @shared_task(name="companies.tasks.reindex_companies_daily")
 def reindex_companies_daily():
@@ -19,7 +28,9 @@ def reindex_companies_daily():
 
     Порядок:
     1) normalize_companies_data — нормализация телефонов и email-ов (без падения задачи при ошибках).
-    2) rebuild_company_search_index — полная переиндексация CompanySearchIndex (только для PostgreSQL).
+    2) rebuild_company_search_index — переиндексация CompanySearchIndex (только для PostgreSQL):
+       инкрементально (--since с момента прошлого запуска), полная — раз в FULL_REINDEX_EVERY
+       или если меток нет.
 
     Запускать вне рабочих часов (например, 03:00).
     """
@@ -36,12 +47,51 @@ def reindex_companies_daily():
 
     # 2) Переиндексация поиска (Postgres)
     if connection.vendor == "postgresql":
+        started_at = timezone.now()
+        last_run = cache.get(REINDEX_LAST_RUN_CACHE_KEY)
+        last_full = cache.get(REINDEX_LAST_FULL_CACHE_KEY)
+        full = not last_run or not last_full or started_at - last_full >= FULL_REINDEX_EVERY
         try:
-            call_command("rebuild_company_search_index", chunk=500)
-            logger.info("reindex_companies_daily: Postgres CompanySearchIndex OK")
+            if full:
+                call_command("rebuild_company_search_index", chunk=500)
+                cache.set(REINDEX_LAST_FULL_CACHE_KEY, started_at, None)
+            else:
+                call_command("rebuild_company_search_index", chunk=500, since=last_run.isoformat())
+            cache.set(REINDEX_LAST_RUN_CACHE_KEY, started_at, None)
+            logger.info(
+                "reindex_companies_daily: Postgres CompanySearchIndex OK (%s)",
+                "full" if full else f"since {last_run.isoformat()}",
+            )
         except Exception as e:
             logger.exception(
                 "reindex_companies_daily: Postgres rebuild_company_search_index: %s", e
             )
 
     logger.info("reindex_companies_daily: завершено")
+
+
+@shared_task(name="companies.tasks.drain_search_index_queue", ignore_result=True)
+def drain_search_index_queue():
+    """
+    Слить «созревшие» метки CompanySearchIndexDirty (beat, каждые несколько секунд).
+
+    Один воркер за раз (cache-лок): пересекающиеся запуски beat просто выходят.
+    """
+    from companies.search_index_queue import drain_search_index_queue as drain
+    from companies.search_index_queue import queue_stats
+
+    lock_key = "lock:companies:drain_search_index_queue"
+    if not cache.add(lock_key, "1", timeout=10 * 60):
+        return
+    try:
+        processed = drain()
+        if processed:
+            stats = queue_stats()
+            logger.info(
+                "drain_search_index_queue: перестроено %s, в очереди %s, лаг %.1f с",
+                processed,
+                stats["size"],
+                stats["lag_seconds"],
+            )
+    finally:
+        cache.delete(lock_key)
@@ -0,0 +1,121 @@
+"""Ключи телефон/домен для autolink и дублей (companies/contact_keys.py)."""
+
+from __future__ import annotations
+
+from types import SimpleNamespace
+from unittest.mock import patch
+
+from django.test import Client, TestCase
+
+from companies.contact_keys import (
+    company_ids_by_email_domain,
+    company_ids_by_phone_tail,
+    rebuild_company_contact_keys,
+)
+from companies.models import (
+    Company,
+    CompanyContactKey,
+    CompanyEmail,
+    CompanyPhone,
+    Contact,
+    ContactEmail,
+    ContactPhone,
+)
+from companies.search_index_queue import flush_search_index_queue, mark_companies_dirty
+from core.test_utils import make_disposable_user
+from messenger.company_autolink import find_company_for_contact
+
+
+class ContactKeysTests(TestCase):
+    def setUp(self):
+        self.alpha = Company.objects.create(
+            name="ООО Альфа", phone="8 (926) 111-22-33", email="info@alpha.ru"
+        )
+        CompanyPhone.objects.create(company=self.alpha, value="+7 495 000-00-01")
+        CompanyEmail.objects.create(company=self.alpha, value="boss@gmail.com")
+        self.beta = Company.objects.create(name="ООО Бета")
+        contact = Contact.objects.create(company=self.beta, first_name="Иван")
+        ContactPhone.objects.create(contact=contact, value="+79261112244")
+        ContactEmail.objects.create(contact=contact, value="ivan@Beta.RU")
+        flush_search_index_queue()
+
+    def test_keys_are_reversed_digits_and_corporate_domains(self):
+        keys = set(
+            CompanyContactKey.objects.filter(company=self.alpha).values_list("kind", "value")
+        )
+        self.assertEqual(
+            keys,
+            {
+                ("phone", "79261112233"[::-1]),
+                ("phone", "74950000001"[::-1]),
+                ("email_domain", "alpha.ru"),
+            },
+        )
+
+    def test_phone_tail_is_prefix_lookup(self):
+        self.assertEqual(company_ids_by_phone_tail("9261112233"), {self.alpha.id})
+        self.assertEqual(company_ids_by_phone_tail("+7 926 111-22-44"[-10:]), {self.beta.id})
+        self.assertEqual(company_ids_by_phone_tail("33"), {self.alpha.id})
+        self.assertEqual(company_ids_by_phone_tail("0000000000"), set())
+
+    def test_domain_lookup_ignores_public_domains(self):
+        self.assertEqual(company_ids_by_email_domain("beta.ru"), {self.beta.id})
+        self.assertEqual(company_ids_by_email_domain("gmail.com"), set())
+
+    def test_signals_refresh_keys_on_drain(self):
+        CompanyPhone.objects.filter(company=self.alpha).delete()
+        self.alpha.phone = ""
+        self.alpha.save()
+        stored = CompanyContactKey.objects.filter(company=self.alpha, kind="phone")
+        self.assertEqual(stored.count(), 2)
+        # До drain компания в очереди — проверяется по живым данным, а не по старым ключам.
+        self.assertEqual(company_ids_by_phone_tail("4950000001"), set())
+        flush_search_index_queue()
+        self.assertFalse(stored.exists())
+        self.assertEqual(company_ids_by_phone_tail("4950000001"), set())
+        self.assertEqual(company_ids_by_email_domain("alpha.ru"), {self.alpha.id})
+
+    def test_deleted_company_loses_keys(self):
+        company_id = self.beta.id
+        self.beta.delete()
+        rebuild_company_contact_keys([company_id])
+        self.assertFalse(CompanyContactKey.objects.filter(company_id=company_id).exists())
+
+    def test_new_company_found_before_drain(self):
+        gamma = Company.objects.create(name="ООО Гамма", email="office@gamma.ru")
+        self.assertFalse(CompanyContactKey.objects.filter(company=gamma).exists())
+        self.assertEqual(company_ids_by_email_domain("gamma.ru"), {gamma.id})
+
+    def test_new_company_found_behind_large_import_queue(self):
+        imported = Company.objects.bulk_create(
+            [Company(name=f"Импорт {i}", email=f"info@imp{i}.ru") for i in range(300)]
+        )
+        mark_companies_dirty([c.id for c in imported])
+        gamma = Company.objects.create(name="ООО Гамма", email="office@gamma.ru")
+        with self.assertNumQueries(2):
+            self.assertEqual(company_ids_by_email_domain("gamma.ru"), {gamma.id})
+
+    def test_autolink_uses_point_lookups(self):
+        contact = SimpleNamespace(email="sales@alpha.ru", phone="")
+        self.assertEqual(find_company_for_contact(contact), self.alpha)
+        contact = SimpleNamespace(email="x@gmail.com", phone="+7 (926) 111-22-44")
+        self.assertEqual(find_company_for_contact(contact), self.beta)
+        with patch("messenger.company_autolink.company_ids_by_phone_tail") as lookup:
+            self.assertIsNone(find_company_for_contact(SimpleNamespace(email="", phone="12")))
+        lookup.assert_not_called()
+
+    def test_duplicates_endpoint_matches_phone_and_domain(self):
+        admin = make_disposable_user(
+            role="admin", prefix="ckey_admin", is_staff=True, is_superuser=True
+        )
+        client = Client()
+        client.force_login(admin)
+        r = client.get(
+            "/companies/duplicates/", {"phone": "+7 926 111 22 44", "email": "new@alpha.ru"}
+        )
+        self.assertEqual(r.status_code, 200)
+        data = r.json()
+        self.assertEqual({i["id"] for i in data["items"]}, {str(self.alpha.id), str(self.beta.id)})
+        self.assertEqual(data["reasons"], ["Телефон", "Домен почты"])
+        matches = {i["id"]: i["match"] for i in data["items"]}
+        self.assertEqual(matches[str(self.beta.id)], ["Телефон"])
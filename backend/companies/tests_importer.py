@@ -0,0 +1,217 @@
+"""Потоковый импорт компаний из CSV amoCRM (companies/importer.py)."""
+
+from __future__ import annotations
+
+import csv
+import io
+import os
+import tempfile
+from unittest.mock import patch
+
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+
+from accounts.models import Branch, User
+from companies.importer import _AmoImporter, import_amo_csv
+from companies.models import (
+    Company,
+    CompanyNote,
+    CompanySearchIndexDirty,
+    CompanySphere,
+    Contact,
+    ContactEmail,
+    ContactPhone,
+)
+
+HEADER = [
+    "ID",
+    "Тип",
+    "Название компании",
+    "ИНН",
+    "Адрес",
+    "Ответственный",
+    "Рабочий телефон",
+    "Рабочий email",
+    "Руководитель",
+    "Сферы деятельности",
+    "Статус",
+    "Примечание 1",
+]
+
+
+def _row(i, **overrides):
+    row = {
+        "ID": str(1000 + i),
+        "Тип": "компания",
+        "Название компании": f"ООО Импорт {i}",
+        "ИНН": "",
+        "Адрес": f"г. Тюмень, ул. Ленина, {i}",
+        "Ответственный": "",
+        "Рабочий телефон": f"8 (912) 000-00-{i:02d}",
+        "Рабочий email": f"office{i}@import{i}.ru",
+        "Руководитель": "Петров Пётр Петрович",
+        "Сферы деятельности": "Медики; Металургия",
+        "Статус": "Клиент",
+        "Примечание 1": f"заметка {i}",
+    }
+    row.update(overrides)
+    return row
+
+
+class AmoImportTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        self.branch = Branch.objects.create(name="Тюмень", code="tmn")
+        self.manager = User.objects.create_user(
+            username="ivanov", first_name="Иван", last_name="Иванов", branch=self.branch
+        )
+
+    def _csv(self, rows, name="amo.csv"):
+        path = os.path.join(self.tmp.name, name)
+        with open(path, "w", encoding="utf-8-sig", newline="") as f:
+            writer = csv.DictWriter(f, fieldnames=HEADER)
+            writer.writeheader()
+            writer.writerows(rows)
+        return path
+
+    def _import(self, path, **kwargs):
+        kwargs.setdefault("limit_companies", 0)
+        kwargs.setdefault("chunk_size", 2)
+        return import_amo_csv(csv_path=path, **kwargs)
+
+    def test_chunks_create_update_and_dedupe(self):
+        existing = Company.objects.create(name="Старое имя", inn="7701234567")
+        reassigned = Company.objects.create(
+            name="Переназначаемая", address="г. Москва", responsible=self.manager
+        )
+        other = User.objects.create_user(
+            username="sidorov", first_name="Сидор", last_name="Сидоров"
+        )
+        CompanySearchIndexDirty.objects.all().delete()
+
+        path = self._csv(
+            [
+                _row(1, ИНН="7701234567", Ответственный="(ТМН) Иванов Иван Иванович"),
+                _row(2),
+                _row(
+                    3, **{"Название компании": "ооо  импорт 2", "Адрес": "г. Тюмень, ул. Ленина, 2"}
+                ),
+                _row(4, **{"Тип": "контакт"}),
+                _row(5, ID=""),
+                _row(
+                    6,
+                    **{"Название компании": "Переназначаемая", "Адрес": "г. Москва"},
+                    Ответственный="Сидоров Сидор",
+                ),
+            ]
+        )
+        result = self._import(path)
+
+        self.assertEqual(result.created_companies, 1)
+        self.assertEqual(result.updated_companies, 3)
+        self.assertEqual(result.company_rows, 4)
+        self.assertEqual(result.skipped_rows, 1)
+        self.assertEqual(result.rows_read, 6)
+        self.assertEqual(result.chunks, 2)
+        self.assertGreater(result.rows_per_sec, 0)
+        self.assertGreater(result.peak_memory_mb, 0)
+
+        existing.refresh_from_db()
+        self.assertEqual(existing.responsible, self.manager)
+        self.assertEqual(existing.branch, self.branch)  # нормализация save() при bulk_update
+        self.assertEqual(existing.amocrm_company_id, 1001)
+        reassigned.refresh_from_db()
+        self.assertEqual(reassigned.responsible, other)
+
+        created = Company.objects.get(name="ООО Импорт 2")
+        self.assertEqual(created.phone, "+79120000002")
+        self.assertEqual(created.status.name, "Клиент")
+        self.assertEqual(
+            set(created.spheres.values_list("name", flat=True)), {"Медицина", "Металлургия"}
+        )
+        self.assertEqual(CompanySphere.objects.filter(name="Медицина").count(), 1)
+        self.assertEqual(CompanyNote.objects.filter(company=created).count(), 1)
+        contact = Contact.objects.get(company=created)
+        self.assertEqual((contact.last_name, contact.first_name), ("Петров", "Пётр"))
+        self.assertEqual(
+            list(ContactPhone.objects.filter(contact=contact).values_list("value", flat=True)),
+            ["+79120000002"],
+        )
+        self.assertTrue(ContactEmail.objects.filter(contact=contact).exists())
+        # Заметки/контакты — только для созданных; очередь индекса слита в конце
+        self.assertFalse(Contact.objects.filter(company=existing).exists())
+        self.assertFalse(CompanySearchIndexDirty.objects.exists())
+
+    def test_queries_per_chunk_do_not_grow_with_rows(self):
+        def _queries(rows, name):
+            path = self._csv(rows, name)
+            with CaptureQueriesContext(connection) as ctx:
+                self._import(path, chunk_size=100)
+            return len(ctx.captured_queries)
+
+        small = _queries([_row(i) for i in range(1, 6)], "small.csv")
+        Company.objects.all().delete()
+        large = _queries([_row(i) for i in range(1, 41)], "large.csv")
+        self.assertEqual(Company.objects.count(), 40)
+        self.assertLessEqual(large, small + 2)
+
+    def test_failed_import_resumes_from_last_chunk(self):
+        path = self._csv([_row(i) for i in range(1, 6)])
+        original = _AmoImporter._write_spheres
+        calls = []
+
+        def _fail_on_second_chunk(importer, spheres):
+            calls.append(1)
+            if len(calls) == 2:
+                raise RuntimeError("boom")
+            return original(importer, spheres)
+
+        with patch.object(_AmoImporter, "_write_spheres", _fail_on_second_chunk):
+            with self.assertRaises(RuntimeError):
+                self._import(path)
+        # Первая пачка записана, вторая откатилась целиком
+        self.assertEqual(Company.objects.count(), 2)
+        self.assertEqual(Contact.objects.count(), 2)
+
+        result = self._import(path)
+        self.assertEqual(result.resumed_from_row, 2)
+        self.assertEqual(result.rows_read, 3)
+        self.assertEqual(result.created_companies, 5)
+        self.assertEqual(Company.objects.count(), 5)
+        self.assertEqual(Contact.objects.count(), 5)
+
+        # Успешный импорт сбрасывает чекпоинт: повторный запуск читает файл заново
+        again = self._import(path)
+        self.assertEqual(again.resumed_from_row, 0)
+        self.assertEqual(again.created_companies, 0)
+        self.assertEqual(Company.objects.count(), 5)
+
+    def test_dry_run_previews_without_writes(self):
+        path = self._csv(
+            [_row(i) for i in range(1, 6)] + [_row(9, ИНН="7701234567"), _row(10, ИНН="7701234567")]
+        )
+        spheres = CompanySphere.objects.count()
+        result = self._import(path, dry_run=True, limit_companies=4)
+        self.assertEqual(result.created_companies, 4)
+        self.assertEqual(len(result.preview_companies), 4)
+        self.assertFalse(Company.objects.exists())
+        self.assertEqual(CompanySphere.objects.count(), spheres)
+
+        result = self._import(path, dry_run=True)
+        self.assertEqual(result.created_companies, 6)  # повтор ИНН — обновление «в памяти»
+        self.assertEqual(result.updated_companies, 1)
+
+    def test_management_command_reports_speed_and_memory(self):
+        path = self._csv([_row(i) for i in range(1, 4)])
+        out = io.StringIO()
+        call_command("import_amo_companies", path, "--chunk-size", "2", stdout=out)
+        output = out.getvalue()
+        self.assertIn("Пачка 2:", output)
+        self.assertIn("добавлено 3", output)
+        self.assertIn("строк/с", output)
+        self.assertIn("пик памяти", output)
@@ -600,3 +600,170 @@ class SearchBackendFacadeTests(TestCase):
                 with self.settings(SEARCH_ENGINE_BACKEND=backend_value):
                     backend = get_company_search_backend()
                 self.assertIsInstance(backend, CompanySearchService)
+
+
+class ChangedSinceTests(TestCase):
+    """companies_changed_since: выбор компаний для инкрементальной переиндексации."""
+
+    @unittest.skipUnless(connection.vendor == "postgresql", "PostgreSQL required (ArrayField)")
+    def test_picks_companies_by_own_and_related_timestamps(self):
+        from datetime import timedelta
+
+        from django.utils import timezone
+
+        from companies.models import CompanyNote
+        from companies.search_index import companies_changed_since
+
+        status = CompanyStatus.objects.create(name="Тест")
+        old = Company.objects.create(name="Старая", status=status)
+        with_contact = Company.objects.create(name="С контактом", status=status)
+        with_note = Company.objects.create(name="С заметкой", status=status)
+        past = timezone.now() - timedelta(days=3)
+        Company.objects.filter(id__in=[old.id, with_contact.id, with_note.id]).update(
+            updated_at=past
+        )
+        for c in (old, with_contact, with_note):
+            CompanySearchIndex.objects.filter(company=c).delete()
+            CompanySearchIndex.objects.create(company=c)
+
+        since = timezone.now() - timedelta(days=1)
+        Contact.objects.create(company=with_contact, first_name="Иван")
+        CompanyNote.objects.create(company=with_note, text="звонили")
+        fresh = Company.objects.create(name="Новая", status=status)
+
+        ids = set(companies_changed_since(since))
+        self.assertEqual(ids, {with_contact.id, with_note.id, fresh.id})
+
+    def test_parse_since_accepts_date_and_datetime(self):
+        from django.core.management.base import CommandError
+        from django.utils import timezone
+
+        from companies.management.commands.rebuild_company_search_index import parse_since
+
+        self.assertTrue(timezone.is_aware(parse_since("2026-01-02")))
+        self.assertEqual(parse_since("2026-01-02T03:04:05+00:00").hour, 3)
+        with self.assertRaises(CommandError):
+            parse_since("вчера")
+
+
+@unittest.skipUnless(
+    connection.vendor == "postgresql", "PostgreSQL required (tsvector/pg_trgm/ArrayField)"
+)
+class BulkRebuildPostgresTests(TestCase):
+    def test_bulk_rebuild_upserts_rows_and_drops_deleted(self):
+        from companies.search_index import bulk_rebuild_company_search_index
+
+        status = CompanyStatus.objects.create(name="Тест")
+        companies = [
+            Company.objects.create(name=f"ООО Ромашка {i}", inn=f"770100000{i}", status=status)
+            for i in range(5)
+        ]
+        CompanySearchIndex.objects.filter(company=companies[0]).update(t_name="устарело")
+        gone = companies.pop()
+        gone_id = gone.id
+        gone.delete()
+
+        stats = bulk_rebuild_company_search_index(
+            [c.id for c in companies] + [gone_id], chunk_size=2
+        )
+
+        self.assertEqual(stats.rows, 4)
+        self.assertGreater(stats.rows_per_sec, 0)
+        idx = CompanySearchIndex.objects.get(company=companies[0])
+        self.assertIn("ромашка 0", idx.t_name)
+        self.assertEqual(idx.normalized_inns, ["7701000000"])
+        self.assertIsNotNone(idx.vector_b)
+        self.assertFalse(CompanySearchIndex.objects.filter(company_id=gone_id).exists())
+
+
+class SearchResultCacheKeyTests(TestCase):
+    """Ключ кэша выдачи: parse_query + отпечаток фильтров + поколение индекса."""
+
+    def setUp(self):
+        self.service = CompanySearchService()
+        self.pq = parse_query("ооо ромашка")
+
+    def test_key_ignores_ordering_and_select_related_but_not_filters(self):
+        base = Company.objects.filter(name__icontains="x")
+        same = Company.objects.select_related("responsible").filter(name__icontains="x")
+        other = Company.objects.filter(name__icontains="y")
+
+        key = self.service._result_cache_key(qs=base.order_by("-updated_at"), pq=self.pq)
+        self.assertEqual(key, self.service._result_cache_key(qs=same, pq=self.pq))
+        self.assertNotEqual(key, self.service._result_cache_key(qs=other, pq=self.pq))
+        self.assertNotEqual(
+            key, self.service._result_cache_key(qs=base, pq=parse_query("ооо лютик"))
+        )
+
+    def test_generation_bump_changes_key(self):
+        from companies.search_index import bump_search_generation
+        from companies.search_index_queue import mark_companies_dirty
+
+        qs = Company.objects.all()
+        key = self.service._result_cache_key(qs=qs, pq=self.pq)
+        bump_search_generation()
+        bumped = self.service._result_cache_key(qs=qs, pq=self.pq)
+        self.assertNotEqual(key, bumped)
+
+        # Правка карточки (метка в очереди индекса) кэш не сбрасывает — это делает слив очереди.
+        status = CompanyStatus.objects.create(name="Тест")
+        mark_companies_dirty([Company.objects.create(name="ООО Ромашка", status=status).id])
+        self.assertEqual(bumped, self.service._result_cache_key(qs=qs, pq=self.pq))
+
+    def test_empty_queryset_is_not_cached(self):
+        self.assertIsNone(self.service._result_cache_key(qs=Company.objects.none(), pq=self.pq))
+
+
+@unittest.skipUnless(
+    connection.vendor == "postgresql", "PostgreSQL required (tsvector/pg_trgm/ArrayField)"
+)
+class SearchResultCachePostgresTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.status = CompanyStatus.objects.create(name="Тест")
+
+    def test_repeated_query_only_fetches_by_ids_in_same_order(self):
+        companies = [
+            Company.objects.create(name=f"ООО Ромашка {i}", status=self.status) for i in range(3)
+        ]
+        for c in companies:
+            rebuild_company_search_index(c.id)
+
+        service = CompanySearchService()
+        first = list(service.apply(qs=Company.objects.all(), query="ромашка"))
+        self.assertEqual({c.id for c in first}, {c.id for c in companies})
+
+        with self.assertNumQueries(1):
+            second = list(service.apply(qs=Company.objects.all(), query="ромашка"))
+        self.assertEqual([c.id for c in second], [c.id for c in first])
+
+    def test_reindex_invalidates_cached_ids(self):
+        c1 = Company.objects.create(name="ООО Ромашка", status=self.status)
+        rebuild_company_search_index(c1.id)
+        service = CompanySearchService()
+        self.assertEqual(
+            [c.id for c in service.apply(qs=Company.objects.all(), query="ромашка")], [c1.id]
+        )
+
+        c2 = Company.objects.create(name="ЗАО Ромашка", status=self.status)
+        rebuild_company_search_index(c2.id)
+        ids = {c.id for c in service.apply(qs=Company.objects.all(), query="ромашка")}
+        self.assertEqual(ids, {c1.id, c2.id})
+
+    def test_over_cap_returns_top_ids_without_second_search(self):
+        companies = [
+            Company.objects.create(name=f"ООО Ромашка {i}", status=self.status) for i in range(3)
+        ]
+        for c in companies:
+            rebuild_company_search_index(c.id)
+
+        service = CompanySearchService(max_results_cap=2)
+        first = list(service.apply(qs=Company.objects.all(), query="ромашка"))
+        self.assertTrue(service.truncated)
+        self.assertEqual(len(first), 2)
+
+        # Повтор — из кэша ID (обрезанный список тоже кэшируется), без полного поиска
+        with self.assertNumQueries(1):
+            second = list(service.apply(qs=Company.objects.all(), query="ромашка"))
+        self.assertTrue(service.truncated)
+        self.assertEqual([c.id for c in second], [c.id for c in first])
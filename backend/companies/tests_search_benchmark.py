@@ -0,0 +1,148 @@
+"""Бенчмарк и регрессия релевантности поиска (companies/search_benchmark.py)."""
+
+from __future__ import annotations
+
+import json
+import tempfile
+import unittest
+from io import StringIO
+from pathlib import Path
+
+from django.core.management import CommandError, call_command
+from django.db import connection
+from django.test import TestCase
+
+from companies.models import Company, CompanyPhone, Contact, ContactPhone
+from companies.search_benchmark import (
+    CORPUS_SOURCE,
+    build_query_log,
+    compare_top_k,
+    delete_corpus,
+    generate_corpus,
+    iter_corpus_rows,
+    percentile,
+    read_query_log,
+    run_benchmark,
+)
+
+
+class CorpusTests(TestCase):
+    def test_corpus_is_deterministic_per_seed(self):
+        a = list(iter_corpus_rows(20, seed=7))
+        b = list(iter_corpus_rows(20, seed=7))
+        c = list(iter_corpus_rows(20, seed=8))
+        self.assertEqual(a, b)
+        self.assertNotEqual([r["id"] for r in a], [r["id"] for r in c])
+        self.assertTrue(all(len(r["inn"]) == 10 for r in a))
+        self.assertTrue(all(p.startswith("+79") and len(p) == 12 for r in a for p in r["phones"]))
+
+    def test_generate_and_delete_corpus(self):
+        self.assertEqual(generate_corpus(30, seed=3, batch_size=7), 30)
+        self.assertEqual(Company.objects.filter(raw_fields__source=CORPUS_SOURCE).count(), 30)
+        self.assertTrue(CompanyPhone.objects.exists() or ContactPhone.objects.exists())
+        rows = list(iter_corpus_rows(30, seed=3))
+        self.assertEqual(Company.objects.get(id=rows[0]["id"]).inn, rows[0]["inn"])
+
+        delete_corpus()
+        self.assertFalse(Company.objects.exists())
+        self.assertFalse(Contact.objects.exists())
+
+    def test_query_log_covers_query_kinds(self):
+        cases = build_query_log(100, seed=5, count=40)
+        self.assertEqual(cases, build_query_log(100, seed=5, count=40))
+        kinds = {c.kind for c in cases}
+        self.assertTrue({"inn", "phone_tail", "phone", "name_opf", "address", "email"} <= kinds)
+        self.assertTrue(all(c.q for c in cases))
+
+    def test_read_query_log(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = Path(tmp) / "q.txt"
+            path.write_text("# журнал\nинн\t7701234567\n\nромашка\n", encoding="utf-8")
+            cases = read_query_log(path)
+        self.assertEqual(
+            [(c.kind, c.q) for c in cases], [("инн", "7701234567"), ("custom", "ромашка")]
+        )
+
+
+class MetricsTests(TestCase):
+    def test_percentile_nearest_rank(self):
+        values = list(range(1, 101))
+        self.assertEqual(percentile(values, 50), 50)
+        self.assertEqual(percentile(values, 95), 95)
+        self.assertEqual(percentile([3.0], 95), 3.0)
+        self.assertEqual(percentile([], 50), 0.0)
+
+    def test_compare_top_k(self):
+        baseline = {"a": ["1", "2"], "b": ["1", "2"], "c": ["1"], "gone": ["9"]}
+        current = {"a": ["1", "2"], "b": ["2", "1"], "c": ["2"], "new": ["5"]}
+        diff = compare_top_k(baseline, current)
+        self.assertEqual(diff["compared"], 3)
+        self.assertEqual(diff["changed"], ["c"])
+        self.assertEqual(diff["order_changed"], ["b"])
+        self.assertAlmostEqual(diff["overlap"], 2 / 3, places=3)
+
+
+class BenchmarkRunTests(TestCase):
+    def test_run_benchmark_records_total_and_explain(self):
+        generate_corpus(40, seed=11)
+        report = run_benchmark(build_query_log(40, seed=11, count=16), top_k=5, size=40)
+        summary = report.summary()
+        self.assertEqual(summary["total"]["count"], 16)
+        self.assertIn("explain", summary)
+        self.assertLessEqual(summary["total"]["p50_ms"], summary["total"]["p95_ms"])
+        self.assertTrue(all(len(ids) <= 5 for ids in report.top_k.values()))
+
+    def test_command_snapshot_and_compare(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            snap = Path(tmp) / "top.json"
+            out = StringIO()
+            call_command(
+                "benchmark_company_search",
+                "--size=40",
+                "--query-count=10",
+                f"--snapshot={snap}",
+                stdout=out,
+            )
+            self.assertIn("total", out.getvalue())
+            self.assertTrue(json.loads(snap.read_text(encoding="utf-8")))
+
+            out = StringIO()
+            call_command(
+                "benchmark_company_search",
+                "--size=40",
+                "--query-count=10",
+                f"--compare={snap}",
+                "--fail-on-diff",
+                "--json",
+                "--cleanup",
+                stdout=out,
+            )
+            payload = json.loads(out.getvalue())
+            self.assertEqual(payload["top_k"]["changed"], [])
+            self.assertEqual(payload["top_k"]["overlap"], 1.0)
+        self.assertFalse(Company.objects.exists())
+
+    def test_command_fails_on_diff(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            snap = Path(tmp) / "top.json"
+            queries = build_query_log(40, seed=42, count=4)
+            snap.write_text(json.dumps({queries[0].q: ["не-тот-id"]}), encoding="utf-8")
+            with self.assertRaises(CommandError):
+                call_command(
+                    "benchmark_company_search",
+                    "--size=40",
+                    "--query-count=4",
+                    f"--compare={snap}",
+                    "--fail-on-diff",
+                    stdout=StringIO(),
+                )
+
+
+@unittest.skipUnless(connection.vendor == "postgresql", "PostgreSQL required")
+class BenchmarkPhasesPostgresTests(TestCase):
+    def test_search_phases_are_timed(self):
+        generate_corpus(60, seed=21)
+        report = run_benchmark(build_query_log(60, seed=21, count=24), top_k=10, size=60)
+        summary = report.summary()
+        self.assertIn("exact", summary)
+        self.assertTrue({"phase15", "fts", "similarity"} & set(summary))
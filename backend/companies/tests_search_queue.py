@@ -0,0 +1,125 @@
+"""Очередь перестройки CompanySearchIndex (companies/search_index_queue.py)."""
+
+from __future__ import annotations
+
+from datetime import timedelta
+from unittest.mock import patch
+
+from django.db import DatabaseError, transaction
+from django.test import TestCase, override_settings
+from django.utils import timezone
+
+from companies.models import Company, CompanyPhone, CompanySearchIndexDirty, CompanyStatus
+from companies.search_index_queue import (
+    drain_search_index_queue,
+    flush_search_index_queue,
+    mark_companies_dirty,
+    queue_stats,
+)
+
+
+class SearchIndexQueueTests(TestCase):
+    def setUp(self):
+        self.status = CompanyStatus.objects.create(name="Тест")
+        self.company = Company.objects.create(name="ООО Ромашка", status=self.status)
+
+    def _age(self, seconds):
+        past = timezone.now() - timedelta(seconds=seconds)
+        CompanySearchIndexDirty.objects.update(marked_at=past, first_marked_at=past)
+
+    def test_signals_only_mark_company_dirty(self):
+        with patch("companies.search_index.rebuild_company_search_index") as rebuild:
+            with self.captureOnCommitCallbacks(execute=True):
+                for i in range(10):
+                    CompanyPhone.objects.create(company=self.company, value=f"+7926000000{i}")
+        rebuild.assert_not_called()
+        self.assertEqual(
+            list(CompanySearchIndexDirty.objects.values_list("company_id", flat=True)),
+            [self.company.id],
+        )
+
+    def test_remark_moves_marked_at_but_keeps_first_marked_at(self):
+        self._age(30)
+        before = CompanySearchIndexDirty.objects.get(company_id=self.company.id)
+        mark_companies_dirty([self.company.id])
+        after = CompanySearchIndexDirty.objects.get(company_id=self.company.id)
+        self.assertGreater(after.marked_at, before.marked_at)
+        self.assertEqual(after.first_marked_at, before.first_marked_at)
+
+    @override_settings(
+        SEARCH_INDEX_QUEUE_DEBOUNCE_SECONDS=5, SEARCH_INDEX_QUEUE_MAX_DELAY_SECONDS=60
+    )
+    def test_drain_waits_for_debounce_window(self):
+        with patch("companies.search_index.bulk_rebuild_company_search_index") as rebuild:
+            self.assertEqual(drain_search_index_queue(), 0)
+            rebuild.assert_not_called()
+
+            self._age(10)
+            self.assertEqual(drain_search_index_queue(), 1)
+            rebuild.assert_called_once()
+            self.assertEqual(list(rebuild.call_args.args[0]), [self.company.id])
+        self.assertFalse(CompanySearchIndexDirty.objects.exists())
+
+    @override_settings(
+        SEARCH_INDEX_QUEUE_DEBOUNCE_SECONDS=5, SEARCH_INDEX_QUEUE_MAX_DELAY_SECONDS=60
+    )
+    def test_continuous_edits_are_drained_after_max_delay(self):
+        past = timezone.now() - timedelta(seconds=120)
+        CompanySearchIndexDirty.objects.update(first_marked_at=past)
+        with patch("companies.search_index.bulk_rebuild_company_search_index"):
+            self.assertEqual(drain_search_index_queue(), 1)
+
+    def test_mark_during_rebuild_is_not_lost(self):
+        def _edit_while_rebuilding(ids, **kwargs):
+            mark_companies_dirty(ids)
+
+        with patch(
+            "companies.search_index.bulk_rebuild_company_search_index",
+            side_effect=_edit_while_rebuilding,
+        ):
+            self.assertEqual(drain_search_index_queue(force=True), 1)
+        self.assertTrue(CompanySearchIndexDirty.objects.filter(company_id=self.company.id).exists())
+
+    def test_flush_drains_everything_and_stats_report_lag(self):
+        Company.objects.create(name="ООО Лютик", status=self.status)
+        self._age(42)
+        stats = queue_stats()
+        self.assertEqual(stats["size"], 2)
+        self.assertGreaterEqual(stats["lag_seconds"], 42)
+
+        self.assertEqual(flush_search_index_queue(), 2)
+        self.assertEqual(queue_stats(), {"size": 0, "lag_seconds": 0.0})
+
+    def test_rolled_back_savepoint_does_not_swallow_next_mark(self):
+        flush_search_index_queue()
+        try:
+            with transaction.atomic():
+                self.company.save()
+                raise RuntimeError("rollback")
+        except RuntimeError:
+            pass
+        self.assertFalse(CompanySearchIndexDirty.objects.exists())
+
+        self.company.save()
+        self.assertTrue(CompanySearchIndexDirty.objects.filter(company_id=self.company.id).exists())
+
+    def test_failed_mark_keeps_business_transaction_usable(self):
+        flush_search_index_queue()
+        with transaction.atomic():
+            with patch(
+                "companies.search_index_queue.CompanySearchIndexDirty.objects.bulk_create",
+                side_effect=DatabaseError("boom"),
+            ):
+                self.company.name = "ООО Ромашка+"
+                self.company.save()
+            # Метка откатилась в своём savepoint — транзакция жива, следующая правка ставит метку
+            self.assertEqual(Company.objects.get(id=self.company.id).name, "ООО Ромашка+")
+            self.company.save()
+        self.assertTrue(CompanySearchIndexDirty.objects.filter(company_id=self.company.id).exists())
+
+    @override_settings(METRICS_TOKEN="secret")
+    def test_metrics_expose_queue_lag(self):
+        resp = self.client.get("/metrics", HTTP_AUTHORIZATION="Bearer secret")
+        body = resp.content.decode()
+        self.assertIn("crm_search_index_queue_size 1", body)
+        self.assertIn("crm_search_index_queue_lag_seconds", body)
@@ -0,0 +1,133 @@
+"""
+Тесты ленты карточки компании (companies.services.timeline).
+
+Покрывает:
+- слияние источников в порядке (дата ↓, вид, pk ↓), включая равные даты
+- постраничный обход по курсору без пропусков и повторов
+- число запросов на страницу не зависит от объёма ленты
+- мусорный/подделанный курсор → лента с начала
+- AJAX-подгрузка: курсор в заголовке X-Timeline-Next-Cursor, старый ?offset=
+"""
+
+from __future__ import annotations
+
+from datetime import timedelta
+
+from django.test import Client, TestCase
+from django.utils import timezone
+
+from companies.models import Company, CompanyNote
+from companies.services.timeline import (
+    TimelinePosition,
+    build_company_timeline,
+    company_timeline_page,
+    count_company_timeline,
+    encode_cursor,
+)
+from core.test_utils import make_disposable_user
+from tasksapp.models import Task
+
+
+def _keys(items):
+    return [(item["kind"], str(item["obj"].pk)) for item in items]
+
+
+class CompanyTimelineServiceTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = make_disposable_user(role="admin", prefix="tl_admin")
+        cls.company = Company.objects.create(name="Timeline Co")
+        now = timezone.now().replace(microsecond=0)
+        cls.same_moment = now - timedelta(hours=1)
+        for i in range(6):
+            note = CompanyNote.objects.create(company=cls.company, author=cls.user, text=f"n{i}")
+            # Половина заметок — в один и тот же момент (проверка равных дат)
+            created = cls.same_moment if i % 2 else now - timedelta(minutes=i)
+            CompanyNote.objects.filter(pk=note.pk).update(created_at=created)
+        for i in range(4):
+            task = Task.objects.create(company=cls.company, title=f"t{i}", created_by=cls.user)
+            Task.objects.filter(pk=task.pk).update(
+                created_at=cls.same_moment,
+                completed_at=now - timedelta(minutes=30 + i) if i < 2 else None,
+            )
+        other = Company.objects.create(name="Other Co")
+        CompanyNote.objects.create(company=other, author=cls.user, text="чужая")
+
+    def test_merged_order_is_total(self):
+        items = build_company_timeline(company=self.company)
+        self.assertEqual(len(items), count_company_timeline(company=self.company))
+        dates = [item["date"] for item in items]
+        self.assertEqual(dates, sorted(dates, reverse=True))
+        kinds = {item["kind"] for item in items}
+        self.assertTrue({"note", "task_created", "task_done"} <= kinds)
+        self.assertNotIn("чужая", [getattr(item["obj"], "text", "") for item in items])
+
+    def test_cursor_walk_matches_full_timeline(self):
+        expected = _keys(build_company_timeline(company=self.company))
+        walked, cursor = [], None
+        for _ in range(len(expected)):
+            page = company_timeline_page(company=self.company, cursor=cursor, limit=3)
+            walked.extend(_keys(page.items))
+            cursor = page.next_cursor
+            if not page.has_more:
+                break
+        self.assertEqual(walked, expected)
+
+    def test_cursor_stable_when_new_events_arrive(self):
+        first = company_timeline_page(company=self.company, limit=4)
+        rest = _keys(build_company_timeline(company=self.company))[4:]
+        CompanyNote.objects.create(company=self.company, author=self.user, text="свежая")
+        second = company_timeline_page(company=self.company, cursor=first.next_cursor, limit=50)
+        self.assertEqual(_keys(second.items), rest)
+
+    def test_page_costs_one_query_per_source(self):
+        for i in range(30):
+            CompanyNote.objects.create(company=self.company, author=self.user, text=f"x{i}")
+        page = company_timeline_page(company=self.company, limit=5)
+        with self.assertNumQueries(9):
+            company_timeline_page(company=self.company, cursor=page.next_cursor, limit=5)
+
+    def test_offset_compat(self):
+        expected = _keys(build_company_timeline(company=self.company))
+        page = company_timeline_page(company=self.company, offset=5, limit=3)
+        self.assertEqual(_keys(page.items), expected[5:8])
+
+    def test_bad_cursor_restarts(self):
+        expected = _keys(build_company_timeline(company=self.company, limit=3))
+        tampered = encode_cursor(TimelinePosition(self.same_moment, "task_created", "not-a-uuid"))
+        for cursor in ("garbage!", tampered):
+            page = company_timeline_page(company=self.company, cursor=cursor, limit=3)
+            self.assertEqual(_keys(page.items), expected)
+
+
+class CompanyTimelineItemsViewTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = make_disposable_user(
+            role="admin", prefix="tl_view", is_staff=True, is_superuser=True
+        )
+        cls.company = Company.objects.create(name="Timeline View Co")
+        for i in range(5):
+            CompanyNote.objects.create(company=cls.company, author=cls.admin, text=f"v{i}")
+
+    def setUp(self):
+        self.client = Client()
+        self.client.force_login(self.admin)
+        self.url = f"/companies/{self.company.id}/timeline/items/"
+
+    def test_cursor_header_until_end(self):
+        total = count_company_timeline(company=self.company)
+        seen, cursor = 0, ""
+        while True:
+            response = self.client.get(self.url, {"cursor": cursor, "limit": 2})
+            self.assertEqual(response.status_code, 200)
+            seen += response.content.decode().count('data-kind="')
+            cursor = response["X-Timeline-Next-Cursor"]
+            if not cursor:
+                break
+        self.assertEqual(seen, total)
+
+    def test_offset_parameter_still_works(self):
+        response = self.client.get(self.url, {"offset": 4, "limit": 10})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response["X-Timeline-Next-Cursor"], "")
@@ -498,8 +498,14 @@ PUBLIC_BASE_URL = os.getenv("PUBLIC_BASE_URL", "")
 
 # Mailer: размер батча отправки (получателей за один проход задачи)
 MAILER_SEND_BATCH_SIZE = int(os.getenv("MAILER_SEND_BATCH_SIZE", "10"))
-# Mailer: таймаут Redis-лока задачи send_pending_emails (секунды)
+# Mailer: аренда записи очереди воркером send_pending_emails на время батча (секунды)
 MAILER_SEND_LOCK_TIMEOUT = int(os.getenv("MAILER_SEND_LOCK_TIMEOUT", "120"))
+# Mailer: параллельных воркеров send_pending_emails на тик beat (захват через skip_locked)
+MAILER_SEND_WORKERS = int(os.getenv("MAILER_SEND_WORKERS", "1"))
+# Mailer: батчей за один запуск воркера (каждый батч — заново по справедливой доле)
+MAILER_SEND_BATCHES_PER_RUN = int(os.getenv("MAILER_SEND_BATCHES_PER_RUN", "1"))
+# Mailer: параллельных SMTP-соединений на батч (пул; 1 — последовательная отправка)
+MAILER_SMTP_POOL_SIZE = int(os.getenv("MAILER_SMTP_POOL_SIZE", "4"))
 # Mailer: максимум получателей в кампании
 MAILER_MAX_CAMPAIGN_RECIPIENTS = int(os.getenv("MAILER_MAX_CAMPAIGN_RECIPIENTS", "10000"))
 
@@ -542,6 +548,12 @@ else:
     MESSENGER_DEFAULT_BRANCH_ID = None
 # Включить определение региона по IP (GeoIP) при bootstrap виджета. 0 = выключено.
 MESSENGER_GEOIP_ENABLED = os.getenv("MESSENGER_GEOIP_ENABLED", "1") == "1"
+# Локальный индекс диапазонов IP → регион (messenger.geoip), собирается командой
+# import_geoip_ranges из CSV. Пока файла нет — запрос к ip-api.com, если не выключен.
+MESSENGER_GEOIP_DB_PATH = os.getenv(
+    "MESSENGER_GEOIP_DB_PATH", str(BASE_DIR / "data" / "geoip" / "regions.bin")
+)
+MESSENGER_GEOIP_HTTP_FALLBACK = os.getenv("MESSENGER_GEOIP_HTTP_FALLBACK", "1") == "1"
 # Сообщение в ответе bootstrap виджета, когда запрос вне рабочих часов (виджет может показать его посетителю).
 MESSENGER_OUTSIDE_WORKING_HOURS_MESSAGE = os.getenv(
     "MESSENGER_OUTSIDE_WORKING_HOURS_MESSAGE",
@@ -550,6 +562,9 @@ MESSENGER_OUTSIDE_WORKING_HOURS_MESSAGE = os.getenv(
 # Таймаут эскалации (секунды): если оператор не открыл диалог за это время — переназначение следующему. По умолчанию 4 мин.
 MESSENGER_ESCALATION_TIMEOUT_SECONDS = int(os.getenv("MESSENGER_ESCALATION_TIMEOUT_SECONDS", "240"))
 MESSENGER_AUTO_RESOLVE_HOURS = int(os.getenv("MESSENGER_AUTO_RESOLVE_HOURS", "24"))
+# SSE-стримы (операторские и виджета): под ASGI ждут пробуждений из channel layer
+# вместо опроса БД (messenger.sse). 0 = прежний poll-цикл и под ASGI.
+MESSENGER_SSE_PUSH_ENABLED = os.getenv("MESSENGER_SSE_PUSH_ENABLED", "1") == "1"
 
 # Политика хранения: через сколько дней переводить RESOLVED → CLOSED (архивировать). По умолчанию 90 дней.
 MESSENGER_RETENTION_RESOLVED_TO_CLOSED_DAYS = int(
@@ -573,6 +588,11 @@ MESSENGER_WIDGET_POLL_RATE_PER_SESSION = int(
 MESSENGER_WIDGET_POLL_MIN_INTERVAL_SECONDS = int(
     os.getenv("MESSENGER_WIDGET_POLL_MIN_INTERVAL_SECONDS", "2")
 )
+# Быстрый путь poll (messenger.widget_cursor): сколько секунд курсор сессии может
+# отвечать «без изменений» без полного опроса (страховка для update() мимо счётчика)
+MESSENGER_WIDGET_POLL_CURSOR_MAX_AGE_SECONDS = int(
+    os.getenv("MESSENGER_WIDGET_POLL_CURSOR_MAX_AGE_SECONDS", "60")
+)
 
 # Secure-by-default allowlist доменов для виджета.
 # Если True (прод-дефолт), при пустом allowlist запрос блокируется.
@@ -631,6 +651,18 @@ REST_FRAMEWORK = {
     },
 }
 
+# Long-poll /api/phone/calls/pull/?wait_seconds=N: запрос ждёт пробуждения из channel
+# layer (phonebridge.wakeup) до N секунд. Под ASGI простаивающий запрос не тратит
+# запросов к БД; под WSGI (gthread) ожидание занимало бы поток — там 0 = сразу 204.
+PHONEBRIDGE_PULL_MAX_WAIT_SECONDS = int(os.getenv("PHONEBRIDGE_PULL_MAX_WAIT_SECONDS", "25"))
+PHONEBRIDGE_PULL_WSGI_MAX_WAIT_SECONDS = int(
+    os.getenv("PHONEBRIDGE_PULL_WSGI_MAX_WAIT_SECONDS", "0")
+)
+# PhoneDevice.last_seen_at из pull пишется не чаще раза в N секунд на устройство
+PHONEBRIDGE_LAST_SEEN_THROTTLE_SECONDS = int(
+    os.getenv("PHONEBRIDGE_LAST_SEEN_THROTTLE_SECONDS", "30")
+)
+
 SPECTACULAR_SETTINGS = {
     "TITLE": "ProfiCRM API",
     "DESCRIPTION": "REST API для ProfiCRM. Аутентификация: JWT Bearer token.",
@@ -758,6 +790,23 @@ else:
         }
     }
 
+# Индекс присутствия операторов мессенджера (messenger.presence): с Redis онлайн
+# филиала читается одним ZRANGEBYSCORE; без Redis ("db") — по полям User/AgentProfile.
+MESSENGER_PRESENCE_INDEX = os.getenv(
+    "MESSENGER_PRESENCE_INDEX", "redis" if REDIS_URL and not DEBUG else "db"
+)
+# Телеметрия телефонов (phonebridge.telemetry): с Redis батчи копятся в stream и
+# сливаются в БД пакетно задачей drain-phone-telemetry; без Redis ("sync") пишутся сразу.
+PHONEBRIDGE_TELEMETRY_BUFFER = os.getenv(
+    "PHONEBRIDGE_TELEMETRY_BUFFER", "redis" if REDIS_URL and not DEBUG else "sync"
+)
+# Сырая телеметрия — дневные секции (PostgreSQL), старше N дней удаляются целиком
+PHONEBRIDGE_TELEMETRY_RETENTION_DAYS = int(os.getenv("PHONEBRIDGE_TELEMETRY_RETENTION_DAYS", "30"))
+# Часовые агрегаты latency живут дольше сырых данных
+PHONEBRIDGE_TELEMETRY_ROLLUP_RETENTION_DAYS = int(
+    os.getenv("PHONEBRIDGE_TELEMETRY_ROLLUP_RETENTION_DAYS", "180")
+)
+
 # Celery Configuration
 CELERY_BROKER_URL = os.getenv("CELERY_BROKER_URL", "redis://localhost:6379/1")
 CELERY_RESULT_BACKEND = os.getenv("CELERY_RESULT_BACKEND", "redis://localhost:6379/2")
@@ -803,6 +852,15 @@ SEARCH_TEXT_SIMILARITY_ONLY_IF_FTS_EMPTY = (
     os.getenv("SEARCH_TEXT_SIMILARITY_ONLY_IF_FTS_EMPTY", "1") or "1"
 ).strip().lower() in ("1", "true", "yes")
 SEARCH_TEXT_SIMILARITY_THRESHOLD = _float_env("SEARCH_TEXT_SIMILARITY_THRESHOLD", 0.4)
+# Кэш выдачи CompanySearchService (упорядоченные ID), сек. 0 — выключен.
+# Инвалидируется поколением индекса; TTL — страховка для изменений мимо сигналов (queryset.update).
+SEARCH_RESULT_CACHE_TTL = int(os.getenv("SEARCH_RESULT_CACHE_TTL", "120") or "120")
+
+# Очередь перестройки CompanySearchIndex (companies/search_index_queue.py):
+# DEBOUNCE — сколько секунд тишины ждать после последней правки карточки;
+# MAX_DELAY — не дольше стольких секунд с первой правки (карточку правят непрерывно).
+SEARCH_INDEX_QUEUE_DEBOUNCE_SECONDS = _float_env("SEARCH_INDEX_QUEUE_DEBOUNCE_SECONDS", 5.0)
+SEARCH_INDEX_QUEUE_MAX_DELAY_SECONDS = _float_env("SEARCH_INDEX_QUEUE_MAX_DELAY_SECONDS", 60.0)
 
 # Celery Beat Schedule (периодические задачи)
 # Частота синхронизации квоты smtp.bz (сек). По умолчанию раз в 5 минут.
@@ -844,6 +902,18 @@ CELERY_BEAT_SCHEDULE = {
         "task": "phonebridge.tasks.clean_old_call_requests",
         "schedule": 3600.0,  # Каждый час
     },
+    "drain-phone-telemetry": {
+        "task": "phonebridge.tasks.drain_telemetry_buffer",
+        "schedule": 10.0,  # Каждые 10 секунд (один воркер за раз — cache-лок)
+    },
+    "maintain-phone-telemetry-partitions": {
+        "task": "phonebridge.tasks.maintain_telemetry_partitions",
+        "schedule": crontab(hour=3, minute=30),  # Ежедневно 03:30 по Moscow
+    },
+    "drain-search-index-queue": {
+        "task": "companies.tasks.drain_search_index_queue",
+        "schedule": 5.0,  # Каждые 5 секунд (debounce внутри задачи)
+    },
     "reindex-companies-daily": {
         "task": "companies.tasks.reindex_companies_daily",
         "schedule": crontab(
@@ -908,6 +978,16 @@ CELERY_BEAT_SCHEDULE = {
         "task": "messenger.check_offline_operators",
         "schedule": 60.0,
     },
+    # Messenger: сжатие часовых агрегатов аналитики (каждые 5 минут)
+    "messenger-compact-reporting-buckets": {
+        "task": "messenger.compact_reporting_buckets",
+        "schedule": 300.0,
+    },
+    # Messenger: сверка счётчиков непрочитанных с сообщениями (каждые 10 минут)
+    "messenger-reconcile-unread-counters": {
+        "task": "messenger.reconcile_unread_counters",
+        "schedule": 600.0,
+    },
 }
 
 # Логирование
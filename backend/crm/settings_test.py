@@ -33,6 +33,8 @@ CACHES = {
         "LOCATION": "test-cache",
     }
 }
+# Индекс присутствия живёт в Redis — в тестах онлайн читается из БД
+MESSENGER_PRESENCE_INDEX = "db"
 
 # ── Email: in-memory для проверки отправки без реального SMTP ──
 EMAIL_BACKEND = "django.core.mail.backends.locmem.EmailBackend"
@@ -63,6 +63,7 @@ from phonebridge.api import (
     LogoutAllView,
     LogoutView,
     MobileAppLatestView,
+    PhoneLatencyView,
     PhoneLogUploadView,
     PhoneTelemetryView,
     PullCallView,
@@ -170,6 +171,9 @@ urlpatterns = [
     path("api/phone/calls/pull/", PullCallView.as_view(), name="phone_pull_call"),
     path("api/phone/calls/update/", UpdateCallInfoView.as_view(), name="phone_update_call_info"),
     path("api/phone/telemetry/", PhoneTelemetryView.as_view(), name="phone_telemetry"),
+    path(
+        "api/phone/telemetry/latency/", PhoneLatencyView.as_view(), name="phone_telemetry_latency"
+    ),
     path("api/phone/logs/", PhoneLogUploadView.as_view(), name="phone_logs"),
     path("api/phone/qr/create/", QrTokenCreateView.as_view(), name="phone_qr_create"),
     path("api/phone/user/info/", UserInfoView.as_view(), name="phone_user_info"),
@@ -201,6 +205,7 @@ urlpatterns = [
     path("api/v1/phone/calls/pull/", PullCallView.as_view()),
     path("api/v1/phone/calls/update/", UpdateCallInfoView.as_view()),
     path("api/v1/phone/telemetry/", PhoneTelemetryView.as_view()),
+    path("api/v1/phone/telemetry/latency/", PhoneLatencyView.as_view()),
     path("api/v1/phone/logs/", PhoneLogUploadView.as_view()),
     path("api/v1/phone/qr/create/", QrTokenCreateView.as_view()),
     path("api/v1/phone/user/info/", UserInfoView.as_view()),
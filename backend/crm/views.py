@@ -101,6 +101,8 @@ def metrics_endpoint(request):
       - crm_conversations_open — открытые диалоги в чате.
       - crm_users_absent — сейчас в отпуске/больничном.
       - crm_mobile_app_builds_active — активных APK production.
+      - crm_search_index_queue_size / crm_search_index_queue_lag_seconds — очередь
+        перестройки CompanySearchIndex.
     """
     from django.conf import settings as dj_settings
     from django.http import HttpResponse
@@ -195,6 +197,23 @@ def metrics_endpoint(request):
     except Exception:
         pass
 
+    try:
+        from companies.search_index_queue import queue_stats
+
+        stats = queue_stats()
+        gauge(
+            "crm_search_index_queue_size",
+            stats["size"],
+            "Companies waiting for search index rebuild",
+        )
+        gauge(
+            "crm_search_index_queue_lag_seconds",
+            round(stats["lag_seconds"], 1),
+            "Age of the oldest pending search index rebuild",
+        )
+    except Exception:
+        pass
+
     body = "\n".join(lines) + "\n"
     return HttpResponse(body, content_type="text/plain; version=0.0.4; charset=utf-8")
 
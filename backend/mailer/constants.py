@@ -41,11 +41,16 @@ DEFER_REASONS = (
     (DEFER_REASON_TRANSIENT_ERROR, "Временная ошибка отправки"),
 )
 
-# Redis lock timeout для задачи send_pending_emails (секунды).
+# Аренда записи очереди воркером send_pending_emails на время батча (секунды).
 # Переопределяется через settings.MAILER_SEND_LOCK_TIMEOUT.
 # 120 сек достаточно: батч из 50 писем × ~2 сек/письмо = ~100 сек.
 SEND_TASK_LOCK_TIMEOUT = 120
 
+# Справедливый планировщик очереди: окно учёта отправленных писем (минуты, как у max_per_hour)
+FAIR_SHARE_WINDOW_MINUTES = 60
+# Сколько записей очереди ранжировать за один выбор
+SCHEDULER_MAX_CANDIDATES = 200
+
 # Задержка перед следующей проверкой квоты smtp.bz (минуты)
 QUOTA_RECHECK_MINUTES = 30
 
@@ -59,6 +64,10 @@ SMTP_BZ_SYNC_MAX_PAGES = 10
 # Переопределяется через settings.MAILER_SEND_BATCH_SIZE.
 SEND_BATCH_SIZE_DEFAULT = 10
 
+# Параллельных SMTP-соединений при отправке батча (пул переиспользуемых соединений).
+# Переопределяется через settings.MAILER_SMTP_POOL_SIZE.
+SMTP_POOL_SIZE_DEFAULT = 4
+
 # Circuit breaker: после N подряд transient-ошибок SMTP кампания ставится на паузу
 CIRCUIT_BREAKER_THRESHOLD = 10
 
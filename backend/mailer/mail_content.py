@@ -69,21 +69,30 @@ def ensure_unsubscribe_tokens(emails: Iterable[str]) -> dict[str, str]:
     return existing
 
 
-def append_unsubscribe_footer(
-    *, body_html: str, body_text: str, unsubscribe_url: str
-) -> tuple[str, str]:
+def unsubscribe_footer(unsubscribe_url: str) -> tuple[str, str]:
     """
-    Добавляет ссылку отписки в HTML и text.
+    Подвал со ссылкой отписки: (html, text). Пустой URL — пустой подвал.
     """
     url = (unsubscribe_url or "").strip()
     if not url:
-        return body_html, body_text
-
+        return "", ""
     footer_text = f"\n\n---\nОтписаться: {url}\n"
     footer_html = (
         '<br><br><hr style="border:none;border-top:1px solid #e5e7eb;margin:16px 0;">'
         f'<div style="font-size:12px;color:#6b7280">Отписаться: <a href="{url}">{url}</a></div>'
     )
+    return footer_html, footer_text
+
+
+def append_unsubscribe_footer(
+    *, body_html: str, body_text: str, unsubscribe_url: str
+) -> tuple[str, str]:
+    """
+    Добавляет ссылку отписки в HTML и text.
+    """
+    footer_html, footer_text = unsubscribe_footer(unsubscribe_url)
+    if not footer_html:
+        return body_html, body_text
 
     out_html = body_html or ""
     out_text = body_text or ""
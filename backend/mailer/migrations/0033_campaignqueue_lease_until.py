@@ -0,0 +1,24 @@
+"""
+CampaignQueue.lease_until — аренда записи очереди воркером.
+
+Справедливый планировщик (mailer.services.scheduler) чередует кампании и позволяет
+нескольким воркерам send_pending_emails работать параллельно: запись захватывается
+через select_for_update(skip_locked=True) и аренду вместо глобального Redis-лока.
+"""
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("mailer", "0032_campaignrecipient_contact_company_fk"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="campaignqueue",
+            name="lease_until",
+            field=models.DateTimeField(blank=True, null=True, verbose_name="Захвачена воркером до"),
+        ),
+    ]
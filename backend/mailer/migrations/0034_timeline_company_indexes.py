@@ -0,0 +1,21 @@
+"""Индекс (company, status, updated_at) для ленты карточки компании.
+
+Отправленные письма компании читаются keyset-выборкой по updated_at.
+"""
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('companies', '0057_timeline_company_indexes'),
+        ('mailer', '0033_campaignqueue_lease_until'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='campaignrecipient',
+            index=models.Index(fields=['company', 'status', 'updated_at'], name='mailer_recip_company_sent_idx'),
+        ),
+    ]
@@ -274,6 +274,10 @@ class CampaignRecipient(models.Model):
         indexes = [
             models.Index(fields=["campaign", "status"]),
             models.Index(fields=["email"]),
+            # Лента карточки компании: отправленные письма по дате
+            models.Index(
+                fields=["company", "status", "updated_at"], name="mailer_recip_company_sent_idx"
+            ),
         ]
 
     def __str__(self) -> str:
@@ -441,6 +445,9 @@ class CampaignQueue(models.Model):
         default=0,
         help_text="Используется для автоматической паузы при множественных ошибках SMTP",
     )
+    # Аренда записи воркером на время батча (mailer.services.scheduler); после батча = момент
+    # освобождения — по нему reconcile отличает «чередуемую» кампанию от зависшей.
+    lease_until = models.DateTimeField("Захвачена воркером до", null=True, blank=True)
 
     class Meta:
         ordering = ["-priority", "queued_at"]
@@ -104,6 +104,171 @@ def reserve_rate_limit_token(max_per_hour: int = 100) -> tuple[bool, int, timezo
             return False, 0, next_retry
 
 
+def _hour_key(now) -> str:
+    return f"mailer:rate:hour:{now.strftime('%Y-%m-%d:%H')}"
+
+
+def reserve_rate_limit_tokens(
+    max_per_hour: int = 100, count: int = 1
+) -> tuple[int, int, timezone.datetime | None]:
+    """
+    Резервирует до count токенов одним INCRBY (вместо count round-trip'ов к Redis).
+
+    Returns:
+        (granted, current_count, next_reset_at)
+        - granted:       сколько писем можно отправить (0..count)
+        - current_count: счётчик часа после резервирования
+        - next_reset_at: время сброса, если выдано меньше count
+    """
+    from django.conf import settings
+
+    if count <= 0:
+        return 0, 0, None
+
+    fail_open: bool = getattr(settings, "MAILER_RATE_LIMIT_FAIL_OPEN", True)
+
+    now = timezone.now()
+    hour_key = _hour_key(now)
+    ttl = _hour_ttl(now)
+
+    try:
+        try:
+            new_value = cache.incr(hour_key, count)
+            _touch_safe(hour_key, ttl)
+        except ValueError:
+            if cache.add(hour_key, count, timeout=ttl):
+                new_value = count
+            else:
+                new_value = cache.incr(hour_key, count)
+                _touch_safe(hour_key, ttl)
+
+        excess = min(count, max(0, new_value - max_per_hour))
+        if excess:
+            # Возвращаем то, что не влезло в часовой лимит
+            try:
+                cache.decr(hour_key, excess)
+            except Exception:
+                logger.warning(
+                    "Rate limiter: DECR failed for key %s, counter may drift by %d",
+                    hour_key,
+                    excess,
+                )
+            next_hour = now.replace(minute=0, second=0, microsecond=0) + timedelta(hours=1)
+            return count - excess, new_value - excess, next_hour
+
+        return count, new_value, None
+
+    except Exception:
+        if fail_open:
+            logger.critical(
+                "RATE LIMITER UNAVAILABLE: Redis недоступен. "
+                "Отправка разрешена (fail-open, MAILER_RATE_LIMIT_FAIL_OPEN=True). "
+                "Возможно превышение лимита %d писем/час.",
+                max_per_hour,
+                exc_info=True,
+                extra={"error_type": "rate_limiter_backend_error", "policy": "fail_open"},
+            )
+            return count, 0, None
+        logger.critical(
+            "RATE LIMITER UNAVAILABLE: Redis недоступен. "
+            "Отправка ЗАБЛОКИРОВАНА (fail-closed, MAILER_RATE_LIMIT_FAIL_OPEN=False).",
+            exc_info=True,
+            extra={"error_type": "rate_limiter_backend_error", "policy": "fail_closed"},
+        )
+        return 0, 0, now + timedelta(minutes=1)
+
+
+def release_rate_limit_tokens(count: int, reserved_at) -> None:
+    """
+    Вернуть неиспользованные токены (батч остановился на временной ошибке).
+    Только в пределах того же часа: счётчик следующего часа не трогаем.
+    """
+    if count <= 0 or reserved_at is None:
+        return
+    now = timezone.now()
+    hour_key = _hour_key(reserved_at)
+    if hour_key != _hour_key(now):
+        return
+    try:
+        cache.decr(hour_key, count)
+    except Exception:
+        logger.debug("Rate limiter: release of %d tokens failed (non-critical)", count)
+
+
+def _daily_key(user_id, now) -> tuple[str, int]:
+    """Ключ дневного счётчика пользователя (сутки МСК) и TTL до их конца + 1 час."""
+    from mailer.utils import msk_day_bounds
+
+    _start, end_utc, now_msk = msk_day_bounds(now)
+    ttl = int((end_utc - now).total_seconds()) + 3600
+    return f"mailer:daily:user:{user_id}:{now_msk.date().isoformat()}", ttl
+
+
+def reserve_daily_quota(user_id, daily_limit: int, count: int, *, sent_today) -> int:
+    """
+    Атомарно резервирует до count писем из дневного лимита пользователя (INCRBY).
+
+    Параллельные воркеры одного пользователя (fan-out по кампаниям) иначе читают
+    одно и то же «отправлено сегодня» и вместе превышают лимит. Счётчик суток
+    заводится значением sent_today() (SendLog за сутки МСК) при первом обращении.
+    Неиспользованное возвращается release_daily_quota.
+
+    Returns: сколько писем можно отправить (0..count).
+    """
+    from django.conf import settings
+
+    if count <= 0 or not daily_limit:
+        return max(count, 0)
+
+    now = timezone.now()
+    key, ttl = _daily_key(user_id, now)
+    try:
+        try:
+            new_value = cache.incr(key, count)
+        except ValueError:
+            cache.add(key, sent_today(), timeout=ttl)
+            new_value = cache.incr(key, count)
+
+        excess = min(count, max(0, new_value - daily_limit))
+        if excess:
+            try:
+                cache.decr(key, excess)
+            except Exception:
+                logger.warning(
+                    "Daily quota: DECR failed for key %s, counter may drift by %d", key, excess
+                )
+        return count - excess
+    except Exception:
+        if getattr(settings, "MAILER_RATE_LIMIT_FAIL_OPEN", True):
+            # Без Redis — прежняя проверка по SendLog (без защиты от гонки воркеров)
+            logger.critical(
+                "DAILY QUOTA UNAVAILABLE: Redis недоступен, лимит %d писем/сутки по SendLog.",
+                daily_limit,
+                exc_info=True,
+                extra={"error_type": "rate_limiter_backend_error", "policy": "fail_open"},
+            )
+            return max(0, min(count, daily_limit - sent_today()))
+        logger.critical(
+            "DAILY QUOTA UNAVAILABLE: Redis недоступен. Отправка ЗАБЛОКИРОВАНА (fail-closed).",
+            exc_info=True,
+            extra={"error_type": "rate_limiter_backend_error", "policy": "fail_closed"},
+        )
+        return 0
+
+
+def release_daily_quota(user_id, count: int, reserved_at) -> None:
+    """Вернуть неотправленное из резерва (только в пределах тех же суток МСК)."""
+    if count <= 0 or reserved_at is None:
+        return
+    key, _ttl = _daily_key(user_id, reserved_at)
+    if key != _daily_key(user_id, timezone.now())[0]:
+        return
+    try:
+        cache.decr(key, count)
+    except Exception:
+        logger.debug("Daily quota: release of %d failed (non-critical)", count)
+
+
 def increment_rate_limit_per_hour(max_per_hour: int = 100) -> tuple[bool, int]:
     """Атомарно увеличивает счётчик (без проверки лимита — используется для аудита)."""
     now = timezone.now()
@@ -0,0 +1,180 @@
+"""
+Справедливый планировщик очереди рассылок.
+
+Раньше send_pending_emails брал одну запись очереди (сначала PROCESSING, иначе
+верхнюю PENDING) и доводил кампанию до конца под глобальным Redis-локом: одна
+кампания на 5000 адресов задерживала 20-адресные рассылки остальных менеджеров
+на часы. Теперь каждый батч выбирается заново:
+
+- справедливая доля между авторами кампаний (created_by): выигрывает пользователь
+  с наименьшим числом отправленных за окно FAIR_SHARE_WINDOW_MINUTES писем,
+  нормированным на вес (приоритет) его кампаний;
+- внутри пользователя — кампания с наименьшим нормированным числом отправок;
+- запись захватывается select_for_update(skip_locked=True) и арендой lease_until,
+  поэтому несколько воркеров работают параллельно, не отправляя один батч дважды.
+
+Квоты (max_per_hour, дневной лимит пользователя, рабочее время) проверяются
+вызывающим кодом как и раньше — планировщик решает только «чья очередь».
+"""
+
+from __future__ import annotations
+
+import datetime
+from dataclasses import dataclass
+
+from django.db import transaction
+from django.db.models import Count, Exists, OuterRef, Q
+from django.utils import timezone
+
+from mailer.constants import (
+    DEFER_REASON_TRANSIENT_ERROR,
+    FAIR_SHARE_WINDOW_MINUTES,
+    SCHEDULER_MAX_CANDIDATES,
+)
+from mailer.models import Campaign, CampaignQueue, CampaignRecipient, SendLog
+
+
+@dataclass(frozen=True)
+class Candidate:
+    """Запись очереди, готовая к обработке, с накопленной «отслуженной» долей."""
+
+    queue_id: object
+    campaign_id: object
+    user_id: int | None
+    priority: int
+    queued_at: datetime.datetime
+    user_share: float
+    campaign_share: float
+
+    def sort_key(self) -> tuple:
+        return (self.user_share, self.campaign_share, -self.priority, self.queued_at)
+
+
+def queue_weight(priority: int | None) -> int:
+    """Вес записи очереди: приоритет 0 → 1, каждый пункт приоритета добавляет долю."""
+    return max(1, int(priority or 0) + 1)
+
+
+def _claimable(now: datetime.datetime):
+    """Записи, которые можно взять в работу прямо сейчас (без учёта аренды)."""
+    has_pending = CampaignRecipient.objects.filter(
+        campaign_id=OuterRef("campaign_id"), status=CampaignRecipient.Status.PENDING
+    )
+    return (
+        CampaignQueue.objects.filter(
+            status__in=(CampaignQueue.Status.PENDING, CampaignQueue.Status.PROCESSING),
+            campaign__status__in=(Campaign.Status.READY, Campaign.Status.SENDING),
+        )
+        .filter(Q(deferred_until__isnull=True) | Q(deferred_until__lte=now))
+        .filter(Q(campaign__send_at__isnull=True) | Q(campaign__send_at__lte=now))
+        .filter(Q(lease_until__isnull=True) | Q(lease_until__lte=now))
+        .filter(Exists(has_pending))
+    )
+
+
+def rank_candidates(now: datetime.datetime | None = None) -> list[Candidate]:
+    """
+    Кандидаты в порядке справедливой доли (первый — следующий на отправку).
+
+    Отслуженная доля считается по SendLog за последние FAIR_SHARE_WINDOW_MINUTES
+    (окно совпадает с лимитом max_per_hour): один агрегатный запрос на всех авторов.
+    """
+    now = now or timezone.now()
+    rows = list(
+        _claimable(now)
+        .order_by("-priority", "queued_at")
+        .values_list("id", "campaign_id", "campaign__created_by_id", "priority", "queued_at")[
+            :SCHEDULER_MAX_CANDIDATES
+        ]
+    )
+    if not rows:
+        return []
+
+    user_ids = {user_id for _, _, user_id, _, _ in rows if user_id}
+    sent_by_campaign: dict = {}
+    sent_by_user: dict = {}
+    if user_ids:
+        served = (
+            SendLog.objects.filter(
+                provider="smtp_global",
+                status=SendLog.Status.SENT,
+                campaign__created_by_id__in=user_ids,
+                created_at__gte=now - datetime.timedelta(minutes=FAIR_SHARE_WINDOW_MINUTES),
+            )
+            .values("campaign_id", "campaign__created_by_id")
+            .annotate(sent=Count("id"))
+        )
+        for row in served:
+            sent_by_campaign[row["campaign_id"]] = row["sent"]
+            user_id = row["campaign__created_by_id"]
+            sent_by_user[user_id] = sent_by_user.get(user_id, 0) + row["sent"]
+
+    # Вес пользователя — максимальный вес его активных кампаний: срочная рассылка
+    # поднимает долю автора, но не даёт обогнать других за счёт числа кампаний.
+    user_weight: dict = {}
+    for _, _, user_id, priority, _ in rows:
+        user_weight[user_id] = max(user_weight.get(user_id, 1), queue_weight(priority))
+
+    candidates = [
+        Candidate(
+            queue_id=queue_id,
+            campaign_id=campaign_id,
+            user_id=user_id,
+            priority=priority,
+            queued_at=queued_at,
+            user_share=sent_by_user.get(user_id, 0) / user_weight[user_id],
+            campaign_share=sent_by_campaign.get(campaign_id, 0) / queue_weight(priority),
+        )
+        for queue_id, campaign_id, user_id, priority, queued_at in rows
+    ]
+    candidates.sort(key=Candidate.sort_key)
+    return candidates
+
+
+def claim_next_queue_entry(*, lease_seconds: int) -> CampaignQueue | None:
+    """
+    Захватить следующую по справедливой доле запись очереди.
+
+    Кандидаты, уже заблокированные другим воркером (skip_locked) или захваченные им
+    между ранжированием и блокировкой, пропускаются. Запись переводится в PROCESSING
+    и получает аренду на lease_seconds; по окончании батча — release_queue_entry().
+    """
+    now = timezone.now()
+    for candidate in rank_candidates(now):
+        with transaction.atomic():
+            entry = (
+                _claimable(now)
+                .select_for_update(skip_locked=True, of=("self",))
+                .filter(id=candidate.queue_id)
+                .select_related("campaign", "campaign__created_by")
+                .first()
+            )
+            if entry is None:
+                continue
+            entry.lease_until = now + datetime.timedelta(seconds=lease_seconds)
+            update_fields = ["lease_until"]
+            if entry.status != CampaignQueue.Status.PROCESSING:
+                entry.status = CampaignQueue.Status.PROCESSING
+                entry.started_at = now
+                # После transient-отложения счётчик не сбрасываем — иначе circuit breaker
+                # никогда не наберёт порог.
+                if entry.defer_reason != DEFER_REASON_TRANSIENT_ERROR:
+                    entry.consecutive_transient_errors = 0
+                entry.deferred_until = None
+                entry.defer_reason = ""
+                update_fields += [
+                    "status",
+                    "started_at",
+                    "deferred_until",
+                    "defer_reason",
+                    "consecutive_transient_errors",
+                ]
+            entry.save(update_fields=update_fields)
+            return entry
+    return None
+
+
+def release_queue_entry(entry: CampaignQueue) -> None:
+    """Снять аренду после батча: запись снова доступна планировщику (и другим воркерам)."""
+    now = timezone.now()
+    CampaignQueue.objects.filter(id=entry.id, lease_until__gt=now).update(lease_until=now)
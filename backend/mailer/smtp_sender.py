@@ -1,9 +1,17 @@
 from __future__ import annotations
 
 import base64
+import logging
+import mimetypes
+import queue
 import re
+import secrets
 import smtplib
 import ssl
+import threading
+from dataclasses import dataclass, field
+from email import base64mime
+from email import policy as email_policy
 from email.message import EmailMessage
 from email.utils import formataddr, make_msgid
 from typing import Optional, Protocol
@@ -12,6 +20,8 @@ from django.conf import settings
 
 from mailer.models import MailAccount
 
+logger = logging.getLogger(__name__)
+
 
 class _SmtpAccountLike(Protocol):
     smtp_host: str
@@ -122,7 +132,9 @@ def build_message(
         # Важно: inline base64-картинки из буфера (например, из Яндекса) многие почтовики режут/ломают.
         # Конвертим data:image/... в cid: и прикладываем как multipart/related.
         html_fixed, inline_imgs = _inline_data_images(body_html)
-        html_part = msg.add_alternative(html_fixed, subtype="html", charset="utf-8")
+        msg.add_alternative(html_fixed, subtype="html", charset="utf-8")
+        # add_alternative() ничего не возвращает — HTML-часть берём из структуры письма
+        html_part = msg.get_body(preferencelist=("html",))
         # Привязываем inline-картинки к HTML-части.
         for cid, content, subtype in inline_imgs:
             try:
@@ -181,6 +193,178 @@ def build_message(
     return msg
 
 
+@dataclass
+class RenderedMessage:
+    """
+    Готовое к отправке письмо из MessageTemplate: сырые байты + конверт.
+    Заголовки доступны как у EmailMessage (msg["Message-ID"], msg.get(...)).
+    """
+
+    from_addr: str
+    to_addrs: list[str]
+    data: bytes
+    headers: dict[str, str] = field(default_factory=dict)
+
+    def get(self, name: str, default=None):
+        return self.headers.get(name, default)
+
+    def __getitem__(self, name: str):
+        return self.headers.get(name)
+
+    def as_bytes(self) -> bytes:
+        return self.data
+
+
+_SMTP_POLICY = email_policy.SMTP
+_SMTP_UTF8_POLICY = email_policy.SMTPUTF8
+
+
+def _fold_header(name: str, value: str) -> bytes:
+    try:
+        return _SMTP_POLICY.fold_binary(name, value)
+    except UnicodeEncodeError:
+        # Кириллический адрес (кто@пример.рф) — только как UTF-8 (отправка через SMTPUTF8)
+        return _SMTP_UTF8_POLICY.fold_binary(name, value)
+
+
+class MessageTemplate:
+    """
+    Скомпилированный «скелет» письма рассылки.
+
+    Всё общее для получателей — заголовки From/Subject/Reply-To, inline-картинки
+    (data:image → cid:) и вложение — кодируется один раз в compile_message_template().
+    На получателя остаются: заголовки To/Message-ID/X-Tag/List-Unsubscribe и
+    base64 текстовой/HTML-части с подвалом отписки, которые вклеиваются в готовые байты.
+    """
+
+    def __init__(self, *, from_addr: str, chunks: list[bytes], slots: list[str], bodies: dict):
+        self.from_addr = from_addr
+        self._chunks = chunks  # байты скелета между слотами тел
+        self._slots = slots  # "plain"/"html" — порядок слотов в скелете
+        self._bodies = bodies  # slot -> базовый текст части
+
+    @property
+    def size(self) -> int:
+        return sum(len(c) for c in self._chunks)
+
+    def render(
+        self,
+        *,
+        to_email: str,
+        html_footer: str = "",
+        text_footer: str = "",
+        headers: dict[str, str] | None = None,
+    ) -> RenderedMessage:
+        to_email = _sanitize_header(to_email or "")
+        values = {"To": to_email, "Message-ID": make_msgid(domain=None)}
+        for name, value in (headers or {}).items():
+            values[name] = _sanitize_header(value or "")
+
+        out = [b"".join(_fold_header(name, value) for name, value in values.items())]
+        for i, slot in enumerate(self._slots):
+            out.append(self._chunks[i])
+            base = self._bodies[slot]
+            if slot == "html":
+                text = base + html_footer if base else html_footer
+            else:
+                text = (base + text_footer) if base else (text_footer.strip() or " ")
+            encoded = base64mime.body_encode(text.encode("utf-8"), eol="\r\n")
+            out.append(encoded.rstrip("\r\n").encode("ascii"))
+        out.append(self._chunks[-1])
+        return RenderedMessage(
+            from_addr=self.from_addr, to_addrs=[to_email], data=b"".join(out), headers=values
+        )
+
+
+def compile_message_template(
+    *,
+    account: MailAccount,
+    subject: str,
+    body_text: str,
+    body_html: str,
+    from_email: str | None = None,
+    from_name: str | None = None,
+    reply_to: str | None = None,
+    attachment_content: bytes | None = None,
+    attachment_filename: str | None = None,
+    headers: dict[str, str] | None = None,
+) -> MessageTemplate:
+    """
+    Собрать письмо один раз (структура как у build_message) и разрезать его по слотам
+    текстовой и HTML-частей. Результат — MessageTemplate для дешёвого render() на получателя.
+    """
+    msg = EmailMessage(policy=_SMTP_POLICY)
+    msg["Subject"] = _sanitize_header(subject or "")
+    _from_email = _sanitize_header(
+        (from_email or account.from_email or account.smtp_username or "").strip()
+    )
+    _from_name = _sanitize_header((from_name or account.from_name or "").strip())
+    msg["From"] = formataddr((_from_name, _from_email)) if _from_name else _from_email
+    _reply_to = _sanitize_header((reply_to or getattr(account, "reply_to", "") or "").strip())
+    if _reply_to:
+        msg["Reply-To"] = _reply_to
+    for name, value in (headers or {}).items():
+        msg[name] = _sanitize_header(value or "")
+
+    # Маркеры слотов: ASCII-строки, которые не встречаются в base64 и границах MIME.
+    marker = secrets.token_hex(16)
+    markers = {"plain": f"@@plain-{marker}@@", "html": f"@@html-{marker}@@"}
+    bodies = {"plain": body_text or ""}
+
+    msg.set_content(markers["plain"], subtype="plain", charset="utf-8", cte="7bit")
+    if body_html:
+        html_fixed, inline_imgs = _inline_data_images(body_html)
+        bodies["html"] = html_fixed
+        msg.add_alternative(markers["html"], subtype="html", charset="utf-8", cte="7bit")
+        html_part = msg.get_body(preferencelist=("html",))
+        for cid, content, subtype in inline_imgs:
+            try:
+                html_part.add_related(
+                    content,
+                    maintype="image",
+                    subtype=subtype,
+                    cid=f"<{cid}>",
+                    filename=None,
+                    disposition="inline",
+                )
+            except Exception:
+                continue
+
+    # Тела частей вклеиваются в base64 на получателя — так и объявляем
+    for part in _walk_text_parts(msg):
+        part.replace_header("Content-Transfer-Encoding", "base64")
+
+    if attachment_content is not None:
+        fname = (attachment_filename or "attachment").strip()
+        mime_type, _ = mimetypes.guess_type(fname)
+        if mime_type:
+            maintype, subtype = mime_type.split("/", 1)
+        else:
+            maintype, subtype = "application", "octet-stream"
+        msg.add_attachment(attachment_content, maintype=maintype, subtype=subtype, filename=fname)
+
+    raw = msg.as_bytes(policy=_SMTP_POLICY)
+    chunks: list[bytes] = []
+    slots: list[str] = []
+    rest = raw
+    while True:
+        found = [(rest.find(m.encode()), slot) for slot, m in markers.items() if m.encode() in rest]
+        if not found:
+            break
+        pos, slot = min(found)
+        chunks.append(rest[:pos])
+        slots.append(slot)
+        rest = rest[pos + len(markers[slot]) :]
+    chunks.append(rest)
+    return MessageTemplate(from_addr=_from_email, chunks=chunks, slots=slots, bodies=bodies)
+
+
+def _walk_text_parts(msg: EmailMessage):
+    for part in msg.walk():
+        if part.get_content_maintype() == "text" and not part.is_attachment():
+            yield part
+
+
 def format_smtp_error(error: Exception, account: _SmtpAccountLike) -> str:
     """
     Форматирует SMTP ошибку в понятное сообщение для пользователя.
@@ -290,8 +474,20 @@ def open_smtp_connection(account: _SmtpAccountLike) -> smtplib.SMTP:
         raise formatted_error_obj from e
 
 
+def _send_message(smtp: smtplib.SMTP, msg: EmailMessage | RenderedMessage) -> dict:
+    if isinstance(msg, RenderedMessage):
+        addrs = [msg.from_addr, *msg.to_addrs]
+        # Как smtplib.send_message: не-ASCII адреса — только через SMTPUTF8
+        options = () if all(a.isascii() for a in addrs) else ("SMTPUTF8", "BODY=8BITMIME")
+        return smtp.sendmail(msg.from_addr, msg.to_addrs, msg.data, mail_options=options)
+    return smtp.send_message(msg)
+
+
 def send_via_smtp(
-    account: _SmtpAccountLike, msg: EmailMessage, *, smtp: smtplib.SMTP | None = None
+    account: _SmtpAccountLike,
+    msg: EmailMessage | RenderedMessage,
+    *,
+    smtp: smtplib.SMTP | None = None,
 ) -> None:
     """
     Отправляет письмо через SMTP с улучшенной обработкой ошибок.
@@ -301,7 +497,7 @@ def send_via_smtp(
     """
     try:
         if smtp is not None:
-            refused = smtp.send_message(msg)
+            refused = _send_message(smtp, msg)
             # smtplib.send_message может вернуть dict отказанных получателей без исключения
             if refused:
                 # формат: {email: (code, resp)} или {email: resp}
@@ -318,7 +514,7 @@ def send_via_smtp(
         # Одиночная отправка (открыть/закрыть соединение внутри)
         smtp_local = open_smtp_connection(account)
         try:
-            refused = smtp_local.send_message(msg)
+            refused = _send_message(smtp_local, msg)
             if refused:
                 first_email = next(iter(refused.keys()))
                 detail = refused.get(first_email)
@@ -340,3 +536,87 @@ def send_via_smtp(
         formatted_error_obj = RuntimeError(formatted_error)
         formatted_error_obj.original_error = e
         raise formatted_error_obj from e
+
+
+class SmtpConnectionPool:
+    """
+    Пул залогиненных SMTP-соединений на время батча рассылки.
+
+    Соединения открываются лениво (не больше size) через open_smtp_connection и
+    переиспользуются между письмами: TLS-рукопожатие и AUTH — один раз на соединение,
+    а не на каждое письмо. Одно соединение в каждый момент используется одним потоком.
+
+    Если соединение открыть не удалось, acquire() возвращает None — вызывающая сторона
+    отправляет письмо по-старому (send_via_smtp без smtp=), получая ту же понятную ошибку.
+    """
+
+    def __init__(self, account: _SmtpAccountLike, *, size: int = 1):
+        self.account = account
+        self.size = max(1, int(size or 1))
+        self._idle: queue.LifoQueue[smtplib.SMTP] = queue.LifoQueue()
+        self._opened = 0
+        self._broken = False
+        self._lock = threading.Lock()
+
+    def acquire(self) -> smtplib.SMTP | None:
+        while True:
+            try:
+                return self._idle.get_nowait()
+            except queue.Empty:
+                pass
+            with self._lock:
+                if self._broken:
+                    return None
+                can_open = self._opened < self.size
+                if can_open:
+                    self._opened += 1
+            if can_open:
+                break
+            try:
+                return self._idle.get(timeout=1)
+            except queue.Empty:
+                # Соединение могли выбросить (release(discard=True)) — освободился слот.
+                continue
+
+        try:
+            return open_smtp_connection(self.account)
+        except Exception as exc:
+            with self._lock:
+                self._opened -= 1
+                self._broken = True
+            logger.warning("SMTP pool: не удалось открыть соединение: %s", exc)
+            return None
+
+    def release(self, smtp: smtplib.SMTP, *, discard: bool = False) -> None:
+        if not discard:
+            self._idle.put(smtp)
+            return
+        with self._lock:
+            self._opened -= 1
+        _quit_quietly(smtp)
+
+    def close(self) -> None:
+        while True:
+            try:
+                smtp = self._idle.get_nowait()
+            except queue.Empty:
+                return
+            with self._lock:
+                self._opened -= 1
+            _quit_quietly(smtp)
+
+    def __enter__(self) -> SmtpConnectionPool:
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+
+def _quit_quietly(smtp: smtplib.SMTP) -> None:
+    try:
+        smtp.quit()
+    except Exception:
+        try:
+            smtp.close()
+        except Exception:
+            pass
@@ -5,8 +5,14 @@
 
 from __future__ import annotations
 
+import hashlib
 import logging
 import re
+import smtplib
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 from zoneinfo import ZoneInfo
 
@@ -18,11 +24,17 @@ from mailer.constants import (
     MAX_ERROR_MESSAGE_LENGTH,
     SEND_BATCH_SIZE_DEFAULT,
     SEND_TASK_LOCK_TIMEOUT,
+    SMTP_POOL_SIZE_DEFAULT,
     WORKING_HOURS_END,
     WORKING_HOURS_START,
 )
 from mailer.services import rate_limiter
-from mailer.smtp_sender import build_message, send_via_smtp
+from mailer.smtp_sender import (
+    MessageTemplate,
+    SmtpConnectionPool,
+    compile_message_template,
+    send_via_smtp,
+)
 
 logger = logging.getLogger(__name__)
 
@@ -36,6 +48,22 @@ def reserve_rate_limit_token(*args, **kwargs):
     return rate_limiter.reserve_rate_limit_token(*args, **kwargs)
 
 
+def reserve_rate_limit_tokens(*args, **kwargs):
+    return rate_limiter.reserve_rate_limit_tokens(*args, **kwargs)
+
+
+def release_rate_limit_tokens(*args, **kwargs):
+    return rate_limiter.release_rate_limit_tokens(*args, **kwargs)
+
+
+def reserve_daily_quota(*args, **kwargs):
+    return rate_limiter.reserve_daily_quota(*args, **kwargs)
+
+
+def release_daily_quota(*args, **kwargs):
+    return rate_limiter.release_daily_quota(*args, **kwargs)
+
+
 def get_effective_quota_available(*args, **kwargs):
     return rate_limiter.get_effective_quota_available(*args, **kwargs)
 
@@ -369,6 +397,98 @@ def _notify_attachment_error(camp, *, error: str) -> None:
 # ---------------------------------------------------------------------------
 
 
+# Скомпилированные письма кампаний: кампания шлётся батчами в одном воркере,
+# поэтому скелет переживает батч. Ключ — хэш всего, что входит в скелет.
+MESSAGE_TEMPLATE_CACHE_SIZE = 4
+_message_templates: OrderedDict[str, MessageTemplate] = OrderedDict()
+_message_templates_lock = threading.Lock()
+
+
+def _campaign_message_template(
+    *,
+    camp,
+    identity,
+    base_html: str,
+    base_text: str,
+    from_email: str,
+    from_name: str,
+    reply_to: str,
+    attachment_bytes,
+    attachment_name,
+) -> MessageTemplate:
+    """
+    MessageTemplate кампании: inline-картинки и вложение кодируются один раз на кампанию,
+    а не на каждого получателя (см. smtp_sender.compile_message_template).
+    """
+    digest = hashlib.sha256()
+    for value in (
+        str(camp.id),
+        camp.subject or "",
+        from_email,
+        from_name,
+        reply_to,
+        base_text or "",
+        base_html or "",
+        attachment_name or "",
+    ):
+        digest.update(value.encode("utf-8", "surrogatepass"))
+        digest.update(b"\0")
+    if attachment_bytes is not None:
+        digest.update(attachment_bytes)
+    key = digest.hexdigest()
+
+    with _message_templates_lock:
+        template = _message_templates.get(key)
+        if template is not None:
+            _message_templates.move_to_end(key)
+            return template
+
+    template = compile_message_template(
+        account=identity,
+        subject=camp.subject,
+        body_text=base_text or "",
+        body_html=base_html or "",
+        from_email=from_email,
+        from_name=from_name,
+        reply_to=reply_to,
+        attachment_content=attachment_bytes,
+        attachment_filename=attachment_name,
+        headers={"Precedence": "bulk", "Auto-Submitted": "auto-generated"},
+    )
+    with _message_templates_lock:
+        _message_templates[key] = template
+        while len(_message_templates) > MESSAGE_TEMPLATE_CACHE_SIZE:
+            _message_templates.popitem(last=False)
+    return template
+
+
+def _send_pooled(pool: SmtpConnectionPool, smtp_cfg, msg) -> None:
+    """
+    Отправить письмо через соединение из пула.
+
+    Соединение, на котором случилась ошибка, выбрасывается (его состояние неизвестно);
+    если сервер успел закрыть простаивающее соединение — одна повторная попытка на новом.
+    Без соединения (пул не смог открыть) — одиночная отправка, как раньше.
+    """
+    for attempt in (1, 2):
+        smtp = pool.acquire()
+        if smtp is None:
+            send_via_smtp(smtp_cfg, msg)
+            return
+        ok = False
+        try:
+            send_via_smtp(smtp_cfg, msg, smtp=smtp)
+            ok = True
+            return
+        except Exception as ex:
+            original = getattr(ex, "original_error", None)
+            if attempt == 1 and isinstance(original, smtplib.SMTPServerDisconnected):
+                continue
+            raise
+        finally:
+            pool.release(smtp, discard=not ok)
+
+
 def _process_batch_recipients(
     *,
     batch: list,
@@ -388,13 +508,23 @@ def _process_batch_recipients(
     """
     Отправляет батч получателей через SMTP и записывает результаты в БД.
 
+    Конвейер:
+    - письмо кампании компилируется один раз (_campaign_message_template), на получателя —
+      только вклейка To/X-Tag/List-Unsubscribe и тел с подвалом отписки;
+    - уже отправленные (SendLog SENT) определяются одним запросом на батч;
+    - токены rate limit резервируются блоком на весь батч (один INCRBY),
+      неиспользованные возвращаются;
+    - письма уходят параллельно (settings.MAILER_SMTP_POOL_SIZE потоков) через пул
+      переиспользуемых SMTP-соединений; в потоках — только SMTP, вся работа с БД здесь.
+
     Returns:
         (transient_blocked, rate_limited) — флаги для управления circuit breaker и defer.
     """
+    from django.conf import settings
     from django.db import transaction
 
     from mailer.logging_utils import get_pii_log_fields
-    from mailer.mail_content import append_unsubscribe_footer, build_unsubscribe_url
+    from mailer.mail_content import build_unsubscribe_url, unsubscribe_footer
     from mailer.models import CampaignRecipient, SendLog
     from mailer.services.queue import defer_queue
 
@@ -404,6 +534,26 @@ def _process_batch_recipients(
     transient_blocked = False
     rate_limited = False
 
+    # Idempotency: если письмо уже было отправлено (воркер упал после send, но
+    # до bulk_update) — не отправляем повторно, просто синхронизируем статус.
+    already_sent = set(
+        SendLog.objects.filter(
+            campaign=camp,
+            recipient_id__in=[r.id for r in batch],
+            status=SendLog.Status.SENT,
+        ).values_list("recipient_id", flat=True)
+    )
+
+    from_email = _sanitize_header_value(
+        (smtp_cfg.from_email or "").strip() or (smtp_cfg.smtp_username or "").strip()
+    )
+    from_name = _sanitize_header_value(
+        (camp.sender_name or "").strip() or (smtp_cfg.from_name or "CRM ПРОФИ").strip()
+    )
+    reply_to = _sanitize_header_value((user.email or "").strip())
+
+    template = None  # компилируется при первом получателе, которому действительно пишем
+    outgoing = []  # [(recipient, msg)]
     for r in batch:
         email_norm = (r.email or "").strip().lower()
         if not email_norm:
@@ -415,58 +565,90 @@ def _process_batch_recipients(
             recipients_to_update.append(r)
             continue
 
-        token = tokens.get(email_norm, "")
-        unsub_url = build_unsubscribe_url(token) if token else ""
-        body_html, body_text = append_unsubscribe_footer(
-            body_html=base_html,
-            body_text=base_text,
-            unsubscribe_url=unsub_url,
-        )
-
-        msg = build_message(
-            account=identity,
-            to_email=r.email,
-            subject=camp.subject,
-            body_text=(body_text or ""),
-            body_html=(body_html or ""),
-            from_email=_sanitize_header_value(
-                (smtp_cfg.from_email or "").strip() or (smtp_cfg.smtp_username or "").strip()
-            ),
-            from_name=_sanitize_header_value(
-                (camp.sender_name or "").strip() or (smtp_cfg.from_name or "CRM ПРОФИ").strip()
-            ),
-            reply_to=_sanitize_header_value((user.email or "").strip()),
-            attachment_content=attachment_bytes,
-            attachment_filename=attachment_name,
-        )
-
-        if unsub_url:
-            msg["List-Unsubscribe"] = f"<{unsub_url}>"
-            msg["List-Unsubscribe-Post"] = "List-Unsubscribe=One-Click"
-        msg["Precedence"] = "bulk"
-        msg["Auto-Submitted"] = "auto-generated"
-        msg["X-Tag"] = f"camp:{camp.id};rcpt:{r.id}"
-
-        # Idempotency: если письмо уже было отправлено (воркер упал после send, но
-        # до bulk_update) — не отправляем повторно, просто синхронизируем статус.
-        if SendLog.objects.filter(campaign=camp, recipient=r, status=SendLog.Status.SENT).exists():
+        if r.id in already_sent:
             r.status = CampaignRecipient.Status.SENT
             r.last_error = ""
             r.updated_at = now_ts
             recipients_to_update.append(r)
             continue
 
-        try:
-            token_reserved, token_count, rate_reset_at = reserve_rate_limit_token(max_per_hour)
-            if not token_reserved:
-                defer_queue(queue_entry, DEFER_REASON_RATE_HOUR, rate_reset_at, notify=True)
-                rate_limited = True
-                break
+        token = tokens.get(email_norm, "")
+        unsub_url = build_unsubscribe_url(token) if token else ""
+        html_footer, text_footer = unsubscribe_footer(unsub_url)
+        headers = {"X-Tag": f"camp:{camp.id};rcpt:{r.id}"}
+        if unsub_url:
+            headers["List-Unsubscribe"] = f"<{unsub_url}>"
+            headers["List-Unsubscribe-Post"] = "List-Unsubscribe=One-Click"
+
+        if template is None:
+            template = _campaign_message_template(
+                camp=camp,
+                identity=identity,
+                base_html=base_html,
+                base_text=base_text,
+                from_email=from_email,
+                from_name=from_name,
+                reply_to=reply_to,
+                attachment_bytes=attachment_bytes,
+                attachment_name=attachment_name,
+            )
+        msg = template.render(
+            to_email=r.email,
+            html_footer=html_footer if base_html else "",
+            text_footer=text_footer,
+            headers=headers,
+        )
+        outgoing.append((r, msg))
 
-            send_start = timezone.now()
-            send_via_smtp(smtp_cfg, msg)
-            send_ms = int((timezone.now() - send_start).total_seconds() * 1000)
+    results: list = []
+    if outgoing:
+        reserved_at = timezone.now()
+        granted, _token_count, rate_reset_at = reserve_rate_limit_tokens(
+            max_per_hour, len(outgoing)
+        )
+        if granted < len(outgoing):
+            # Остаток батча не влезает в часовой бюджет: отправляем, что можно;
+            # откладывать очередь или нет — решается после отправки (см. ниже)
+            rate_limited = True
+            outgoing = outgoing[:granted]
+
+        if outgoing:
+            pool_size = int(getattr(settings, "MAILER_SMTP_POOL_SIZE", SMTP_POOL_SIZE_DEFAULT))
+            workers = max(1, min(pool_size, len(outgoing)))
+            stop = threading.Event()
+
+            def _send_one(msg):
+                # После временной ошибки новые письма не начинаем (как прежний break)
+                if stop.is_set():
+                    return "skipped", 0, None
+                started = time.monotonic()
+                try:
+                    _send_pooled(pool, smtp_cfg, msg)
+                except Exception as ex:
+                    if _is_transient_send_error(str(ex)):
+                        stop.set()
+                    return "error", 0, ex
+                return "sent", int((time.monotonic() - started) * 1000), None
+
+            with SmtpConnectionPool(smtp_cfg, size=workers) as pool:
+                if workers == 1:
+                    results = [_send_one(msg) for _r, msg in outgoing]
+                else:
+                    with ThreadPoolExecutor(
+                        max_workers=workers, thread_name_prefix="mailer-smtp"
+                    ) as executor:
+                        results = list(executor.map(_send_one, [msg for _r, msg in outgoing]))
+
+            unused = sum(1 for outcome, _ms, _ex in results if outcome == "skipped")
+            release_rate_limit_tokens(unused, reserved_at)
+
+    any_sent = False
+    for (r, msg), (outcome, send_ms, ex) in zip(outgoing, results, strict=True):
+        if outcome == "skipped":
+            continue
 
+        if outcome == "sent":
+            any_sent = True
             r.status = CampaignRecipient.Status.SENT
             r.last_error = ""
             r.updated_at = timezone.now()
@@ -491,52 +673,22 @@ def _process_batch_recipients(
                     "took_ms": send_ms,
                 },
             )
-            if queue_entry and queue_entry.consecutive_transient_errors > 0:
-                queue_entry.consecutive_transient_errors = 0
-                queue_entry.save(update_fields=["consecutive_transient_errors"])
-
-        except Exception as ex:
-            err = str(ex)
-            logger.error(
-                "Failed to send email",
-                exc_info=True,
-                extra={
-                    "campaign_id": str(camp.id),
-                    "recipient_id": str(r.id),
-                    **get_pii_log_fields(r.email, log_level=logging.ERROR),
-                },
-            )
+            continue
 
-            if _is_transient_send_error(err):
-                r.status = CampaignRecipient.Status.PENDING
-                r.last_error = (err or "Временная ошибка")[:MAX_ERROR_MESSAGE_LENGTH]
-                r.updated_at = timezone.now()
-                recipients_to_update.append(r)
-                logs_to_create.append(
-                    SendLog(
-                        campaign=camp,
-                        recipient=r,
-                        account=None,
-                        provider="smtp_global",
-                        status=SendLog.Status.FAILED,
-                        error=(err or "Временная ошибка")[:MAX_ERROR_MESSAGE_LENGTH],
-                    )
-                )
-                transient_blocked = True
-                break
-
-            # Обогащение ошибки через smtp.bz API
-            if smtp_cfg.smtp_bz_api_key:
-                err = _smtp_bz_enrich_error(
-                    api_key=smtp_cfg.smtp_bz_api_key,
-                    msg=msg,
-                    campaign_id=str(camp.id),
-                    recipient_id=str(r.id),
-                    err=err,
-                )
+        err = str(ex)
+        logger.error(
+            "Failed to send email",
+            exc_info=ex,
+            extra={
+                "campaign_id": str(camp.id),
+                "recipient_id": str(r.id),
+                **get_pii_log_fields(r.email, log_level=logging.ERROR),
+            },
+        )
 
-            r.status = CampaignRecipient.Status.FAILED
-            r.last_error = (err or "Ошибка отправки")[:MAX_ERROR_MESSAGE_LENGTH]
+        if _is_transient_send_error(err):
+            r.status = CampaignRecipient.Status.PENDING
+            r.last_error = (err or "Временная ошибка")[:MAX_ERROR_MESSAGE_LENGTH]
             r.updated_at = timezone.now()
             recipients_to_update.append(r)
             logs_to_create.append(
@@ -546,9 +698,47 @@ def _process_batch_recipients(
                     account=None,
                     provider="smtp_global",
                     status=SendLog.Status.FAILED,
-                    error=(err or "Ошибка отправки")[:MAX_ERROR_MESSAGE_LENGTH],
+                    error=(err or "Временная ошибка")[:MAX_ERROR_MESSAGE_LENGTH],
                 )
             )
+            transient_blocked = True
+            continue
+
+        # Обогащение ошибки через smtp.bz API
+        if smtp_cfg.smtp_bz_api_key:
+            err = _smtp_bz_enrich_error(
+                api_key=smtp_cfg.smtp_bz_api_key,
+                msg=msg,
+                campaign_id=str(camp.id),
+                recipient_id=str(r.id),
+                err=err,
+            )
+
+        r.status = CampaignRecipient.Status.FAILED
+        r.last_error = (err or "Ошибка отправки")[:MAX_ERROR_MESSAGE_LENGTH]
+        r.updated_at = timezone.now()
+        recipients_to_update.append(r)
+        logs_to_create.append(
+            SendLog(
+                campaign=camp,
+                recipient=r,
+                account=None,
+                provider="smtp_global",
+                status=SendLog.Status.FAILED,
+                error=(err or "Ошибка отправки")[:MAX_ERROR_MESSAGE_LENGTH],
+            )
+        )
+
+    if any_sent and queue_entry and queue_entry.consecutive_transient_errors > 0:
+        queue_entry.consecutive_transient_errors = 0
+        queue_entry.save(update_fields=["consecutive_transient_errors"])
+
+    # Исход батча — ровно один: временная ошибка уводит очередь в circuit breaker
+    # (send.py, свой defer с backoff), и только без неё — отложить до сброса часового лимита.
+    if transient_blocked:
+        rate_limited = False
+    elif rate_limited:
+        defer_queue(queue_entry, DEFER_REASON_RATE_HOUR, rate_reset_at, notify=True)
 
     if recipients_to_update or logs_to_create:
         with transaction.atomic():
@@ -558,6 +748,14 @@ def _process_batch_recipients(
                     ["status", "last_error", "updated_at"],
                     batch_size=BULK_UPDATE_BATCH_SIZE,
                 )
+                # Отправленные письма видны в ленте карточки компании
+                from companies.card_cache import bump_company_cards
+
+                bump_company_cards(
+                    r.company_id
+                    for r in recipients_to_update
+                    if r.status == CampaignRecipient.Status.SENT
+                )
             if logs_to_create:
                 SendLog.objects.bulk_create(logs_to_create, ignore_conflicts=True)
 
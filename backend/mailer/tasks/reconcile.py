@@ -22,39 +22,26 @@ logger = logging.getLogger(__name__)
 def reconcile_campaign_queue():
     """
     Периодическая сверка очереди и статусов кампаний:
-    - Несколько PROCESSING → оставляем одну, остальные → PENDING
+    - PROCESSING без батчей дольше STUCK_CAMPAIGN_TIMEOUT_MINUTES → PENDING
     - Queue активна, но pending-получателей нет → COMPLETED + кампания SENT
     - Queue активна, кампания не READY/SENDING → CANCELLED
     - READY/SENDING с pending, но без записи в очереди → создаём запись
     """
     now = timezone.now()
 
-    # 1) Исправляем «несколько PROCESSING» — должна быть только одна
-    processing = list(
-        CampaignQueue.objects.filter(status=CampaignQueue.Status.PROCESSING)
-        .order_by("started_at", "queued_at")
-        .values_list("id", flat=True)
-    )
-    if len(processing) > 1:
-        keep_id = processing[0]
-        CampaignQueue.objects.filter(id__in=processing[1:]).update(
-            status=CampaignQueue.Status.PENDING, started_at=None
-        )
-        logger.warning(
-            "Queue reconcile: multiple PROCESSING, kept %s, reset %d to PENDING",
-            keep_id,
-            len(processing) - 1,
-        )
-
-    # 2) Сброс «зависших» PROCESSING-кампаний (дольше STUCK_CAMPAIGN_TIMEOUT_MINUTES) → PENDING
+    # 1) Сброс «зависших» PROCESSING-кампаний (дольше STUCK_CAMPAIGN_TIMEOUT_MINUTES) → PENDING.
     # Это обеспечивает восстановление после краша Celery-воркера с PROCESSING-записью.
+    # Несколько PROCESSING — норма: планировщик (mailer.services.scheduler) чередует
+    # кампании, и аренду чередуемой снимают после каждого батча (lease_until ≈ время
+    # последнего батча) — такие не трогаем, даже если started_at давно.
+    stuck_before = now - timedelta(minutes=STUCK_CAMPAIGN_TIMEOUT_MINUTES)
     stuck_qs = CampaignQueue.objects.filter(
         status=CampaignQueue.Status.PROCESSING,
-        started_at__lt=now - timedelta(minutes=STUCK_CAMPAIGN_TIMEOUT_MINUTES),
-    )
+        started_at__lt=stuck_before,
+    ).filter(Q(lease_until__isnull=True) | Q(lease_until__lt=stuck_before))
     stuck_ids = list(stuck_qs.values_list("campaign_id", flat=True))
     if stuck_ids:
-        stuck_qs.update(status=CampaignQueue.Status.PENDING, started_at=None)
+        stuck_qs.update(status=CampaignQueue.Status.PENDING, started_at=None, lease_until=None)
         logger.warning(
             "Queue reconcile: reset %d stuck PROCESSING campaigns to PENDING (threshold=%d min): %s",
             len(stuck_ids),
@@ -62,7 +49,7 @@ def reconcile_campaign_queue():
             stuck_ids,
         )
 
-    # 3) Закрываем или отменяем записи очереди по состоянию кампании
+    # 2) Закрываем или отменяем записи очереди по состоянию кампании
     active_queues = (
         CampaignQueue.objects.filter(
             status__in=(CampaignQueue.Status.PENDING, CampaignQueue.Status.PROCESSING)
@@ -94,7 +81,7 @@ def reconcile_campaign_queue():
             q.completed_at = now
             q.save(update_fields=["status", "completed_at"])
 
-    # 4) Гарантируем, что активные кампании с pending-получателями есть в очереди
+    # 3) Гарантируем, что активные кампании с pending-получателями есть в очереди
     missing = (
         Campaign.objects.filter(
             status__in=(Campaign.Status.READY, Campaign.Status.SENDING),
@@ -0,0 +1,196 @@
+"""
+Тесты справедливого планировщика очереди рассылок (mailer.services.scheduler).
+"""
+
+from __future__ import annotations
+
+from datetime import timedelta
+from unittest.mock import patch
+
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+from django.utils import timezone
+
+from accounts.models import User
+from mailer.constants import DEFER_REASON_TRANSIENT_ERROR, STUCK_CAMPAIGN_TIMEOUT_MINUTES
+from mailer.models import (
+    Campaign,
+    CampaignQueue,
+    CampaignRecipient,
+    GlobalMailAccount,
+    SendLog,
+)
+from mailer.services.scheduler import (
+    claim_next_queue_entry,
+    queue_weight,
+    rank_candidates,
+    release_queue_entry,
+)
+
+
+class _SchedulerBase(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.alice = User.objects.create_user(
+            username="fair_a", password="p", role=User.Role.MANAGER, email="a@ex.com"
+        )
+        self.bob = User.objects.create_user(
+            username="fair_b", password="p", role=User.Role.MANAGER, email="b@ex.com"
+        )
+
+    def _campaign(self, user, recipients, *, priority=0, status=CampaignQueue.Status.PENDING):
+        camp = Campaign.objects.create(
+            created_by=user,
+            name=f"{user.username}-{recipients}",
+            subject="S",
+            body_html="<p>x</p>",
+            body_text="x",
+            sender_name="X",
+            status=Campaign.Status.READY,
+        )
+        CampaignRecipient.objects.bulk_create(
+            CampaignRecipient(
+                campaign=camp,
+                email=f"{camp.name}-{i}@ex.com",
+                status=CampaignRecipient.Status.PENDING,
+            )
+            for i in range(recipients)
+        )
+        CampaignQueue.objects.create(campaign=camp, status=status, priority=priority)
+        return camp
+
+    def _served(self, camp, count):
+        for _ in range(count):
+            SendLog.objects.create(
+                campaign=camp,
+                provider="smtp_global",
+                status=SendLog.Status.SENT,
+            )
+
+
+class RankCandidatesTests(_SchedulerBase):
+    def test_user_with_fewer_sends_goes_first(self):
+        big = self._campaign(self.alice, 50)
+        self._served(big, 30)
+        small = self._campaign(self.bob, 3)
+        order = [c.campaign_id for c in rank_candidates()]
+        self.assertEqual(order, [small.id, big.id])
+
+    def test_priority_weights_fair_share(self):
+        urgent = self._campaign(self.alice, 5, priority=4)
+        regular = self._campaign(self.bob, 5)
+        self._served(urgent, 10)
+        self._served(regular, 5)
+        # 10 / 5 < 5 / 1: приоритетная кампания получает большую долю отправок.
+        self.assertEqual(rank_candidates()[0].campaign_id, urgent.id)
+        self.assertEqual(queue_weight(-3), 1)
+
+    def test_deferred_and_leased_entries_are_skipped(self):
+        deferred = self._campaign(self.alice, 2)
+        CampaignQueue.objects.filter(campaign=deferred).update(
+            deferred_until=timezone.now() + timedelta(hours=1)
+        )
+        leased = self._campaign(self.bob, 2)
+        CampaignQueue.objects.filter(campaign=leased).update(
+            lease_until=timezone.now() + timedelta(minutes=2)
+        )
+        self.assertEqual(rank_candidates(), [])
+
+
+class ClaimTests(_SchedulerBase):
+    def test_claim_leases_entry_until_release(self):
+        camp = self._campaign(self.alice, 2)
+        entry = claim_next_queue_entry(lease_seconds=120)
+        self.assertEqual(entry.campaign_id, camp.id)
+        self.assertEqual(entry.status, CampaignQueue.Status.PROCESSING)
+        self.assertIsNotNone(entry.started_at)
+        # Второй воркер, пока аренда жива, ничего не получает.
+        self.assertIsNone(claim_next_queue_entry(lease_seconds=120))
+
+        release_queue_entry(entry)
+        again = claim_next_queue_entry(lease_seconds=120)
+        self.assertEqual(again.id, entry.id)
+        self.assertEqual(again.started_at, entry.started_at)
+
+    def test_transient_error_counter_survives_reclaim(self):
+        camp = self._campaign(self.alice, 2)
+        CampaignQueue.objects.filter(campaign=camp).update(
+            consecutive_transient_errors=2, defer_reason=DEFER_REASON_TRANSIENT_ERROR
+        )
+        entry = claim_next_queue_entry(lease_seconds=60)
+        self.assertEqual(entry.consecutive_transient_errors, 2)
+        self.assertEqual(entry.defer_reason, "")
+
+
+@override_settings(MAILER_SEND_BATCH_SIZE=5)
+class InterleavingTests(_SchedulerBase):
+    def setUp(self):
+        super().setUp()
+        GlobalMailAccount.objects.update_or_create(
+            id=1, defaults={"is_enabled": True, "per_user_daily_limit": 1000}
+        )
+
+    def _run(self, times):
+        from mailer.tasks import send_pending_emails
+
+        sent = []
+        with (
+            patch(
+                "mailer.tasks.helpers.send_via_smtp", side_effect=lambda cfg, msg: sent.append(1)
+            ),
+            patch("mailer.tasks.send.get_effective_quota_available", return_value=10000),
+            patch("mailer.tasks.send._is_working_hours", return_value=True),
+        ):
+            for _ in range(times):
+                send_pending_emails.run()
+        return sent
+
+    def _pending(self, camp):
+        return camp.recipients.filter(status=CampaignRecipient.Status.PENDING).count()
+
+    def test_small_campaign_is_not_blocked_by_big_one(self):
+        big = self._campaign(self.alice, 40)
+        small = self._campaign(self.bob, 4)
+
+        self._run(3)
+        # Батчи чередуются: маленькая рассылка готова после второго прохода,
+        # большая продолжается.
+        self.assertEqual(self._pending(small), 0)
+        self.assertEqual(self._pending(big), 40 - 10)
+        self.assertEqual(
+            CampaignQueue.objects.get(campaign=small).status, CampaignQueue.Status.COMPLETED
+        )
+        self.assertEqual(
+            CampaignQueue.objects.get(campaign=big).status, CampaignQueue.Status.PROCESSING
+        )
+
+    @override_settings(MAILER_SEND_BATCHES_PER_RUN=4)
+    def test_batches_per_run_reuse_fair_order(self):
+        big = self._campaign(self.alice, 40)
+        small = self._campaign(self.bob, 4)
+        sent = self._run(1)
+        self.assertEqual(len(sent), 4 + 15)
+        self.assertEqual(self._pending(small), 0)
+        self.assertEqual(self._pending(big), 25)
+        self.assertIsNotNone(CampaignQueue.objects.get(campaign=big).lease_until)
+        self.assertLessEqual(CampaignQueue.objects.get(campaign=big).lease_until, timezone.now())
+
+
+class ReconcileWithSchedulerTests(_SchedulerBase):
+    def test_interleaved_processing_entries_are_kept(self):
+        from mailer.tasks import reconcile_campaign_queue
+
+        old = timezone.now() - timedelta(minutes=STUCK_CAMPAIGN_TIMEOUT_MINUTES + 30)
+        active = self._campaign(self.alice, 3, status=CampaignQueue.Status.PROCESSING)
+        other = self._campaign(self.bob, 3, status=CampaignQueue.Status.PROCESSING)
+        CampaignQueue.objects.filter(campaign__in=[active, other]).update(started_at=old)
+        CampaignQueue.objects.filter(campaign=active).update(lease_until=timezone.now())
+
+        reconcile_campaign_queue.run()
+
+        self.assertEqual(
+            CampaignQueue.objects.get(campaign=active).status, CampaignQueue.Status.PROCESSING
+        )
+        self.assertEqual(
+            CampaignQueue.objects.get(campaign=other).status, CampaignQueue.Status.PENDING
+        )
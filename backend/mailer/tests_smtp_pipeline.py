@@ -0,0 +1,360 @@
+"""
+Тесты конвейерной отправки батча (_process_batch_recipients) через локальный SMTP-сервер.
+
+Вместо реального SMTP поднимается минимальный сервер на socketserver (EHLO/AUTH/MAIL/
+RCPT/DATA): он считает соединения и письма и умеет отвечать 550/451 на заданные адреса.
+"""
+
+from __future__ import annotations
+
+import base64
+import socketserver
+import threading
+import time
+from email import message_from_bytes, policy
+
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+
+from accounts.models import User
+from mailer.constants import DEFER_REASON_RATE_HOUR
+from mailer.models import Campaign, CampaignQueue, CampaignRecipient, MailAccount, SendLog
+from mailer.services.rate_limiter import release_rate_limit_tokens, reserve_rate_limit_tokens
+from mailer.smtp_sender import SmtpConnectionPool
+from mailer.tasks.helpers import _process_batch_recipients
+
+
+class _SmtpHandler(socketserver.StreamRequestHandler):
+    def _reply(self, line: str) -> None:
+        self.wfile.write((line + "\r\n").encode())
+
+    def handle(self):
+        srv = self.server
+        with srv.lock:
+            srv.connections += 1
+        self._reply("220 localhost ESMTP test")
+        rcpt: list[str] = []
+        while True:
+            raw = self.rfile.readline()
+            if not raw:
+                return
+            cmd = raw.decode(errors="replace").strip()
+            verb = cmd.split(" ", 1)[0].upper()
+            if verb in ("EHLO", "HELO"):
+                self._reply("250-localhost")
+                self._reply("250 AUTH PLAIN LOGIN")
+            elif verb == "AUTH":
+                creds = base64.b64decode(cmd.split()[-1]).split(b"\0")
+                ok = creds[-1] == srv.password.encode()
+                self._reply("235 OK" if ok else "535 Authentication failed")
+            elif verb == "MAIL":
+                rcpt = []
+                self._reply("250 OK")
+            elif verb == "RCPT":
+                addr = cmd.split(":", 1)[1].strip().strip("<>").lower()
+                if addr in srv.reject:
+                    self._reply(srv.reject[addr])
+                else:
+                    rcpt.append(addr)
+                    self._reply("250 OK")
+            elif verb == "DATA":
+                self._reply("354 End data with <CR><LF>.<CR><LF>")
+                lines = []
+                while True:
+                    line = self.rfile.readline()
+                    if line in (b".\r\n", b".\n", b""):
+                        break
+                    lines.append(line[1:] if line.startswith(b"..") else line)
+                if srv.delay:
+                    time.sleep(srv.delay)
+                with srv.lock:
+                    srv.messages.append(
+                        (rcpt, message_from_bytes(b"".join(lines), policy=policy.default))
+                    )
+                self._reply("250 OK queued")
+            elif verb in ("RSET", "NOOP"):
+                self._reply("250 OK")
+            elif verb == "QUIT":
+                self._reply("221 Bye")
+                return
+            else:
+                self._reply("502 Command not implemented")
+
+
+class LocalSmtpServer(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, *, password="secret", delay=0.0, reject=None):
+        super().__init__(("127.0.0.1", 0), _SmtpHandler)
+        self.password = password
+        self.delay = delay
+        self.reject = reject or {}
+        self.lock = threading.Lock()
+        self.connections = 0
+        self.messages: list = []
+
+    def __enter__(self):
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+        return self
+
+    def __exit__(self, *exc):
+        self.shutdown()
+        self.server_close()
+
+
+class _Account:
+    """Настройки SMTP в форме GlobalMailAccount (без шифрования пароля)."""
+
+    def __init__(self, port: int, password: str = "secret"):
+        self.smtp_host = "127.0.0.1"
+        self.smtp_port = port
+        self.use_starttls = False
+        self.smtp_username = "crm@example.com"
+        self.from_email = "no-reply@example.com"
+        self.from_name = "CRM"
+        self.is_enabled = True
+        self.smtp_bz_api_key = ""
+        self._password = password
+
+    def get_password(self) -> str:
+        return self._password
+
+
+@override_settings(MAILER_SMTP_POOL_SIZE=4, MAILER_RATE_LIMIT_FAIL_OPEN=True)
+class SmtpPipelineTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(
+            username="pipe_u", password="p", role=User.Role.MANAGER, email="pipe@ex.com"
+        )
+        self.identity, _ = MailAccount.objects.get_or_create(user=self.user)
+        self.camp = Campaign.objects.create(
+            created_by=self.user,
+            name="Pipeline",
+            subject="Тема",
+            body_html="<p>Привет</p>",
+            body_text="Привет",
+            sender_name="ПРОФИ",
+            status=Campaign.Status.SENDING,
+        )
+        self.queue = CampaignQueue.objects.create(
+            campaign=self.camp, status=CampaignQueue.Status.PROCESSING, priority=0
+        )
+
+    def _recipients(self, n, prefix="r"):
+        return [
+            CampaignRecipient.objects.create(
+                campaign=self.camp,
+                email=f"{prefix}{i}@ex.com",
+                status=CampaignRecipient.Status.PENDING,
+            )
+            for i in range(n)
+        ]
+
+    def _run(self, batch, account, *, max_per_hour=1000):
+        return _process_batch_recipients(
+            batch=batch,
+            camp=self.camp,
+            queue_entry=self.queue,
+            smtp_cfg=account,
+            max_per_hour=max_per_hour,
+            tokens={},
+            unsub_set=set(),
+            base_html="<p>Привет</p>",
+            base_text="Привет",
+            attachment_bytes=None,
+            attachment_name=None,
+            identity=self.identity,
+            user=self.user,
+        )
+
+    def test_batch_is_sent_over_pooled_connections(self):
+        batch = self._recipients(12)
+        with LocalSmtpServer() as server:
+            result = self._run(batch, _Account(server.server_address[1]))
+        self.assertEqual(result, (False, False))
+        self.assertEqual(len(server.messages), 12)
+        self.assertLessEqual(server.connections, 4)
+        tags = {msg["X-Tag"] for _rcpt, msg in server.messages}
+        self.assertEqual(tags, {f"camp:{self.camp.id};rcpt:{r.id}" for r in batch})
+        self.assertEqual(
+            SendLog.objects.filter(campaign=self.camp, status=SendLog.Status.SENT).count(), 12
+        )
+        self.assertFalse(
+            CampaignRecipient.objects.filter(status=CampaignRecipient.Status.PENDING).exists()
+        )
+
+    def test_campaign_message_is_compiled_once_across_batches(self):
+        from unittest.mock import patch
+
+        from mailer.smtp_sender import compile_message_template
+
+        first, second = self._recipients(3), self._recipients(3, prefix="s")
+        tokens = {"r0@ex.com": "tok-r0"}
+        with patch(
+            "mailer.tasks.helpers.compile_message_template", wraps=compile_message_template
+        ) as compile_mock:
+            with LocalSmtpServer() as server:
+                account = _Account(server.server_address[1])
+                for batch in (first, second):
+                    _process_batch_recipients(
+                        batch=batch,
+                        camp=self.camp,
+                        queue_entry=self.queue,
+                        smtp_cfg=account,
+                        max_per_hour=1000,
+                        tokens=tokens,
+                        unsub_set=set(),
+                        base_html="<p>Кампания с картинкой</p>",
+                        base_text="Кампания",
+                        attachment_bytes=b"attachment",
+                        attachment_name="file.txt",
+                        identity=self.identity,
+                        user=self.user,
+                    )
+        self.assertEqual(compile_mock.call_count, 1)
+        self.assertEqual(len(server.messages), 6)
+        msg = next(m for rcpt, m in server.messages if rcpt == ["r0@ex.com"])
+        self.assertIn("/unsubscribe/tok-r0/", msg["List-Unsubscribe"])
+        self.assertIn("/unsubscribe/tok-r0/", msg.get_body(("html",)).get_content())
+        self.assertEqual(msg["Precedence"], "bulk")
+        self.assertEqual(next(msg.iter_attachments()).get_content(), "attachment")
+
+    def test_already_sent_recipients_are_skipped_with_one_query(self):
+        batch = self._recipients(3)
+        SendLog.objects.create(
+            campaign=self.camp, recipient=batch[0], provider="smtp_global", status="sent"
+        )
+        with LocalSmtpServer() as server:
+            self._run(batch, _Account(server.server_address[1]))
+        self.assertEqual(sorted(r[0][0] for r in server.messages), ["r1@ex.com", "r2@ex.com"])
+        batch[0].refresh_from_db()
+        self.assertEqual(batch[0].status, CampaignRecipient.Status.SENT)
+
+    def test_hourly_budget_limits_block_and_defers_queue(self):
+        batch = self._recipients(8)
+        with LocalSmtpServer() as server:
+            transient, rate_limited = self._run(
+                batch, _Account(server.server_address[1]), max_per_hour=5
+            )
+        self.assertFalse(transient)
+        self.assertTrue(rate_limited)
+        self.assertEqual(len(server.messages), 5)
+        self.queue.refresh_from_db()
+        self.assertEqual(self.queue.defer_reason, DEFER_REASON_RATE_HOUR)
+        self.assertEqual(
+            CampaignRecipient.objects.filter(status=CampaignRecipient.Status.PENDING).count(), 3
+        )
+
+    def test_permanent_rejection_fails_only_that_recipient(self):
+        batch = self._recipients(4)
+        reject = {"r2@ex.com": "550 5.1.1 User unknown"}
+        with LocalSmtpServer(reject=reject) as server:
+            transient, _ = self._run(batch, _Account(server.server_address[1]))
+        self.assertFalse(transient)
+        self.assertEqual(len(server.messages), 3)
+        statuses = dict(
+            CampaignRecipient.objects.filter(campaign=self.camp).values_list("email", "status")
+        )
+        self.assertEqual(statuses["r2@ex.com"], CampaignRecipient.Status.FAILED)
+        self.assertEqual(sum(1 for s in statuses.values() if s == CampaignRecipient.Status.SENT), 3)
+
+    @override_settings(MAILER_SMTP_POOL_SIZE=1)
+    def test_transient_error_stops_batch_and_returns_tokens(self):
+        batch = self._recipients(4)
+        reject = {"r1@ex.com": "451 4.3.0 Try again later"}
+        with LocalSmtpServer(reject=reject) as server:
+            transient, rate_limited = self._run(batch, _Account(server.server_address[1]))
+        self.assertTrue(transient)
+        self.assertFalse(rate_limited)
+        self.assertEqual(len(server.messages), 1)
+        self.assertEqual(
+            CampaignRecipient.objects.filter(status=CampaignRecipient.Status.PENDING).count(), 3
+        )
+        # Зарезервировано 4, израсходовано 2 (успех + временная ошибка) — 2 вернулись
+        granted, count, _ = reserve_rate_limit_tokens(1000, 1)
+        self.assertEqual((granted, count), (1, 3))
+
+    @override_settings(MAILER_SMTP_POOL_SIZE=1)
+    def test_rate_limited_batch_with_transient_error_takes_one_path(self):
+        batch = self._recipients(6)
+        reject = {"r1@ex.com": "451 4.3.0 Try again later"}
+        with LocalSmtpServer(reject=reject) as server:
+            transient, rate_limited = self._run(
+                batch, _Account(server.server_address[1]), max_per_hour=3
+            )
+        # Временная ошибка решает исход: defer по часовому лимиту не ставится
+        self.assertEqual((transient, rate_limited), (True, False))
+        self.queue.refresh_from_db()
+        self.assertNotEqual(self.queue.defer_reason, DEFER_REASON_RATE_HOUR)
+
+    def test_auth_failure_fails_recipients_without_pool(self):
+        batch = self._recipients(2)
+        with LocalSmtpServer(password="other") as server:
+            self._run(batch, _Account(server.server_address[1]))
+        self.assertEqual(server.messages, [])
+        self.assertEqual(
+            CampaignRecipient.objects.filter(status=CampaignRecipient.Status.FAILED).count(), 2
+        )
+
+    def test_parallel_pipeline_is_faster_than_sequential(self):
+        """Грубый бенчмарк писем/сек: сервер отвечает на DATA с задержкой 50 мс."""
+        rates = {}
+        for pool_size in (1, 4):
+            batch = self._recipients(8, prefix=f"p{pool_size}-")
+            with override_settings(MAILER_SMTP_POOL_SIZE=pool_size):
+                with LocalSmtpServer(delay=0.05) as server:
+                    started = time.monotonic()
+                    self._run(batch, _Account(server.server_address[1]))
+                    rates[pool_size] = len(server.messages) / (time.monotonic() - started)
+        self.assertGreater(rates[4], rates[1] * 1.5)
+
+
+class RateLimitBlockTests(TestCase):
+    def setUp(self):
+        cache.clear()
+
+    def test_block_reservation_grants_remaining_budget(self):
+        self.assertEqual(reserve_rate_limit_tokens(10, 6)[:2], (6, 6))
+        granted, count, reset_at = reserve_rate_limit_tokens(10, 6)
+        self.assertEqual((granted, count), (4, 10))
+        self.assertIsNotNone(reset_at)
+        self.assertEqual(reserve_rate_limit_tokens(10, 1)[0], 0)
+
+    def test_release_returns_tokens_within_the_hour(self):
+        from django.utils import timezone
+
+        reserve_rate_limit_tokens(10, 10)
+        release_rate_limit_tokens(3, timezone.now())
+        self.assertEqual(reserve_rate_limit_tokens(10, 5)[0], 3)
+
+    def test_daily_quota_is_shared_between_parallel_reservations(self):
+        from django.utils import timezone
+
+        from mailer.services.rate_limiter import release_daily_quota, reserve_daily_quota
+
+        # Сегодня уже 4 письма: два «воркера» вместе не получают больше 10 - 4
+        self.assertEqual(reserve_daily_quota(7, 10, 5, sent_today=lambda: 4), 5)
+        self.assertEqual(reserve_daily_quota(7, 10, 5, sent_today=lambda: 4), 1)
+        release_daily_quota(7, 2, timezone.now())
+        self.assertEqual(reserve_daily_quota(7, 10, 5, sent_today=lambda: 4), 2)
+        self.assertEqual(reserve_daily_quota(8, 10, 5, sent_today=lambda: 0), 5)
+
+
+class SmtpConnectionPoolTests(TestCase):
+    def test_connections_are_reused(self):
+        with LocalSmtpServer() as server:
+            with SmtpConnectionPool(_Account(server.server_address[1]), size=2) as pool:
+                first = pool.acquire()
+                pool.release(first)
+                self.assertIs(pool.acquire(), first)
+                pool.release(first)
+        self.assertEqual(server.connections, 1)
+
+    def test_open_failure_returns_none(self):
+        with LocalSmtpServer(password="other") as server:
+            pool = SmtpConnectionPool(_Account(server.server_address[1]), size=2)
+            self.assertIsNone(pool.acquire())
+            self.assertIsNone(pool.acquire())
+        self.assertEqual(server.connections, 1)
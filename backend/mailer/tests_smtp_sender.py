@@ -8,6 +8,8 @@ from __future__ import annotations
 
 import base64
 import smtplib
+import time
+from email import message_from_bytes, policy
 from email.message import EmailMessage
 from unittest.mock import MagicMock, patch
 
@@ -17,6 +19,7 @@ from mailer.smtp_sender import (
     _inline_data_images,
     _sanitize_header,
     build_message,
+    compile_message_template,
     format_smtp_error,
 )
 
@@ -148,6 +151,12 @@ class BuildMessageTest(TestCase):
         msg = self._build()
         self.assertIsInstance(msg, EmailMessage)
 
+    def test_inline_image_is_attached_as_related_part(self):
+        msg = self._build(body_html=f'<p>x</p><img src="data:image/png;base64,{_tiny_png_b64()}">')
+        types = [p.get_content_type() for p in msg.walk()]
+        self.assertIn("multipart/related", types)
+        self.assertIn("image/png", types)
+
     def test_subject_set(self):
         msg = self._build(subject="Hello World")
         self.assertEqual(msg["Subject"], "Hello World")
@@ -261,3 +270,114 @@ class FormatSmtpErrorTest(TestCase):
         err = smtplib.SMTPException("STARTTLS not supported")
         result = self._fmt(err)
         self.assertIn("STARTTLS", result)
+
+
+# ---------------------------------------------------------------------------
+# compile_message_template / MessageTemplate.render
+# ---------------------------------------------------------------------------
+
+
+class MessageTemplateTest(TestCase):
+    def setUp(self):
+        self.account = _make_account()
+        self.html = f'<p>Привет</p><img src="data:image/png;base64,{_tiny_png_b64()}">'
+
+    def _compile(self, **kwargs):
+        defaults = dict(
+            account=self.account,
+            subject="Тема рассылки",
+            body_text="Текст письма",
+            body_html=self.html,
+            from_name="ПРОФИ",
+            reply_to="reply@example.com",
+            attachment_content=b"%PDF-1.4 test",
+            attachment_filename="прайс.pdf",
+            headers={"Precedence": "bulk"},
+        )
+        defaults.update(kwargs)
+        return compile_message_template(**defaults)
+
+    def _parse(self, rendered):
+        return message_from_bytes(rendered.as_bytes(), policy=policy.default)
+
+    def test_render_matches_build_message_structure(self):
+        rendered = self._compile().render(
+            to_email="to@example.com",
+            html_footer="<div>Отписаться</div>",
+            text_footer="\n\nОтписаться: https://x/u/1/",
+            headers={"X-Tag": "camp:1;rcpt:2", "List-Unsubscribe": "<https://x/u/1/>"},
+        )
+        msg = self._parse(rendered)
+        self.assertEqual(msg["To"], "to@example.com")
+        self.assertEqual(msg["Subject"], "Тема рассылки")
+        self.assertIn("ПРОФИ", msg["From"])
+        self.assertEqual(msg["Reply-To"], "reply@example.com")
+        self.assertEqual(msg["Precedence"], "bulk")
+        self.assertEqual(msg["X-Tag"], "camp:1;rcpt:2")
+        self.assertEqual(rendered["Message-ID"], msg["Message-ID"])
+        self.assertEqual(rendered.to_addrs, ["to@example.com"])
+        self.assertEqual(rendered.from_addr, "user@example.com")
+
+        self.assertEqual(
+            msg.get_body(("plain",)).get_content().strip(),
+            "Текст письма\n\nОтписаться: https://x/u/1/",
+        )
+        html = msg.get_body(("html",)).get_content()
+        self.assertIn("cid:", html)
+        self.assertTrue(html.strip().endswith("<div>Отписаться</div>"))
+        types = [p.get_content_type() for p in msg.walk()]
+        self.assertIn("image/png", types)
+        attachment = next(msg.iter_attachments())
+        self.assertEqual(attachment.get_filename(), "прайс.pdf")
+        self.assertEqual(attachment.get_content(), b"%PDF-1.4 test")
+
+    def test_each_render_has_own_headers(self):
+        template = self._compile()
+        a = template.render(to_email="a@example.com", headers={"X-Tag": "a"})
+        b = template.render(to_email="b@example.com", headers={"X-Tag": "b"})
+        self.assertNotEqual(a["Message-ID"], b["Message-ID"])
+        self.assertEqual(self._parse(b)["X-Tag"], "b")
+
+    def test_header_injection_is_stripped(self):
+        rendered = self._compile().render(
+            to_email="to@example.com\r\nBcc: evil@bad.com", headers={"X-Tag": "a\r\nX-Evil: 1"}
+        )
+        msg = self._parse(rendered)
+        self.assertIsNone(msg["Bcc"])
+        self.assertIsNone(msg["X-Evil"])
+
+    def test_plain_only_and_cyrillic_recipient(self):
+        rendered = self._compile(body_html="", attachment_content=None).render(
+            to_email="кто@пример.рф", text_footer="\n\nОтписаться: url"
+        )
+        msg = self._parse(rendered)
+        self.assertEqual(msg.get_content_type(), "text/plain")
+        self.assertEqual(msg["To"], "кто@пример.рф")
+        self.assertIn("Отписаться: url", msg.get_content())
+
+    def test_render_is_much_cheaper_than_build_message(self):
+        """Грубый замер: картинка 300 КБ + вложение 300 КБ, 20 получателей."""
+        img = base64.b64encode(b"\x89PNG" + bytes(range(256)) * 1200).decode()
+        html = f'<p>x</p><img src="data:image/png;base64,{img}">'
+        attachment = bytes(range(256)) * 1200
+
+        started = time.perf_counter()
+        for i in range(20):
+            build_message(
+                account=self.account,
+                to_email=f"r{i}@example.com",
+                subject="S",
+                body_text="t",
+                body_html=html,
+                attachment_content=attachment,
+                attachment_filename="a.bin",
+            ).as_bytes()
+        per_message = time.perf_counter() - started
+
+        started = time.perf_counter()
+        template = self._compile(body_html=html, attachment_content=attachment)
+        for i in range(20):
+            template.render(to_email=f"r{i}@example.com").as_bytes()
+        compiled = time.perf_counter() - started
+
+        self.assertLess(compiled * 3, per_message)
@@ -61,13 +61,17 @@ def mail_progress_poll(request: HttpRequest) -> JsonResponse:
     queued_count = 0
     next_campaign_at = None
 
+    # Кампании разных пользователей чередуются — PROCESSING может быть несколько.
     processing_queue = (
-        CampaignQueue.objects.filter(status=CampaignQueue.Status.PROCESSING)
-        .select_related("campaign", "campaign__created_by")
+        CampaignQueue.objects.filter(
+            status=CampaignQueue.Status.PROCESSING, campaign__created_by=user
+        )
+        .select_related("campaign")
+        .order_by("started_at")
         .first()
     )
 
-    if processing_queue and processing_queue.campaign.created_by == user:
+    if processing_queue:
         active_campaign = {
             "id": str(processing_queue.campaign.id),
             "name": processing_queue.campaign.name,
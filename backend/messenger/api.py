@@ -20,18 +20,18 @@ class EventStreamRenderer(BaseRenderer):
 
 
 import json
-import time
 
+from django.core.serializers.json import DjangoJSONEncoder
 from django.db.models import Q
-from django.http import StreamingHttpResponse
 from django.utils import timezone
 from rest_framework import serializers as drf_serializers
 
 from accounts.models import Branch, User
 from policy.drf import PolicyPermission
 
-from . import models, selectors, serializers, services
+from . import models, selectors, serializers, services, sse, unread
 from .utils import ensure_messenger_enabled_api, validate_upload_safety
+from .ws_notify import sse_group_conversation
 
 
 class MessengerEnabledApiMixin:
@@ -120,7 +120,7 @@ class ConversationViewSet(
         qs = qs.annotate(last_message_body=Subquery(last_message))
 
         # Аннотируем last_activity_at_fallback (fallback на created_at как в Chatwoot)
-        from django.db.models import Case, DateTimeField, When
+        from django.db.models import Case, DateTimeField, IntegerField, Value, When
 
         qs = qs.annotate(
             last_activity_at_fallback=Case(
@@ -131,18 +131,12 @@ class ConversationViewSet(
         )
 
         if user and user.is_authenticated:
+            # Счётчик ведётся на диалоге (messenger/unread.py) — без JOIN по сообщениям
             qs = qs.annotate(
-                unread_count=Count(
-                    "messages__id",
-                    filter=Q(
-                        messages__direction=Message.Direction.IN,
-                        assignee_id=user.id,
-                    )
-                    & (
-                        Q(assignee_last_read_at__isnull=True)
-                        | Q(messages__created_at__gt=F("assignee_last_read_at"))
-                    ),
-                    distinct=True,
+                unread_count=Case(
+                    When(assignee_id=user.id, then=F("assignee_unread_count")),
+                    default=Value(0),
+                    output_field=IntegerField(),
                 )
             )
 
@@ -235,12 +229,14 @@ class ConversationViewSet(
 
         # Обновляем last_seen оператора с троттлингом (по образцу Chatwoot)
         now = services.touch_assignee_last_seen(conversation, request.user)
+        unread.mark_read(conversation, now)
 
         # Пометить все IN-сообщения как прочитанные оператором
         conversation.messages.filter(
             direction=models.Message.Direction.IN,
             read_at__isnull=True,
         ).update(read_at=now)
+        sse.publish_conversation_change(conversation.id, kind="read")
 
         return Response(
             {"status": "ok", "assignee_last_read_at": now.isoformat()},
@@ -311,10 +307,8 @@ class ConversationViewSet(
     def unread_count(self, request):
         """GET /api/conversations/unread-count/ — общее число непрочитанных диалогов для sidebar badge.
 
-        Использует `selectors.get_messenger_unread_count` — он кэшируется на 30 сек
-        в Redis (per-user). При polling интервале frontend 30 сек cache-hit ≈90%,
-        вместо 1 тяжёлого DISTINCT JOIN на каждый запрос.
-        Performance audit 2026-04-20: ~100K SQL/день → ~10K.
+        Использует `selectors.get_messenger_unread_count` — итог оператора ведётся
+        инкрементально в Redis (messenger/unread.py), чтение без SQL.
         """
         count = selectors.get_messenger_unread_count(request.user)
         return Response({"unread_count": count})
@@ -450,6 +444,7 @@ class ConversationViewSet(
             update_fields["assignee_assigned_at"] = now_ts
 
         models.Conversation.objects.filter(pk=conv.pk).update(**update_fields)
+        sse.publish_conversation_change(conv.pk)
 
         # Служебная запись в диалог: кто и когда нажал «Я связался».
         try:
@@ -512,6 +507,7 @@ class ConversationViewSet(
             return Response({"detail": "ids is required."}, status=status.HTTP_400_BAD_REQUEST)
 
         qs = self.get_queryset().filter(id__in=ids)
+        target_ids = list(qs.values_list("id", flat=True))
         updated = 0
 
         if action_type == "close":
@@ -520,13 +516,19 @@ class ConversationViewSet(
             updated = qs.update(status=models.Conversation.Status.OPEN)
         elif action_type == "assign":
             assignee_id = request.data.get("assignee_id")
+            # Итоги непрочитанных прежних и нового оператора пересчитаются при чтении
+            previous = set(qs.values_list("assignee_id", flat=True))
             if assignee_id:
                 updated = qs.update(assignee_id=assignee_id)
             else:
                 updated = qs.update(assignee=None)
+            unread.invalidate_totals(previous | {assignee_id})
         else:
             return Response({"detail": "Unknown action."}, status=status.HTTP_400_BAD_REQUEST)
 
+        for conversation_id in target_ids:
+            sse.publish_conversation_change(conversation_id)
+
         return Response({"status": "ok", "updated": updated})
 
     @action(
@@ -549,47 +551,44 @@ class ConversationViewSet(
         - notification.message: новое входящее сообщение (conversation_id, contact_name, preview)
         - notification.assignment: новый диалог назначен оператору
         - keep-alive: каждые 5 секунд
+
+        Под ASGI стрим подписан на группы selectors.visible_stream_groups и
+        читает БД только по пробуждению (messenger.sse).
         """
+        from django.db.models import Max
+
         user = request.user
         visible_qs = selectors.visible_conversations_qs(user)
-        visible_ids = set(visible_qs.values_list("id", flat=True))
-
-        def event_stream():
-            started = time.time()
-            last_keepalive = 0.0
-            # Запоминаем последний ID сообщения на старте, чтобы отдавать только новые
-            from django.db.models import Max
 
-            last_seen_msg_id = (
-                models.Message.objects.filter(conversation_id__in=visible_ids).aggregate(
+        # Запоминаем последний ID сообщения на старте, чтобы отдавать только новые
+        state = {
+            "last_seen_msg_id": (
+                models.Message.objects.filter(conversation__in=visible_qs).aggregate(
                     max_id=Max("id")
                 )["max_id"]
                 or 0
-            )
-
-            # Запоминаем текущие assignee для отслеживания новых назначений
-            my_assigned_ids = set(visible_qs.filter(assignee=user).values_list("id", flat=True))
-
-            yield "event: ready\ndata: {}\n\n"
+            ),
+            # Текущие assignee для отслеживания новых назначений
+            "my_assigned_ids": set(visible_qs.filter(assignee=user).values_list("id", flat=True)),
+        }
 
-            while True:
-                now = time.time()
-                if now - started > 55:  # 55сек (длиннее чем per-conversation)
-                    break
+        def collect(event):
+            """Снимок новых входящих и назначений (см. messenger.sse)."""
+            chunks = []
 
+            if sse.wants(event, "message"):
                 # Новые входящие сообщения по всем видимым диалогам
                 new_messages = list(
                     models.Message.objects.filter(
-                        conversation_id__in=visible_ids,
-                        id__gt=last_seen_msg_id,
+                        conversation__in=visible_qs,
+                        id__gt=state["last_seen_msg_id"],
                         direction=models.Message.Direction.IN,
                     )
                     .select_related("conversation__contact", "sender_contact")
                     .order_by("id")[:20]
                 )
-
                 for msg in new_messages:
-                    last_seen_msg_id = max(last_seen_msg_id, msg.id)
+                    state["last_seen_msg_id"] = max(state["last_seen_msg_id"], msg.id)
                     contact_name = ""
                     if msg.conversation and msg.conversation.contact:
                         c = msg.conversation.contact
@@ -601,48 +600,42 @@ class ConversationViewSet(
                         "preview": (msg.body or "")[:140],
                         "created_at": msg.created_at.isoformat() if msg.created_at else None,
                     }
-                    yield f"event: notification.message\ndata: {json.dumps(payload, ensure_ascii=False)}\n\n"
+                    chunks.append(
+                        f"event: notification.message\ndata: {json.dumps(payload, ensure_ascii=False)}\n\n"
+                    )
 
+            if sse.wants(event, "conversation"):
                 # Проверяем новые назначения на текущего оператора
                 current_assigned = set(
                     visible_qs.filter(assignee=user).values_list("id", flat=True)
                 )
-                newly_assigned = current_assigned - my_assigned_ids
-                for conv_id in newly_assigned:
-                    try:
-                        conv = visible_qs.get(id=conv_id)
-                        contact_name = ""
-                        if conv.contact:
-                            contact_name = (
-                                conv.contact.name or conv.contact.email or conv.contact.phone or ""
-                            )
-                        payload = {
-                            "conversation_id": conv_id,
-                            "contact_name": contact_name,
-                            "status": conv.status,
-                        }
-                        yield f"event: notification.assignment\ndata: {json.dumps(payload, ensure_ascii=False)}\n\n"
-                    except models.Conversation.DoesNotExist:
-                        pass
-                my_assigned_ids = current_assigned
-
-                # Обновляем список видимых диалогов (могут появиться новые)
-                if int(now - started) % 15 == 0 and int(now - started) > 0:
-                    visible_ids.update(
-                        selectors.visible_conversations_qs(user).values_list("id", flat=True)
+                newly_assigned = current_assigned - state["my_assigned_ids"]
+                for conv in visible_qs.filter(id__in=newly_assigned):
+                    contact_name = ""
+                    if conv.contact:
+                        contact_name = (
+                            conv.contact.name or conv.contact.email or conv.contact.phone or ""
+                        )
+                    payload = {
+                        "conversation_id": conv.id,
+                        "contact_name": contact_name,
+                        "status": conv.status,
+                    }
+                    chunks.append(
+                        f"event: notification.assignment\ndata: {json.dumps(payload, ensure_ascii=False)}\n\n"
                     )
+                state["my_assigned_ids"] = current_assigned
 
-                # Keep-alive
-                if now - last_keepalive > 5:
-                    last_keepalive = now
-                    yield ": keep-alive\n\n"
-
-                time.sleep(2)
+            return chunks
 
-        resp = StreamingHttpResponse(event_stream(), content_type="text/event-stream")
-        resp["Cache-Control"] = "no-cache"
-        resp["X-Accel-Buffering"] = "no"
-        return resp
+        # 55сек (длиннее чем per-conversation)
+        return sse.event_stream_response(
+            request,
+            collect,
+            selectors.visible_stream_groups(user),
+            lifetime=55,
+            poll_interval=2,
+        )
 
     @action(detail=True, methods=["get", "post"], url_path="messages")
     def messages(self, request, pk=None):
@@ -810,27 +803,33 @@ class ConversationViewSet(
         mentions = set(re.findall(r"@(\w+)", body))
         if not mentions:
             return
-        mentioned_users = User.objects.filter(username__in=mentions, is_active=True).exclude(
-            pk=author.pk
+        mentioned_users = list(
+            User.objects.filter(username__in=mentions, is_active=True).exclude(pk=author.pk)
         )
+        if not mentioned_users:
+            return
+        author_name = author.get_full_name() or author.username
+        try:
+            from notifications.service import notify_many
+
+            notify_many(
+                users=mentioned_users,
+                title=f"{author_name} упомянул вас",
+                body=body[:200],
+                url=f"/messenger/?conversation={conversation.id}",
+                kind="info",
+                dedupe_seconds=60,
+            )
+        except Exception:
+            pass
+        # Также отправить push-уведомления
+        from .push import send_push_to_user
+
         for user in mentioned_users:
             try:
-                from notifications.service import notify
-
-                notify(
-                    user=user,
-                    title=f"{author.get_full_name() or author.username} упомянул вас",
-                    body=body[:200],
-                    url=f"/messenger/?conversation={conversation.id}",
-                    kind="info",
-                    dedupe_seconds=60,
-                )
-                # Также отправить push-уведомление
-                from .push import send_push_to_user
-
                 send_push_to_user(
                     user=user,
-                    title=f"Упоминание от {author.get_full_name() or author.username}",
+                    title=f"Упоминание от {author_name}",
                     body=body[:100],
                     url=f"/messenger/?conversation={conversation.id}",
                     tag=f"mention-{conversation.id}",
@@ -859,7 +858,8 @@ class ConversationViewSet(
 
         Note:
             Соединение закрывается через 30 секунд, клиент должен переподключаться.
-            Использует prefetch_related для оптимизации запросов сообщений.
+            Под ASGI стрим ждёт пробуждений из channel layer и читает БД только
+            при изменениях; под WSGI — прежний опрос раз в секунду (messenger.sse).
         """
         conversation = self.get_object()
 
@@ -878,56 +878,46 @@ class ConversationViewSet(
 
         from .typing import get_typing_status
 
-        def event_stream():
-            """SSE стрим для операторской панели."""
-            started = time.time()
-            last_keepalive = 0.0
-            # Начинаем с последнего существующего сообщения, чтобы не дублировать
-            last_message_id = (
+        # Начинаем с последнего существующего сообщения, чтобы не дублировать
+        state = {
+            "last_message_id": (
                 conversation.messages.order_by("-id").values_list("id", flat=True).first() or 0
-            )
-            last_typing = None
-            last_conversation_data = None
-
-            # Первое событие (handshake)
-            yield "event: ready\ndata: {}\n\n"
+            ),
+            "last_typing": None,
+            "last_conversation_data": None,
+        }
 
-            while True:
-                now = time.time()
-                # Закрываем соединение через 30 секунд (по образцу Chatwoot)
-                if now - started > 30:
-                    break
+        def collect(event):
+            """Снимок изменений диалога (см. messenger.sse)."""
+            chunks = []
 
-                # Получаем новые сообщения
+            if sse.wants(event, "message"):
                 new_messages = (
-                    conversation.messages.filter(id__gt=last_message_id)
+                    conversation.messages.filter(id__gt=state["last_message_id"])
                     .select_related("sender_user", "sender_contact")
                     .prefetch_related("attachments")
                     .order_by("created_at", "id")
                 )
-
-                messages_list = list(new_messages)
-
-                # Отправляем события для новых сообщений
-                for msg in messages_list:
-                    if msg.id > last_message_id:
-                        last_message_id = msg.id
-
+                for msg in new_messages:
+                    if msg.id > state["last_message_id"]:
+                        state["last_message_id"] = msg.id
                     serializer = serializers.MessageSerializer(msg)
-                    yield f"event: message.created\ndata: {json.dumps(serializer.data, ensure_ascii=False)}\n\n"
-
-                # Проверяем статус печати
-                typing_status = get_typing_status(conversation.id)
-                contact_typing = typing_status.get("contact_typing") is True
-
-                if last_typing != contact_typing:
-                    last_typing = contact_typing
-                    if contact_typing:
-                        yield "event: conversation.typing_started\ndata: {}\n\n"
-                    else:
-                        yield "event: conversation.typing_stopped\ndata: {}\n\n"
+                    chunks.append(
+                        f"event: message.created\ndata: {json.dumps(serializer.data, ensure_ascii=False, cls=DjangoJSONEncoder)}\n\n"
+                    )
 
-                # Проверяем обновления диалога (статус, назначение и т.д.)
+            # Статус печати — из кэша, проверяем на каждом тике
+            typing_status = get_typing_status(conversation.id)
+            contact_typing = typing_status.get("contact_typing") is True
+            if state["last_typing"] != contact_typing:
+                state["last_typing"] = contact_typing
+                if contact_typing:
+                    chunks.append("event: conversation.typing_started\ndata: {}\n\n")
+                else:
+                    chunks.append("event: conversation.typing_stopped\ndata: {}\n\n")
+
+            # Обновления диалога (статус, назначение и т.д.)
+            if sse.wants(event, "conversation", "message"):
                 conversation.refresh_from_db()
                 current_data = {
                     "id": conversation.id,
@@ -939,23 +929,22 @@ class ConversationViewSet(
                         else None
                     ),
                 }
+                if state["last_conversation_data"] != current_data:
+                    state["last_conversation_data"] = current_data
+                    chunks.append(
+                        f"event: conversation.updated\ndata: {json.dumps(current_data, ensure_ascii=False)}\n\n"
+                    )
 
-                if last_conversation_data != current_data:
-                    last_conversation_data = current_data
-                    yield f"event: conversation.updated\ndata: {json.dumps(current_data, ensure_ascii=False)}\n\n"
-
-                # Keep-alive каждые 5 секунд
-                if now - last_keepalive > 5:
-                    last_keepalive = now
-                    yield ": keep-alive\n\n"
-
-                time.sleep(1)
-
-        resp = StreamingHttpResponse(event_stream(), content_type="text/event-stream")
-        resp["Cache-Control"] = "no-cache"
-        resp["X-Accel-Buffering"] = "no"  # nginx: не буферизовать SSE
+            return chunks
 
-        return resp
+        # Соединение закрывается через 30 секунд (по образцу Chatwoot)
+        return sse.event_stream_response(
+            request,
+            collect,
+            [sse_group_conversation(conversation.id)],
+            lifetime=30,
+            poll_interval=1,
+        )
 
     @action(detail=True, methods=["get", "post"], url_path="typing")
     def typing(self, request, pk=None):
@@ -1257,30 +1246,67 @@ class ReportingViewSet(MessengerEnabledApiMixin, viewsets.ViewSet):
 
     @action(detail=False, methods=["get"], url_path="overview")
     def overview(self, request):
-        """Обзорные метрики за период."""
+        """
+        Обзорные метрики за период.
+
+        Время ответа и число решённых диалогов берутся из часовых агрегатов
+        ReportingBucket (окно выравнивается по началу часа): среднее, p50/p90
+        по всему периоду и FRT в разрезе inbox и оператора.
+        """
         from datetime import timedelta
 
-        from django.db.models import Avg, Count
+        from django.db.models import Avg
+
+        from .reporting import aggregate_buckets
 
         days = int(request.query_params.get("days", "7"))
         since = timezone.now() - timedelta(days=days)
 
-        events = models.ReportingEvent.objects.filter(created_at__gte=since)
-
-        # Средний FRT
-        avg_frt = events.filter(name=models.ReportingEvent.EventType.FIRST_RESPONSE).aggregate(
-            avg=Avg("value")
-        )["avg"]
+        event_type = models.ReportingEvent.EventType
+        names = [event_type.FIRST_RESPONSE, event_type.REPLY_TIME]
+        totals = aggregate_buckets(since, names=[*names, event_type.CONVERSATION_RESOLVED])
+        by_inbox = aggregate_buckets(since, names=[event_type.FIRST_RESPONSE], by=("inbox_id",))
+        by_user = aggregate_buckets(since, names=[event_type.FIRST_RESPONSE], by=("user_id",))
+
+        def _seconds(value, digits=1):
+            return round(value, digits) if value else None
+
+        def _timing(stats):
+            return {
+                "count": stats.count if stats else 0,
+                "avg_seconds": _seconds(stats.avg) if stats else None,
+                "p50_seconds": _seconds(stats.quantile(0.5)) if stats else None,
+                "p90_seconds": _seconds(stats.quantile(0.9)) if stats else None,
+            }
 
-        # Средний reply time
-        avg_reply = events.filter(name=models.ReportingEvent.EventType.REPLY_TIME).aggregate(
-            avg=Avg("value")
-        )["avg"]
+        frt = totals.get((event_type.FIRST_RESPONSE,))
+        reply = totals.get((event_type.REPLY_TIME,))
+        resolved = totals.get((event_type.CONVERSATION_RESOLVED,))
 
-        # Решённые диалоги
-        resolved_count = events.filter(
-            name=models.ReportingEvent.EventType.CONVERSATION_RESOLVED
-        ).count()
+        inbox_names = dict(
+            models.Inbox.objects.filter(id__in=[key[1] for key in by_inbox]).values_list(
+                "id", "name"
+            )
+        )
+        users = {u.id: u for u in User.objects.filter(id__in=[key[1] for key in by_user if key[1]])}
+        frt_by_inbox = [
+            {"inbox_id": inbox_id, "inbox_name": inbox_names.get(inbox_id, ""), **_timing(stats)}
+            for (_, inbox_id), stats in by_inbox.items()
+        ]
+        frt_by_operator = [
+            {
+                "user_id": user_id,
+                "user_name": (
+                    (users[user_id].get_full_name() or users[user_id].username)
+                    if user_id in users
+                    else ""
+                ),
+                **_timing(stats),
+            }
+            for (_, user_id), stats in by_user.items()
+        ]
+        frt_by_inbox.sort(key=lambda row: -row["count"])
+        frt_by_operator.sort(key=lambda row: -row["count"])
 
         # Общее кол-во диалогов за период
         total_conversations = models.Conversation.objects.filter(created_at__gte=since).count()
@@ -1294,9 +1320,13 @@ class ReportingViewSet(MessengerEnabledApiMixin, viewsets.ViewSet):
             {
                 "period_days": days,
                 "total_conversations": total_conversations,
-                "resolved_conversations": resolved_count,
-                "avg_first_response_time_seconds": round(avg_frt, 1) if avg_frt else None,
-                "avg_reply_time_seconds": round(avg_reply, 1) if avg_reply else None,
+                "resolved_conversations": resolved.count if resolved else 0,
+                "avg_first_response_time_seconds": _seconds(frt.avg) if frt else None,
+                "avg_reply_time_seconds": _seconds(reply.avg) if reply else None,
+                "first_response_time": _timing(frt),
+                "reply_time": _timing(reply),
+                "first_response_by_inbox": frt_by_inbox,
+                "first_response_by_operator": frt_by_operator,
                 "avg_csat_score": round(avg_csat, 2) if avg_csat else None,
                 "csat_responses_count": csat_count,
             }
@@ -1379,12 +1409,28 @@ def branches_list_view(request):
 @api_view(["POST"])
 @permission_classes([IsAuthenticated])
 def heartbeat_view(request):
-    """Обновить messenger_online/messenger_last_seen для текущего пользователя."""
+    """Обновить messenger_online/messenger_last_seen для текущего пользователя.
+
+    С индексом присутствия heartbeat идёт в Redis (messenger.presence), а
+    строка пользователя пишется, только если он был offline или last_seen
+    старше presence.DB_TOUCH_SECONDS — этого хватает check_offline_operators.
+    """
+    from . import presence
+
     user = request.user
-    user.messenger_online = True
-    user.messenger_last_seen = timezone.now()
-    user.save(update_fields=["messenger_online", "messenger_last_seen"])
-    return Response({"ok": True, "last_seen": user.messenger_last_seen.isoformat()})
+    now = timezone.now()
+    presence.touch(user.pk, user.branch_id)
+    stale = (
+        not presence.enabled()
+        or not user.messenger_online
+        or user.messenger_last_seen is None
+        or (now - user.messenger_last_seen).total_seconds() >= presence.DB_TOUCH_SECONDS
+    )
+    if stale:
+        user.messenger_online = True
+        user.messenger_last_seen = now
+        user.save(update_fields=["messenger_online", "messenger_last_seen"])
+    return Response({"ok": True, "last_seen": now.isoformat()})
 
 
 class TransferRequestSerializer(drf_serializers.Serializer):
@@ -1438,5 +1484,6 @@ def transfer_conversation(request, conversation_id):
     if to_branch:
         update_fields["branch"] = to_branch
     Conversation.objects.filter(pk=conv.pk).update(**update_fields)
+    sse.publish_conversation_change(conv.pk)
 
     return Response({"ok": True, "cross_branch": cross_branch})
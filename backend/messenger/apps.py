@@ -9,3 +9,7 @@ class MessengerConfig(AppConfig):
     def ready(self):
         # Подключаем сигналы (автоназначение диалога и т.п.).
         from messenger import signals
+        from messenger.sse import register_stream_listeners
+
+        # SSE-стримы будятся из EventDispatcher (см. messenger.sse).
+        register_stream_listeners()
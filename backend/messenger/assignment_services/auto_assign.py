@@ -4,9 +4,11 @@ from dataclasses import dataclass
 from typing import Optional
 
 from accounts.models import Branch, User
+from messenger import unread
 from messenger.assignment_services.branch_load_balancer import BranchLoadBalancer
 from messenger.assignment_services.region_router import MultiBranchRouter
 from messenger.models import Conversation
+from messenger.sse import publish_conversation_change
 
 
 @dataclass
@@ -46,8 +48,11 @@ def auto_assign_conversation(conversation: Conversation) -> AutoAssignResult:
     if user is not None:
         update_fields["assignee"] = user
 
+    old_assignee_id = conversation.assignee_id
     Conversation.objects.filter(pk=conversation.pk).update(**update_fields)
     conversation.refresh_from_db()
+    unread.transfer(conversation.assignee_unread_count, old_assignee_id, conversation.assignee_id)
+    publish_conversation_change(conversation.pk)
 
     return AutoAssignResult(
         assigned=user is not None,
@@ -5,6 +5,7 @@ from typing import Optional
 from django.db.models import Count, Q
 
 from accounts.models import Branch, User
+from messenger import presence
 from messenger.models import Conversation
 
 
@@ -12,17 +13,21 @@ class BranchLoadBalancer:
     """Выбирает наименее загруженного онлайн-менеджера указанного филиала.
 
     Кандидаты: активные пользователи филиала с ролью MANAGER и статусом
-    messenger_online=True. Нагрузкой считается число открытых (status=OPEN)
-    диалогов, назначенных на пользователя. При равенстве нагрузки — случайный.
+    messenger_online=True. С индексом присутствия (messenger.presence) онлайн —
+    это heartbeat в окне STALE_SECONDS, без ожидания check_offline_operators.
+    Нагрузкой считается число открытых (status=OPEN) диалогов, назначенных
+    на пользователя. При равенстве нагрузки — случайный.
     """
 
     def pick(self, branch: Branch) -> User | None:
+        statuses = presence.branch_statuses(branch.id)
+        online = Q(messenger_online=True) if statuses is None else Q(id__in=list(statuses))
         candidates = (
             User.objects.filter(
+                online,
                 branch=branch,
                 role=User.Role.MANAGER,
                 is_active=True,
-                messenger_online=True,
             )
             .annotate(
                 active_count=Count(
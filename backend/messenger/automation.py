@@ -3,7 +3,9 @@ Automation engine for messenger — Chatwoot-style event-driven rules.
 
 Two layers:
 1. Legacy auto_reply (inbox.settings.automation.auto_reply) — kept for backward compat.
-2. AutomationRule model — flexible conditions + actions engine.
+2. AutomationRule model — flexible conditions + actions engine. Active rules are
+   compiled into per-(event, inbox) predicate lists cached per process and
+   rebuilt when the shared rules version changes (signals on AutomationRule).
 
 Usage:
     from messenger.automation import dispatch_event
@@ -14,9 +16,15 @@ Usage:
 from __future__ import annotations
 
 import logging
-from typing import Any, Dict, List, Optional
+import threading
+import time
+from collections import defaultdict
+from collections.abc import Callable
+from dataclasses import dataclass
+from typing import Any, Optional
 
-from django.db.models import Q
+from django.core.cache import cache
+from django.db import transaction
 
 from .models import AutomationRule, Conversation, Message
 
@@ -96,6 +104,168 @@ def run_automation_for_incoming_message(message: Message) -> None:
 
 
 # ─── AutomationRule engine ───────────────────────────────────────────────
+#
+# Активные правила компилируются в списки по (event_name, inbox_id): условия
+# превращаются в замыкания с заранее разобранными значениями операторов.
+# Списки живут в памяти процесса и пересобираются, когда меняется версия
+# RULES_VERSION_KEY в общем кэше (сигналы AutomationRule, rules_changed()).
+
+RULES_VERSION_KEY = "messenger:automation:rules_version"
+# Страховка от изменений правил в обход сигналов (queryset.update())
+COMPILED_MAX_AGE = 300
+
+Predicate = Callable[[Conversation, Message | None], bool]
+
+
+@dataclass(frozen=True)
+class CompiledRule:
+    """Правило, готовое к проверке без обращения к БД и разбора JSON."""
+
+    id: int
+    name: str
+    predicates: tuple[Predicate, ...]
+    actions: tuple[dict, ...]
+
+    def matches(self, conversation: Conversation, message: Message | None) -> bool:
+        return all(predicate(conversation, message) for predicate in self.predicates)
+
+
+_ATTRIBUTE_GETTERS: dict[str, Callable[[Conversation, Message | None], Any]] = {
+    "status": lambda c, m: c.status,
+    "assignee_id": lambda c, m: c.assignee_id,
+    "priority": lambda c, m: c.priority,
+    "inbox_id": lambda c, m: c.inbox_id,
+    "browser_language": lambda c, m: getattr(c.contact, "browser_language", None),
+    "country": lambda c, m: getattr(c.contact, "country", None),
+    "message_type": lambda c, m: m.direction if m else None,
+    "content": lambda c, m: (m.body or "") if m else None,
+}
+
+
+def _missing_attribute(conversation: Conversation, message: Message | None) -> Any:
+    return None
+
+
+def _as_str(value: Any) -> str:
+    return str(value) if value is not None else ""
+
+
+def _compile_condition(cond: dict) -> Predicate | None:
+    """
+    Условие → предикат. Формат условия:
+    {
+      "attribute_key": "status" | "assignee_id" | "priority" | "inbox_id" | "message_type" | "content",
+      "filter_operator": "equal_to" | "not_equal_to" | "contains" | "does_not_contain" | "is_present" | "is_not_present",
+      "values": [...]
+    }
+    None — условие не проверяется (неизвестный оператор пропускаем).
+    """
+    get = _ATTRIBUTE_GETTERS.get(cond.get("attribute_key", ""), _missing_attribute)
+    operator = cond.get("filter_operator", "")
+    values = cond.get("values", [])
+    values_str = [str(v) for v in values] if values else []
+
+    if operator in ("equal_to", "not_equal_to"):
+        expected = frozenset(values_str)
+        if operator == "equal_to":
+            return lambda c, m: _as_str(get(c, m)) in expected
+        return lambda c, m: _as_str(get(c, m)) not in expected
+    if operator in ("contains", "does_not_contain"):
+        needles = tuple(v.lower() for v in values_str)
+        if operator == "contains":
+            return lambda c, m: _contains_any(_as_str(get(c, m)).lower(), needles)
+        return lambda c, m: not _contains_any(_as_str(get(c, m)).lower(), needles)
+    if operator == "is_present":
+        return lambda c, m: bool(get(c, m))
+    if operator == "is_not_present":
+        return lambda c, m: not get(c, m)
+    return None
+
+
+def _contains_any(actual: str, needles: tuple[str, ...]) -> bool:
+    return any(needle in actual for needle in needles)
+
+
+def compile_rule(rule: AutomationRule) -> CompiledRule:
+    """Все условия — AND; нет условий — правило срабатывает всегда."""
+    predicates = []
+    for cond in rule.conditions or []:
+        if not isinstance(cond, dict):
+            continue
+        predicate = _compile_condition(cond)
+        if predicate is not None:
+            predicates.append(predicate)
+    actions = tuple(a for a in (rule.actions or []) if isinstance(a, dict))
+    return CompiledRule(rule.id, rule.name, tuple(predicates), actions)
+
+
+def _build_compiled() -> dict[tuple[str, int | None], tuple[CompiledRule, ...]]:
+    """Одним запросом: {(event, inbox_id): правила inbox + общие, по id; (event, None): общие}."""
+    common: dict[str, list[CompiledRule]] = defaultdict(list)
+    per_inbox: dict[tuple[str, int], list[CompiledRule]] = defaultdict(list)
+    rules = AutomationRule.objects.filter(is_active=True).order_by("id")
+    for rule in rules.only("id", "name", "event_name", "inbox_id", "conditions", "actions"):
+        try:
+            compiled = compile_rule(rule)
+        except Exception:
+            logger.warning("Automation rule %s (id=%d) failed to compile", rule.name, rule.id)
+            continue
+        if rule.inbox_id is None:
+            common[rule.event_name].append(compiled)
+        else:
+            per_inbox[(rule.event_name, rule.inbox_id)].append(compiled)
+
+    by_key: dict[tuple[str, int | None], tuple[CompiledRule, ...]] = {
+        (event_name, None): tuple(items) for event_name, items in common.items()
+    }
+    for (event_name, inbox_id), items in per_inbox.items():
+        merged = sorted(items + common.get(event_name, []), key=lambda r: r.id)
+        by_key[(event_name, inbox_id)] = tuple(merged)
+    return by_key
+
+
+_compiled: dict[str, Any] = {"version": None, "built_at": 0.0, "by_key": None}
+_compiled_lock = threading.Lock()
+
+
+def _rules_version():
+    version = cache.get(RULES_VERSION_KEY)
+    if version is None:
+        # Ключ вытеснен или ещё не создан — новая версия, общая для всех процессов
+        cache.add(RULES_VERSION_KEY, time.time_ns(), None)
+        version = cache.get(RULES_VERSION_KEY)
+    return version
+
+
+def compiled_rules(event_name: str, inbox_id: int | None) -> tuple[CompiledRule, ...]:
+    """Скомпилированные правила события для inbox (с общими), в порядке id."""
+    version = _rules_version()
+    now = time.monotonic()
+    by_key = _compiled["by_key"]
+    if (
+        by_key is None
+        or _compiled["version"] != version
+        or now - _compiled["built_at"] > COMPILED_MAX_AGE
+    ):
+        with _compiled_lock:
+            by_key = _build_compiled()
+            _compiled.update(version=version, built_at=now, by_key=by_key)
+    return by_key.get((event_name, inbox_id)) or by_key.get((event_name, None), ())
+
+
+def _bump_rules_version() -> None:
+    try:
+        cache.incr(RULES_VERSION_KEY)
+    except ValueError:
+        cache.set(RULES_VERSION_KEY, time.time_ns(), None)
+
+
+def rules_changed() -> None:
+    """Правила изменились — процессы пересоберут скомпилированные списки."""
+    _bump_rules_version()
+    # Повтор после коммита: процесс, успевший пересобрать списки по ещё
+    # не закоммиченным данным, пересоберёт их снова
+    transaction.on_commit(_bump_rules_version)
 
 
 def dispatch_event(
@@ -109,25 +279,20 @@ def dispatch_event(
     - message_created
     - conversation_updated
 
-    Находит подходящие правила, проверяет условия, выполняет действия.
-    Возвращает кол-во выполненных правил.
+    Берёт скомпилированные правила, проверяет условия, выполняет действия.
+    Изменения полей и меток диалога от всех сработавших правил пишутся
+    одним save(). Возвращает кол-во выполненных правил.
     """
-    rules = (
-        AutomationRule.objects.filter(
-            event_name=event_name,
-            is_active=True,
-        )
-        .filter(
-            Q(inbox=conversation.inbox) | Q(inbox__isnull=True),
-        )
-        .order_by("id")
-    )
+    rules = compiled_rules(event_name, conversation.inbox_id)
+    if not rules:
+        return 0
 
+    batch = _ActionBatch(conversation)
     executed = 0
     for rule in rules:
         try:
-            if _evaluate_conditions(rule.conditions, conversation, message):
-                _execute_actions(rule.actions, conversation, message)
+            if rule.matches(conversation, message):
+                batch.run(rule.actions)
                 executed += 1
                 logger.info(
                     "Automation rule %s (id=%d) fired for conversation %d",
@@ -142,88 +307,15 @@ def dispatch_event(
                 rule.id,
                 exc_info=True,
             )
+    try:
+        batch.flush()
+    except Exception:
+        logger.warning(
+            "Automation actions failed for conversation %d", conversation.id, exc_info=True
+        )
     return executed
 
 
-# ─── Conditions evaluator ────────────────────────────────────────────────
-
-
-def _evaluate_conditions(
-    conditions: list[dict],
-    conversation: Conversation,
-    message: Message | None,
-) -> bool:
-    """
-    Все условия — AND. Каждое условие:
-    {
-      "attribute_key": "status" | "assignee_id" | "priority" | "inbox_id" | "message_type" | "content",
-      "filter_operator": "equal_to" | "not_equal_to" | "contains" | "does_not_contain" | "is_present" | "is_not_present",
-      "values": [...]
-    }
-    """
-    if not conditions:
-        return True  # Нет условий = всегда срабатывает
-
-    for cond in conditions:
-        if not isinstance(cond, dict):
-            continue
-        attr_key = cond.get("attribute_key", "")
-        operator = cond.get("filter_operator", "")
-        values = cond.get("values", [])
-
-        actual = _get_attribute_value(attr_key, conversation, message)
-
-        if not _check_operator(actual, operator, values):
-            return False
-
-    return True
-
-
-def _get_attribute_value(
-    attr_key: str,
-    conversation: Conversation,
-    message: Message | None,
-) -> Any:
-    """Получить значение атрибута для проверки условия."""
-    if attr_key == "status":
-        return conversation.status
-    elif attr_key == "assignee_id":
-        return conversation.assignee_id
-    elif attr_key == "priority":
-        return conversation.priority
-    elif attr_key == "inbox_id":
-        return conversation.inbox_id
-    elif attr_key == "browser_language":
-        return getattr(conversation.contact, "browser_language", None)
-    elif attr_key == "country":
-        return getattr(conversation.contact, "country", None)
-    elif attr_key == "message_type" and message:
-        return message.direction
-    elif attr_key == "content" and message:
-        return message.body or ""
-    return None
-
-
-def _check_operator(actual: Any, operator: str, values: list) -> bool:
-    """Проверить один оператор условия."""
-    actual_str = str(actual) if actual is not None else ""
-    values_str = [str(v) for v in values] if values else []
-
-    if operator == "equal_to":
-        return actual_str in values_str
-    elif operator == "not_equal_to":
-        return actual_str not in values_str
-    elif operator == "contains":
-        return any(v.lower() in actual_str.lower() for v in values_str)
-    elif operator == "does_not_contain":
-        return not any(v.lower() in actual_str.lower() for v in values_str)
-    elif operator == "is_present":
-        return bool(actual)
-    elif operator == "is_not_present":
-        return not bool(actual)
-    return True  # Неизвестный оператор — пропускаем
-
-
 # ─── Actions executor ────────────────────────────────────────────────────
 
 
@@ -239,45 +331,109 @@ def _execute_actions(
       "action_params": [...]
     }
     """
-    for action in actions:
-        if not isinstance(action, dict):
-            continue
-        action_name = action.get("action_name", "")
-        params = action.get("action_params", [])
-        _run_action(action_name, params, conversation, message)
+    batch = _ActionBatch(conversation)
+    batch.run(actions)
+    batch.flush()
 
 
-def _run_action(
-    action_name: str,
-    params: list,
-    conversation: Conversation,
-    message: Message | None,
-) -> None:
-    """Выполнить одно действие."""
+class _ActionBatch:
+    """
+    Действия над одним диалогом. Поля (resolve/set_priority/mute) и метки
+    копятся и пишутся одним save() и одной операцией над метками в flush().
+    Действия с собственной записью (assign_agent, send_message) сначала
+    сбрасывают накопленное — порядок действий сохраняется.
+    """
 
-    if action_name == "assign_agent":
-        _action_assign_agent(conversation, params)
+    def __init__(self, conversation: Conversation):
+        self.conversation = conversation
+        self.fields: set[str] = set()
+        self.add_labels: set[int] = set()
+        self.remove_labels: set[int] = set()
+
+    def run(self, actions) -> None:
+        for action in actions:
+            if not isinstance(action, dict):
+                continue
+            action_name = action.get("action_name", "")
+            params = action.get("action_params", [])
+            if action_name in _BATCHED_ACTIONS:
+                _BATCHED_ACTIONS[action_name](self, params)
+            elif action_name in _IMMEDIATE_ACTIONS:
+                self.flush()
+                _IMMEDIATE_ACTIONS[action_name](self.conversation, params)
+            else:
+                logger.warning("Unknown automation action: %s", action_name)
+
+    def set_field(self, name: str, value: Any) -> None:
+        if getattr(self.conversation, name) != value:
+            setattr(self.conversation, name, value)
+            self.fields.add(name)
+
+    def flush(self) -> None:
+        conversation = self.conversation
+        if self.fields:
+            conversation.save(update_fields=sorted(self.fields))
+            self.fields.clear()
+        if self.remove_labels:
+            conversation.labels.remove(*self.remove_labels)
+            self.remove_labels.clear()
+        if self.add_labels:
+            from .models import ConversationLabel
+
+            existing = ConversationLabel.objects.filter(pk__in=self.add_labels)
+            conversation.labels.add(*existing.values_list("id", flat=True))
+            self.add_labels.clear()
+
+
+def _label_ids(params: list) -> list[int]:
+    ids = []
+    for label_id in params or []:
+        try:
+            ids.append(int(label_id))
+        except (ValueError, TypeError):
+            pass
+    return ids
 
-    elif action_name == "resolve":
-        _action_resolve(conversation)
 
-    elif action_name == "add_label":
-        _action_add_label(conversation, params)
+def _action_resolve(batch: _ActionBatch, params: list) -> None:
+    """Перевести диалог в resolved."""
+    batch.set_field("status", Conversation.Status.RESOLVED)
 
-    elif action_name == "remove_label":
-        _action_remove_label(conversation, params)
 
-    elif action_name == "send_message":
-        _action_send_message(conversation, params)
+def _action_add_label(batch: _ActionBatch, params: list) -> None:
+    """Добавить метки. params = [label_id, ...]"""
+    for label_id in _label_ids(params):
+        batch.add_labels.add(label_id)
+        batch.remove_labels.discard(label_id)
 
-    elif action_name == "set_priority":
-        _action_set_priority(conversation, params)
 
-    elif action_name == "mute":
-        _action_mute(conversation)
+def _action_remove_label(batch: _ActionBatch, params: list) -> None:
+    """Убрать метки. params = [label_id, ...]"""
+    for label_id in _label_ids(params):
+        batch.remove_labels.add(label_id)
+        batch.add_labels.discard(label_id)
 
-    else:
-        logger.warning("Unknown automation action: %s", action_name)
+
+def _action_set_priority(batch: _ActionBatch, params: list) -> None:
+    """Установить приоритет. params = [10|20|30]"""
+    if not params:
+        return
+    try:
+        priority = int(params[0])
+    except (ValueError, TypeError):
+        return
+    if priority in (
+        Conversation.Priority.LOW,
+        Conversation.Priority.NORMAL,
+        Conversation.Priority.HIGH,
+    ):
+        batch.set_field("priority", priority)
+
+
+def _action_mute(batch: _ActionBatch, params: list) -> None:
+    """Замьютить диалог (выключить уведомления)."""
+    if hasattr(batch.conversation, "is_muted"):
+        batch.set_field("is_muted", True)
 
 
 def _action_assign_agent(conversation: Conversation, params: list) -> None:
@@ -293,34 +449,10 @@ def _action_assign_agent(conversation: Conversation, params: list) -> None:
         assign_conversation(conversation, user)
     except (User.DoesNotExist, ValueError, IndexError):
         logger.warning("assign_agent: user %s not found", params)
-
-
-def _action_resolve(conversation: Conversation) -> None:
-    """Перевести диалог в resolved."""
-    if conversation.status != Conversation.Status.RESOLVED:
-        conversation.status = Conversation.Status.RESOLVED
-        conversation.save(update_fields=["status"])
-
-
-def _action_add_label(conversation: Conversation, params: list) -> None:
-    """Добавить метки. params = [label_id, ...]"""
-    from .models import ConversationLabel
-
-    for label_id in params:
-        try:
-            label = ConversationLabel.objects.get(pk=int(label_id))
-            conversation.labels.add(label)
-        except (ConversationLabel.DoesNotExist, ValueError):
-            pass
-
-
-def _action_remove_label(conversation: Conversation, params: list) -> None:
-    """Убрать метки. params = [label_id, ...]"""
-    for label_id in params:
-        try:
-            conversation.labels.remove(int(label_id))
-        except (ValueError, TypeError):
-            pass
+        return
+    # assign_conversation пишет через свой экземпляр — синхронизируем наш,
+    # чтобы следующий save() не считал assignee изменённым
+    conversation.assignee = user
 
 
 def _action_send_message(conversation: Conversation, params: list) -> None:
@@ -341,25 +473,14 @@ def _action_send_message(conversation: Conversation, params: list) -> None:
     )
 
 
-def _action_set_priority(conversation: Conversation, params: list) -> None:
-    """Установить приоритет. params = [10|20|30]"""
-    if not params:
-        return
-    try:
-        priority = int(params[0])
-        if priority in (
-            Conversation.Priority.LOW,
-            Conversation.Priority.NORMAL,
-            Conversation.Priority.HIGH,
-        ):
-            conversation.priority = priority
-            conversation.save(update_fields=["priority"])
-    except (ValueError, TypeError):
-        pass
-
-
-def _action_mute(conversation: Conversation) -> None:
-    """Замьютить диалог (выключить уведомления)."""
-    if hasattr(conversation, "is_muted"):
-        conversation.is_muted = True
-        conversation.save(update_fields=["is_muted"])
+_BATCHED_ACTIONS: dict[str, Callable[[_ActionBatch, list], None]] = {
+    "resolve": _action_resolve,
+    "add_label": _action_add_label,
+    "remove_label": _action_remove_label,
+    "set_priority": _action_set_priority,
+    "mute": _action_mute,
+}
+_IMMEDIATE_ACTIONS: dict[str, Callable[[Conversation, list], None]] = {
+    "assign_agent": _action_assign_agent,
+    "send_message": _action_send_message,
+}
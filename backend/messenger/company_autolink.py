@@ -10,6 +10,10 @@
    CompanyPhone.value / ContactPhone.value.
 3. Привязываем только если нашли РОВНО одну компанию-кандидата.
 
+Оба поиска — точечные запросы к companies.CompanyContactKey (перевёрнутые цифры
+телефонов и домены почты, поддерживаются вместе с поисковым индексом), а не
+endswith по JOIN'ам телефонов/почт.
+
 ВАЖНО: модуль лежит на верхнем уровне приложения `messenger`, а не в
 `messenger.services`, потому что `messenger/services.py` — существующий
 файл (widget helpers), и пакет с тем же именем затенил бы его.
@@ -17,95 +21,13 @@
 
 from __future__ import annotations
 
-import re
-
-# Публичные почтовые домены, которые нельзя использовать как признак
-# принадлежности к компании.
-PUBLIC_EMAIL_DOMAINS: frozenset[str] = frozenset(
-    {
-        "gmail.com",
-        "yahoo.com",
-        "yahoo.ru",
-        "outlook.com",
-        "hotmail.com",
-        "live.com",
-        "mail.ru",
-        "internet.ru",
-        "yandex.ru",
-        "yandex.com",
-        "ya.ru",
-        "bk.ru",
-        "list.ru",
-        "inbox.ru",
-        "icloud.com",
-        "me.com",
-        "rambler.ru",
-        "protonmail.com",
-        "proton.me",
-        "gmx.com",
-        "aol.com",
-    }
+from companies.contact_keys import (
+    PUBLIC_EMAIL_DOMAINS,
+    company_ids_by_email_domain,
+    company_ids_by_phone_tail,
 )
-
-_NON_DIGIT_RE = re.compile(r"\D+")
-
-
-def _extract_email_domain(email: str | None) -> str:
-    if not email:
-        return ""
-    email = str(email).strip().lower()
-    if "@" not in email:
-        return ""
-    return email.split("@", 1)[1].strip()
-
-
-def _phone_tail(phone: str | None) -> str:
-    """Возвращает последние 10 цифр нормализованного номера или ''."""
-    if not phone:
-        return ""
-    try:
-        from companies.normalizers import normalize_phone
-
-        normalized = normalize_phone(str(phone))
-    except Exception:
-        normalized = str(phone)
-    digits = _NON_DIGIT_RE.sub("", normalized or "")
-    if len(digits) < 10:
-        return ""
-    return digits[-10:]
-
-
-def _find_candidates_by_domain(domain: str) -> set:
-    from django.db.models import Q
-
-    from companies.models import Company
-
-    if not domain or domain in PUBLIC_EMAIL_DOMAINS:
-        return set()
-
-    suffix = f"@{domain}"
-    q = (
-        Q(email__iendswith=suffix)
-        | Q(emails__value__iendswith=suffix)
-        | Q(contacts__emails__value__iendswith=suffix)
-    )
-    return set(Company.objects.filter(q).values_list("id", flat=True).distinct()[:5])
-
-
-def _find_candidates_by_phone(phone_tail: str) -> set:
-    from django.db.models import Q
-
-    from companies.models import Company
-
-    if not phone_tail:
-        return set()
-
-    q = (
-        Q(phone__endswith=phone_tail)
-        | Q(phones__value__endswith=phone_tail)
-        | Q(contacts__phones__value__endswith=phone_tail)
-    )
-    return set(Company.objects.filter(q).values_list("id", flat=True).distinct()[:5])
+from companies.contact_keys import email_domain as _extract_email_domain
+from companies.contact_keys import phone_tail as _phone_tail
 
 
 def find_company_for_contact(contact):
@@ -119,7 +41,7 @@ def find_company_for_contact(contact):
     candidate_ids: set = set()
 
     if domain and domain not in PUBLIC_EMAIL_DOMAINS:
-        candidate_ids = _find_candidates_by_domain(domain)
+        candidate_ids = company_ids_by_email_domain(domain)
         if len(candidate_ids) > 1:
             # Домен неоднозначен — не фолбэкаемся на phone.
             return None
@@ -127,7 +49,7 @@ def find_company_for_contact(contact):
     if not candidate_ids:
         tail = _phone_tail(getattr(contact, "phone", ""))
         if tail:
-            candidate_ids = _find_candidates_by_phone(tail)
+            candidate_ids = company_ids_by_phone_tail(tail)
 
     if len(candidate_ids) != 1:
         return None
@@ -246,20 +246,24 @@ class OperatorConsumer(AsyncWebsocketConsumer):
 
     @database_sync_to_async
     def _set_operator_online(self):
+        from . import presence
         from .models import AgentProfile
 
         AgentProfile.objects.update_or_create(
             user=self.user,
             defaults={"status": AgentProfile.Status.ONLINE},
         )
+        presence.touch(self.user_id, self.user.branch_id, AgentProfile.Status.ONLINE)
 
     @database_sync_to_async
     def _set_operator_offline(self):
+        from . import presence
         from .models import AgentProfile
 
         AgentProfile.objects.filter(user=self.user).update(
             status=AgentProfile.Status.OFFLINE,
         )
+        presence.leave(self.user_id, self.user.branch_id)
 
 
 class WidgetConsumer(AsyncWebsocketConsumer):
@@ -0,0 +1,113 @@
+"""
+Расписание эскалации молчаливых диалогов.
+
+- Conversation.escalation_due_at — срок следующего уровня эскалации:
+  last_customer_msg_at + порог уровня escalation_level + 1. Ставится тем же
+  UPDATE, что и переход состояния в Message.save(): входящее — новый срок,
+  исходящее — NULL (клиент больше не ждёт), после 4-го уровня — NULL.
+- escalate_waiting_conversations (Celery beat) выбирает по частичному индексу
+  только диалоги с наступившим сроком, а не все открытые.
+- Пороги берутся из PolicyConfig.livechat_escalation и кэшируются; при их
+  смене сроки открытых диалогов пересчитываются одним UPDATE (reschedule).
+"""
+
+from __future__ import annotations
+
+from datetime import datetime, timedelta
+
+from django.core.cache import cache
+from django.db.models import Case, DateTimeField, ExpressionWrapper, F, Q, QuerySet, Value, When
+
+from .models import Conversation
+
+THRESHOLDS_KEY = "messenger:escalation:thresholds"
+THRESHOLDS_TIMEOUT = 60
+# Пороги, под которые посчитаны текущие сроки (сверяет задача эскалации)
+SCHEDULED_KEY = "messenger:escalation:scheduled_thresholds"
+
+# Порог перехода на уровень i + 1 (уровни 1..4: warn/urgent/rop_alert/pool_return)
+LEVEL_KEYS = ("warn_min", "urgent_min", "rop_alert_min", "pool_return_min")
+MAX_LEVEL = len(LEVEL_KEYS)
+
+ACTIVE_STATUSES = (Conversation.Status.OPEN, Conversation.Status.PENDING)
+
+# Клиент ждёт ответа: его сообщение новее последнего ответа оператора
+WAITING = Q(last_customer_msg_at__isnull=False) & (
+    Q(last_agent_msg_at__isnull=True) | Q(last_agent_msg_at__lt=F("last_customer_msg_at"))
+)
+
+
+def thresholds() -> dict:
+    """Пороги эскалации (минуты) с кэшем: Message.save() не ходит в PolicyConfig."""
+    value = cache.get(THRESHOLDS_KEY)
+    if value is None:
+        value = Conversation.escalation_thresholds()
+        cache.set(THRESHOLDS_KEY, value, THRESHOLDS_TIMEOUT)
+    return value
+
+
+def level_delay(level: int, limits: dict) -> timedelta | None:
+    """Задержка от last_customer_msg_at до уровня level + 1; None — уровней больше нет."""
+    if level >= MAX_LEVEL:
+        return None
+    return timedelta(minutes=float(limits[LEVEL_KEYS[level]]))
+
+
+def target_level(waiting_minutes: float, limits: dict) -> int:
+    """Уровень, которого заслуживает ожидание waiting_minutes."""
+    level = 0
+    for i, key in enumerate(LEVEL_KEYS, start=1):
+        if waiting_minutes >= limits[key]:
+            level = i
+    return level
+
+
+def due_after(customer_at: datetime, level: int, limits: dict | None = None) -> datetime | None:
+    delay = level_delay(level, limits or thresholds())
+    return customer_at + delay if delay is not None else None
+
+
+def deadline_at_level(level: int, limits: dict):
+    """SQL-выражение срока для диалога, только что переведённого на level."""
+    delay = level_delay(level, limits)
+    if delay is None:
+        return Value(None, output_field=DateTimeField())
+    return ExpressionWrapper(F("last_customer_msg_at") + Value(delay), output_field=DateTimeField())
+
+
+def deadline_expression(customer_at, limits: dict | None = None, condition: Q | None = None):
+    """SQL-выражение срока по текущему escalation_level строки.
+
+    customer_at — момент сообщения клиента (datetime или выражение);
+    condition — дополнительное условие, без которого срок NULL.
+    """
+    limits = limits or thresholds()
+    whens = []
+    for level in range(MAX_LEVEL):
+        if isinstance(customer_at, datetime):
+            then = Value(customer_at + level_delay(level, limits))
+        else:
+            then = ExpressionWrapper(
+                customer_at + Value(level_delay(level, limits)), output_field=DateTimeField()
+            )
+        match = Q(escalation_level=level)
+        whens.append(When(match & condition if condition is not None else match, then=then))
+    return Case(*whens, default=Value(None), output_field=DateTimeField())
+
+
+def reschedule(queryset: QuerySet | None = None, limits: dict | None = None) -> int:
+    """Пересчитать escalation_due_at одним UPDATE (после смены порогов или update() в обход save)."""
+    if queryset is None:
+        queryset = Conversation.objects.filter(status__in=ACTIVE_STATUSES)
+    return queryset.update(
+        escalation_due_at=deadline_expression(F("last_customer_msg_at"), limits, condition=WAITING)
+    )
+
+
+def sync_thresholds() -> dict:
+    """Актуальные пороги; если они изменились с прошлого расчёта — пересчитать сроки."""
+    limits = thresholds()
+    if cache.get(SCHEDULED_KEY) != limits:
+        reschedule(limits=limits)
+        cache.set(SCHEDULED_KEY, limits, None)
+    return limits
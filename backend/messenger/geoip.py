@@ -1,13 +1,30 @@
 """
 Определение региона по IP (GeoIP) для маршрутизации чатов.
 
-Используется бесплатный API ip-api.com (лимит 45 запросов/мин с одного IP).
-Для продакшена можно заменить на MaxMind GeoLite2 или платный сервис.
+Основной путь — локальный индекс диапазонов (MESSENGER_GEOIP_DB_PATH):
+отсортированные начала диапазонов IPv4/IPv6 → companies.Region.id в компактном
+бинарном файле. Файл собирается командой import_geoip_ranges из CSV
+(GeoLite2/DB-IP/ip2location-подобные выгрузки), открывается через mmap и
+ищется bisect'ом; последние адреса дополнительно держатся в LRU процесса.
+
+HTTP-запрос к ip-api.com (лимит 45 запросов/мин, таймаут 3с) — только запасной
+путь, когда локального индекса нет и включён MESSENGER_GEOIP_HTTP_FALLBACK.
 """
 
 from __future__ import annotations
 
+import ipaddress
 import logging
+import mmap
+import os
+import struct
+import sys
+import threading
+import time
+from array import array
+from bisect import bisect_right
+from collections.abc import Iterable
+from functools import lru_cache
 from typing import TYPE_CHECKING
 
 from django.conf import settings
@@ -17,30 +34,213 @@ if TYPE_CHECKING:
 
 logger = logging.getLogger("messenger.widget")
 
+# Формат файла: заголовок, затем для IPv4 и IPv6 — начала диапазонов
+# (big-endian, 4/16 байт, по возрастанию) и Region.id (uint32 little-endian).
+# Region.id = 0 — адреса вне известных диапазонов (разрыв между ними).
+MAGIC = b"CRMGEO1\n"
+HEADER = struct.Struct("<8sII")
+WIDTHS = {4: 4, 6: 16}
 
-def get_region_from_ip(ip: str) -> Region | None:
-    """
-    Определяет регион по IP-адресу.
+# Размер LRU «IP → Region.id» в процессе
+LRU_SIZE = 4096
+# Как часто проверять, не пересобран ли файл индекса (секунды)
+RECHECK_SECONDS = 60
 
-    Сопоставляет с справочником companies.Region по полю name
-    (regionName из API для России, иначе по имени региона).
 
-    Args:
-        ip: IPv4 или IPv6 адрес. Локальные (127.0.0.1, ::1) возвращают None.
+class _Starts:
+    """Последовательность начал диапазонов поверх буфера — для bisect без копирования."""
 
-    Returns:
-        Region или None, если не удалось определить или сопоставить.
+    __slots__ = ("_buffer", "_count", "_offset", "_width")
+
+    def __init__(self, buffer, offset: int, width: int, count: int):
+        self._buffer = buffer
+        self._offset = offset
+        self._width = width
+        self._count = count
+
+    def __len__(self) -> int:
+        return self._count
+
+    def __getitem__(self, i: int) -> bytes:
+        start = self._offset + i * self._width
+        return self._buffer[start : start + self._width]
+
+
+def _region_ids(buffer, offset: int, count: int):
+    raw = memoryview(buffer)[offset : offset + 4 * count]
+    if sys.byteorder == "little" and array("I").itemsize == 4:
+        return raw.cast("I")
+    ids = array("I", bytes(raw))
+    if sys.byteorder != "little":
+        ids.byteswap()
+    return ids
+
+
+class RangeIndex:
+    """Индекс диапазонов: lookup() — один bisect по отсортированным началам."""
+
+    def __init__(self, buffer):
+        magic, v4_count, v6_count = HEADER.unpack_from(buffer, 0)
+        if magic != MAGIC:
+            raise ValueError("Not a GeoIP range index")
+        self._buffer = buffer
+        self._tables = {}
+        offset = HEADER.size
+        for version, count in ((4, v4_count), (6, v6_count)):
+            width = WIDTHS[version]
+            starts = _Starts(buffer, offset, width, count)
+            offset += width * count
+            self._tables[version] = (starts, _region_ids(buffer, offset, count))
+            offset += 4 * count
+        if offset > len(buffer):
+            raise ValueError("Truncated GeoIP range index")
+
+    def __len__(self) -> int:
+        return sum(len(starts) for starts, _ in self._tables.values())
+
+    def lookup(self, ip: ipaddress.IPv4Address | ipaddress.IPv6Address) -> int | None:
+        """Region.id диапазона, в который попадает адрес; None — адрес не покрыт."""
+        if ip.version == 6 and ip.ipv4_mapped is not None:
+            ip = ip.ipv4_mapped
+        starts, region_ids = self._tables[ip.version]
+        i = bisect_right(starts, ip.packed) - 1
+        if i < 0:
+            return None
+        return region_ids[i] or None
+
+    @classmethod
+    def open(cls, path: str) -> RangeIndex:
+        with open(path, "rb") as f:
+            buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        return cls(buffer)
+
+
+def compile_ranges(ranges: Iterable[tuple[int, int, int, int]]) -> bytes:
     """
-    if not ip or not ip.strip():
-        return None
-    ip = ip.strip()
-    if ip in ("127.0.0.1", "::1", "localhost"):
-        return None
+    Собрать файл индекса из диапазонов (version, first, last, region_id).
 
-    # Опционально отключить GeoIP через настройки
-    if not getattr(settings, "MESSENGER_GEOIP_ENABLED", True):
+    Пересекающиеся диапазоны обрезаются (выигрывает начавшийся раньше),
+    соседние с одним регионом склеиваются, разрывы помечаются region_id = 0.
+    """
+    by_version: dict[int, list[tuple[int, int, int]]] = {4: [], 6: []}
+    for version, first, last, region_id in ranges:
+        by_version[version].append((first, last, region_id))
+
+    counts = []
+    chunks = []
+    for version, width in WIDTHS.items():
+        top = (1 << (8 * width)) - 1
+        starts: list[int] = []
+        region_ids = array("I")
+        prev_last = -1
+        for first, last, region_id in sorted(by_version[version]):
+            first = max(first, prev_last + 1)
+            if first > last:
+                continue
+            if starts and first > prev_last + 1 and region_ids[-1] != 0:
+                starts.append(prev_last + 1)
+                region_ids.append(0)
+            if not starts or region_ids[-1] != region_id:
+                starts.append(first)
+                region_ids.append(region_id)
+            prev_last = last
+        if starts and prev_last < top and region_ids[-1] != 0:
+            starts.append(prev_last + 1)
+            region_ids.append(0)
+        if sys.byteorder != "little":
+            region_ids.byteswap()
+        counts.append(len(starts))
+        chunks.append(b"".join(start.to_bytes(width, "big") for start in starts))
+        chunks.append(region_ids.tobytes())
+    return HEADER.pack(MAGIC, *counts) + b"".join(chunks)
+
+
+def write_index(path: str, data: bytes) -> None:
+    """Атомарно заменить файл индекса (воркеры подхватят его в течение RECHECK_SECONDS)."""
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(data)
+    os.replace(tmp_path, path)
+
+
+# ---------------------------------------------------------------------------
+# Загрузка индекса процесса
+# ---------------------------------------------------------------------------
+
+_state: dict = {"path": None, "mtime": None, "index": None, "checked_at": 0.0}
+_state_lock = threading.Lock()
+
+
+def _index_path() -> str:
+    return str(getattr(settings, "MESSENGER_GEOIP_DB_PATH", "") or "")
+
+
+def get_index() -> RangeIndex | None:
+    """Локальный индекс (перечитывается, если файл пересобран); None — файла нет."""
+    path = _index_path()
+    now = time.monotonic()
+    if path == _state["path"] and now - _state["checked_at"] < RECHECK_SECONDS:
+        return _state["index"]
+    with _state_lock:
+        try:
+            mtime = os.stat(path).st_mtime_ns if path else None
+        except OSError:
+            mtime = None
+        if path != _state["path"] or mtime != _state["mtime"]:
+            index = None
+            if mtime is not None:
+                try:
+                    index = RangeIndex.open(path)
+                except (OSError, ValueError, struct.error):
+                    logger.warning("GeoIP index %s is unreadable", path, exc_info=True)
+            _state.update(path=path, mtime=mtime, index=index)
+            _resolve_region_id.cache_clear()
+        _state["checked_at"] = now
+        return _state["index"]
+
+
+def reset() -> None:
+    """Забыть загруженный индекс и LRU (тесты, смена настроек)."""
+    with _state_lock:
+        _state.update(path=None, mtime=None, index=None, checked_at=0.0)
+    _resolve_region_id.cache_clear()
+
+
+# ---------------------------------------------------------------------------
+# Поиск
+# ---------------------------------------------------------------------------
+
+
+class _LookupFailed(Exception):
+    """HTTP-запрос не удался — результат не кэшируется в LRU."""
+
+
+def region_id_by_name(region_name: str) -> int | None:
+    """Region.id по названию: напрямую или через MESSENGER_GEOIP_REGION_MAPPING."""
+    from companies.models import Region
+
+    region_name = (region_name or "").strip()
+    if not region_name:
         return None
+    # Совпадение по имени (без учёта регистра).
+    # Источники отдают названия на английском; в БД могут быть русские названия.
+    # Для точного маппинга добавьте в справочник Region название на английском или настройте MESSENGER_GEOIP_REGION_MAPPING.
+    region_id = Region.objects.filter(name__iexact=region_name).values_list("id", flat=True).first()
+    if region_id:
+        return region_id
+    # Опциональный маппинг из настроек: {"Sverdlovskaya Oblast": "Свердловская область", ...}
+    mapping = getattr(settings, "MESSENGER_GEOIP_REGION_MAPPING", None)
+    if isinstance(mapping, dict) and region_name in mapping:
+        return (
+            Region.objects.filter(name__iexact=mapping[region_name])
+            .values_list("id", flat=True)
+            .first()
+        )
+    return None
 
+
+def _http_region_id(ip: str) -> int | None:
     try:
         import json
         import urllib.error
@@ -59,25 +259,54 @@ def get_region_from_ip(ip: str) -> Region | None:
         logger.warning(
             "GeoIP request failed for %s: %s", ip[:20] + "..." if len(ip) > 20 else ip, e
         )
+        raise _LookupFailed from e
+    return region_id_by_name(data.get("regionName") or "")
+
+
+@lru_cache(maxsize=LRU_SIZE)
+def _resolve_region_id(ip: str) -> int | None:
+    try:
+        address = ipaddress.ip_address(ip)
+    except ValueError:
+        return None
+    if not address.is_global:
         return None
+    index = get_index()
+    if index is not None:
+        return index.lookup(address)
+    if getattr(settings, "MESSENGER_GEOIP_HTTP_FALLBACK", True):
+        return _http_region_id(ip)
+    return None
 
-    region_name = (data.get("regionName") or "").strip()
-    country_code = (data.get("countryCode") or "").strip().upper()
-    if not region_name:
+
+def get_region_id_from_ip(ip: str) -> int | None:
+    """Region.id по IP: LRU → локальный индекс → (опционально) HTTP."""
+    if not ip or not ip.strip():
+        return None
+    # Опционально отключить GeoIP через настройки
+    if not getattr(settings, "MESSENGER_GEOIP_ENABLED", True):
+        return None
+    get_index()  # перечитать индекс (и сбросить LRU), если файл пересобран
+    try:
+        return _resolve_region_id(ip.strip())
+    except _LookupFailed:
+        return None
+
+
+def get_region_from_ip(ip: str) -> Region | None:
+    """
+    Определяет регион по IP-адресу.
+
+    Args:
+        ip: IPv4 или IPv6 адрес. Локальные и приватные адреса возвращают None.
+
+    Returns:
+        Region или None, если не удалось определить или сопоставить.
+    """
+    region_id = get_region_id_from_ip(ip)
+    if not region_id:
         return None
 
     from companies.models import Region
 
-    # Совпадение по имени (без учёта регистра).
-    # ip-api.com возвращает regionName на английском; в БД могут быть русские названия.
-    # Для точного маппинга добавьте в справочник Region название на английском или настройте MESSENGER_GEOIP_REGION_MAPPING.
-    region = Region.objects.filter(name__iexact=region_name).first()
-    if region:
-        return region
-    # Опциональный маппинг из настроек: {"Sverdlovskaya Oblast": "Свердловская область", ...}
-    mapping = getattr(settings, "MESSENGER_GEOIP_REGION_MAPPING", None)
-    if isinstance(mapping, dict) and region_name in mapping:
-        region = Region.objects.filter(name__iexact=mapping[region_name]).first()
-        if region:
-            return region
-    return None
+    return Region.objects.filter(pk=region_id).first()
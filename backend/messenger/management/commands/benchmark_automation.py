@@ -0,0 +1,129 @@
+"""
+Бенчмарк движка AutomationRule: стоимость проверки правил на событие.
+
+Создаёт временный inbox с диалогом и --rules правил message_created (половина —
+для inbox, половина — общие; по 3 условия, ни одно правило не срабатывает) и
+прогоняет --events вызовов dispatch_event(). Считает микросекунды и запросы
+к БД на событие, отдельно — первое событие после изменения правил
+(компиляция списков):
+  python manage.py benchmark_automation --events 5000 --rules 200
+
+Временные данные удаляются после прогона.
+"""
+
+from __future__ import annotations
+
+import json
+import time
+import uuid
+from functools import partial
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+
+from accounts.models import Branch
+from messenger.automation import dispatch_event, rules_changed
+from messenger.models import AutomationRule, Contact, Conversation, Inbox, Message
+
+
+def _count_query(counter, execute, sql, params, many, context):
+    counter[0] += 1
+    return execute(sql, params, many, context)
+
+
+def _conditions(i: int) -> list[dict]:
+    return [
+        {"attribute_key": "message_type", "filter_operator": "equal_to", "values": ["in"]},
+        {"attribute_key": "status", "filter_operator": "not_equal_to", "values": ["closed"]},
+        {
+            "attribute_key": "content",
+            "filter_operator": "contains",
+            "values": [f"ключевое-слово-{i}", f"keyword-{i}"],
+        },
+    ]
+
+
+class Command(BaseCommand):
+    help = "Бенчмарк dispatch_event(): микросекунды и запросы к БД на событие."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--events", type=int, default=5000, help="Событий message_created.")
+        parser.add_argument("--rules", type=int, default=200, help="Активных правил.")
+        parser.add_argument("--json", action="store_true", help="Вывести отчёт в JSON.")
+
+    def handle(self, *args, **options):
+        events = int(options["events"])
+        rules_count = int(options["rules"])
+        if events <= 0 or rules_count <= 0:
+            raise CommandError("--events и --rules должны быть > 0.")
+
+        tag = uuid.uuid4().hex[:10]
+        branch = Branch.objects.create(name=f"benchmark {tag}", code=f"bench-{tag}")
+        inbox = Inbox.objects.create(
+            name=f"benchmark {tag}", widget_token=f"bench-{tag}", branch=branch
+        )
+        contact = Contact.objects.create(name=f"benchmark {tag}")
+        rules = AutomationRule.objects.bulk_create(
+            AutomationRule(
+                name=f"benchmark {tag} #{i}",
+                event_name=AutomationRule.EventName.MESSAGE_CREATED,
+                inbox=inbox if i % 2 == 0 else None,
+                conditions=_conditions(i),
+                actions=[{"action_name": "resolve", "action_params": []}],
+            )
+            for i in range(rules_count)
+        )
+        rules_changed()
+        try:
+            conversation = Conversation.objects.create(inbox=inbox, contact=contact)
+            message = Message(
+                conversation=conversation,
+                direction=Message.Direction.IN,
+                body="Здравствуйте, подскажите по доставке",
+            )
+
+            queries = [0]
+            with connection.execute_wrapper(partial(_count_query, queries)):
+                started = time.perf_counter()
+                dispatch_event("message_created", conversation=conversation, message=message)
+                cold_seconds = time.perf_counter() - started
+                cold_queries = queries[0]
+
+                queries[0] = 0
+                started = time.perf_counter()
+                fired = 0
+                for _ in range(events):
+                    fired += dispatch_event(
+                        "message_created", conversation=conversation, message=message
+                    )
+                warm_seconds = time.perf_counter() - started
+                warm_queries = queries[0]
+        finally:
+            AutomationRule.objects.filter(pk__in=[r.pk for r in rules]).delete()
+            inbox.delete()
+            contact.delete()
+            branch.delete()
+
+        report = {
+            "events": events,
+            "rules": rules_count,
+            "rules_fired": fired,
+            "first_event_ms": round(cold_seconds * 1000, 2),
+            "first_event_queries": cold_queries,
+            "us_per_event": round(warm_seconds / events * 1e6, 2),
+            "us_per_rule_check": round(warm_seconds / events / rules_count * 1e6, 3),
+            "queries_per_event": round(warm_queries / events, 3),
+        }
+        if options["json"]:
+            self.stdout.write(json.dumps(report, ensure_ascii=False, indent=2))
+            return
+        self.stdout.write(
+            f"Правил: {rules_count}, событий: {events} — "
+            f"{report['us_per_event']} мкс/событие "
+            f"({report['us_per_rule_check']} мкс на правило), "
+            f"{report['queries_per_event']} запросов/событие"
+        )
+        self.stdout.write(
+            f"  первое событие после изменения правил: {report['first_event_ms']} мс, "
+            f"{cold_queries} запросов (компиляция)"
+        )
@@ -0,0 +1,118 @@
+"""
+Бенчмарк локального GeoIP (messenger.geoip): микросекунды на поиск.
+
+Собирает синтетический индекс из --ranges диапазонов IPv4 (и четверти от
+этого IPv6) во временный файл и меряет:
+  - bisect: RangeIndex.lookup() по mmap без LRU;
+  - cold:   get_region_id_from_ip() по каждый раз новым адресам (промах LRU);
+  - warm:   get_region_id_from_ip() по --hot повторяющимся адресам (попадание LRU).
+
+  python manage.py benchmark_geoip --ranges 300000 --lookups 200000
+"""
+
+from __future__ import annotations
+
+import ipaddress
+import json
+import os
+import random
+import tempfile
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.test import override_settings
+
+from messenger import geoip
+
+
+def _synthetic_ranges(count: int, rnd: random.Random) -> list[tuple[int, int, int, int]]:
+    ranges = []
+    for version, total, space in ((4, count, 1 << 32), (6, max(1, count // 4), 1 << 128)):
+        step = space // total
+        for i in range(total):
+            first = i * step + rnd.randrange(step // 4 or 1)
+            last = first + rnd.randrange(1, step // 2 or 2)
+            ranges.append((version, first, last, rnd.randrange(1, 90)))
+    return ranges
+
+
+def _random_ips(count: int, rnd: random.Random) -> list[str]:
+    ips = []
+    while len(ips) < count:
+        if rnd.random() < 0.8:
+            address = ipaddress.IPv4Address(rnd.getrandbits(32))
+        else:
+            address = ipaddress.IPv6Address((0x2A << 120) | rnd.getrandbits(120))
+        if address.is_global:
+            ips.append(str(address))
+    return ips
+
+
+def _per_lookup_us(func, items) -> float:
+    started = time.perf_counter()
+    for item in items:
+        func(item)
+    return (time.perf_counter() - started) / len(items) * 1e6
+
+
+class Command(BaseCommand):
+    help = "Бенчмарк локального GeoIP: микросекунды на поиск (bisect, промах и попадание LRU)."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--ranges", type=int, default=300_000, help="Диапазонов IPv4.")
+        parser.add_argument("--lookups", type=int, default=100_000, help="Поисков на замер.")
+        parser.add_argument("--hot", type=int, default=1000, help="Адресов в тёплом замере.")
+        parser.add_argument("--seed", type=int, default=1)
+        parser.add_argument("--json", action="store_true", help="Вывести отчёт в JSON.")
+
+    def handle(self, *args, **options):
+        ranges_count, lookups = int(options["ranges"]), int(options["lookups"])
+        hot = min(int(options["hot"]), geoip.LRU_SIZE)
+        if ranges_count <= 0 or lookups <= 0 or hot <= 0:
+            raise CommandError("--ranges, --lookups и --hot должны быть > 0.")
+        rnd = random.Random(options["seed"])
+
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "regions.bin")
+            started = time.perf_counter()
+            data = geoip.compile_ranges(_synthetic_ranges(ranges_count, rnd))
+            build_seconds = time.perf_counter() - started
+            geoip.write_index(path, data)
+
+            with override_settings(
+                MESSENGER_GEOIP_DB_PATH=path,
+                MESSENGER_GEOIP_ENABLED=True,
+                MESSENGER_GEOIP_HTTP_FALLBACK=False,
+            ):
+                geoip.reset()
+                index = geoip.get_index()
+                cold_ips = _random_ips(lookups, rnd)
+                addresses = [ipaddress.ip_address(ip) for ip in cold_ips]
+                hot_ips = cold_ips[:hot] * max(1, lookups // hot)
+
+                report = {
+                    "entries": len(index),
+                    "index_bytes": len(data),
+                    "build_seconds": round(build_seconds, 2),
+                    "lookups": lookups,
+                    "bisect_us": round(_per_lookup_us(index.lookup, addresses), 2),
+                    "cold_us": round(_per_lookup_us(geoip.get_region_id_from_ip, cold_ips), 2),
+                }
+                geoip.reset()
+                geoip.get_index()
+                for ip in hot_ips[:hot]:
+                    geoip.get_region_id_from_ip(ip)
+                report["warm_us"] = round(_per_lookup_us(geoip.get_region_id_from_ip, hot_ips), 2)
+                del index
+            geoip.reset()
+
+        if options["json"]:
+            self.stdout.write(json.dumps(report, ensure_ascii=False, indent=2))
+            return
+        self.stdout.write(
+            f"Индекс: {report['entries']} границ, {report['index_bytes']} байт, "
+            f"сборка {report['build_seconds']} с"
+        )
+        self.stdout.write(f"  bisect (без LRU): {report['bisect_us']} мкс/поиск")
+        self.stdout.write(f"  промах LRU:       {report['cold_us']} мкс/поиск")
+        self.stdout.write(f"  попадание LRU:    {report['warm_us']} мкс/поиск")
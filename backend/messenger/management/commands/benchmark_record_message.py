@@ -0,0 +1,113 @@
+"""
+Бенчмарк пути записи сообщения: record_message() в сообщениях в секунду.
+
+Создаёт временный inbox с диалогами и прогоняет чередование входящих
+сообщений клиента и ответов оператора (как в живом диалоге), в autocommit —
+вместе с on_commit-слушателями, webhooks и событиями аналитики.
+Считает msg/s и запросов к БД на сообщение по направлениям:
+  python manage.py benchmark_record_message --messages 2000 --conversations 50
+
+Временные данные удаляются после прогона.
+"""
+
+from __future__ import annotations
+
+import json
+import time
+import uuid
+from functools import partial
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+
+from accounts.models import Branch
+from messenger.models import Contact, Conversation, Inbox, Message
+from messenger.services import record_message
+
+
+def _count_query(counter, execute, sql, params, many, context):
+    counter[0] += 1
+    return execute(sql, params, many, context)
+
+
+class Command(BaseCommand):
+    help = "Бенчмарк record_message(): сообщений в секунду и запросов на сообщение."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--messages", type=int, default=2000, help="Всего сообщений.")
+        parser.add_argument(
+            "--conversations", type=int, default=50, help="Диалогов, по которым идёт поток."
+        )
+        parser.add_argument("--json", action="store_true", help="Вывести отчёт в JSON.")
+
+    def handle(self, *args, **options):
+        total = int(options["messages"])
+        conv_count = int(options["conversations"])
+        if total <= 0 or conv_count <= 0:
+            raise CommandError("--messages и --conversations должны быть > 0.")
+
+        tag = uuid.uuid4().hex[:10]
+        branch = Branch.objects.create(name=f"benchmark {tag}", code=f"bench-{tag}")
+        inbox = Inbox.objects.create(
+            name=f"benchmark {tag}", widget_token=f"bench-{tag}", branch=branch
+        )
+        operator = get_user_model().objects.create_user(f"bench_{tag}", password=None)
+        contact = Contact.objects.create(name=f"benchmark {tag}")
+        try:
+            conversations = [
+                Conversation.objects.create(inbox=inbox, contact=contact) for _ in range(conv_count)
+            ]
+            stats = {
+                direction: {"messages": 0, "seconds": 0.0, "queries": 0}
+                for direction in (Message.Direction.IN, Message.Direction.OUT)
+            }
+            for i in range(total):
+                conversation = conversations[i % conv_count]
+                # Диалог: вопрос клиента → ответ оператора → вопрос → ...
+                incoming = (i // conv_count) % 2 == 0
+                direction = Message.Direction.IN if incoming else Message.Direction.OUT
+                queries = [0]
+                with connection.execute_wrapper(partial(_count_query, queries)):
+                    started = time.perf_counter()
+                    record_message(
+                        conversation=conversation,
+                        direction=direction,
+                        body=f"Сообщение {i}",
+                        sender_user=None if incoming else operator,
+                        sender_contact=contact if incoming else None,
+                    )
+                    elapsed = time.perf_counter() - started
+                row = stats[direction]
+                row["messages"] += 1
+                row["seconds"] += elapsed
+                row["queries"] += queries[0]
+        finally:
+            inbox.delete()
+            contact.delete()
+            operator.delete()
+            branch.delete()
+
+        report = {"messages": total, "conversations": conv_count, "directions": {}}
+        seconds = sum(row["seconds"] for row in stats.values())
+        report["msg_per_sec"] = round(total / seconds, 1) if seconds else None
+        for direction, row in stats.items():
+            if not row["messages"]:
+                continue
+            report["directions"][direction] = {
+                "messages": row["messages"],
+                "msg_per_sec": round(row["messages"] / row["seconds"], 1),
+                "queries_per_msg": round(row["queries"] / row["messages"], 2),
+            }
+
+        if options["json"]:
+            self.stdout.write(json.dumps(report, ensure_ascii=False, indent=2))
+            return
+        self.stdout.write(
+            f"Сообщений: {total} в {conv_count} диалогах — {report['msg_per_sec']} msg/s"
+        )
+        for direction, row in report["directions"].items():
+            self.stdout.write(
+                f"  {direction:<4} {row['msg_per_sec']:>8} msg/s  "
+                f"{row['queries_per_msg']} запросов/сообщение"
+            )
@@ -0,0 +1,127 @@
+"""
+Собрать локальный индекс GeoIP (messenger.geoip) из CSV диапазонов.
+
+Колонки (первая строка — заголовок):
+  - диапазон: network (CIDR) или start_ip/end_ip (ip_from/ip_to — адреса
+    или целые числа);
+  - регион: region_id (companies.Region.id) или название в region /
+    region_name / subdivision_1_name / stateprov — сопоставляется со
+    справочником Region как в messenger.geoip.region_id_by_name.
+
+  python manage.py import_geoip_ranges ranges.csv
+  python manage.py import_geoip_ranges ranges.csv --output /srv/geoip/regions.bin
+
+Файл заменяется атомарно; воркеры перечитывают его сами.
+"""
+
+from __future__ import annotations
+
+import csv
+import ipaddress
+from collections import Counter
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from companies.models import Region
+from messenger import geoip
+
+START_COLUMNS = ("start_ip", "ip_from", "first_ip")
+END_COLUMNS = ("end_ip", "ip_to", "last_ip")
+REGION_NAME_COLUMNS = ("region", "region_name", "subdivision_1_name", "stateprov")
+
+
+def _address(value: str):
+    value = (value or "").strip()
+    return ipaddress.ip_address(int(value) if value.isdigit() else value)
+
+
+def _pick(row: dict, columns: tuple[str, ...]) -> str:
+    for column in columns:
+        if row.get(column):
+            return row[column]
+    return ""
+
+
+class Command(BaseCommand):
+    help = "Собрать локальный индекс GeoIP (диапазоны IP → Region) из CSV."
+
+    def add_arguments(self, parser):
+        parser.add_argument("path", help="CSV с диапазонами.")
+        parser.add_argument(
+            "--output",
+            default="",
+            help="Файл индекса (по умолчанию MESSENGER_GEOIP_DB_PATH).",
+        )
+        parser.add_argument(
+            "--dry-run", action="store_true", help="Только разобрать CSV и вывести статистику."
+        )
+
+    def handle(self, *args, **options):
+        output = options["output"] or getattr(settings, "MESSENGER_GEOIP_DB_PATH", "")
+        if not output and not options["dry_run"]:
+            raise CommandError("Не задан файл индекса (--output или MESSENGER_GEOIP_DB_PATH).")
+
+        known_ids = set(Region.objects.values_list("id", flat=True))
+        region_ids: dict[str, int | None] = {}
+        unresolved: Counter[str] = Counter()
+        ranges = []
+        skipped = 0
+
+        try:
+            f = open(options["path"], encoding="utf-8-sig", newline="")
+        except OSError as exc:
+            raise CommandError(f"Не удалось открыть {options['path']}: {exc}") from exc
+        with f:
+            reader = csv.DictReader(f)
+            columns = set(reader.fieldnames or ())
+            has_network = "network" in columns
+            if not has_network and not (
+                columns.intersection(START_COLUMNS) and columns.intersection(END_COLUMNS)
+            ):
+                raise CommandError("Нет колонок диапазона: network или start_ip/end_ip.")
+
+            for row in reader:
+                try:
+                    if has_network:
+                        network = ipaddress.ip_network(row["network"].strip(), strict=False)
+                        first, last = network.network_address, network.broadcast_address
+                    else:
+                        first = _address(_pick(row, START_COLUMNS))
+                        last = _address(_pick(row, END_COLUMNS))
+                except ValueError:
+                    skipped += 1
+                    continue
+                if first.version != last.version or first > last:
+                    skipped += 1
+                    continue
+
+                raw_id = (row.get("region_id") or "").strip()
+                if raw_id:
+                    region_id = int(raw_id) if raw_id.isdigit() else None
+                    if region_id not in known_ids:
+                        unresolved[f"id={raw_id}"] += 1
+                        region_id = None
+                else:
+                    name = _pick(row, REGION_NAME_COLUMNS).strip()
+                    if name not in region_ids:
+                        region_ids[name] = geoip.region_id_by_name(name)
+                    region_id = region_ids[name]
+                    if region_id is None:
+                        unresolved[name or "—"] += 1
+                ranges.append((first.version, int(first), int(last), region_id or 0))
+
+        data = geoip.compile_ranges(ranges)
+        self.stdout.write(
+            f"Диапазонов: {len(ranges)}, пропущено строк: {skipped}, "
+            f"без региона: {sum(unresolved.values())}"
+        )
+        for name, count in unresolved.most_common(10):
+            self.stdout.write(f"  не сопоставлен регион «{name}»: {count}")
+
+        if options["dry_run"]:
+            self.stdout.write(f"Индекс: {len(data)} байт (не записан, --dry-run)")
+            return
+        geoip.write_index(output, data)
+        geoip.reset()
+        self.stdout.write(self.style.SUCCESS(f"Индекс записан: {output} ({len(data)} байт)"))
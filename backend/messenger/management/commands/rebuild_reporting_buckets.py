@@ -0,0 +1,57 @@
+"""
+Пересборка часовых агрегатов аналитики (ReportingBucket) из истории ReportingEvent.
+
+Запуск после деплоя (однократно) или для восстановления после сбоя:
+  python manage.py rebuild_reporting_buckets            # вся история
+  python manage.py rebuild_reporting_buckets --days 30  # последние 30 дней
+
+Идемпотентна: бакеты диапазона удаляются и строятся заново посуточно.
+"""
+
+from __future__ import annotations
+
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from messenger.models import ReportingEvent
+from messenger.reporting import rebuild_buckets
+
+
+class Command(BaseCommand):
+    help = "Пересобрать ReportingBucket (часовые агрегаты аналитики) из ReportingEvent."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--days",
+            type=int,
+            default=None,
+            help="Сколько последних дней пересобрать (по умолчанию — всю историю).",
+        )
+
+    def handle(self, *args, **options):
+        end = timezone.now().replace(minute=0, second=0, microsecond=0) + timedelta(hours=1)
+        days = options.get("days")
+        if days:
+            start = end - timedelta(days=int(days))
+        else:
+            first = (
+                ReportingEvent.objects.order_by("created_at")
+                .values_list("created_at", flat=True)
+                .first()
+            )
+            if first is None:
+                self.stdout.write("Событий нет.")
+                return
+            start = first.replace(minute=0, second=0, microsecond=0)
+
+        buckets = 0
+        cursor = start
+        while cursor < end:
+            chunk_end = min(cursor + timedelta(days=1), end)
+            buckets += rebuild_buckets(cursor, chunk_end)
+            cursor = chunk_end
+        self.stdout.write(
+            self.style.SUCCESS(f"Бакетов записано: {buckets} ({start:%Y-%m-%d %H:%M} — now)")
+        )
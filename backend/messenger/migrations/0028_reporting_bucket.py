@@ -0,0 +1,165 @@
+# Часовые агрегаты ReportingEvent (count, сумма, DDSketch) для отчётов мессенджера.
+# ReportingViewSet.overview читает только бакеты — существующая история событий
+# раскладывается по ним здесь же, пачками по BACKFILL_CHUNK.
+#
+# Бэкфилл использует только исторические модели: формат скетча (ключи a/n/z/
+# min/max/b) повторяет messenger.sketch.DDSketch.to_dict() на момент миграции.
+# Старый код бакеты не пишет, а события, созданные им во время миграции, в бэкфилл
+# могут не попасть — после деплоя их дособирает
+# `manage.py rebuild_reporting_buckets --days 1`.
+
+import math
+from datetime import timedelta
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Max, Min
+
+BACKFILL_CHUNK = timedelta(days=31)
+
+SKETCH_ALPHA = 0.01
+SKETCH_MAX_BINS = 2048
+SKETCH_MIN_VALUE = 1e-3
+SKETCH_LOG_GAMMA = math.log((1 + SKETCH_ALPHA) / (1 - SKETCH_ALPHA))
+
+
+def _new_stats():
+    return {"count": 0, "total": 0.0, "z": 0, "min": None, "max": None, "b": {}}
+
+
+def _add_value(stats, value):
+    stats["count"] += 1
+    stats["total"] += value
+    value = max(float(value), 0.0)
+    if value < SKETCH_MIN_VALUE:
+        stats["z"] += 1
+    else:
+        index = math.ceil(math.log(value) / SKETCH_LOG_GAMMA)
+        stats["b"][index] = stats["b"].get(index, 0) + 1
+        if len(stats["b"]) > SKETCH_MAX_BINS:
+            indices = sorted(stats["b"])
+            target = indices[len(indices) - SKETCH_MAX_BINS]
+            for small in indices[: len(indices) - SKETCH_MAX_BINS]:
+                stats["b"][target] += stats["b"].pop(small)
+    stats["min"] = value if stats["min"] is None else min(stats["min"], value)
+    stats["max"] = value if stats["max"] is None else max(stats["max"], value)
+
+
+def _sketch_dict(stats):
+    return {
+        "a": SKETCH_ALPHA,
+        "n": stats["count"],
+        "z": stats["z"],
+        "min": stats["min"],
+        "max": stats["max"],
+        "b": {str(index): count for index, count in stats["b"].items()},
+    }
+
+
+def backfill_buckets(apps, schema_editor):
+    ReportingEvent = apps.get_model("messenger", "ReportingEvent")
+    ReportingBucket = apps.get_model("messenger", "ReportingBucket")
+    bounds = ReportingEvent.objects.aggregate(first=Min("created_at"), last=Max("created_at"))
+    if bounds["first"] is None:
+        return
+    cursor = bounds["first"].replace(minute=0, second=0, microsecond=0)
+    end = bounds["last"].replace(minute=0, second=0, microsecond=0) + timedelta(hours=1)
+    while cursor < end:
+        chunk_end = min(cursor + BACKFILL_CHUNK, end)
+        stats = {}
+        rows = ReportingEvent.objects.filter(
+            created_at__gte=cursor, created_at__lt=chunk_end
+        ).values_list("created_at", "name", "inbox_id", "user_id", "value")
+        for created_at, name, inbox_id, user_id, value in rows.iterator(chunk_size=2000):
+            hour = created_at.replace(minute=0, second=0, microsecond=0)
+            _add_value(stats.setdefault((hour, name, inbox_id, user_id), _new_stats()), value)
+        ReportingBucket.objects.bulk_create(
+            [
+                ReportingBucket(
+                    hour=hour,
+                    name=name,
+                    inbox_id=inbox_id,
+                    user_id=user_id,
+                    count=item["count"],
+                    total=item["total"],
+                    sketch=_sketch_dict(item),
+                )
+                for (hour, name, inbox_id, user_id), item in stats.items()
+            ],
+            batch_size=500,
+        )
+        cursor = chunk_end
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("messenger", "0027_remove_conversation_conversation_valid_status_and_more"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="ReportingBucket",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True, primary_key=True, serialize=False, verbose_name="ID"
+                    ),
+                ),
+                ("hour", models.DateTimeField(verbose_name="Час (начало)")),
+                (
+                    "name",
+                    models.CharField(
+                        choices=[
+                            ("first_response", "Первый ответ"),
+                            ("reply_time", "Время ответа"),
+                            ("conversation_resolved", "Решён"),
+                            ("conversation_opened", "Открыт"),
+                        ],
+                        max_length=32,
+                        verbose_name="Тип",
+                    ),
+                ),
+                ("count", models.IntegerField(default=0, verbose_name="Событий")),
+                ("total", models.FloatField(default=0, verbose_name="Сумма значений (секунды)")),
+                (
+                    "sketch",
+                    models.JSONField(blank=True, default=dict, verbose_name="DDSketch значений"),
+                ),
+                (
+                    "inbox",
+                    models.ForeignKey(
+                        blank=True,
+                        null=True,
+                        on_delete=django.db.models.deletion.SET_NULL,
+                        related_name="+",
+                        to="messenger.inbox",
+                    ),
+                ),
+                (
+                    "user",
+                    models.ForeignKey(
+                        blank=True,
+                        null=True,
+                        on_delete=django.db.models.deletion.SET_NULL,
+                        related_name="+",
+                        to=settings.AUTH_USER_MODEL,
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "Агрегат аналитики (час)",
+                "verbose_name_plural": "Агрегаты аналитики (по часам)",
+                "indexes": [
+                    models.Index(fields=["name", "hour"], name="msg_repbucket_name_hour_idx"),
+                    models.Index(
+                        fields=["hour", "name", "inbox", "user"], name="msg_repbucket_key_idx"
+                    ),
+                ],
+            },
+        ),
+        migrations.RunPython(backfill_buckets, migrations.RunPython.noop),
+    ]
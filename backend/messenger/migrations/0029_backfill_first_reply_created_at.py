@@ -0,0 +1,31 @@
+# first_reply_created_at — флаг первого ответа: Message.save() больше не сканирует
+# исходящие сообщения диалога, поэтому заполняем поле для старых диалогов.
+
+from django.db import migrations, models
+
+
+def backfill_first_reply(apps, schema_editor):
+    """Проставить first_reply_created_at по первому исходящему сообщению оператора."""
+    Conversation = apps.get_model("messenger", "Conversation")
+    Message = apps.get_model("messenger", "Message")
+    replies = Message.objects.filter(direction="out", sender_user__isnull=False)
+    first_out = (
+        replies.filter(conversation=models.OuterRef("pk"))
+        .order_by("created_at")
+        .values("created_at")[:1]
+    )
+    Conversation.objects.filter(
+        first_reply_created_at__isnull=True,
+        pk__in=replies.values("conversation_id"),
+    ).update(first_reply_created_at=models.Subquery(first_out))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("messenger", "0028_reporting_bucket"),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill_first_reply, reverse_code=migrations.RunPython.noop),
+    ]
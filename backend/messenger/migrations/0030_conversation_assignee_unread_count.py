@@ -0,0 +1,43 @@
+# Счётчик непрочитанных входящих на диалоге (messenger/unread.py) + заполнение по истории.
+
+from django.db import migrations, models
+
+
+def backfill_unread(apps, schema_editor):
+    """Посчитать непрочитанные IN-сообщения для диалогов, где они есть."""
+    Conversation = apps.get_model("messenger", "Conversation")
+    Message = apps.get_model("messenger", "Message")
+    unread = Message.objects.filter(direction="in").filter(
+        models.Q(conversation__assignee_last_read_at__isnull=True)
+        | models.Q(created_at__gt=models.F("conversation__assignee_last_read_at"))
+    )
+    counts = (
+        unread.filter(conversation=models.OuterRef("pk"))
+        .order_by()
+        .values("conversation")
+        .annotate(n=models.Count("id"))
+        .values("n")
+    )
+    Conversation.objects.filter(pk__in=unread.values("conversation_id")).update(
+        assignee_unread_count=models.Subquery(counts)
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("messenger", "0029_backfill_first_reply_created_at"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="conversation",
+            name="assignee_unread_count",
+            field=models.PositiveIntegerField(
+                default=0,
+                help_text="Входящие сообщения новее assignee_last_read_at.",
+                verbose_name="Непрочитанных входящих",
+            ),
+        ),
+        migrations.RunPython(backfill_unread, reverse_code=migrations.RunPython.noop),
+    ]
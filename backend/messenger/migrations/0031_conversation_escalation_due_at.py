@@ -0,0 +1,74 @@
+# escalation_due_at — срок следующей эскалации (messenger/escalation.py): тик выбирает
+# по частичному индексу только открытые диалоги с наступившим сроком. Для уже
+# ждущих диалогов срок заполняется по текущим порогам PolicyConfig.
+
+from django.db import migrations, models
+
+LEVEL_KEYS = ("warn_min", "urgent_min", "rop_alert_min", "pool_return_min")
+DEFAULT_THRESHOLDS = {"warn_min": 3, "urgent_min": 10, "rop_alert_min": 20, "pool_return_min": 40}
+
+
+def backfill_escalation_due_at(apps, schema_editor):
+    """Срок = last_customer_msg_at + порог уровня escalation_level + 1 для ждущих диалогов."""
+    from datetime import timedelta
+
+    Conversation = apps.get_model("messenger", "Conversation")
+    PolicyConfig = apps.get_model("policy", "PolicyConfig")
+
+    limits = dict(DEFAULT_THRESHOLDS)
+    data = PolicyConfig.objects.filter(id=1).values_list("livechat_escalation", flat=True).first()
+    if isinstance(data, dict):
+        limits.update(data)
+
+    waiting = models.Q(last_customer_msg_at__isnull=False) & (
+        models.Q(last_agent_msg_at__isnull=True)
+        | models.Q(last_agent_msg_at__lt=models.F("last_customer_msg_at"))
+    )
+    whens = [
+        models.When(
+            waiting & models.Q(escalation_level=level),
+            then=models.ExpressionWrapper(
+                models.F("last_customer_msg_at")
+                + models.Value(timedelta(minutes=float(limits[key]))),
+                output_field=models.DateTimeField(),
+            ),
+        )
+        for level, key in enumerate(LEVEL_KEYS)
+    ]
+    Conversation.objects.filter(status__in=["open", "pending"]).update(
+        escalation_due_at=models.Case(
+            *whens, default=models.Value(None), output_field=models.DateTimeField()
+        )
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("messenger", "0030_conversation_assignee_unread_count"),
+        ("policy", "0003_policyconfig_livechat_escalation"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="conversation",
+            name="escalation_due_at",
+            field=models.DateTimeField(
+                blank=True,
+                help_text="last_customer_msg_at + порог следующего уровня; NULL — эскалация не ждёт",
+                null=True,
+                verbose_name="Срок следующей эскалации",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="conversation",
+            index=models.Index(
+                condition=models.Q(
+                    ("escalation_due_at__isnull", False), ("status__in", ["open", "pending"])
+                ),
+                fields=["escalation_due_at"],
+                name="msg_conv_escalation_due_idx",
+            ),
+        ),
+        migrations.RunPython(backfill_escalation_due_at, reverse_code=migrations.RunPython.noop),
+    ]
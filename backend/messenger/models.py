@@ -55,8 +55,18 @@ class Inbox(models.Model):
             self.widget_token = secrets.token_urlsafe(32)
         # Гарантируем инвариант через clean() и логику выше.
         self.full_clean()
+        old_token = None
+        if self.pk:
+            old_token = (
+                type(self).objects.filter(pk=self.pk).values_list("widget_token", flat=True).first()
+            )
         super().save(*args, **kwargs)
 
+        from . import widget_cursor
+
+        # Кэш конфигурации виджета: и по новому токену, и по перевыпущенному старому
+        widget_cursor.invalidate_inbox(self.widget_token, old_token)
+
 
 class Channel(models.Model):
     class Type(models.TextChoices):
@@ -266,6 +276,13 @@ class Conversation(models.Model):
         db_index=True,
         help_text="Для подсчёта непрочитанных входящих сообщений.",
     )
+    # Ведётся инкрементально (messenger/unread.py): +1 на входящее в Message.save(),
+    # 0 при прочтении оператором; итог по оператору — в Redis.
+    assignee_unread_count = models.PositiveIntegerField(
+        "Непрочитанных входящих",
+        default=0,
+        help_text="Входящие сообщения новее assignee_last_read_at.",
+    )
     # Флаг эскалации: менеджер нажимает «Нужна помощь», диалог подсвечивается
     # РОПу/директору подразделения. Поведение будет реализовано в Plan 3.
     needs_help = models.BooleanField(
@@ -296,6 +313,12 @@ class Conversation(models.Model):
         null=True,
         blank=True,
     )
+    escalation_due_at = models.DateTimeField(
+        "Срок следующей эскалации",
+        null=True,
+        blank=True,
+        help_text="last_customer_msg_at + порог следующего уровня; NULL — эскалация не ждёт",
+    )
     # ВАЖНО: branch определяется строго из inbox.branch и не редактируется вручную.
     branch = models.ForeignKey(
         "accounts.Branch",
@@ -492,6 +515,12 @@ class Conversation(models.Model):
                 fields=["branch", "status", "assignee"], name="msg_conv_branch_st_assign_idx"
             ),
             models.Index(fields=["contact", "inbox", "status"], name="msg_conv_cont_inbox_st_idx"),
+            # Тик эскалации: только открытые диалоги с наступившим сроком
+            models.Index(
+                fields=["escalation_due_at"],
+                name="msg_conv_escalation_due_idx",
+                condition=models.Q(status__in=["open", "pending"], escalation_due_at__isnull=False),
+            ),
             # Индекс для сортировки по waiting_since (уже есть в базовых, но добавляем для явности)
         ]
         constraints = [
@@ -610,11 +639,16 @@ class Conversation(models.Model):
             try:
                 old = (
                     type(self)
-                    .objects.only("status", "assignee_id", "inbox_id", "branch_id")
+                    .objects.only(
+                        "status", "assignee_id", "inbox_id", "branch_id", "assignee_unread_count"
+                    )
                     .get(pk=self.pk)
                 )
                 old_status = old.status
                 old_assignee_id = old.assignee_id
+                # Счётчик ведётся UPDATE'ами: полный save() устаревшего экземпляра
+                # не должен его откатывать.
+                self.assignee_unread_count = old.assignee_unread_count
             except type(self).DoesNotExist:
                 old = None
         else:
@@ -642,6 +676,17 @@ class Conversation(models.Model):
 
         super().save(*args, **kwargs)
 
+        from . import widget_cursor
+
+        # Статус/оценка видны в ответе опроса виджета
+        widget_cursor.bump(self.pk)
+
+        if old is not None and old_assignee_id != self.assignee_id:
+            from . import unread
+
+            # Непрочитанные диалога переходят в итог нового оператора
+            unread.transfer(old.assignee_unread_count, old_assignee_id, self.assignee_id)
+
         # Отправка событий через Event Dispatcher (по образцу Chatwoot)
         from .dispatchers import Events, get_dispatcher
 
@@ -855,8 +900,8 @@ class Message(models.Model):
 
     def save(self, *args, **kwargs):
         """
-        Обновление processed_message_content и last_activity_at диалога (по образцу Chatwoot).
-        Отправка событий через Event Dispatcher.
+        Обновление processed_message_content и состояния диалога (по образцу Chatwoot).
+        События Event Dispatcher отправляются после коммита транзакции.
         """
         is_new = self.pk is None
 
@@ -864,70 +909,118 @@ class Message(models.Model):
         if not self.processed_message_content and self.body:
             self.processed_message_content = self.body[: self.MAX_CONTENT_LENGTH]
 
-        # Сохраняем created_at до super().save() для использования после сохранения
-        created_at_before = self.created_at
-
         super().save(*args, **kwargs)
 
         # Используем created_at после сохранения (может быть установлен auto_now_add)
         created_at_used = self.created_at or timezone.now()
 
-        # Обновить last_activity_at диалога с защитой от race condition (по образцу Chatwoot)
-        # Используем update с F() для атомарного обновления, чтобы избежать race condition
-        from django.db.models import F
+        # Редактирование сообщения не меняет состояние диалога: метки активности,
+        # waiting_since и первый ответ определяются только новыми сообщениями.
+        first_reply = is_new and self._apply_conversation_transition(created_at_used)
 
-        update_kwargs = {"last_activity_at": created_at_used}
-        if is_new:
-            if self.direction == self.Direction.IN:
-                update_kwargs["last_customer_msg_at"] = created_at_used
-            elif self.direction == self.Direction.OUT:
-                update_kwargs["last_agent_msg_at"] = created_at_used
-            # INTERNAL: служебная заметка не меняет метки клиента/оператора.
-        Conversation.objects.filter(pk=self.conversation_id).update(**update_kwargs)
+        from . import widget_cursor
 
-        # Обновить waiting_since логику (по образцу Chatwoot)
-        self._update_waiting_since(created_at_used)
+        # Опрос виджета по этому диалогу больше не может ответить «без изменений»
+        widget_cursor.bump(self.conversation_id)
 
-        # Обновить first_reply_created_at (по образцу Chatwoot)
-        self._update_first_reply(created_at_used)
+        # Слушатели (SSE-пробуждения и т.п.) — после коммита, вне транзакции записи:
+        # не держат блокировку строки диалога и не срабатывают при откате.
+        from django.db import transaction
 
-        # Отправка событий через Event Dispatcher (по образцу Chatwoot)
+        transaction.on_commit(lambda: self._dispatch_events(is_new, first_reply))
+
+    def _apply_conversation_transition(self, created_at_used) -> bool:
+        """
+        Переход состояния диалога одним UPDATE (по образцу Chatwoot).
+
+        - IN: last_customer_msg_at; waiting_since = COALESCE(waiting_since, created_at);
+        - IN: +1 к assignee_unread_count (итог оператора — после коммита, unread.py);
+        - OUT: last_agent_msg_at; человеческий ответ очищает waiting_since;
+        - escalation_due_at: IN — срок следующего уровня, OUT — NULL (escalation.py);
+        - первый человеческий ответ: first_reply_created_at ставится в том же UPDATE
+          с условием first_reply_created_at IS NULL — поле диалога служит флагом,
+          сканировать сообщения диалога не нужно.
+
+        Возвращает True, если это сообщение стало первым ответом оператора.
+        """
+        from django.db.models import F, Value
+        from django.db.models.functions import Coalesce
+
+        from . import escalation
+
+        values = {"last_activity_at": created_at_used}
+        is_human = self._is_human_response()
+        if self.direction == self.Direction.IN:
+            values["last_customer_msg_at"] = created_at_used
+            # Срок эскалации от нового сообщения клиента по текущему уровню диалога
+            values["escalation_due_at"] = escalation.deadline_expression(created_at_used)
+            values["waiting_since"] = Coalesce(
+                F("waiting_since"), Value(created_at_used, output_field=models.DateTimeField())
+            )
+            values["assignee_unread_count"] = F("assignee_unread_count") + 1
+        elif self.direction == self.Direction.OUT:
+            values["last_agent_msg_at"] = created_at_used
+            values["escalation_due_at"] = None
+            if is_human:
+                values["waiting_since"] = None
+        # INTERNAL: служебная заметка двигает только last_activity_at.
+
+        conversations = Conversation.objects.filter(pk=self.conversation_id)
+        field = self._meta.get_field("conversation")
+        cached = field.get_cached_value(self) if field.is_cached(self) else None
+
+        first_reply = False
+        # first_reply_created_at не сбрасывается: если он уже виден в загруженном
+        # диалоге, условный UPDATE заведомо не сработает — сразу обычный.
+        if is_human and (cached is None or cached.first_reply_created_at is None):
+            first_reply = bool(
+                conversations.filter(first_reply_created_at__isnull=True).update(
+                    first_reply_created_at=created_at_used, **values
+                )
+            )
+        if not first_reply:
+            conversations.update(**values)
+
+        if cached is not None:
+            # Держим загруженный экземпляр согласованным с БД для вызывающего кода
+            for name, value in values.items():
+                if name == "waiting_since" and value is not None:
+                    value = cached.waiting_since or created_at_used
+                elif name == "assignee_unread_count":
+                    value = cached.assignee_unread_count + 1
+                elif name == "escalation_due_at" and value is not None:
+                    value = escalation.due_after(created_at_used, cached.escalation_level)
+                setattr(cached, name, value)
+            if first_reply:
+                cached.first_reply_created_at = created_at_used
+
+        if self.direction == self.Direction.IN:
+            from . import unread
+
+            if cached is not None:
+                assignee_id = cached.assignee_id
+            else:
+                assignee_id = conversations.values_list("assignee_id", flat=True).first()
+            unread.adjust_total(assignee_id, 1)
+        return first_reply
+
+    def _dispatch_events(self, is_new: bool, first_reply: bool) -> None:
+        """Отправка событий через Event Dispatcher (по образцу Chatwoot)."""
         from .dispatchers import Events, get_dispatcher
 
         dispatcher = get_dispatcher()
         now = timezone.now()
 
         if is_new:
-            # Событие создания сообщения
             dispatcher.dispatch(Events.MESSAGE_CREATED, now, {"message": self})
-
-            # Проверка первого ответа (уже обработано в _update_first_reply)
+            if first_reply:
+                dispatcher.dispatch(Events.FIRST_REPLY_CREATED, now, {"message": self})
             if self._is_human_response():
-                conversation = self.conversation
-                if conversation.first_reply_created_at == created_at_used:
-                    dispatcher.dispatch(Events.FIRST_REPLY_CREATED, now, {"message": self})
-
-                if self.direction == self.Direction.OUT:
-                    dispatcher.dispatch(Events.REPLY_CREATED, now, {"message": self})
+                dispatcher.dispatch(Events.REPLY_CREATED, now, {"message": self})
         else:
             # Событие обновления сообщения
             dispatcher.dispatch(Events.MESSAGE_UPDATED, now, {"message": self})
 
-    def _update_waiting_since(self, created_at_used):
-        """Обновление waiting_since по образцу Chatwoot."""
-        conversation = self.conversation
-
-        if self.direction == self.Direction.IN:
-            # Входящее сообщение: устанавливаем waiting_since если пусто
-            if not conversation.waiting_since:
-                Conversation.objects.filter(pk=conversation.pk).update(
-                    waiting_since=created_at_used
-                )
-        elif self.direction == self.Direction.OUT:
-            # Исходящее сообщение: очищаем waiting_since если это человеческий ответ
-            if self._is_human_response() and conversation.waiting_since:
-                Conversation.objects.filter(pk=conversation.pk).update(waiting_since=None)
-
     def _is_human_response(self):
         """Проверка, что это человеческий ответ (по образцу Chatwoot)."""
         # Проверки:
@@ -946,33 +1039,6 @@ class Message(models.Model):
 
         return True
 
-    def _update_first_reply(self, created_at_used):
-        """Обновление first_reply_created_at по образцу Chatwoot."""
-        if not self._is_human_response():
-            return
-
-        conversation = self.conversation
-
-        # Проверяем, что это первый ответ
-        if conversation.first_reply_created_at:
-            return
-
-        # Проверяем, что нет других исходящих сообщений от пользователей
-        other_outgoing = (
-            Message.objects.filter(
-                conversation=conversation,
-                direction=self.Direction.OUT,
-                sender_user__isnull=False,
-            )
-            .exclude(pk=self.pk)
-            .exists()
-        )
-
-        if not other_outgoing:
-            Conversation.objects.filter(pk=conversation.pk).update(
-                first_reply_created_at=created_at_used, waiting_since=None  # Очищаем waiting_since
-            )
-
 
 class MessageAttachment(models.Model):
     """
@@ -1393,6 +1459,48 @@ class ReportingEvent(models.Model):
         return f"{self.name}: {self.value:.1f}s"
 
 
+class ReportingBucket(models.Model):
+    """
+    Часовой агрегат ReportingEvent по (inbox, user, name): число, сумма и
+    DDSketch значений (messenger/sketch.py) для перцентилей.
+
+    record_* (messenger/reporting.py) добавляют строку на событие без блокировок,
+    compact_reporting_buckets сливает строки одного ключа. Отчёт за любое окно —
+    слияние бакетов (строки одного ключа складываются, поэтому до сжатия ответ тот же).
+    """
+
+    hour = models.DateTimeField("Час (начало)")
+    name = models.CharField("Тип", max_length=32, choices=ReportingEvent.EventType.choices)
+    inbox = models.ForeignKey(
+        Inbox,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name="+",
+    )
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name="+",
+    )
+    count = models.IntegerField("Событий", default=0)
+    total = models.FloatField("Сумма значений (секунды)", default=0)
+    sketch = models.JSONField("DDSketch значений", default=dict, blank=True)
+
+    class Meta:
+        verbose_name = "Агрегат аналитики (час)"
+        verbose_name_plural = "Агрегаты аналитики (по часам)"
+        indexes = [
+            models.Index(fields=["name", "hour"], name="msg_repbucket_name_hour_idx"),
+            models.Index(fields=["hour", "name", "inbox", "user"], name="msg_repbucket_key_idx"),
+        ]
+
+    def __str__(self) -> str:
+        return f"{self.name} @ {self.hour:%Y-%m-%d %H}: {self.count}"
+
+
 class Macro(models.Model):
     """
     Макросы оператора (аналог Chatwoot macros).
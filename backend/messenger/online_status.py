@@ -3,6 +3,7 @@ Online Status Tracker для операторов (по образцу Chatwoot)
 
 Отслеживает онлайн статус операторов в Redis для быстрого доступа.
 Используется для фильтрации доступных операторов при автоназначении.
+Онлайн операторов филиала читается из индекса присутствия (messenger.presence).
 """
 
 from datetime import timedelta
@@ -11,7 +12,7 @@ from typing import Dict, Optional, Set
 from django.core.cache import cache
 from django.utils import timezone
 
-from accounts.models import User
+from messenger import presence
 from messenger.models import AgentProfile
 
 
@@ -39,23 +40,31 @@ class OnlineStatusTracker:
             Словарь {user_id: status}, где status = 'online', 'away', 'busy', 'offline'
 
         Note:
-            Использует кэширование в Redis для быстрого доступа.
-            Результат кэшируется на TTL секунд (по умолчанию 5 минут).
+            С филиалом и индексом присутствия — один ZRANGEBYSCORE + HMGET
+            (messenger.presence), только операторы с живым heartbeat. Иначе —
+            один запрос статусов AgentProfile и один get_many по кэшу статусов.
         """
-        # Получаем всех операторов с активными профилями
-        qs = User.objects.filter(is_active=True, agent_profile__isnull=False)
-
         if branch_id:
-            qs = qs.filter(branch_id=branch_id)
-
-        available_users = {}
+            statuses = presence.branch_statuses(branch_id)
+            if statuses is not None:
+                return statuses
 
-        for user in qs.select_related("agent_profile"):
-            status = cls.get_status(user.id)
-            if status:
-                available_users[user.id] = status
-
-        return available_users
+        qs = AgentProfile.objects.filter(user__is_active=True)
+        if branch_id:
+            qs = qs.filter(user__branch_id=branch_id)
+        profiles = dict(qs.values_list("user_id", "status"))
+
+        keys = {f"{cls.STATUS_KEY_PREFIX}:{user_id}": user_id for user_id in profiles}
+        cached = cache.get_many(list(keys))
+        missing = {}
+        for key, user_id in keys.items():
+            if key in cached:
+                profiles[user_id] = cached[key]
+            else:
+                missing[key] = profiles[user_id]
+        if missing:
+            cache.set_many(missing, timeout=cls.TTL)
+        return {user_id: status for user_id, status in profiles.items() if status}
 
     @classmethod
     def get_status(cls, user_id: int) -> str | None:
@@ -112,6 +121,7 @@ class OnlineStatusTracker:
         # Кэшируем в Redis
         redis_key = f"{cls.STATUS_KEY_PREFIX}:{user_id}"
         cache.set(redis_key, status, timeout=cls.TTL)
+        presence.set_status(user_id, status)
 
         # Отправляем событие через Event Dispatcher
         from .dispatchers import Events, get_dispatcher
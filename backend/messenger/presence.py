@@ -0,0 +1,142 @@
+"""
+Индекс присутствия операторов в Redis.
+
+- messenger:presence:branch:{branch_id} — ZSET: user_id → время последнего
+  heartbeat (unix-время). Кормят OperatorConsumer (connect/disconnect) и
+  heartbeat_view.
+- messenger:presence:status — HASH: user_id → статус AgentProfile
+  (online/away/busy/offline). Нет записи — оператор считается онлайн, как и
+  пользователь без AgentProfile в выборке из БД.
+
+«Онлайн-операторы филиала» — один ZRANGEBYSCORE по окну STALE_SECONDS и HMGET
+статусов: протухшие записи просто не попадают в окно (и вычищаются тем же
+конвейером), отдельный проход check_offline_operators для маршрутизации не
+нужен.
+
+Включается настройкой MESSENGER_PRESENCE_INDEX="redis". Без Redis (LocMem,
+"db") функции чтения возвращают None — вызывающий код идёт в БД по-старому.
+"""
+
+from __future__ import annotations
+
+import logging
+import time
+
+from django.conf import settings
+
+logger = logging.getLogger("messenger.presence")
+
+BRANCH_KEY = "messenger:presence:branch:{branch_id}"
+STATUS_KEY = "messenger:presence:status"
+# Как у check_offline_operators: 3 пропущенных heartbeat (30с × 3)
+STALE_SECONDS = 90
+# heartbeat_view при включённом индексе обновляет User.messenger_last_seen не чаще:
+# 45с + интервал heartbeat 30с < STALE_SECONDS, check_offline_operators не ошибётся
+DB_TOUCH_SECONDS = 45
+# Филиал без heartbeat дольше суток — ключ удаляется сам
+BRANCH_KEY_TTL = 24 * 3600
+
+# Не принимают новые диалоги (как exclude по agent_profile__status в services)
+UNAVAILABLE_STATUSES = frozenset({"away", "busy", "offline"})
+
+
+def enabled() -> bool:
+    return getattr(settings, "MESSENGER_PRESENCE_INDEX", "db") == "redis"
+
+
+def _redis():
+    from django_redis import get_redis_connection
+
+    return get_redis_connection("default")
+
+
+def _key(branch_id: int) -> str:
+    return BRANCH_KEY.format(branch_id=branch_id)
+
+
+def _decode(value) -> str | None:
+    if value is None:
+        return None
+    return value.decode() if isinstance(value, bytes) else str(value)
+
+
+# ---------------------------------------------------------------------------
+# Запись
+# ---------------------------------------------------------------------------
+
+
+def touch(user_id: int, branch_id: int | None, status: str | None = None) -> None:
+    """Heartbeat оператора: обновить отметку в индексе филиала (и статус, если задан)."""
+    if not enabled():
+        return
+    try:
+        pipe = _redis().pipeline(transaction=False)
+        if branch_id:
+            key = _key(branch_id)
+            pipe.zadd(key, {str(user_id): time.time()})
+            pipe.expire(key, BRANCH_KEY_TTL)
+        if status:
+            pipe.hset(STATUS_KEY, str(user_id), status)
+        pipe.execute()
+    except Exception:
+        logger.warning("Presence index unavailable (touch user=%s)", user_id, exc_info=True)
+
+
+def set_status(user_id: int, status: str) -> None:
+    """Сменить статус оператора (панель, OnlineStatusTracker)."""
+    touch(user_id, None, status)
+
+
+def leave(user_id: int, branch_id: int | None) -> None:
+    """Оператор отключился: убрать из индекса филиала, статус — offline."""
+    if not enabled():
+        return
+    try:
+        pipe = _redis().pipeline(transaction=False)
+        if branch_id:
+            pipe.zrem(_key(branch_id), str(user_id))
+        pipe.hset(STATUS_KEY, str(user_id), "offline")
+        pipe.execute()
+    except Exception:
+        logger.warning("Presence index unavailable (leave user=%s)", user_id, exc_info=True)
+
+
+# ---------------------------------------------------------------------------
+# Чтение
+# ---------------------------------------------------------------------------
+
+
+def branch_statuses(branch_id: int, now: float | None = None) -> dict[int, str] | None:
+    """
+    {user_id: status} операторов филиала с heartbeat в окне STALE_SECONDS.
+
+    None — индекс выключен или Redis недоступен (читать из БД).
+    """
+    if not enabled():
+        return None
+    threshold = (now if now is not None else time.time()) - STALE_SECONDS
+    key = _key(branch_id)
+    try:
+        client = _redis()
+        pipe = client.pipeline(transaction=False)
+        pipe.zremrangebyscore(key, "-inf", f"({threshold}")
+        pipe.zrangebyscore(key, threshold, "+inf")
+        _removed, members = pipe.execute()
+        if not members:
+            return {}
+        statuses = client.hmget(STATUS_KEY, members)
+    except Exception:
+        logger.warning("Presence index unavailable (branch=%s)", branch_id, exc_info=True)
+        return None
+    return {
+        int(_decode(member)): _decode(status) or "online"
+        for member, status in zip(members, statuses, strict=True)
+    }
+
+
+def online_user_ids(branch_id: int, now: float | None = None) -> set[int] | None:
+    """Операторы филиала, готовые принять диалог; None — читать из БД."""
+    statuses = branch_statuses(branch_id, now)
+    if statuses is None:
+        return None
+    return {user_id for user_id, status in statuses.items() if status not in UNAVAILABLE_STATUSES}
@@ -6,18 +6,85 @@ Call these from services/views when:
 - Any reply (reply time)
 - Conversation resolved
 - Conversation opened
+
+Every event is also appended to an hourly ReportingBucket (count, sum and a
+mergeable DDSketch), so reports over any window merge a few buckets instead of
+scanning raw events:
+- compact_buckets() merges rows of the same (hour, name, inbox, user) key;
+- rebuild_buckets() recomputes buckets from ReportingEvent history;
+- aggregate_buckets() answers a window, optionally grouped by inbox/user.
 """
 
 from __future__ import annotations
 
+import datetime
 import logging
+from dataclasses import dataclass, field
 
+from django.db import connection, transaction
+from django.db.models import Count
 from django.utils import timezone
 
-from .models import Conversation, Message, ReportingEvent
+from .models import Conversation, Message, ReportingBucket, ReportingEvent
+from .sketch import DDSketch
 
 logger = logging.getLogger("messenger.reporting")
 
+BUCKET_KEY_FIELDS = ("hour", "name", "inbox_id", "user_id")
+
+
+def _bucket_hour(moment: datetime.datetime) -> datetime.datetime:
+    return moment.replace(minute=0, second=0, microsecond=0)
+
+
+@dataclass
+class BucketStats:
+    """Merged buckets: count, sum and the quantile sketch of event values."""
+
+    count: int = 0
+    total: float = 0.0
+    sketch: DDSketch = field(default_factory=DDSketch)
+
+    def add(self, value: float) -> None:
+        self.count += 1
+        self.total += value
+        self.sketch.add(value)
+
+    def merge_row(self, count: int, total: float, sketch: dict) -> None:
+        self.count += count
+        self.total += total
+        self.sketch.merge(DDSketch.from_dict(sketch))
+
+    @property
+    def avg(self) -> float | None:
+        return self.total / self.count if self.count else None
+
+    def quantile(self, q: float) -> float | None:
+        return self.sketch.quantile(q)
+
+
+def _create_event(name: str, value: float, *, conversation, inbox, user) -> ReportingEvent:
+    """Create the raw event and append its value to the hourly bucket.
+
+    Both rows commit together, so rebuild_buckets never sees one without the other.
+    """
+    with transaction.atomic():
+        event = ReportingEvent.objects.create(
+            name=name, value=value, conversation=conversation, inbox=inbox, user=user
+        )
+        stats = BucketStats()
+        stats.add(event.value)
+        ReportingBucket.objects.create(
+            hour=_bucket_hour(event.created_at),
+            name=name,
+            inbox=inbox,
+            user=user,
+            count=1,
+            total=event.value,
+            sketch=stats.sketch.to_dict(),
+        )
+    return event
+
 
 def record_first_response(conversation: Conversation, message: Message) -> None:
     """
@@ -33,9 +100,9 @@ def record_first_response(conversation: Conversation, message: Message) -> None:
             return
 
         delta = (message.created_at - conversation.created_at).total_seconds()
-        ReportingEvent.objects.create(
-            name=ReportingEvent.EventType.FIRST_RESPONSE,
-            value=max(delta, 0),
+        _create_event(
+            ReportingEvent.EventType.FIRST_RESPONSE,
+            max(delta, 0),
             conversation=conversation,
             inbox=conversation.inbox,
             user=message.sender_user,
@@ -61,9 +128,9 @@ def record_reply_time(conversation: Conversation, message: Message) -> None:
             return
 
         delta = (message.created_at - last_incoming).total_seconds()
-        ReportingEvent.objects.create(
-            name=ReportingEvent.EventType.REPLY_TIME,
-            value=max(delta, 0),
+        _create_event(
+            ReportingEvent.EventType.REPLY_TIME,
+            max(delta, 0),
             conversation=conversation,
             inbox=conversation.inbox,
             user=message.sender_user,
@@ -78,9 +145,9 @@ def record_conversation_resolved(conversation: Conversation) -> None:
     """
     try:
         delta = (timezone.now() - conversation.created_at).total_seconds()
-        ReportingEvent.objects.create(
-            name=ReportingEvent.EventType.CONVERSATION_RESOLVED,
-            value=max(delta, 0),
+        _create_event(
+            ReportingEvent.EventType.CONVERSATION_RESOLVED,
+            max(delta, 0),
             conversation=conversation,
             inbox=conversation.inbox,
             user=conversation.assignee,
@@ -94,11 +161,115 @@ def record_conversation_opened(conversation: Conversation) -> None:
     Record conversation_opened event (for counting new conversations).
     """
     try:
-        ReportingEvent.objects.create(
-            name=ReportingEvent.EventType.CONVERSATION_OPENED,
-            value=0,
+        _create_event(
+            ReportingEvent.EventType.CONVERSATION_OPENED,
+            0,
             conversation=conversation,
             inbox=conversation.inbox,
+            user=None,
         )
     except Exception:
         logger.warning("Failed to record conversation_opened event", exc_info=True)
+
+
+def aggregate_buckets(
+    since: datetime.datetime,
+    until: datetime.datetime | None = None,
+    *,
+    names: list[str] | None = None,
+    by: tuple[str, ...] = (),
+) -> dict[tuple, BucketStats]:
+    """
+    Merge buckets of the window into {(name, *by values): BucketStats}.
+
+    The window is aligned to whole hours (since is rounded down), `by` may hold
+    "inbox_id" and/or "user_id".
+    """
+    qs = ReportingBucket.objects.filter(hour__gte=_bucket_hour(since))
+    if until is not None:
+        qs = qs.filter(hour__lt=until)
+    if names:
+        qs = qs.filter(name__in=names)
+    result: dict[tuple, BucketStats] = {}
+    rows = qs.values_list("name", *by, "count", "total", "sketch")
+    for row in rows.iterator(chunk_size=1000):
+        key = tuple(row[: 1 + len(by)])
+        count, total, sketch = row[1 + len(by) :]
+        result.setdefault(key, BucketStats()).merge_row(count, total, sketch)
+    return result
+
+
+def compact_buckets(limit: int = 500) -> int:
+    """
+    Merge rows sharing a (hour, name, inbox, user) key into one row.
+
+    Processes up to `limit` keys per call; returns the number of rows removed.
+    New rows appended concurrently are picked up by the next run.
+    """
+    keys = (
+        ReportingBucket.objects.values(*BUCKET_KEY_FIELDS)
+        .annotate(rows=Count("id"))
+        .filter(rows__gt=1)
+        .order_by("hour")[:limit]
+    )
+    removed = 0
+    for key in list(keys):
+        key.pop("rows")
+        with transaction.atomic():
+            rows = list(ReportingBucket.objects.select_for_update().filter(**key).order_by("id"))
+            if len(rows) < 2:
+                continue
+            target, *rest = rows
+            stats = BucketStats()
+            for row in rows:
+                stats.merge_row(row.count, row.total, row.sketch)
+            target.count = stats.count
+            target.total = stats.total
+            target.sketch = stats.sketch.to_dict()
+            target.save(update_fields=["count", "total", "sketch"])
+            ReportingBucket.objects.filter(id__in=[row.id for row in rest]).delete()
+            removed += len(rest)
+    return removed
+
+
+def rebuild_buckets(since: datetime.datetime, until: datetime.datetime) -> int:
+    """
+    Recompute buckets of [since, until) from ReportingEvent (idempotent).
+
+    Both bounds should be whole hours. Returns the number of buckets written.
+
+    Safe to run next to live writers: the delete, the event read and the insert
+    share one transaction, and on PostgreSQL the bucket table is locked against
+    inserts first. A concurrent _create_event (event and bucket in one
+    transaction) either committed before the lock and is counted from its event,
+    or waits and appends its bucket after the rebuild; it is never lost or
+    counted twice.
+    """
+    with transaction.atomic():
+        if connection.vendor == "postgresql":
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    f"LOCK TABLE {ReportingBucket._meta.db_table} IN SHARE ROW EXCLUSIVE MODE"
+                )
+        # На SQLite удаление берёт блокировку записи — писатели ждут до COMMIT.
+        ReportingBucket.objects.filter(hour__gte=since, hour__lt=until).delete()
+        stats: dict[tuple, BucketStats] = {}
+        events = ReportingEvent.objects.filter(created_at__gte=since, created_at__lt=until)
+        rows = events.values_list("created_at", "name", "inbox_id", "user_id", "value")
+        for created_at, name, inbox_id, user_id, value in rows.iterator(chunk_size=2000):
+            key = (_bucket_hour(created_at), name, inbox_id, user_id)
+            stats.setdefault(key, BucketStats()).add(value)
+        buckets = [
+            ReportingBucket(
+                hour=hour,
+                name=name,
+                inbox_id=inbox_id,
+                user_id=user_id,
+                count=item.count,
+                total=item.total,
+                sketch=item.sketch.to_dict(),
+            )
+            for (hour, name, inbox_id, user_id), item in stats.items()
+        ]
+        ReportingBucket.objects.bulk_create(buckets, batch_size=500)
+    return len(buckets)
@@ -71,6 +71,30 @@ def visible_conversations_qs(user: User) -> QuerySet[Conversation]:
     return qs.filter(assignee_id=user.id)
 
 
+def visible_stream_groups(user: User) -> list[str]:
+    """
+    Группы SSE-пробуждений (messenger.ws_notify), на которые подписывается
+    глобальный стрим уведомлений пользователя.
+
+    Повторяет правила visible_conversations_qs: админ слушает всё (sse_all),
+    оператор филиала — свой филиал, SELF/без филиала — только свои диалоги.
+    Личная группа оператора нужна всегда (новые назначения).
+    """
+    from .ws_notify import SSE_GROUP_ALL, sse_group_branch, sse_group_operator
+
+    if not user or not user.is_authenticated or not user.is_active:
+        return []
+    if user.role == User.Role.TENDERIST:
+        return []
+
+    groups = [sse_group_operator(user.id)]
+    if user.is_superuser or user.role == User.Role.ADMIN:
+        groups.append(SSE_GROUP_ALL)
+    elif user.data_scope != User.DataScope.SELF and user.branch_id:
+        groups.append(sse_group_branch(user.branch_id))
+    return groups
+
+
 def visible_canned_responses_qs(user: User) -> QuerySet[CannedResponse]:
     """
     Шаблоны ответов, видимые пользователю.
@@ -106,38 +130,14 @@ def get_messenger_unread_count(user: User) -> int:
     Note:
         Непрочитанное = входящее (IN) сообщение с created_at > assignee_last_read_at
         (или все входящие, если assignee_last_read_at не задан).
-        Использует кэширование для оптимизации частых запросов.
+        Итог ведётся инкрементально в Redis (messenger/unread.py) — чтение O(1).
     """
     if not user or not user.is_authenticated or not user.is_active:
         return 0
 
-    # Кэширование для оптимизации (по образцу Chatwoot)
-    from django.conf import settings
-    from django.core.cache import cache
-
-    cache_key = f"messenger:unread_count:{user.id}"
-    cache_timeout = getattr(settings, "MESSENGER_UNREAD_COUNT_CACHE_TIMEOUT", 30)  # 30 секунд
-
-    cached_count = cache.get(cache_key)
-    if cached_count is not None:
-        return cached_count
-
-    count = (
-        Message.objects.filter(
-            conversation__assignee_id=user.id,
-            direction=Message.Direction.IN,
-        )
-        .filter(
-            Q(conversation__assignee_last_read_at__isnull=True)
-            | Q(created_at__gt=F("conversation__assignee_last_read_at"))
-        )
-        .count()
-    )
-
-    # Кэшируем результат
-    cache.set(cache_key, count, timeout=cache_timeout)
-
-    return count
+    from .unread import get_total
+
+    return get_total(user.id)
 
 
 def get_visible_conversations(user) -> QuerySet[Conversation]:
@@ -234,7 +234,10 @@ def record_message(
 
     # Reporting events для исходящих сообщений (ответ оператора)
     if direction == Message.Direction.OUT and sender_user:
-        record_first_response(conversation, msg)
+        # Message.save() обновил загруженный диалог: совпадение меток — это первый
+        # ответ оператора, остальным ответам проверка FIRST_RESPONSE не нужна.
+        if conversation.first_reply_created_at == msg.created_at:
+            record_first_response(conversation, msg)
         record_reply_time(conversation, msg)
 
     return msg
@@ -288,6 +291,29 @@ def assign_conversation(conversation: Conversation, user: User) -> None:
             pass  # push не критичен
 
 
+def _available_operators(qs, branch_id: int):
+    """
+    Оставить в выборке пользователей только готовых принять диалог.
+
+    С индексом присутствия (messenger/presence.py) — один ZRANGEBYSCORE по
+    филиалу: heartbeat в окне и статус не away/busy/offline. Без Redis —
+    по статусу AgentProfile в БД (пользователь без профиля считается онлайн).
+    """
+    from django.db.models import Q
+
+    from . import presence
+    from .models import AgentProfile
+
+    online_ids = presence.online_user_ids(branch_id)
+    if online_ids is not None:
+        return qs.filter(id__in=online_ids)
+    return qs.exclude(
+        Q(agent_profile__status=AgentProfile.Status.AWAY)
+        | Q(agent_profile__status=AgentProfile.Status.BUSY)
+        | Q(agent_profile__status=AgentProfile.Status.OFFLINE)
+    )
+
+
 def auto_assign_conversation(conversation: Conversation) -> User | None:
     """
     Автоназначение диалога оператору филиала через Round-Robin список (по образцу Chatwoot).
@@ -333,16 +359,8 @@ def auto_assign_conversation(conversation: Conversation) -> User | None:
     # без активного UserAbsence на сегодня
     # + число назначенных открытых/ожидающих диалогов (нагрузка)
     candidates_qs = (
-        User.objects.filter(
-            branch_id=branch_id,
-            is_active=True,
-        )
+        _available_operators(User.objects.filter(branch_id=branch_id, is_active=True), branch_id)
         .exclude(role=User.Role.ADMIN)
-        .exclude(
-            Q(agent_profile__status=AgentProfile.Status.AWAY)
-            | Q(agent_profile__status=AgentProfile.Status.BUSY)
-            | Q(agent_profile__status=AgentProfile.Status.OFFLINE)
-        )
         .exclude(
             # Активное отсутствие (UserAbsence)
             absences__start_date__lte=today,
@@ -426,23 +444,8 @@ def has_online_operators_for_branch(branch_id: int, inbox_id: int) -> bool:
     Note:
         Используется для проверки возможности автоназначения перед вызовом auto_assign_conversation.
     """
-    from django.db.models import Q
-
-    from .models import AgentProfile
-
-    return (
-        User.objects.filter(
-            branch_id=branch_id,
-            is_active=True,
-        )
-        .exclude(role=User.Role.ADMIN)
-        .exclude(
-            Q(agent_profile__status=AgentProfile.Status.AWAY)
-            | Q(agent_profile__status=AgentProfile.Status.BUSY)
-            | Q(agent_profile__status=AgentProfile.Status.OFFLINE)
-        )
-        .exists()
-    )
+    users = User.objects.filter(branch_id=branch_id, is_active=True).exclude(role=User.Role.ADMIN)
+    return _available_operators(users, branch_id).exists()
 
 
 def select_routing_rule(
@@ -605,17 +608,9 @@ def escalate_conversation(conversation: Conversation) -> User | None:
         return None
 
     candidates_qs = (
-        User.objects.filter(
-            branch_id=branch_id,
-            is_active=True,
-        )
+        _available_operators(User.objects.filter(branch_id=branch_id, is_active=True), branch_id)
         .exclude(role=User.Role.ADMIN)
         .exclude(id=current_assignee_id)
-        .exclude(
-            Q(agent_profile__status=AgentProfile.Status.AWAY)
-            | Q(agent_profile__status=AgentProfile.Status.BUSY)
-            | Q(agent_profile__status=AgentProfile.Status.OFFLINE)
-        )
         .annotate(
             open_count=Count(
                 "assigned_conversations",
@@ -2,10 +2,10 @@
 
 import logging
 
-from django.db.models.signals import post_save
+from django.db.models.signals import post_delete, post_save
 from django.dispatch import receiver
 
-from messenger.models import Conversation
+from messenger.models import AutomationRule, Conversation, Inbox
 
 logger = logging.getLogger("messenger.auto_assign")
 
@@ -56,3 +56,28 @@ def autolink_company_on_create(sender, instance: Conversation, created: bool, **
         autolink_conversation_company(instance)
     except Exception:
         logger.exception("company autolink failed for conversation %s", instance.pk)
+
+
+@receiver(post_delete, sender=Conversation)
+def drop_unread_on_delete(sender, instance: Conversation, **kwargs):
+    """Убрать непрочитанные удалённого диалога из итога оператора."""
+    from messenger import unread
+
+    unread.adjust_total(instance.assignee_id, -instance.assignee_unread_count)
+
+
+@receiver(post_save, sender=AutomationRule)
+@receiver(post_delete, sender=AutomationRule)
+def automation_rules_changed(sender, instance: AutomationRule, **kwargs):
+    """Сбросить скомпилированные правила автоматизации во всех процессах."""
+    from messenger.automation import rules_changed
+
+    rules_changed()
+
+
+@receiver(post_delete, sender=Inbox)
+def widget_inbox_deleted(sender, instance: Inbox, **kwargs):
+    """Удалённый inbox не должен отвечать виджету из кэша конфигурации."""
+    from messenger.widget_cursor import invalidate_inbox
+
+    invalidate_inbox(instance.widget_token)
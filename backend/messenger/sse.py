@@ -0,0 +1,221 @@
+"""
+SSE-стримы мессенджера: push-доставка поверх channel layer.
+
+Раньше каждый стрим (диалог оператора, уведомления оператора, виджет)
+держал воркер в цикле ``while True: ...; time.sleep(1..2)`` и перечитывал
+БД на каждом тике. Теперь:
+
+- изменения публикуются один раз — слушателями EventDispatcher
+  (ws_notify.notify_stream_wakeup) после коммита транзакции;
+- стрим подписан на группы channel layer (Redis в проде, InMemory в тестах)
+  и ждёт пробуждения; БД читается только когда что-то изменилось;
+- под ASGI (daphne) стрим — async-генератор, простаивающее соединение не
+  занимает поток. Под WSGI async-итератор Django буферизовал бы целиком,
+  поэтому там остаётся прежний poll-цикл.
+
+collect(event) — общий для обоих режимов «снимок изменений» стрима:
+- event=None — холостой тик push-режима: только дешёвые проверки без БД
+  (typing из кэша);
+- event=POLL_EVENT — тик poll-режима: полная проверка;
+- иначе — пробуждение из брокера (kind подсказывает, что перечитать).
+"""
+
+from __future__ import annotations
+
+import asyncio
+import logging
+import time
+from collections.abc import AsyncIterator, Callable, Iterable, Iterator
+from typing import Any
+
+from asgiref.sync import sync_to_async
+from channels.layers import get_channel_layer
+from django.conf import settings
+from django.core.handlers.asgi import ASGIRequest
+from django.db import transaction
+from django.http import StreamingHttpResponse
+
+from .ws_notify import notify_stream_wakeup
+
+logger = logging.getLogger("messenger.ws")
+
+SSE_READY = "event: ready\ndata: {}\n\n"
+SSE_KEEPALIVE = ": keep-alive\n\n"
+KEEPALIVE_SECONDS = 5.0
+
+POLL_EVENT: dict[str, Any] = {"kind": "poll"}
+INITIAL_EVENT: dict[str, Any] = {"kind": "initial"}
+
+Collect = Callable[[dict[str, Any] | None], list[str]]
+
+
+def wants(event: dict[str, Any] | None, *kinds: str) -> bool:
+    """Нужно ли перечитывать данные вида kinds для этого события."""
+    if event is None:
+        return False
+    kind = event.get("kind")
+    return kind in ("poll", "initial") or kind in kinds
+
+
+def push_enabled(request) -> bool:
+    """Push-режим доступен только под ASGI и при MESSENGER_SSE_PUSH_ENABLED."""
+    if not getattr(settings, "MESSENGER_SSE_PUSH_ENABLED", True):
+        return False
+    django_request = getattr(request, "_request", request)  # DRF Request → HttpRequest
+    return isinstance(django_request, ASGIRequest)
+
+
+class StreamSubscription:
+    """Подписка одного SSE-соединения на группы channel layer."""
+
+    def __init__(self, groups: Iterable[str]):
+        self.groups = list(groups)
+        self.layer = None
+        self.channel: str | None = None
+
+    async def __aenter__(self) -> StreamSubscription:
+        self.layer = get_channel_layer()
+        if self.layer is None:
+            return self
+        self.channel = await self.layer.new_channel("sse")
+        for group in self.groups:
+            await self.layer.group_add(group, self.channel)
+        return self
+
+    async def __aexit__(self, *exc_info) -> None:
+        if self.layer is None or self.channel is None:
+            return
+        for group in self.groups:
+            try:
+                await self.layer.group_discard(group, self.channel)
+            except Exception:
+                logger.warning("SSE group_discard %s failed", group, exc_info=True)
+
+    async def wait(self, timeout: float) -> dict[str, Any] | None:
+        """Дождаться пробуждения; None — таймаут без событий."""
+        if self.channel is None:
+            # Без channel layer деградируем до редкого опроса.
+            await asyncio.sleep(timeout)
+            return POLL_EVENT
+        try:
+            return await asyncio.wait_for(self.layer.receive(self.channel), timeout)
+        except TimeoutError:
+            return None
+
+
+def poll_stream(collect: Collect, *, lifetime: float, interval: float) -> Iterator[str]:
+    """WSGI-путь: прежний цикл с опросом БД каждые interval секунд."""
+    started = time.time()
+    last_keepalive = 0.0
+    yield SSE_READY
+    while True:
+        now = time.time()
+        if now - started > lifetime:
+            break
+        yield from collect(POLL_EVENT)
+        if now - last_keepalive > KEEPALIVE_SECONDS:
+            last_keepalive = now
+            yield SSE_KEEPALIVE
+        time.sleep(interval)
+
+
+async def push_stream(
+    collect: Collect, groups: Iterable[str], *, lifetime: float
+) -> AsyncIterator[str]:
+    """ASGI-путь: ждём пробуждений из channel layer, БД — только по событию."""
+    started = time.monotonic()
+    yield SSE_READY
+    # Подписываемся до начального снимка — изменения между ними не теряются.
+    async with StreamSubscription(groups) as subscription:
+        event: dict[str, Any] | None = INITIAL_EVENT
+        while True:
+            for chunk in await sync_to_async(collect)(event):
+                yield chunk
+            remaining = lifetime - (time.monotonic() - started)
+            if remaining <= 0:
+                break
+            event = await subscription.wait(min(KEEPALIVE_SECONDS, remaining))
+            if event is None:
+                yield SSE_KEEPALIVE
+
+
+def event_stream_response(
+    request,
+    collect: Collect,
+    groups: Iterable[str],
+    *,
+    lifetime: float,
+    poll_interval: float,
+) -> StreamingHttpResponse:
+    """StreamingHttpResponse для SSE: push под ASGI, poll под WSGI."""
+    if push_enabled(request):
+        content = push_stream(collect, groups, lifetime=lifetime)
+    else:
+        content = poll_stream(collect, lifetime=lifetime, interval=poll_interval)
+    resp = StreamingHttpResponse(content, content_type="text/event-stream")
+    resp["Cache-Control"] = "no-cache"
+    resp["X-Accel-Buffering"] = "no"  # nginx: не буферизовать SSE
+    return resp
+
+
+# ─── Публикация ──────────────────────────────────────────────────────
+
+
+def publish_conversation_change(conversation_id: int, kind: str = "conversation") -> None:
+    """
+    Разбудить стримы после queryset.update() по диалогу (после коммита).
+
+    Для путей, которые обходят Conversation.save() и потому не проходят через
+    EventDispatcher: назначение, перевод, bulk-действия, прочтение.
+    Диалог перечитывается на коммите, чтобы группы (филиал, assignee) были актуальны.
+    Заодно сдвигается номер изменения для быстрого пути опроса виджета.
+    """
+    from .widget_cursor import bump
+
+    bump(conversation_id)
+
+    def _publish():
+        from .models import Conversation
+
+        conversation = (
+            Conversation.objects.only("id", "branch_id", "assignee_id")
+            .filter(pk=conversation_id)
+            .first()
+        )
+        if conversation is not None:
+            notify_stream_wakeup(conversation, kind)
+
+    transaction.on_commit(_publish)
+
+
+def _on_message_event(event_name: str, timestamp, data: dict[str, Any]) -> None:
+    message = data.get("message")
+    if message is None or not message.conversation_id:
+        return
+    conversation = message.conversation
+    transaction.on_commit(lambda: notify_stream_wakeup(conversation, "message"))
+
+
+def _on_conversation_event(event_name: str, timestamp, data: dict[str, Any]) -> None:
+    conversation = data.get("conversation")
+    if conversation is None:
+        return
+    transaction.on_commit(lambda: notify_stream_wakeup(conversation, "conversation"))
+
+
+_listeners_registered = False
+
+
+def register_stream_listeners() -> None:
+    """Подписать публикацию SSE-пробуждений на события EventDispatcher (из apps.ready)."""
+    global _listeners_registered
+    if _listeners_registered:
+        return
+    from .dispatchers import Events, get_dispatcher
+
+    dispatcher = get_dispatcher()
+    for event_name in (Events.MESSAGE_CREATED, Events.MESSAGE_UPDATED):
+        dispatcher.subscribe(event_name, _on_message_event)
+    for event_name in (Events.CONVERSATION_CREATED, Events.CONVERSATION_UPDATED):
+        dispatcher.subscribe(event_name, _on_conversation_event)
+    _listeners_registered = True
@@ -4,9 +4,12 @@ Celery-задачи мессенджера (аналог Chatwoot Sidekiq jobs).
 - auto_resolve: закрытие неактивных диалогов
 - escalate: переназначение диалогов при таймауте
 - check_offline_operators: перевод операторов в offline по таймауту heartbeat
+- compact_reporting_buckets: сжатие часовых агрегатов аналитики
+- reconcile_unread_counters: сверка счётчиков непрочитанных операторов
 """
 
 import logging
+import time
 from datetime import timedelta
 
 from celery import shared_task
@@ -216,7 +219,7 @@ def send_offline_email_notification(self, conversation_id: int, message_id: int)
 
 
 @shared_task(name="messenger.escalate_waiting_conversations")
-def escalate_waiting_conversations():
+def escalate_waiting_conversations(limit: int = 500):
     """Эскалация молчаливых диалогов по waiting_minutes.
 
     Идемпотентна: каждый уровень триггерит события ровно один раз
@@ -225,100 +228,137 @@ def escalate_waiting_conversations():
       2 — urgent (уведомление ассигни)
       3 — rop_alert (уведомления всем РОП филиала)
       4 — pool_return (снять ассигни + уведомить онлайн-менеджеров филиала)
-    """
-    from django.db import models as dj_models
 
+    Выбираются только диалоги с наступившим escalation_due_at (частичный
+    индекс, см. messenger/escalation.py), не более limit за тик. Уведомления
+    уровня — одним bulk_notify, переход уровня — одним UPDATE на уровень.
+    """
     from accounts.models import User
     from notifications.models import Notification
+    from notifications.service import bulk_notify
 
+    from . import escalation, unread
     from .models import Conversation
 
-    thresholds = Conversation.escalation_thresholds()
+    started = time.monotonic()
+    thresholds = escalation.sync_thresholds()
     now = timezone.now()
     stats = {"warn": 0, "urgent": 0, "rop_alert": 0, "pool_return": 0}
 
-    candidates = Conversation.objects.filter(
-        status__in=[Conversation.Status.OPEN, Conversation.Status.PENDING],
-        last_customer_msg_at__isnull=False,
-    ).exclude(
-        last_agent_msg_at__gte=dj_models.F("last_customer_msg_at"),
+    due = list(
+        Conversation.objects.filter(
+            status__in=escalation.ACTIVE_STATUSES, escalation_due_at__lte=now
+        )
+        .select_related("assignee", "contact")
+        .order_by("escalation_due_at")[:limit]
     )
 
-    for conv in candidates.select_related("assignee", "branch", "contact"):
-        waiting = (now - conv.last_customer_msg_at).total_seconds() / 60
-        target_level = 0
-        if waiting >= thresholds["pool_return_min"]:
-            target_level = 4
-        elif waiting >= thresholds["rop_alert_min"]:
-            target_level = 3
-        elif waiting >= thresholds["urgent_min"]:
-            target_level = 2
-        elif waiting >= thresholds["warn_min"]:
-            target_level = 1
-
-        if target_level <= conv.escalation_level:
+    by_level: dict[int, list] = {level: [] for level in range(1, escalation.MAX_LEVEL + 1)}
+    stale = []
+    waited: dict[int, int] = {}
+    for conv in due:
+        customer_at, agent_at = conv.last_customer_msg_at, conv.last_agent_msg_at
+        if customer_at is None or (agent_at is not None and agent_at >= customer_at):
+            stale.append(conv.pk)  # Клиент уже не ждёт — срок устарел
             continue
+        waiting = (now - customer_at).total_seconds() / 60
+        level = escalation.target_level(waiting, thresholds)
+        if level <= conv.escalation_level:
+            stale.append(conv.pk)  # Пороги изменились — пересчитать срок
+            continue
+        waited[conv.pk] = int(waiting)
+        by_level[level].append(conv)
+
+    if stale:
+        escalation.reschedule(Conversation.objects.filter(pk__in=stale), thresholds)
+
+    def _branch_users(convs, **filters) -> dict[int, list[int]]:
+        branch_ids = {c.branch_id for c in convs if c.branch_id}
+        users: dict[int, list[int]] = {}
+        if branch_ids:
+            for user_id, branch_id in User.objects.filter(
+                branch_id__in=branch_ids, is_active=True, **filters
+            ).values_list("id", "branch_id"):
+                users.setdefault(branch_id, []).append(user_id)
+        return users
+
+    def _notification(user_id, conv, title, body, level):
+        return Notification(
+            user_id=user_id,
+            kind=Notification.Kind.INFO,
+            title=title,
+            body=body,
+            url=f"/messenger/?conv={conv.id}",
+            payload={"conversation_id": conv.id, "level": level},
+        )
 
-        contact_name = conv.contact.name if conv.contact else ""
-
-        if target_level == 1:
-            stats["warn"] += 1
-        elif target_level == 2 and conv.assignee_id:
-            Notification.objects.create(
-                user=conv.assignee,
-                kind=Notification.Kind.INFO,
-                title=f"Клиент ждёт {int(waiting)} мин",
-                body=f"Диалог #{conv.id} — {contact_name}",
-                url=f"/messenger/?conv={conv.id}",
-                payload={"conversation_id": conv.id, "level": "urgent"},
-            )
-            stats["urgent"] += 1
-        elif target_level == 3 and conv.branch_id:
-            rops = User.objects.filter(
-                branch_id=conv.branch_id,
-                role=User.Role.SALES_HEAD,
-                is_active=True,
-            )
-            assignee_name = (
-                conv.assignee.get_full_name() or conv.assignee.username
-                if conv.assignee
-                else "не назначен"
-            )
-            for rop in rops:
-                Notification.objects.create(
-                    user=rop,
-                    kind=Notification.Kind.INFO,
-                    title=f"Клиент ждёт {int(waiting)} мин — требуется вмешательство",
-                    body=f"Диалог #{conv.id} у {assignee_name}",
-                    url=f"/messenger/?conv={conv.id}",
-                    payload={"conversation_id": conv.id, "level": "rop_alert"},
-                )
-            stats["rop_alert"] += 1
-        elif target_level == 4 and conv.branch_id:
-            Conversation.objects.filter(pk=conv.pk).update(assignee=None)
-            branch_managers = User.objects.filter(
-                branch_id=conv.branch_id,
-                role=User.Role.MANAGER,
-                is_active=True,
-                messenger_online=True,
+    stats["warn"] = len(by_level[1])
+
+    urgent = [c for c in by_level[2] if c.assignee_id]
+    bulk_notify(
+        _notification(
+            conv.assignee_id,
+            conv,
+            f"Клиент ждёт {waited[conv.pk]} мин",
+            f"Диалог #{conv.id} — {conv.contact.name if conv.contact else ''}",
+            "urgent",
+        )
+        for conv in urgent
+    )
+    stats["urgent"] = len(urgent)
+
+    rop_alert = [c for c in by_level[3] if c.branch_id]
+    rops = _branch_users(rop_alert, role=User.Role.SALES_HEAD)
+    notifications = []
+    for conv in rop_alert:
+        assignee_name = (
+            conv.assignee.get_full_name() or conv.assignee.username
+            if conv.assignee
+            else "не назначен"
+        )
+        notifications.extend(
+            _notification(
+                rop_id,
+                conv,
+                f"Клиент ждёт {waited[conv.pk]} мин — требуется вмешательство",
+                f"Диалог #{conv.id} у {assignee_name}",
+                "rop_alert",
             )
-            for m in branch_managers:
-                Notification.objects.create(
-                    user=m,
-                    kind=Notification.Kind.INFO,
-                    title=f"Диалог возвращён в пул — ждёт {int(waiting)} мин",
-                    body=f"Диалог #{conv.id} ожидает свободного оператора",
-                    url=f"/messenger/?conv={conv.id}",
-                    payload={"conversation_id": conv.id, "level": "pool_return"},
-                )
-            stats["pool_return"] += 1
-
-        Conversation.objects.filter(pk=conv.pk).update(
-            escalation_level=target_level,
-            last_escalated_at=now,
+            for rop_id in rops.get(conv.branch_id, [])
         )
+    bulk_notify(notifications)
+    stats["rop_alert"] = len(rop_alert)
+
+    pool_return = [c for c in by_level[4] if c.branch_id]
+    if pool_return:
+        Conversation.objects.filter(pk__in=[c.pk for c in pool_return]).update(assignee=None)
+        for conv in pool_return:
+            unread.transfer(conv.assignee_unread_count, conv.assignee_id, None)
+    managers = _branch_users(pool_return, role=User.Role.MANAGER, messenger_online=True)
+    bulk_notify(
+        _notification(
+            manager_id,
+            conv,
+            f"Диалог возвращён в пул — ждёт {waited[conv.pk]} мин",
+            f"Диалог #{conv.id} ожидает свободного оператора",
+            "pool_return",
+        )
+        for conv in pool_return
+        for manager_id in managers.get(conv.branch_id, [])
+    )
+    stats["pool_return"] = len(pool_return)
+
+    for level, convs in by_level.items():
+        if convs:
+            Conversation.objects.filter(pk__in=[c.pk for c in convs]).update(
+                escalation_level=level,
+                last_escalated_at=now,
+                escalation_due_at=escalation.deadline_at_level(level, thresholds),
+            )
 
-    if any(stats.values()):
+    stats["processed"] = len(due)
+    stats["duration_ms"] = round((time.monotonic() - started) * 1000, 1)
+    if due:
         logger.info("escalate_waiting_conversations stats: %s", stats)
     return stats
 
@@ -340,6 +380,30 @@ def check_offline_operators(stale_seconds: int = 90):
     return {"marked_offline": updated}
 
 
+@shared_task(name="messenger.compact_reporting_buckets")
+def compact_reporting_buckets(limit: int = 500):
+    """Слить строки ReportingBucket одного ключа (час, тип, inbox, оператор).
+
+    record_* добавляют по строке на событие без блокировок; задача раз в
+    несколько минут сворачивает их, чтобы отчёт читал по строке на ключ.
+    """
+    from .reporting import compact_buckets
+
+    return {"removed": compact_buckets(limit=limit)}
+
+
+@shared_task(name="messenger.reconcile_unread_counters")
+def reconcile_unread_counters(window_hours: int = 24):
+    """Сверить счётчики непрочитанных с сообщениями и обновить итоги операторов в Redis.
+
+    Инкременты идут на пути записи; задача чинит дрейф (удалённые сообщения,
+    массовые update() по диалогам) в диалогах с активностью за окно.
+    """
+    from .unread import reconcile_unread
+
+    return reconcile_unread(since=timezone.now() - timedelta(hours=window_hours))
+
+
 # ---------------------------------------------------------------------------
 # Outbound webhooks и push-уведомления (P1-7, P1-8 bug-hunt)
 # ---------------------------------------------------------------------------
@@ -0,0 +1,177 @@
+"""Тесты скомпилированного движка AutomationRule (messenger/automation.py)."""
+
+import io
+import json
+
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection
+from django.db.models.signals import post_save
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+
+from accounts.models import Branch
+from messenger import automation
+from messenger.models import (
+    AutomationRule,
+    Contact,
+    Conversation,
+    ConversationLabel,
+    Inbox,
+    Message,
+)
+from messenger.signals import auto_assign_new_conversation
+
+
+class AutomationEngineTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        post_save.disconnect(auto_assign_new_conversation, sender=Conversation)
+        self.addCleanup(post_save.connect, auto_assign_new_conversation, sender=Conversation)
+        self.branch = Branch.objects.create(name="Авто", code="auto")
+        self.inbox = Inbox.objects.create(name="Auto", branch=self.branch)
+        self.other_inbox = Inbox.objects.create(name="Other", branch=self.branch)
+        self.contact = Contact.objects.create(name="Клиент")
+        self.conversation = Conversation.objects.create(inbox=self.inbox, contact=self.contact)
+        self.message = Message(
+            conversation=self.conversation,
+            direction=Message.Direction.IN,
+            body="Нужна СРОЧНАЯ доставка",
+        )
+
+    def _rule(self, conditions, actions=None, inbox=None, event="message_created", **kwargs):
+        return AutomationRule.objects.create(
+            name=f"rule {AutomationRule.objects.count()}",
+            event_name=event,
+            inbox=inbox,
+            conditions=conditions,
+            actions=actions or [],
+            **kwargs,
+        )
+
+    def _dispatch(self, event="message_created"):
+        return automation.dispatch_event(event, self.conversation, self.message)
+
+    def test_condition_operators(self):
+        cases = [
+            ({"attribute_key": "content", "filter_operator": "contains", "values": ["срочн"]}, 1),
+            (
+                {
+                    "attribute_key": "content",
+                    "filter_operator": "does_not_contain",
+                    "values": ["ДОСТ"],
+                },
+                0,
+            ),
+            ({"attribute_key": "message_type", "filter_operator": "equal_to", "values": ["in"]}, 1),
+            ({"attribute_key": "status", "filter_operator": "not_equal_to", "values": ["open"]}, 0),
+            ({"attribute_key": "priority", "filter_operator": "equal_to", "values": [20]}, 1),
+            ({"attribute_key": "assignee_id", "filter_operator": "is_present", "values": []}, 0),
+            ({"attribute_key": "assignee_id", "filter_operator": "is_not_present"}, 1),
+            ({"attribute_key": "status", "filter_operator": "unknown_op", "values": ["x"]}, 1),
+            ({"attribute_key": "nope", "filter_operator": "equal_to", "values": [""]}, 1),
+        ]
+        for condition, expected in cases:
+            with self.subTest(condition=condition):
+                rule = self._rule([condition])
+                self.assertEqual(self._dispatch(), expected)
+                rule.delete()
+
+    def test_inbox_scope_and_warm_dispatch_without_queries(self):
+        self._rule([], inbox=self.inbox)
+        self._rule([])
+        self._rule([], inbox=self.other_inbox)
+        self._rule([], event="conversation_created")
+        self._rule([], is_active=False)
+
+        self.assertEqual(self._dispatch(), 2)  # компиляция
+        with self.assertNumQueries(0):
+            self.assertEqual(self._dispatch(), 2)
+            self.assertEqual(self._dispatch("conversation_updated"), 0)
+        self.assertEqual(
+            [r.name for r in automation.compiled_rules("message_created", self.inbox.id)],
+            ["rule 0", "rule 1"],
+        )
+
+    def test_rule_changes_invalidate_compiled_lists(self):
+        rule = self._rule(
+            [{"attribute_key": "status", "filter_operator": "equal_to", "values": ["open"]}]
+        )
+        self.assertEqual(self._dispatch(), 1)
+
+        rule.conditions = [
+            {"attribute_key": "status", "filter_operator": "equal_to", "values": ["closed"]}
+        ]
+        rule.save()
+        self.assertEqual(self._dispatch(), 0)
+
+        rule.is_active = False
+        rule.save(update_fields=["is_active"])
+        self._rule([])
+        self.assertEqual(
+            [r.name for r in automation.compiled_rules("message_created", None)], ["rule 1"]
+        )
+
+        AutomationRule.objects.all().delete()
+        self.assertEqual(self._dispatch(), 0)
+
+    def test_actions_batched_into_one_update(self):
+        keep = ConversationLabel.objects.create(title="vip")
+        drop = ConversationLabel.objects.create(title="spam")
+        self.conversation.labels.add(drop)
+        self._rule(
+            [],
+            actions=[
+                {"action_name": "resolve"},
+                {"action_name": "add_label", "action_params": [keep.id, 999999]},
+            ],
+        )
+        self._rule(
+            [{"attribute_key": "status", "filter_operator": "equal_to", "values": ["resolved"]}],
+            actions=[
+                {"action_name": "set_priority", "action_params": [30]},
+                {"action_name": "remove_label", "action_params": [drop.id]},
+                {"action_name": "mute"},
+            ],
+        )
+
+        with CaptureQueriesContext(connection) as ctx:
+            self.assertEqual(self._dispatch(), 2)
+        updates = [
+            q["sql"]
+            for q in ctx.captured_queries
+            if q["sql"].startswith('UPDATE "messenger_conversation"')
+        ]
+        self.assertEqual(len(updates), 1)
+
+        self.conversation.refresh_from_db()
+        self.assertEqual(self.conversation.status, Conversation.Status.RESOLVED)
+        self.assertEqual(self.conversation.priority, Conversation.Priority.HIGH)
+        self.assertEqual(list(self.conversation.labels.values_list("title", flat=True)), ["vip"])
+
+    def test_immediate_action_flushes_pending_fields_first(self):
+        self._rule(
+            [],
+            actions=[
+                {"action_name": "set_priority", "action_params": [10]},
+                {"action_name": "send_message", "action_params": ["Авто-ответ"]},
+                {"action_name": "bogus"},
+            ],
+        )
+        self.assertEqual(self._dispatch(), 1)
+        self.conversation.refresh_from_db()
+        self.assertEqual(self.conversation.priority, Conversation.Priority.LOW)
+        self.assertTrue(
+            self.conversation.messages.filter(
+                direction=Message.Direction.OUT, body="Авто-ответ"
+            ).exists()
+        )
+
+    def test_benchmark_command(self):
+        self._rule([])  # общее правило — срабатывает в бенчмарке тоже
+        out = io.StringIO()
+        call_command("benchmark_automation", "--events", "20", "--rules", "6", "--json", stdout=out)
+        report = json.loads(out.getvalue())
+        self.assertEqual(report["queries_per_event"], 0)
+        self.assertGreater(report["first_event_queries"], 0)
+        self.assertFalse(AutomationRule.objects.filter(name__startswith="benchmark").exists())
@@ -2,17 +2,20 @@
 
 from datetime import timedelta
 
+from django.core.cache import cache
 from django.test import TestCase
 from django.utils import timezone
 
 from accounts.models import Branch, User
-from messenger.models import Contact, Conversation, Inbox
+from messenger import escalation
+from messenger.models import Contact, Conversation, Inbox, Message
 from messenger.tasks import escalate_waiting_conversations
 from notifications.models import Notification
 
 
 class EscalationTaskTests(TestCase):
     def setUp(self):
+        cache.clear()
         self.branch = Branch.objects.create(name="ЕКБ", code="ekb")
         self.manager = User.objects.create_user(
             username="m", password="x", role="manager", branch=self.branch
@@ -44,6 +47,8 @@ class EscalationTaskTests(TestCase):
             last_customer_msg_at=timezone.now() - timedelta(minutes=5),
             last_agent_msg_at=None,
         )
+        # update() идёт в обход Message.save() — срок эскалации пересчитываем явно
+        escalation.reschedule(Conversation.objects.filter(pk=self.conv.pk))
         self.conv.refresh_from_db()
 
     def _set_waiting(self, minutes: int):
@@ -51,6 +56,7 @@ class EscalationTaskTests(TestCase):
             last_customer_msg_at=timezone.now() - timedelta(minutes=minutes),
             last_agent_msg_at=None,
         )
+        escalation.reschedule(Conversation.objects.filter(pk=self.conv.pk))
 
     def test_warn_level_creates_no_notification(self):
         escalate_waiting_conversations()
@@ -103,3 +109,92 @@ class EscalationTaskTests(TestCase):
         )
         escalate_waiting_conversations()
         self.assertEqual(Notification.objects.count(), 0)
+
+    def test_stats_report_processed_and_duration(self):
+        stats = escalate_waiting_conversations()
+        self.assertEqual(stats["processed"], 1)
+        self.assertIn("duration_ms", stats)
+        # Срок сдвинут на следующий уровень — повторный тик диалог не выбирает
+        self.assertEqual(escalate_waiting_conversations()["processed"], 0)
+
+
+class EscalationDeadlineTests(TestCase):
+    """Срок escalation_due_at: Message.save(), выборка тика, пакетные уведомления."""
+
+    def setUp(self):
+        cache.clear()
+        self.branch = Branch.objects.create(name="Пермь", code="prm")
+        self.manager = User.objects.create_user(
+            username="dl_m", password="x", role="manager", branch=self.branch
+        )
+        self.inbox = Inbox.objects.create(
+            name="Site", branch=self.branch, widget_token="tok_deadline_test", settings={}
+        )
+
+    def _conversation(self, waiting_minutes=None, **extra):
+        contact = Contact.objects.create(name="Client")
+        conv = Conversation.objects.create(
+            inbox=self.inbox, contact=contact, branch=self.branch, **extra
+        )
+        if waiting_minutes is not None:
+            Conversation.objects.filter(pk=conv.pk).update(
+                last_customer_msg_at=timezone.now() - timedelta(minutes=waiting_minutes)
+            )
+            escalation.reschedule(Conversation.objects.filter(pk=conv.pk))
+        return conv
+
+    def test_message_sets_and_clears_deadline(self):
+        conv = self._conversation()
+        Message.objects.create(conversation=conv, direction=Message.Direction.IN, body="Алло")
+        conv.refresh_from_db()
+        expected = conv.last_customer_msg_at + timedelta(minutes=3)
+        self.assertEqual(conv.escalation_due_at, expected)
+
+        Message.objects.create(
+            conversation=conv,
+            direction=Message.Direction.OUT,
+            body="Здравствуйте",
+            sender_user=self.manager,
+        )
+        conv.refresh_from_db()
+        self.assertIsNone(conv.escalation_due_at)
+
+    def test_deadline_follows_current_level(self):
+        conv = self._conversation(escalation_level=2)
+        Message.objects.create(conversation=conv, direction=Message.Direction.IN, body="Ещё")
+        conv.refresh_from_db()
+        self.assertEqual(conv.escalation_due_at, conv.last_customer_msg_at + timedelta(minutes=20))
+
+    def test_tick_queries_do_not_grow_with_due_rows(self):
+        rops = [
+            User.objects.create_user(
+                username=f"dl_rop{i}", password="x", role="sales_head", branch=self.branch
+            )
+            for i in range(3)
+        ]
+        for _ in range(10):
+            self._conversation(waiting_minutes=21, assignee=self.manager)
+        self._conversation(waiting_minutes=1)  # срок не наступил
+        escalation.sync_thresholds()
+
+        # выборка сроков, РОП филиала, bulk_create уведомлений, UPDATE уровня
+        with self.assertNumQueries(4):
+            stats = escalate_waiting_conversations()
+        self.assertEqual((stats["processed"], stats["rop_alert"]), (10, 10))
+        self.assertEqual(Notification.objects.filter(user__in=rops).count(), 30)
+        self.assertEqual(Conversation.objects.filter(escalation_level=3).count(), 10)
+
+    def test_changed_thresholds_reschedule(self):
+        from policy.models import PolicyConfig
+
+        conv = self._conversation(waiting_minutes=5)
+        escalation.sync_thresholds()
+        cfg = PolicyConfig.load()
+        cfg.livechat_escalation = {"warn_min": 10}
+        cfg.save()
+        cache.delete(escalation.THRESHOLDS_KEY)
+
+        escalate_waiting_conversations()
+        conv.refresh_from_db()
+        self.assertEqual(conv.escalation_level, 0)
+        self.assertEqual(conv.escalation_due_at, conv.last_customer_msg_at + timedelta(minutes=10))
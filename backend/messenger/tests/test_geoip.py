@@ -0,0 +1,142 @@
+"""Тесты локального GeoIP-индекса (messenger/geoip.py, import_geoip_ranges)."""
+
+import io
+import ipaddress
+import json
+import os
+import tempfile
+from unittest import mock
+
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+
+from companies.models import Region
+from messenger import geoip
+
+
+def _v4(ip: str) -> int:
+    return int(ipaddress.IPv4Address(ip))
+
+
+class RangeIndexTests(TestCase):
+    def _index(self, ranges):
+        return geoip.RangeIndex(geoip.compile_ranges(ranges))
+
+    def test_bisect_lookup_with_gaps_overlaps_and_v6(self):
+        index = self._index(
+            [
+                (4, _v4("5.0.0.0"), _v4("5.0.0.255"), 7),
+                (4, _v4("5.0.1.0"), _v4("5.0.1.255"), 7),  # склеится с предыдущим
+                (4, _v4("5.0.1.128"), _v4("5.0.2.255"), 9),  # пересечение обрезается
+                (4, _v4("6.0.0.0"), _v4("6.0.0.255"), 0),  # регион не сопоставлен
+                (
+                    6,
+                    int(ipaddress.IPv6Address("2a00::")),
+                    int(ipaddress.IPv6Address("2a00::ffff")),
+                    3,
+                ),
+            ]
+        )
+        lookup = lambda ip: index.lookup(ipaddress.ip_address(ip))
+        self.assertEqual(len(index), 5)  # 5.0.0.0, 5.0.2.0, 5.0.3.0 (разрыв), 2a00::, 2a00::1:0
+        self.assertIsNone(lookup("4.255.255.255"))
+        self.assertEqual(lookup("5.0.0.0"), 7)
+        self.assertEqual(lookup("5.0.1.200"), 7)
+        self.assertEqual(lookup("5.0.2.0"), 9)
+        self.assertIsNone(lookup("5.0.3.0"))
+        self.assertIsNone(lookup("6.0.0.1"))
+        self.assertEqual(lookup("::ffff:5.0.2.1"), 9)
+        self.assertEqual(lookup("2a00::10"), 3)
+        self.assertIsNone(lookup("2a00::1:0"))
+
+    def test_rejects_foreign_file(self):
+        with self.assertRaises(ValueError):
+            geoip.RangeIndex(b"not an index at all")
+
+
+class GeoIPResolverTests(TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        self.path = os.path.join(self.tmp.name, "regions.bin")
+        override = override_settings(
+            MESSENGER_GEOIP_DB_PATH=self.path,
+            MESSENGER_GEOIP_ENABLED=True,
+            MESSENGER_GEOIP_HTTP_FALLBACK=True,
+            MESSENGER_GEOIP_REGION_MAPPING={"Tyumen Oblast": "Тюменская область"},
+        )
+        override.enable()
+        self.addCleanup(override.disable)
+        geoip.reset()
+        self.addCleanup(geoip.reset)
+
+        self.sverdlovsk, _ = Region.objects.get_or_create(name="Свердловская область")
+        self.tyumen, _ = Region.objects.get_or_create(name="Тюменская область")
+
+    def _import(self, rows: str) -> str:
+        csv_path = os.path.join(self.tmp.name, "ranges.csv")
+        with open(csv_path, "w", encoding="utf-8") as f:
+            f.write(rows)
+        out = io.StringIO()
+        call_command("import_geoip_ranges", csv_path, stdout=out)
+        return out.getvalue()
+
+    def test_import_and_local_lookup_without_http(self):
+        output = self._import(
+            "network,region_name\n"
+            "5.0.0.0/24,Свердловская область\n"
+            "5.0.1.0/24,Tyumen Oblast\n"
+            "5.0.2.0/24,Atlantis\n"
+            "2a00::/32,Свердловская область\n"
+            "garbage,Свердловская область\n"
+        )
+        self.assertIn("Диапазонов: 4, пропущено строк: 1, без региона: 1", output)
+        self.assertIn("Atlantis", output)
+
+        with mock.patch("urllib.request.urlopen", side_effect=AssertionError("HTTP")):
+            self.assertEqual(geoip.get_region_from_ip("5.0.0.10"), self.sverdlovsk)
+            self.assertEqual(geoip.get_region_from_ip("5.0.1.10"), self.tyumen)
+            self.assertEqual(geoip.get_region_from_ip("2a00:0:ab::1"), self.sverdlovsk)
+            self.assertIsNone(geoip.get_region_from_ip("5.0.2.10"))
+            self.assertIsNone(geoip.get_region_from_ip("8.8.8.8"))
+            self.assertIsNone(geoip.get_region_from_ip("10.0.0.1"))
+            self.assertIsNone(geoip.get_region_from_ip("not-an-ip"))
+
+    def test_start_end_columns_and_lru(self):
+        self._import(
+            f"ip_from,ip_to,region_id\n"
+            f"{_v4('5.0.0.0')},{_v4('5.0.0.255')},{self.tyumen.id}\n"
+            f"6.0.0.0,6.0.0.255,{self.sverdlovsk.id}\n"
+        )
+        self.assertEqual(geoip.get_region_id_from_ip("5.0.0.1"), self.tyumen.id)
+        self.assertEqual(geoip.get_region_id_from_ip("6.0.0.1"), self.sverdlovsk.id)
+
+        geoip._resolve_region_id.cache_clear()
+        with mock.patch.object(
+            geoip.RangeIndex, "lookup", wraps=geoip.get_index().lookup
+        ) as lookup:
+            for _ in range(3):
+                geoip.get_region_id_from_ip("5.0.0.1")
+        self.assertEqual(lookup.call_count, 1)
+
+    def test_http_fallback_only_without_index(self):
+        response = mock.MagicMock()
+        response.__enter__.return_value.read.return_value = json.dumps(
+            {"regionName": "Tyumen Oblast", "countryCode": "RU"}
+        ).encode()
+        with mock.patch("urllib.request.urlopen", return_value=response) as urlopen:
+            self.assertEqual(geoip.get_region_from_ip("8.8.4.4"), self.tyumen)
+            self.assertEqual(geoip.get_region_from_ip("8.8.4.4"), self.tyumen)
+        self.assertEqual(urlopen.call_count, 1)
+
+        # Ошибка HTTP не кэшируется
+        with mock.patch("urllib.request.urlopen", side_effect=OSError("timeout")) as urlopen:
+            self.assertIsNone(geoip.get_region_from_ip("8.8.8.8"))
+            self.assertIsNone(geoip.get_region_from_ip("8.8.8.8"))
+        self.assertEqual(urlopen.call_count, 2)
+
+        with override_settings(MESSENGER_GEOIP_HTTP_FALLBACK=False):
+            geoip.reset()
+            with mock.patch("urllib.request.urlopen") as urlopen:
+                self.assertIsNone(geoip.get_region_from_ip("1.1.1.1"))
+            urlopen.assert_not_called()
@@ -0,0 +1,165 @@
+"""Путь записи сообщения: переход состояния диалога одним UPDATE и события после коммита."""
+
+from datetime import timedelta
+from io import StringIO
+from unittest import mock
+
+from django.core.management import call_command
+from django.test import TestCase
+from django.utils import timezone
+
+from accounts.models import Branch, User
+from messenger.dispatchers import Events, get_dispatcher
+from messenger.models import Contact, Conversation, Inbox, Message, ReportingEvent
+from messenger.services import record_message
+
+
+class _WritePathBase(TestCase):
+    def setUp(self):
+        self.branch = Branch.objects.create(code="wp", name="Write path")
+        self.operator = User.objects.create_user(
+            username="wp_op", password="pw", role=User.Role.MANAGER, branch=self.branch
+        )
+        self.inbox = Inbox.objects.create(name="WP", branch=self.branch, widget_token="wp_tok")
+        self.contact = Contact.objects.create(name="Клиент")
+        self.conversation = Conversation.objects.create(inbox=self.inbox, contact=self.contact)
+        # Диалог создаётся с waiting_since = now; для проверок IN начинаем с пустого.
+        Conversation.objects.filter(pk=self.conversation.pk).update(waiting_since=None)
+        self.conversation.refresh_from_db()
+
+    def _message(self, direction, conversation=None, **kwargs):
+        if direction == Message.Direction.IN:
+            kwargs.setdefault("sender_contact", self.contact)
+        elif direction == Message.Direction.OUT:
+            kwargs.setdefault("sender_user", self.operator)
+        return Message.objects.create(
+            conversation=conversation or self.conversation,
+            direction=direction,
+            body="text",
+            **kwargs,
+        )
+
+    def _db_state(self):
+        return Conversation.objects.get(pk=self.conversation.pk)
+
+
+class ConversationTransitionTests(_WritePathBase):
+    def test_incoming_sets_waiting_since_once(self):
+        first = self._message(Message.Direction.IN)
+        self._message(Message.Direction.IN)
+        conv = self._db_state()
+        self.assertEqual(conv.waiting_since, first.created_at)
+        self.assertIsNotNone(conv.last_customer_msg_at)
+        self.assertIsNone(conv.last_agent_msg_at)
+        # Загруженный экземпляр согласован с БД
+        self.assertEqual(self.conversation.waiting_since, first.created_at)
+
+    def test_first_human_reply_recorded_once(self):
+        self._message(Message.Direction.IN)
+        reply = self._message(Message.Direction.OUT)
+        self._message(Message.Direction.IN)
+        self._message(Message.Direction.OUT)
+
+        conv = self._db_state()
+        self.assertEqual(conv.first_reply_created_at, reply.created_at)
+        self.assertIsNone(conv.waiting_since)
+        self.assertEqual(self.conversation.first_reply_created_at, reply.created_at)
+
+    def test_first_reply_without_loaded_conversation(self):
+        Message.objects.create(
+            conversation_id=self.conversation.pk,
+            direction=Message.Direction.OUT,
+            body="text",
+            sender_user=self.operator,
+        )
+        self.assertIsNotNone(self._db_state().first_reply_created_at)
+
+    def test_automated_reply_keeps_waiting(self):
+        self._message(Message.Direction.IN)
+        self._message(Message.Direction.OUT, content_attributes={"automation_rule_id": 1})
+        self._message(Message.Direction.OUT, sender_user=None)
+        conv = self._db_state()
+        self.assertIsNotNone(conv.waiting_since)
+        self.assertIsNone(conv.first_reply_created_at)
+        self.assertIsNotNone(conv.last_agent_msg_at)
+
+    def test_internal_note_only_moves_activity(self):
+        past = timezone.now() - timedelta(hours=1)
+        Conversation.objects.filter(pk=self.conversation.pk).update(last_activity_at=past)
+        note = self._message(Message.Direction.INTERNAL, sender_user=self.operator)
+        conv = self._db_state()
+        self.assertEqual(conv.last_activity_at, note.created_at)
+        self.assertIsNone(conv.last_agent_msg_at)
+        self.assertIsNone(conv.first_reply_created_at)
+
+    def test_edit_does_not_touch_conversation(self):
+        msg = self._message(Message.Direction.IN)
+        later = timezone.now() + timedelta(minutes=5)
+        Conversation.objects.filter(pk=self.conversation.pk).update(last_activity_at=later)
+        msg.body = "edited"
+        msg.save()
+        self.assertEqual(self._db_state().last_activity_at, later)
+
+    def test_single_update_per_message(self):
+        self._message(Message.Direction.OUT)
+        # INSERT сообщения + один UPDATE диалога, без exists()-скана сообщений
+        with self.assertNumQueries(2):
+            self._message(Message.Direction.OUT)
+        with self.assertNumQueries(2):
+            self._message(Message.Direction.IN)
+
+
+class DispatchAfterCommitTests(_WritePathBase):
+    def setUp(self):
+        super().setUp()
+        self.events = []
+        listener = mock.Mock(side_effect=lambda name, ts, data: self.events.append(name))
+        dispatcher = get_dispatcher()
+        for name in (Events.MESSAGE_CREATED, Events.FIRST_REPLY_CREATED, Events.REPLY_CREATED):
+            dispatcher.subscribe(name, listener)
+            self.addCleanup(dispatcher.unsubscribe, name, listener)
+
+    def test_events_dispatched_on_commit(self):
+        with self.captureOnCommitCallbacks() as callbacks:
+            self._message(Message.Direction.OUT)
+        self.assertEqual(self.events, [])
+
+        for callback in callbacks:
+            callback()
+        self.assertEqual(
+            self.events,
+            [Events.MESSAGE_CREATED, Events.FIRST_REPLY_CREATED, Events.REPLY_CREATED],
+        )
+
+        self.events.clear()
+        with self.captureOnCommitCallbacks(execute=True):
+            self._message(Message.Direction.OUT)
+        self.assertEqual(self.events, [Events.MESSAGE_CREATED, Events.REPLY_CREATED])
+
+
+class RecordMessageTests(_WritePathBase):
+    def test_first_response_recorded_for_first_reply_only(self):
+        record_message(
+            conversation=self.conversation,
+            direction=Message.Direction.IN,
+            body="Здравствуйте",
+            sender_contact=self.contact,
+        )
+        for _ in range(2):
+            record_message(
+                conversation=self.conversation,
+                direction=Message.Direction.OUT,
+                body="Ответ",
+                sender_user=self.operator,
+            )
+        names = list(ReportingEvent.objects.values_list("name", flat=True))
+        self.assertEqual(names.count(ReportingEvent.EventType.FIRST_RESPONSE), 1)
+        self.assertEqual(names.count(ReportingEvent.EventType.REPLY_TIME), 2)
+
+    def test_benchmark_command(self):
+        out = StringIO()
+        call_command(
+            "benchmark_record_message", "--messages", "20", "--conversations", "2", stdout=out
+        )
+        self.assertIn("msg/s", out.getvalue())
+        self.assertFalse(Inbox.objects.filter(name__startswith="benchmark").exists())
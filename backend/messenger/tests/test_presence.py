@@ -0,0 +1,179 @@
+"""Тесты индекса присутствия операторов (messenger/presence.py)."""
+
+import time
+from unittest import mock
+
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+from rest_framework.test import APIClient
+
+from accounts.models import Branch, User
+from messenger import presence, services
+from messenger.assignment_services.branch_load_balancer import BranchLoadBalancer
+from messenger.models import AgentProfile
+from messenger.online_status import OnlineStatusTracker
+
+
+class _FakeRedis:
+    """Минимальный in-memory Redis: ZSET/HASH-команды, которые использует presence."""
+
+    def __init__(self):
+        self.zsets: dict[str, dict[str, float]] = {}
+        self.hashes: dict[str, dict[str, str]] = {}
+        self.commands: list[str] = []
+
+    def pipeline(self, transaction=True):
+        return _FakePipeline(self)
+
+    @staticmethod
+    def _bound(value, upper):
+        if value in ("-inf", "+inf"):
+            return float(value)
+        if isinstance(value, str) and value.startswith("("):
+            return float(value[1:]) - (1e-9 if upper else -1e-9)
+        return float(value)
+
+    def zadd(self, key, mapping):
+        self.commands.append("zadd")
+        self.zsets.setdefault(key, {}).update(mapping)
+
+    def zrem(self, key, member):
+        self.commands.append("zrem")
+        self.zsets.get(key, {}).pop(member, None)
+
+    def expire(self, key, seconds):
+        self.commands.append("expire")
+
+    def zremrangebyscore(self, key, low, high):
+        self.commands.append("zremrangebyscore")
+        zset = self.zsets.get(key, {})
+        low, high = self._bound(low, False), self._bound(high, True)
+        stale = [m for m, score in zset.items() if low <= score <= high]
+        for member in stale:
+            del zset[member]
+        return len(stale)
+
+    def zrangebyscore(self, key, low, high):
+        self.commands.append("zrangebyscore")
+        low, high = self._bound(low, False), self._bound(high, True)
+        items = sorted(self.zsets.get(key, {}).items(), key=lambda item: item[1])
+        return [member.encode() for member, score in items if low <= score <= high]
+
+    def hset(self, key, field, value):
+        self.commands.append("hset")
+        self.hashes.setdefault(key, {})[field] = value
+
+    def hmget(self, key, fields):
+        self.commands.append("hmget")
+        data = self.hashes.get(key, {})
+        return [data[f.decode()].encode() if f.decode() in data else None for f in fields]
+
+
+class _FakePipeline:
+    def __init__(self, client):
+        self.client = client
+        self.calls = []
+
+    def __getattr__(self, name):
+        def queue(*args, **kwargs):
+            self.calls.append((name, args, kwargs))
+
+        return queue
+
+    def execute(self):
+        return [getattr(self.client, name)(*a, **kw) for name, a, kw in self.calls]
+
+
+@override_settings(MESSENGER_PRESENCE_INDEX="redis")
+class PresenceIndexTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.redis = _FakeRedis()
+        patcher = mock.patch.object(presence, "_redis", return_value=self.redis)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+        self.branch = Branch.objects.create(name="ЕКБ", code="ekb")
+        self.ops = [
+            User.objects.create_user(
+                username=f"pres_op{i}",
+                password="pw",
+                role=User.Role.MANAGER,
+                branch=self.branch,
+            )
+            for i in range(3)
+        ]
+
+    def test_online_is_heartbeat_window_and_status(self):
+        now = time.time()
+        op_fresh, op_away, op_stale = self.ops
+        presence.touch(op_fresh.id, self.branch.id)  # статуса нет — онлайн
+        presence.touch(op_away.id, self.branch.id, AgentProfile.Status.AWAY)
+        self.redis.zadd(
+            presence.BRANCH_KEY.format(branch_id=self.branch.id),
+            {str(op_stale.id): now - presence.STALE_SECONDS - 1},
+        )
+
+        self.redis.commands.clear()
+        self.assertEqual(presence.online_user_ids(self.branch.id), {op_fresh.id})
+        self.assertEqual(self.redis.commands, ["zremrangebyscore", "zrangebyscore", "hmget"])
+        # Протухшая запись вычищена без отдельного прохода
+        key = presence.BRANCH_KEY.format(branch_id=self.branch.id)
+        self.assertNotIn(str(op_stale.id), self.redis.zsets[key])
+
+        presence.leave(op_fresh.id, self.branch.id)
+        self.assertEqual(presence.online_user_ids(self.branch.id), set())
+
+    def test_unavailable_redis_falls_back_to_db(self):
+        with mock.patch.object(presence, "_redis", side_effect=ConnectionError):
+            presence.touch(self.ops[0].id, self.branch.id)
+            self.assertIsNone(presence.online_user_ids(self.branch.id))
+        # Без профиля и без индекса пользователь считается доступным (как раньше)
+        with mock.patch.object(presence, "_redis", side_effect=ConnectionError):
+            self.assertTrue(services.has_online_operators_for_branch(self.branch.id, 0))
+
+    def test_routing_reads_index(self):
+        op_idle, op_online, _ = self.ops
+        # Профиль «онлайн», но heartbeat нет — в индексе оператора нет
+        AgentProfile.objects.create(user=op_idle, status=AgentProfile.Status.ONLINE)
+        self.assertFalse(services.has_online_operators_for_branch(self.branch.id, 0))
+        self.assertIsNone(BranchLoadBalancer().pick(self.branch))
+
+        presence.touch(op_online.id, self.branch.id)
+        self.assertTrue(services.has_online_operators_for_branch(self.branch.id, 0))
+        self.assertEqual(BranchLoadBalancer().pick(self.branch), op_online)
+        self.assertEqual(OnlineStatusTracker.get_online_user_ids(self.branch.id), {op_online.id})
+
+    def test_heartbeat_feeds_index_and_throttles_db(self):
+        op = self.ops[0]
+        client = APIClient()
+        client.force_authenticate(op)
+
+        client.post("/api/messenger/heartbeat/")
+        op.refresh_from_db()
+        self.assertTrue(op.messenger_online)
+        first_seen = op.messenger_last_seen
+        self.assertEqual(presence.online_user_ids(self.branch.id), {op.id})
+
+        client.post("/api/messenger/heartbeat/")
+        op.refresh_from_db()
+        self.assertEqual(op.messenger_last_seen, first_seen)
+
+
+class OnlineStatusTrackerDbTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.branch = Branch.objects.create(name="ТМН", code="tmn")
+
+    def test_available_users_without_per_user_queries(self):
+        for i, status in enumerate(["online", "away", "online", "busy"]):
+            user = User.objects.create_user(
+                username=f"tracker_op{i}", password="pw", branch=self.branch
+            )
+            AgentProfile.objects.create(user=user, status=status)
+
+        with self.assertNumQueries(1):
+            available = OnlineStatusTracker.get_available_users(self.branch.id)
+        self.assertEqual(sorted(available.values()), ["away", "busy", "online", "online"])
+        with self.assertNumQueries(1):
+            self.assertEqual(len(OnlineStatusTracker.get_online_user_ids(self.branch.id)), 2)
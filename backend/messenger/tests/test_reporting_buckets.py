@@ -0,0 +1,156 @@
+"""Часовые агрегаты аналитики (ReportingBucket) и DDSketch-перцентили."""
+
+import random
+from datetime import timedelta
+from io import StringIO
+
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from accounts.models import Branch
+from messenger import reporting
+from messenger.models import Contact, Conversation, Inbox, ReportingBucket, ReportingEvent
+from messenger.sketch import DDSketch
+
+User = get_user_model()
+
+
+def _exact_quantile(values, q):
+    ordered = sorted(values)
+    return ordered[int(q * (len(ordered) - 1))]
+
+
+class DDSketchTests(SimpleTestCase):
+    def test_quantiles_within_relative_accuracy(self):
+        rng = random.Random(42)
+        values = [rng.lognormvariate(4, 1.2) for _ in range(5000)]
+        sketch = DDSketch()
+        for value in values:
+            sketch.add(value)
+        for q in (0.5, 0.9, 0.99):
+            exact = _exact_quantile(values, q)
+            self.assertAlmostEqual(sketch.quantile(q) / exact, 1, delta=0.011)
+
+    def test_merge_equals_single_sketch(self):
+        rng = random.Random(7)
+        values = [rng.uniform(0, 600) for _ in range(1000)]
+        whole = DDSketch()
+        left, right = DDSketch(), DDSketch()
+        for i, value in enumerate(values):
+            whole.add(value)
+            (left if i % 2 else right).add(value)
+        merged = DDSketch.from_dict(left.to_dict()).merge(DDSketch.from_dict(right.to_dict()))
+        self.assertEqual(merged.to_dict(), whole.to_dict())
+
+    def test_zero_values_and_empty(self):
+        self.assertIsNone(DDSketch().quantile(0.5))
+        sketch = DDSketch()
+        for value in (0, 0, 0, 10):
+            sketch.add(value)
+        self.assertEqual(sketch.quantile(0.5), 0.0)
+        self.assertEqual(sketch.quantile(1), 10)
+
+
+class _BucketBase(TestCase):
+    def setUp(self):
+        self.branch = Branch.objects.create(name="Бакеты", code="buckets")
+        self.inbox = Inbox.objects.create(
+            name="Сайт", widget_token="bucket-token", branch=self.branch
+        )
+        self.other_inbox = Inbox.objects.create(
+            name="Лендинг", widget_token="bucket-token-2", branch=self.branch
+        )
+        self.op = User.objects.create_user(
+            "bucket_op", password="pw", role=User.Role.MANAGER, branch=self.branch
+        )
+        self.contact = Contact.objects.create(name="Клиент")
+
+    def _conversation(self, inbox=None):
+        return Conversation.objects.create(
+            inbox=inbox or self.inbox, contact=self.contact, branch=self.branch
+        )
+
+    def _first_response(self, seconds, *, inbox=None, user=None):
+        conversation = self._conversation(inbox)
+        return reporting._create_event(
+            ReportingEvent.EventType.FIRST_RESPONSE,
+            seconds,
+            conversation=conversation,
+            inbox=conversation.inbox,
+            user=user or self.op,
+        )
+
+
+class BucketTests(_BucketBase):
+    def test_record_appends_bucket_and_compaction_merges(self):
+        for seconds in (10, 20, 30, 40, 600):
+            self._first_response(seconds)
+        self.assertEqual(ReportingBucket.objects.count(), 5)
+        before = reporting.aggregate_buckets(timezone.now() - timedelta(hours=1))
+
+        self.assertEqual(reporting.compact_buckets(), 4)
+        self.assertEqual(ReportingBucket.objects.count(), 1)
+        after = reporting.aggregate_buckets(timezone.now() - timedelta(hours=1))
+
+        key = (ReportingEvent.EventType.FIRST_RESPONSE,)
+        self.assertEqual(after[key].count, 5)
+        self.assertEqual(after[key].total, 700)
+        self.assertEqual(after[key].sketch.to_dict(), before[key].sketch.to_dict())
+        self.assertAlmostEqual(after[key].quantile(0.5), 30, delta=0.3)
+
+    def test_record_opened_goes_through_buckets(self):
+        reporting.record_conversation_opened(self._conversation())
+        bucket = ReportingBucket.objects.get()
+        self.assertEqual(bucket.name, ReportingEvent.EventType.CONVERSATION_OPENED)
+        self.assertEqual(bucket.inbox, self.inbox)
+
+    def test_rebuild_from_events(self):
+        for seconds in (5, 15):
+            self._first_response(seconds)
+        self._first_response(100, inbox=self.other_inbox)
+        old = ReportingEvent.objects.order_by("id").first()
+        ReportingEvent.objects.filter(pk=old.pk).update(
+            created_at=timezone.now() - timedelta(days=2)
+        )
+        ReportingBucket.objects.all().delete()
+
+        call_command("rebuild_reporting_buckets", "--days", "7", stdout=StringIO())
+
+        self.assertEqual(ReportingBucket.objects.count(), 3)
+        by_inbox = reporting.aggregate_buckets(timezone.now() - timedelta(days=7), by=("inbox_id",))
+        key = ReportingEvent.EventType.FIRST_RESPONSE
+        self.assertEqual(by_inbox[(key, self.inbox.id)].count, 2)
+        self.assertEqual(by_inbox[(key, self.other_inbox.id)].total, 100)
+        recent = reporting.aggregate_buckets(timezone.now() - timedelta(days=1))
+        self.assertEqual(recent[(key,)].count, 2)
+
+
+@override_settings(MESSENGER_ENABLED=True)
+class OverviewTests(_BucketBase):
+    def test_overview_reports_percentiles_per_inbox_and_operator(self):
+        other_op = User.objects.create_user("bucket_op2", password="pw", role=User.Role.MANAGER)
+        for seconds in (10, 20, 30, 40, 50, 60, 70, 80, 90, 1000):
+            self._first_response(seconds)
+        self._first_response(5, inbox=self.other_inbox, user=other_op)
+        admin = User.objects.create_user(
+            "bucket_admin", password="pw", role=User.Role.ADMIN, is_superuser=True
+        )
+        client = APIClient()
+        client.force_authenticate(admin)
+
+        resp = client.get("/api/messenger-reports/overview/", {"days": 7})
+
+        self.assertEqual(resp.status_code, 200)
+        data = resp.json()
+        self.assertEqual(data["first_response_time"]["count"], 11)
+        self.assertAlmostEqual(data["first_response_time"]["p50_seconds"], 50, delta=0.6)
+        self.assertAlmostEqual(data["first_response_time"]["p90_seconds"], 90, delta=1)
+        self.assertAlmostEqual(data["avg_first_response_time_seconds"], 1455 / 11, delta=0.1)
+        inboxes = {row["inbox_id"]: row for row in data["first_response_by_inbox"]}
+        self.assertEqual(inboxes[self.inbox.id]["count"], 10)
+        self.assertEqual(inboxes[self.other_inbox.id]["inbox_name"], "Лендинг")
+        operators = {row["user_id"]: row for row in data["first_response_by_operator"]}
+        self.assertAlmostEqual(operators[other_op.id]["p90_seconds"], 5, delta=0.1)
@@ -0,0 +1,134 @@
+"""Тесты push-режима SSE: публикация пробуждений и стрим под ASGI (messenger.sse)."""
+
+import asyncio
+
+from asgiref.sync import async_to_sync, sync_to_async
+from channels.layers import get_channel_layer
+from django.db.models.signals import post_save
+from django.test import TestCase, override_settings
+
+from accounts.models import Branch, User
+from messenger import sse
+from messenger.models import Contact, Conversation, Inbox, Message
+from messenger.selectors import visible_stream_groups
+from messenger.signals import auto_assign_new_conversation
+from messenger.ws_notify import (
+    SSE_GROUP_ALL,
+    sse_group_branch,
+    sse_group_conversation,
+    sse_group_operator,
+)
+
+IN_MEMORY_LAYERS = {"default": {"BACKEND": "channels.layers.InMemoryChannelLayer"}}
+
+
+@override_settings(CHANNEL_LAYERS=IN_MEMORY_LAYERS, MESSENGER_ENABLED=True)
+class SsePushTests(TestCase):
+    def setUp(self):
+        post_save.disconnect(auto_assign_new_conversation, sender=Conversation)
+        self.addCleanup(post_save.connect, auto_assign_new_conversation, sender=Conversation)
+
+        self.branch = Branch.objects.create(code="sse", name="SSE")
+        self.manager = User.objects.create_user(
+            username="sse_mgr", password="pass12345", role=User.Role.MANAGER, branch=self.branch
+        )
+        self.inbox = Inbox.objects.create(name="SSE", branch=self.branch, widget_token="sse_tok")
+        self.contact = Contact.objects.create(name="Гость", email="guest@example.com")
+        self.conversation = Conversation.objects.create(
+            inbox=self.inbox,
+            contact=self.contact,
+            assignee=self.manager,
+            status=Conversation.Status.OPEN,
+        )
+
+    def _subscribe(self, group):
+        layer = get_channel_layer()
+        channel = async_to_sync(layer.new_channel)("test")
+        async_to_sync(layer.group_add)(group, channel)
+        return layer, channel
+
+    def test_message_save_publishes_wakeup_after_commit(self):
+        subscriptions = [
+            self._subscribe(group)
+            for group in (
+                sse_group_conversation(self.conversation.id),
+                sse_group_branch(self.branch.id),
+                sse_group_operator(self.manager.id),
+                SSE_GROUP_ALL,
+            )
+        ]
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Message.objects.create(
+                conversation=self.conversation,
+                direction=Message.Direction.IN,
+                body="Здравствуйте",
+                sender_contact=self.contact,
+            )
+
+        for layer, channel in subscriptions:
+            event = async_to_sync(layer.receive)(channel)
+            self.assertEqual(event["type"], "stream.wakeup")
+            self.assertEqual(event["conversation_id"], self.conversation.id)
+
+    def test_visible_stream_groups_follow_visibility_rules(self):
+        admin = User.objects.create_superuser(username="sse_admin", password="pass12345")
+        self_scoped = User.objects.create_user(
+            username="sse_self",
+            password="pass12345",
+            role=User.Role.MANAGER,
+            branch=self.branch,
+            data_scope=User.DataScope.SELF,
+        )
+
+        self.assertEqual(
+            visible_stream_groups(self.manager),
+            [sse_group_operator(self.manager.id), sse_group_branch(self.branch.id)],
+        )
+        self.assertEqual(visible_stream_groups(self_scoped), [sse_group_operator(self_scoped.id)])
+        self.assertIn(SSE_GROUP_ALL, visible_stream_groups(admin))
+
+    def test_wsgi_request_falls_back_to_poll_mode(self):
+        self.client.force_login(self.manager)
+        resp = self.client.get(f"/api/conversations/{self.conversation.id}/stream/")
+        self.assertEqual(resp.status_code, 200)
+        self.assertFalse(resp.is_async)
+
+    async def test_asgi_stream_waits_for_wakeup_instead_of_polling(self):
+        await self.async_client.aforce_login(self.manager)
+        resp = await self.async_client.get(f"/api/conversations/{self.conversation.id}/stream/")
+        self.assertEqual(resp.status_code, 200)
+        self.assertTrue(resp.is_async)
+
+        chunks = aiter(resp.streaming_content)
+
+        async def read_until(marker):
+            while True:
+                chunk = await asyncio.wait_for(anext(chunks), timeout=3)
+                chunk = chunk.decode() if isinstance(chunk, bytes) else chunk
+                if marker in chunk:
+                    return chunk
+
+        await read_until("event: ready")
+        # Начальный снимок: состояние диалога.
+        await read_until("event: conversation.updated")
+
+        msg = await sync_to_async(Message.objects.create)(
+            conversation=self.conversation,
+            direction=Message.Direction.IN,
+            body="Новое",
+            sender_contact=self.contact,
+        )
+        await get_channel_layer().group_send(
+            sse_group_conversation(self.conversation.id),
+            {"type": "stream.wakeup", "kind": "message", "conversation_id": msg.conversation_id},
+        )
+
+        chunk = await read_until("event: message.created")
+        self.assertIn(f'"id": {msg.id}', chunk)
+
+    def test_wants_distinguishes_idle_ticks(self):
+        self.assertFalse(sse.wants(None, "message"))
+        self.assertTrue(sse.wants(sse.POLL_EVENT, "message"))
+        self.assertTrue(sse.wants({"kind": "message"}, "message"))
+        self.assertFalse(sse.wants({"kind": "typing"}, "message"))
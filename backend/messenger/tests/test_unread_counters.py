@@ -0,0 +1,116 @@
+"""Инкрементальные счётчики непрочитанных (messenger/unread.py)."""
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+from rest_framework.test import APIClient
+
+from accounts.models import Branch
+from messenger import selectors, unread
+from messenger.models import Contact, Conversation, Inbox, Message
+from messenger.tasks import reconcile_unread_counters
+
+User = get_user_model()
+
+
+@override_settings(MESSENGER_ENABLED=True)
+class UnreadCounterTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.branch = Branch.objects.create(name="Непрочитанные", code="unread")
+        self.op = User.objects.create_user(
+            "unread_op", password="pw", role=User.Role.MANAGER, branch=self.branch
+        )
+        self.other = User.objects.create_user(
+            "unread_other", password="pw", role=User.Role.MANAGER, branch=self.branch
+        )
+        self.inbox = Inbox.objects.create(
+            name="Сайт", widget_token="unread-token", branch=self.branch
+        )
+        self.contact = Contact.objects.create(name="Клиент")
+        self.conversation = Conversation.objects.create(
+            inbox=self.inbox, contact=self.contact, assignee=self.op
+        )
+
+    def _incoming(self, count=1, conversation=None):
+        with self.captureOnCommitCallbacks(execute=True):
+            for _ in range(count):
+                Message.objects.create(
+                    conversation=conversation or self.conversation,
+                    direction=Message.Direction.IN,
+                    body="Вопрос",
+                    sender_contact=self.contact,
+                )
+
+    def _total(self, user=None):
+        return selectors.get_messenger_unread_count(user or self.op)
+
+    def test_incoming_increments_conversation_and_total(self):
+        self.assertEqual(self._total(), 0)
+        self._incoming(3)
+        with self.captureOnCommitCallbacks(execute=True):
+            Message.objects.create(
+                conversation=self.conversation,
+                direction=Message.Direction.OUT,
+                body="Ответ",
+                sender_user=self.op,
+            )
+        self.conversation.refresh_from_db()
+        self.assertEqual(self.conversation.assignee_unread_count, 3)
+        with self.assertNumQueries(0):
+            self.assertEqual(self._total(), 3)
+
+    def test_read_resets_counter(self):
+        self._incoming(2)
+        self.assertEqual(self._total(), 2)
+        client = APIClient()
+        client.force_authenticate(self.op)
+        with self.captureOnCommitCallbacks(execute=True):
+            resp = client.post(f"/api/conversations/{self.conversation.id}/read/")
+        self.assertEqual(resp.status_code, 200)
+        self.conversation.refresh_from_db()
+        self.assertEqual(self.conversation.assignee_unread_count, 0)
+        self.assertIsNotNone(self.conversation.assignee_last_read_at)
+        self.assertEqual(self._total(), 0)
+        self.assertEqual(client.get("/api/conversations/unread-count/").json()["unread_count"], 0)
+
+    def test_reassign_moves_counter_between_operators(self):
+        self.assertEqual((self._total(), self._total(self.other)), (0, 0))
+        self._incoming(2)
+        with self.captureOnCommitCallbacks(execute=True):
+            conversation = Conversation.objects.get(pk=self.conversation.pk)
+            conversation.assignee = self.other
+            conversation.save()
+        self.assertEqual((self._total(), self._total(self.other)), (0, 2))
+
+    def test_stale_full_save_keeps_counter(self):
+        stale = Conversation.objects.get(pk=self.conversation.pk)
+        self._incoming(2)
+        stale.status = Conversation.Status.PENDING
+        stale.save()
+        self.conversation.refresh_from_db()
+        self.assertEqual(self.conversation.assignee_unread_count, 2)
+
+    def test_list_annotation_uses_counter(self):
+        self._incoming(2)
+        client = APIClient()
+        client.force_authenticate(self.other)
+        Conversation.objects.filter(pk=self.conversation.pk).update(assignee=self.other)
+        rows = client.get("/api/conversations/").json()
+        row = next(r for r in rows if r["id"] == self.conversation.id)
+        self.assertEqual(row["unread_count"], 2)
+
+    def test_reconcile_repairs_drift(self):
+        self._incoming(3)
+        Message.objects.filter(conversation=self.conversation).first().delete()
+        Conversation.objects.filter(pk=self.conversation.pk).update(assignee=self.other)
+        unread.invalidate_totals([self.op.id])
+
+        result = reconcile_unread_counters()
+
+        self.assertEqual(result["repaired"], 1)
+        self.conversation.refresh_from_db()
+        self.assertEqual(self.conversation.assignee_unread_count, 2)
+        with self.assertNumQueries(0):
+            self.assertEqual(self._total(self.other), 2)
+            self.assertEqual(self._total(), 0)
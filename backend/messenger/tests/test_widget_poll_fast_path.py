@@ -0,0 +1,112 @@
+"""Быстрый путь /api/widget/poll/ без БД (messenger/widget_cursor.py)."""
+
+from unittest import mock
+
+from django.core.cache import cache
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APIClient
+
+from accounts.models import Branch, User
+from messenger import sse
+from messenger.models import Conversation, Inbox, Message
+from messenger.throttles import WidgetPollThrottle
+
+
+@override_settings(MESSENGER_ENABLED=True)
+class WidgetPollFastPathTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        throttle_interval = mock.patch.object(WidgetPollThrottle, "MIN_INTERVAL_SECONDS", 0)
+        throttle_interval.start()
+        self.addCleanup(throttle_interval.stop)
+        self.branch = Branch.objects.create(code="fast_poll", name="Fast poll")
+        self.inbox = Inbox.objects.create(
+            name="Site", branch=self.branch, widget_token="fast_poll_token", is_active=True
+        )
+        self.operator = User.objects.create_user(username="op_fast_poll", password="x")
+        self.client = APIClient()
+        response = self.client.post(
+            "/api/widget/bootstrap/",
+            {"widget_token": "fast_poll_token", "contact_external_id": "visitor_fast"},
+        )
+        self.session_token = response.data["widget_session_token"]
+        self.conversation = Conversation.objects.get(contact__external_id="visitor_fast")
+
+    def tearDown(self):
+        cache.clear()
+
+    def _poll(self, since_id=None):
+        params = {"widget_token": "fast_poll_token", "widget_session_token": self.session_token}
+        if since_id is not None:
+            params["since_id"] = since_id
+        response = self.client.get("/api/widget/poll/", params)
+        self.assertEqual(response.status_code, 200)
+        return response.data
+
+    def _reply(self, body="Ответ"):
+        return Message.objects.create(
+            conversation=self.conversation,
+            direction=Message.Direction.OUT,
+            body=body,
+            sender_user=self.operator,
+        )
+
+    def test_up_to_date_poll_skips_messenger_tables(self):
+        reply = self._reply()
+        self.assertEqual([m["id"] for m in self._poll()["messages"]], [reply.id])
+
+        with CaptureQueriesContext(connection) as ctx:
+            data = self._poll(since_id=reply.id)
+        self.assertEqual([q["sql"] for q in ctx.captured_queries if "messenger_" in q["sql"]], [])
+        self.assertEqual(data["messages"], [])
+        self.assertFalse(data["rating_requested"])
+
+    def test_new_reply_breaks_fast_path(self):
+        first = self._reply("Первый")
+        self._poll(since_id=0)
+        self._poll(since_id=first.id)
+
+        second = self._reply("Второй")
+        data = self._poll(since_id=first.id)
+        self.assertEqual([m["id"] for m in data["messages"]], [second.id])
+
+    def test_stale_since_id_falls_back_to_full_poll(self):
+        first = self._reply("Первый")
+        second = self._reply("Второй")
+        self._poll(since_id=second.id)
+
+        data = self._poll(since_id=first.id)
+        self.assertEqual([m["id"] for m in data["messages"]], [second.id])
+
+    def test_status_change_and_operator_read_are_seen(self):
+        self.inbox.settings = {"rating": {"enabled": True, "type": "stars", "max_score": 5}}
+        self.inbox.save()
+        incoming = Message.objects.create(
+            conversation=self.conversation,
+            direction=Message.Direction.IN,
+            body="Вопрос",
+            sender_contact=self.conversation.contact,
+        )
+        self._poll()
+        self.assertIsNone(self._poll()["operator_read_up_to"])
+
+        Message.objects.filter(pk=incoming.pk).update(read_at=incoming.created_at)
+        sse.publish_conversation_change(self.conversation.pk, kind="read")
+        self.assertEqual(self._poll()["operator_read_up_to"], incoming.id)
+
+        self.conversation.status = Conversation.Status.RESOLVED
+        self.conversation.save()
+        self.assertTrue(self._poll()["rating_requested"])
+
+    def test_deactivated_inbox_is_not_served_from_cache(self):
+        self._poll()
+        self.inbox.is_active = False
+        self.inbox.save()
+
+        response = self.client.get(
+            "/api/widget/poll/",
+            {"widget_token": "fast_poll_token", "widget_session_token": self.session_token},
+        )
+        self.assertEqual(response.status_code, 404)
@@ -4,6 +4,9 @@
 Ключи:
 - messenger:typing:{conversation_id}:operator — оператор печатает (TTL 8 с)
 - messenger:typing:{conversation_id}:contact — контакт (виджет) печатает (TTL 8 с)
+
+Начало набора будит SSE-стримы диалога (ws_notify.notify_stream_typing);
+окончание они видят сами по истечению TTL на холостом тике.
 """
 
 from django.core.cache import cache
@@ -19,12 +22,22 @@ def _key_contact(conversation_id: int) -> str:
     return f"messenger:typing:{conversation_id}:contact"
 
 
+def _set_typing(key: str, conversation_id: int) -> None:
+    # cache.add → True только если ключа не было: будим стримы лишь на старте набора.
+    if cache.add(key, 1, timeout=TYPING_TTL):
+        from .ws_notify import notify_stream_typing
+
+        notify_stream_typing(conversation_id)
+    else:
+        cache.set(key, 1, timeout=TYPING_TTL)
+
+
 def set_operator_typing(conversation_id: int) -> None:
-    cache.set(_key_operator(conversation_id), 1, timeout=TYPING_TTL)
+    _set_typing(_key_operator(conversation_id), conversation_id)
 
 
 def set_contact_typing(conversation_id: int) -> None:
-    cache.set(_key_contact(conversation_id), 1, timeout=TYPING_TTL)
+    _set_typing(_key_contact(conversation_id), conversation_id)
 
 
 def get_typing_status(conversation_id: int) -> dict:
@@ -0,0 +1,165 @@
+"""
+Счётчики непрочитанных входящих сообщений для операторов.
+
+- Conversation.assignee_unread_count — непрочитанные IN по диалогу: +1 тем же
+  UPDATE, что и переход состояния в Message.save(); сброс в mark_read().
+- Итог по оператору — ключ кэша (Redis) messenger:unread_total:{user_id}:
+  INCR/DECR после коммита, при смене assignee счётчик диалога переносится.
+  Отсутствующий ключ лениво пересчитывается SUM по диалогам оператора.
+- reconcile_unread() (Celery beat) сверяет счётчики диалогов с сообщениями
+  и перезаписывает итоги — чинит дрейф (удаление сообщений, гонки, update()).
+
+Непрочитанное = входящее сообщение новее assignee_last_read_at
+(или любое входящее, если диалог ещё не открывали).
+"""
+
+from __future__ import annotations
+
+import logging
+from collections.abc import Iterable
+from datetime import datetime
+
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Count, F, OuterRef, Q, Subquery, Sum
+from django.db.models.functions import Coalesce
+
+from .models import Conversation, Message
+
+logger = logging.getLogger("messenger.unread")
+
+TOTAL_KEY = "messenger:unread_total:{user_id}"
+# Итоги неактивных операторов истекают сами; активных — обновляет reconcile
+TOTAL_TIMEOUT = 24 * 3600
+
+
+def _key(user_id: int) -> str:
+    return TOTAL_KEY.format(user_id=user_id)
+
+
+def _adjust_now(user_id: int | None, delta: int) -> None:
+    if not user_id or not delta:
+        return
+    key = _key(user_id)
+    try:
+        value = cache.incr(key, delta)
+    except ValueError:
+        return  # Ключа нет — пересчитается при чтении
+    if value < 0:
+        cache.delete(key)
+
+
+def adjust_total(user_id: int | None, delta: int) -> None:
+    """Сдвинуть итог оператора после коммита текущей транзакции."""
+    if user_id and delta:
+        transaction.on_commit(lambda: _adjust_now(user_id, delta))
+
+
+def transfer(count: int, old_assignee_id: int | None, new_assignee_id: int | None) -> None:
+    """Перенести непрочитанные диалога при смене assignee."""
+    if old_assignee_id == new_assignee_id or not count:
+        return
+    adjust_total(old_assignee_id, -count)
+    adjust_total(new_assignee_id, count)
+
+
+def invalidate_totals(user_ids: Iterable[int | None]) -> None:
+    """Сбросить итоги операторов (после массового update() по диалогам)."""
+    keys = [_key(user_id) for user_id in set(user_ids) if user_id]
+    if keys:
+        transaction.on_commit(lambda: cache.delete_many(keys))
+
+
+def get_total(user_id: int) -> int:
+    """Непрочитанные входящие по всем диалогам оператора — O(1) из кэша."""
+    key = _key(user_id)
+    total = cache.get(key)
+    if total is None:
+        total = Conversation.objects.filter(assignee_id=user_id).aggregate(
+            total=Coalesce(Sum("assignee_unread_count"), 0)
+        )["total"]
+        cache.add(key, total, timeout=TOTAL_TIMEOUT)
+    return max(int(total), 0)
+
+
+def mark_read(conversation: Conversation, read_at: datetime) -> int:
+    """
+    Диалог прочитан оператором: обнулить счётчик и сдвинуть итог assignee.
+
+    assignee_last_read_at пишется тем же UPDATE — иначе троттлинг
+    touch_assignee_last_seen разводил бы счётчик и reconcile. Возвращает
+    число сообщений, отмеченных прочитанными.
+    """
+    with transaction.atomic():
+        row = (
+            Conversation.objects.select_for_update()
+            .filter(pk=conversation.pk)
+            .values_list("assignee_id", "assignee_unread_count")
+            .first()
+        )
+        if row is None:
+            return 0
+        assignee_id, count = row
+        Conversation.objects.filter(pk=conversation.pk).update(
+            assignee_unread_count=0, assignee_last_read_at=read_at
+        )
+        adjust_total(assignee_id, -count)
+    conversation.assignee_unread_count = 0
+    conversation.assignee_last_read_at = read_at
+    return count
+
+
+def expected_unread_expression():
+    """Подзапрос: фактическое число непрочитанных IN по диалогу."""
+    unread = (
+        Message.objects.filter(conversation=OuterRef("pk"), direction=Message.Direction.IN)
+        .filter(
+            Q(conversation__assignee_last_read_at__isnull=True)
+            | Q(created_at__gt=F("conversation__assignee_last_read_at"))
+        )
+        .order_by()
+        .values("conversation")
+        .annotate(n=Count("id"))
+        .values("n")
+    )
+    return Coalesce(Subquery(unread), 0)
+
+
+def reconcile_unread(since: datetime | None = None) -> dict[str, int]:
+    """
+    Сверить счётчики с сообщениями и перезаписать итоги операторов.
+
+    Проверяются диалоги с активностью после since и все с ненулевым
+    счётчиком; since=None — все диалоги.
+    Запись условная (по прочитанному значению), чтобы не затереть
+    инкремент, пришедший между сверкой и записью.
+    """
+    scope = Conversation.objects.all()
+    if since is not None:
+        scope = scope.filter(Q(last_activity_at__gte=since) | Q(assignee_unread_count__gt=0))
+    stale = (
+        scope.annotate(expected=expected_unread_expression())
+        .exclude(assignee_unread_count=F("expected"))
+        .values_list("pk", "assignee_unread_count", "expected")
+    )
+    repaired = 0
+    for pk, current, expected in stale.iterator():
+        repaired += Conversation.objects.filter(pk=pk, assignee_unread_count=current).update(
+            assignee_unread_count=expected
+        )
+
+    totals = {
+        _key(row["assignee_id"]): row["total"] or 0
+        for row in Conversation.objects.filter(assignee__isnull=False)
+        .values("assignee_id")
+        .annotate(total=Sum("assignee_unread_count"))
+    }
+    # Операторам без назначенных диалогов — явный 0 вместо устаревшего итога
+    from accounts.models import User
+
+    for user_id in User.objects.filter(is_active=True).values_list("id", flat=True):
+        totals.setdefault(_key(user_id), 0)
+    cache.set_many(totals, timeout=TOTAL_TIMEOUT)
+    if repaired:
+        logger.warning("Unread counters repaired for %d conversations", repaired)
+    return {"repaired": repaired, "assignees": len(totals)}
@@ -113,6 +113,8 @@ class WidgetSession:
     contact_id: str
     bound_ip: str = ""
     created_at: str = ""
+    # Снимок последнего полного опроса (messenger.widget_cursor)
+    poll_cursor: dict | None = None
 
 
 def _widget_session_cache_key(token: str) -> str:
@@ -163,6 +165,28 @@ def get_widget_session(token: str, client_ip: str = "") -> WidgetSession | None:
     return WidgetSession(token=token, **data)
 
 
+def set_widget_poll_cursor(session: WidgetSession, cursor: dict) -> None:
+    """
+    Сохранить курсор опроса в сессии, не продлевая её: TTL — остаток от
+    WIDGET_SESSION_TTL_SECONDS с момента создания.
+    """
+    timeout = WIDGET_SESSION_TTL_SECONDS
+    if session.created_at:
+        timeout -= int(_time.time()) - int(session.created_at)
+        if timeout <= 0:
+            return
+    data = {
+        "inbox_id": session.inbox_id,
+        "conversation_id": session.conversation_id,
+        "contact_id": session.contact_id,
+        "bound_ip": session.bound_ip,
+        "created_at": session.created_at,
+        "poll_cursor": cursor,
+    }
+    safe_cache_set(_widget_session_cache_key(session.token), data, timeout=timeout)
+    session.poll_cursor = cursor
+
+
 def delete_widget_session(token: str) -> None:
     if not token:
         return
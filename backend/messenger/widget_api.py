@@ -16,7 +16,7 @@ import time
 
 from django.conf import settings
 from django.core.exceptions import ValidationError
-from django.http import FileResponse, Http404, StreamingHttpResponse
+from django.http import FileResponse, Http404
 from django.utils import timezone as django_timezone
 from rest_framework import status
 from rest_framework.decorators import (
@@ -30,7 +30,7 @@ from rest_framework.exceptions import ValidationError as DRFValidationError
 from rest_framework.permissions import AllowAny
 from rest_framework.response import Response
 
-from . import models, serializers, services
+from . import models, serializers, services, sse, widget_cursor
 from .automation import dispatch_event, run_automation_for_incoming_message
 from .integrations import notify_conversation_created, notify_message
 from .logging_utils import safe_log_widget_error, widget_logger
@@ -55,6 +55,10 @@ from .utils import (
     validate_upload_safety,
     verify_math_captcha,
 )
+from .ws_notify import sse_group_conversation
+
+# Лимит сообщений за один опрос /api/widget/poll/
+POLL_MESSAGES_LIMIT = 50
 
 
 def _add_widget_cors_headers(request, response):
@@ -743,6 +747,24 @@ def widget_offhours_request(request):
     return _add_widget_cors_headers(request, resp)
 
 
+def _rating_prompt(inbox, conversation_status: str, rated: bool) -> tuple[bool, str, int]:
+    """(rating_requested, rating_type, rating_max_score) для ответа виджету."""
+    rating_cfg = (inbox.settings or {}).get("rating") or {}
+    if (
+        rating_cfg.get("enabled")
+        and conversation_status
+        in (
+            models.Conversation.Status.RESOLVED,
+            models.Conversation.Status.CLOSED,
+        )
+        and not rated
+    ):
+        rating_type = rating_cfg.get("type", "stars")
+        rating_max_score = int(rating_cfg.get("max_score", 5)) if rating_type == "stars" else 10
+        return True, rating_type, rating_max_score
+    return False, "stars", 5
+
+
 def _get_inbox_by_widget_token(widget_token):
     """Возвращает Inbox по widget_token или None."""
     if not widget_token:
@@ -1141,10 +1163,9 @@ def widget_poll(request):
         )
 
     try:
-        # Валидировать widget_token → inbox
-        try:
-            inbox = models.Inbox.objects.get(widget_token=widget_token, is_active=True)
-        except models.Inbox.DoesNotExist:
+        # Валидировать widget_token → inbox (конфигурация из кэша)
+        inbox = widget_cursor.get_inbox(widget_token)
+        if inbox is None:
             safe_log_widget_error(
                 widget_logger,
                 logging.WARNING,
@@ -1190,6 +1211,36 @@ def widget_poll(request):
                 status=status.HTTP_403_FORBIDDEN,
             )
 
+        from . import services as messenger_services
+        from .typing import get_typing_status
+
+        # Быстрый путь: диалог не менялся с прошлого полного опроса, а у клиента
+        # уже есть все исходящие — отвечаем из курсора сессии, без БД.
+        cursor = widget_cursor.unchanged(session, since_id)
+        if cursor is not None:
+            messenger_services.touch_contact_last_seen(
+                models.Conversation(pk=session.conversation_id), session.contact_id
+            )
+            rating_requested, rating_type, rating_max_score = _rating_prompt(
+                inbox, cursor["status"], cursor["rated"]
+            )
+            return Response(
+                {
+                    "messages": [],
+                    "operator_typing": get_typing_status(session.conversation_id)[
+                        "operator_typing"
+                    ],
+                    "operator_read_up_to": cursor["read_up_to"],
+                    "rating_requested": rating_requested,
+                    "rating_type": rating_type,
+                    "rating_max_score": rating_max_score,
+                },
+                status=status.HTTP_200_OK,
+            )
+        # Номер изменения — до чтения БД: изменение во время опроса сдвинет его,
+        # и следующий опрос снова пойдёт полным путём.
+        seq = widget_cursor.current_seq(session.conversation_id, create=True)
+
         # Получить conversation
         try:
             conversation = models.Conversation.objects.get(id=session.conversation_id, inbox=inbox)
@@ -1209,8 +1260,6 @@ def widget_poll(request):
             )
 
         # Обновить last_seen контакта с троттлингом (по образцу Chatwoot)
-        from . import services as messenger_services
-
         messenger_services.touch_contact_last_seen(conversation, session.contact_id)
 
         # Получить новые сообщения (только OUT, без INTERNAL и без приватных заметок)
@@ -1219,6 +1268,7 @@ def widget_poll(request):
             is_private=False,
         ).order_by("created_at", "id")
 
+        since_id_int = 0
         if since_id:
             try:
                 since_id_int = int(since_id)
@@ -1229,7 +1279,7 @@ def widget_poll(request):
                     status=status.HTTP_400_BAD_REQUEST,
                 )
 
-        messages = list(messages_qs[:50])  # Лимит 50 сообщений за запрос
+        messages = list(messages_qs[:POLL_MESSAGES_LIMIT])
 
         # Помечаем исходящие сообщения как доставленные при первой выдаче в виджет
         _mark_out_messages_delivered(messages)
@@ -1248,27 +1298,12 @@ def widget_poll(request):
             )
             result.append(payload)
 
-        from .typing import get_typing_status
-
         typing_status = get_typing_status(conversation.id)
 
         # Оценка: запросить у контакта, если диалог закрыт/решён и ещё не оценен
-        rating_requested = False
-        rating_type = "stars"
-        rating_max_score = 5
-        rating_cfg = (inbox.settings or {}).get("rating") or {}
-        if (
-            rating_cfg.get("enabled")
-            and conversation.status
-            in (
-                models.Conversation.Status.RESOLVED,
-                models.Conversation.Status.CLOSED,
-            )
-            and conversation.rating_score is None
-        ):
-            rating_requested = True
-            rating_type = rating_cfg.get("type", "stars")
-            rating_max_score = int(rating_cfg.get("max_score", 5)) if rating_type == "stars" else 10
+        rating_requested, rating_type, rating_max_score = _rating_prompt(
+            inbox, conversation.status, conversation.rating_score is not None
+        )
 
         # Последний IN-месседж, прочитанный оператором (для чекмарков в виджете)
         operator_read_up_to = (
@@ -1280,6 +1315,17 @@ def widget_poll(request):
             .first()
         )
 
+        # Упёрлись в лимит — у клиента ещё не всё, курсор не запоминаем
+        if len(messages) < POLL_MESSAGES_LIMIT:
+            widget_cursor.remember(
+                session,
+                seq=seq,
+                last_out_id=max((m.id for m in messages), default=since_id_int),
+                status=conversation.status,
+                rated=conversation.rating_score is not None,
+                read_up_to=operator_read_up_to,
+            )
+
         return Response(
             {
                 "messages": result,
@@ -1328,6 +1374,7 @@ def widget_stream(request):
 
     SSE-стрим обновлений для виджета (замена частого poll).
     Работает короткими соединениями (≈25 секунд), затем клиент переподключается.
+    Под ASGI ждёт пробуждений из channel layer вместо опроса БД (messenger.sse).
 
     Используется обычный Django view вместо DRF, чтобы избежать проблем с content negotiation для text/event-stream.
     """
@@ -1396,127 +1443,117 @@ def widget_stream(request):
     from .typing import get_typing_status
 
     def _rating_payload() -> tuple[bool, str, int]:
-        rating_requested = False
-        rating_type = "stars"
-        rating_max_score = 5
-        rating_cfg = (inbox.settings or {}).get("rating") or {}
-        if (
-            rating_cfg.get("enabled")
-            and conversation.status
-            in (
-                models.Conversation.Status.RESOLVED,
-                models.Conversation.Status.CLOSED,
-            )
-            and conversation.rating_score is None
-        ):
-            rating_requested = True
-            rating_type = rating_cfg.get("type", "stars")
-            rating_max_score = int(rating_cfg.get("max_score", 5)) if rating_type == "stars" else 10
-        return rating_requested, rating_type, rating_max_score
-
-    def event_stream():
-        nonlocal last_id
-        started = time.time()
-        last_keepalive = 0.0
-        last_typing = None
-        last_rating = None
-        last_read_up_to = None
-        last_read_check = 0.0
-
-        # Первое событие (handshake) — чтобы браузер сразу «увидел» поток
-        yield "event: ready\ndata: {}\n\n"
-
-        while True:
-            now = time.time()
-            if now - started > 25:
-                break
+        return _rating_prompt(inbox, conversation.status, conversation.rating_score is not None)
+
+    state = {
+        "last_id": last_id,
+        "last_typing": None,
+        "last_rating": None,
+        "last_read_up_to": None,
+        "last_read_check": 0.0,
+    }
 
-            # Новые OUT сообщения (приватные заметки не отдаём клиенту)
-            msgs_qs = conversation.messages.filter(
-                direction=models.Message.Direction.OUT,
-                is_private=False,
-                id__gt=last_id,
-            ).order_by("created_at", "id")[:50]
+    def collect(event):
+        """Снимок изменений для виджета (см. messenger.sse)."""
+        changed = False
+        messages_payload = []
+        max_id = state["last_id"]
 
-            msgs = list(msgs_qs)
+        if sse.wants(event, "message"):
+            # Новые OUT сообщения (приватные заметки не отдаём клиенту)
+            msgs = list(
+                conversation.messages.filter(
+                    direction=models.Message.Direction.OUT,
+                    is_private=False,
+                    id__gt=state["last_id"],
+                ).order_by("created_at", "id")[:50]
+            )
 
             # Помечаем исходящие сообщения как доставленные при первой выдаче в виджет
             _mark_out_messages_delivered(msgs)
 
-            messages_payload = []
-            max_id = last_id
             for msg in msgs:
                 if msg.id and msg.id > max_id:
                     max_id = msg.id
-                payload = {
-                    "id": msg.id,
-                    "body": msg.body,
-                    "direction": str(msg.direction),  # Явно преобразуем в строку для JSON
-                    "created_at": msg.created_at.isoformat(),
-                    "read_at": msg.read_at.isoformat() if msg.read_at else None,
-                    "attachments": build_message_attachments_payload(
-                        msg, request, widget_token, widget_session_token
-                    ),
-                }
-                messages_payload.append(payload)
-
-            typing_status = get_typing_status(conversation.id)
-            operator_typing = typing_status.get("operator_typing") is True
-
-            rating_requested, rating_type, rating_max_score = _rating_payload()
-            rating_tuple = (rating_requested, rating_type, rating_max_score)
-
-            # Последний IN-месседж, прочитанный оператором (проверяем раз в 5 сек)
-            current_read_up_to = last_read_up_to
-            changed = False
-            if now - last_read_check >= 5:
-                last_read_check = now
-                current_read_up_to = (
-                    conversation.messages.filter(
-                        direction=models.Message.Direction.IN, read_at__isnull=False
-                    )
-                    .order_by("-id")
-                    .values_list("id", flat=True)
-                    .first()
+                messages_payload.append(
+                    {
+                        "id": msg.id,
+                        "body": msg.body,
+                        "direction": str(msg.direction),  # Явно преобразуем в строку для JSON
+                        "created_at": msg.created_at.isoformat(),
+                        "read_at": msg.read_at.isoformat() if msg.read_at else None,
+                        "attachments": build_message_attachments_payload(
+                            msg, request, widget_token, widget_session_token
+                        ),
+                    }
                 )
-                if current_read_up_to != last_read_up_to:
-                    last_read_up_to = current_read_up_to
-                    changed = True
 
-            if messages_payload:
-                changed = True
-            if last_typing is None or last_typing != operator_typing:
-                changed = True
-            if last_rating is None or last_rating != rating_tuple:
-                changed = True
+        if event is not None and event.get("kind") == "conversation":
+            # Статус/оценка диалога изменились — перечитываем для rating_requested
+            conversation.refresh_from_db()
 
-            if changed:
-                last_typing = operator_typing
-                last_rating = rating_tuple
-                if messages_payload:
-                    last_id = max_id
-
-                data = {
-                    "messages": messages_payload if messages_payload else [],
-                    "operator_typing": operator_typing,
-                    "operator_read_up_to": current_read_up_to,
-                    "rating_requested": rating_requested,
-                    "rating_type": rating_type,
-                    "rating_max_score": rating_max_score,
-                    "since_id": last_id,
-                }
-                yield "event: update\ndata: " + json.dumps(data, ensure_ascii=False) + "\n\n"
-            else:
-                # keep-alive раз в ~5 сек, чтобы прокси не резали соединение
-                if now - last_keepalive > 5:
-                    last_keepalive = now
-                    yield ": keep-alive\n\n"
-
-            time.sleep(1)
+        typing_status = get_typing_status(conversation.id)
+        operator_typing = typing_status.get("operator_typing") is True
+
+        rating_requested, rating_type, rating_max_score = _rating_payload()
+        rating_tuple = (rating_requested, rating_type, rating_max_score)
+
+        # Последний IN-месседж, прочитанный оператором. В poll-режиме проверяем
+        # раз в 5 сек, в push-режиме — по пробуждению.
+        current_read_up_to = state["last_read_up_to"]
+        now = time.time()
+        kind = event.get("kind") if event is not None else None
+        if kind == "poll":
+            read_due = now - state["last_read_check"] >= 5
+        else:
+            read_due = kind in ("initial", "read")
+        if read_due:
+            state["last_read_check"] = now
+            current_read_up_to = (
+                conversation.messages.filter(
+                    direction=models.Message.Direction.IN, read_at__isnull=False
+                )
+                .order_by("-id")
+                .values_list("id", flat=True)
+                .first()
+            )
+            if current_read_up_to != state["last_read_up_to"]:
+                state["last_read_up_to"] = current_read_up_to
+                changed = True
 
-    resp = StreamingHttpResponse(event_stream(), content_type="text/event-stream")
-    resp["Cache-Control"] = "no-cache"
-    resp["X-Accel-Buffering"] = "no"  # nginx: не буферизовать SSE
+        if messages_payload:
+            changed = True
+        if state["last_typing"] is None or state["last_typing"] != operator_typing:
+            changed = True
+        if state["last_rating"] is None or state["last_rating"] != rating_tuple:
+            changed = True
+
+        if not changed:
+            return []
+
+        state["last_typing"] = operator_typing
+        state["last_rating"] = rating_tuple
+        if messages_payload:
+            state["last_id"] = max_id
+
+        data = {
+            "messages": messages_payload,
+            "operator_typing": operator_typing,
+            "operator_read_up_to": current_read_up_to,
+            "rating_requested": rating_requested,
+            "rating_type": rating_type,
+            "rating_max_score": rating_max_score,
+            "since_id": state["last_id"],
+        }
+        return ["event: update\ndata: " + json.dumps(data, ensure_ascii=False) + "\n\n"]
+
+    resp = sse.event_stream_response(
+        request,
+        collect,
+        [sse_group_conversation(conversation.id)],
+        lifetime=25,
+        poll_interval=1,
+    )
 
     # Добавить CORS заголовки для SSE вручную (StreamingHttpResponse не поддерживает _add_widget_cors_headers напрямую)
     origin = (request.META.get("HTTP_ORIGIN") or "").strip()
@@ -0,0 +1,194 @@
+"""
+Быстрый путь опроса виджета (GET /api/widget/poll/) без обращений к БД.
+
+Посетители опрашивают poll каждые несколько секунд, и почти всегда ответ —
+«ничего нового». Чтобы такой ответ не стоил запросов в PostgreSQL:
+
+- messenger:widget:inbox:{token} — конфигурация Inbox по widget_token
+  (id, branch_id, settings). Сбрасывается Inbox.save()/delete, для
+  queryset.update() — короткий TTL. Неизвестный токен кэшируется коротко:
+  старые встраивания после перевыпуска токена не бьют в БД.
+- messenger:widget:seq:{conversation_id} — «номер изменения» диалога в Redis.
+  INCR при Message.save(), Conversation.save() и publish_conversation_change
+  (прочтение, bulk-действия, назначение): сразу и ещё раз после коммита —
+  чтобы опрос между записью и коммитом не закрепил старый снимок.
+- курсор в widget-сессии (WidgetSession.poll_cursor): номер изменения, на
+  котором полный опрос видел диалог, верхняя граница id исходящих сообщений и
+  поля ответа, зависящие от диалога (статус, оценка, operator_read_up_to).
+
+Опрос с since_id не меньше курсора при неизменном номере отвечает из курсора.
+Пропавший ключ номера (вытеснение, рестарт Redis) заводится заново значением
+time.time_ns(), поэтому старые курсоры с ним не совпадут. Пути, которые меняют
+диалог в обход перечисленных (auto_resolve через update()), ограничены сроком
+жизни курсора MESSENGER_WIDGET_POLL_CURSOR_MAX_AGE_SECONDS.
+"""
+
+from __future__ import annotations
+
+import logging
+import time
+from typing import Any
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+from .models import Inbox
+from .utils import (
+    WidgetSession,
+    safe_cache_delete,
+    safe_cache_get,
+    safe_cache_set,
+    set_widget_poll_cursor,
+)
+
+logger = logging.getLogger("messenger.widget")
+
+INBOX_KEY = "messenger:widget:inbox:{token}"
+INBOX_TTL = 300
+# Отрицательный ответ (нет такого активного inbox) живёт меньше
+INBOX_MISS_TTL = 60
+
+SEQ_KEY = "messenger:widget:seq:{conversation_id}"
+SEQ_TTL = 24 * 3600
+
+CURSOR_MAX_AGE_SECONDS = getattr(settings, "MESSENGER_WIDGET_POLL_CURSOR_MAX_AGE_SECONDS", 60)
+
+
+def _inbox_key(widget_token: str) -> str:
+    return INBOX_KEY.format(token=widget_token)
+
+
+def _seq_key(conversation_id: int) -> str:
+    return SEQ_KEY.format(conversation_id=conversation_id)
+
+
+# ─── Конфигурация inbox ──────────────────────────────────────────────
+
+
+def get_inbox(widget_token: str) -> Inbox | None:
+    """
+    Активный Inbox по widget_token из кэша (при промахе — один запрос).
+
+    Возвращает несохраняемый экземпляр с id, branch_id и settings: его хватает
+    для проверки origin, фильтров по inbox и настроек оценки. save() на нём
+    не вызывать.
+    """
+    if not widget_token:
+        return None
+    key = _inbox_key(widget_token)
+    data = safe_cache_get(key)
+    if data is None:
+        row = (
+            Inbox.objects.filter(widget_token=widget_token, is_active=True)
+            .values("id", "branch_id", "settings")
+            .first()
+        )
+        data = row or {"id": None}
+        safe_cache_set(key, data, timeout=INBOX_TTL if row else INBOX_MISS_TTL)
+    if not data.get("id"):
+        return None
+    return Inbox(
+        id=data["id"],
+        branch_id=data["branch_id"],
+        widget_token=widget_token,
+        settings=data["settings"] or {},
+        is_active=True,
+    )
+
+
+def invalidate_inbox(*widget_tokens: str) -> None:
+    """Сбросить конфигурацию inbox: сразу и ещё раз после коммита."""
+    keys = [_inbox_key(token) for token in widget_tokens if token]
+    if not keys:
+        return
+
+    def _drop():
+        for key in keys:
+            safe_cache_delete(key)
+
+    _drop()
+    transaction.on_commit(_drop)
+
+
+# ─── Номер изменения диалога ─────────────────────────────────────────
+
+
+def _incr(conversation_id: int) -> None:
+    try:
+        cache.incr(_seq_key(conversation_id))
+    except ValueError:
+        pass  # Ключа нет — заведёт следующий полный опрос
+    except Exception:
+        logger.warning("widget poll seq bump failed for conversation %s", conversation_id)
+
+
+def bump(conversation_id: int | None) -> None:
+    """Диалог изменился: сдвинуть номер сразу и ещё раз после коммита."""
+    if not conversation_id:
+        return
+    _incr(conversation_id)
+    transaction.on_commit(lambda: _incr(conversation_id))
+
+
+def current_seq(conversation_id: int, *, create: bool = False) -> int | None:
+    """Текущий номер изменения; create=True заводит отсутствующий ключ."""
+    key = _seq_key(conversation_id)
+    try:
+        seq = cache.get(key)
+        if seq is None and create:
+            cache.add(key, time.time_ns(), timeout=SEQ_TTL)
+            seq = cache.get(key)
+    except Exception:
+        return None
+    return seq
+
+
+# ─── Курсор сессии ───────────────────────────────────────────────────
+
+
+def remember(
+    session: WidgetSession,
+    *,
+    seq: int | None,
+    last_out_id: int,
+    status: str,
+    rated: bool,
+    read_up_to: int | None,
+) -> None:
+    """Запомнить в сессии снимок полного опроса, сделанного на номере seq."""
+    if seq is None:
+        return
+    set_widget_poll_cursor(
+        session,
+        {
+            "seq": seq,
+            "last_out_id": last_out_id,
+            "status": status,
+            "rated": rated,
+            "read_up_to": read_up_to,
+            "at": int(time.time()),
+        },
+    )
+
+
+def unchanged(session: WidgetSession, since_id: str | None) -> dict[str, Any] | None:
+    """
+    Курсор сессии, если с прошлого полного опроса диалог не менялся и у клиента
+    уже есть все исходящие сообщения; иначе None — нужен полный опрос.
+    """
+    cursor = session.poll_cursor
+    if not cursor:
+        return None
+    try:
+        since = int(since_id) if since_id else 0
+    except ValueError:
+        return None  # Ошибку формата вернёт полный опрос
+    if since < cursor["last_out_id"]:
+        return None
+    if time.time() - cursor["at"] > CURSOR_MAX_AGE_SECONDS:
+        return None
+    seq = current_seq(session.conversation_id)
+    if seq is None or seq != cursor["seq"]:
+        return None
+    return cursor
@@ -6,6 +6,11 @@
 
     notify_new_message(conversation, message_data)
     notify_conversation_updated(conversation, {"status": "resolved"})
+
+SSE-стримы (messenger.sse) слушают отдельные группы sse_*: в них уходит
+только «пробуждение» (stream.wakeup) без payload — стрим сам дочитывает
+изменения из БД одним запросом. Так payload не дублируется в брокере, а
+consumers.py не получает сообщений неизвестного ему типа.
 """
 
 import logging
@@ -15,6 +20,21 @@ from channels.layers import get_channel_layer
 
 logger = logging.getLogger("messenger.ws")
 
+# Группы channel layer для SSE-стримов (см. messenger.sse)
+SSE_GROUP_ALL = "sse_all"
+
+
+def sse_group_conversation(conversation_id: int) -> str:
+    return f"sse_conversation_{conversation_id}"
+
+
+def sse_group_branch(branch_id: int) -> str:
+    return f"sse_branch_{branch_id}"
+
+
+def sse_group_operator(user_id: int) -> str:
+    return f"sse_operator_{user_id}"
+
 
 def _get_layer():
     """Получить channel layer (может быть None в тестах без Redis)."""
@@ -154,3 +174,44 @@ def notify_new_conversation(conversation, conversation_data: dict) -> None:
             )
         except Exception:
             pass
+
+
+def notify_stream_wakeup(conversation, kind: str) -> None:
+    """
+    Разбудить SSE-стримы, которым может быть интересно изменение диалога.
+
+    kind: "message" | "conversation" | "read" — подсказка стриму, что перечитывать.
+    Группы: сам диалог, его филиал, назначенный оператор и админы (sse_all) —
+    ровно те, по которым selectors.visible_stream_groups раскладывает подписчиков.
+    """
+    layer = _get_layer()
+    if not layer:
+        return
+
+    groups = [sse_group_conversation(conversation.id), SSE_GROUP_ALL]
+    if conversation.branch_id:
+        groups.append(sse_group_branch(conversation.branch_id))
+    if conversation.assignee_id:
+        groups.append(sse_group_operator(conversation.assignee_id))
+
+    event = {"type": "stream.wakeup", "kind": kind, "conversation_id": conversation.id}
+    group_send = async_to_sync(layer.group_send)
+    for group in groups:
+        try:
+            group_send(group, event)
+        except Exception:
+            logger.error("SSE wakeup to %s failed", group, exc_info=True)
+
+
+def notify_stream_typing(conversation_id: int) -> None:
+    """Разбудить SSE-стримы диалога при начале набора текста (только группа диалога)."""
+    layer = _get_layer()
+    if not layer:
+        return
+    try:
+        async_to_sync(layer.group_send)(
+            sse_group_conversation(conversation_id),
+            {"type": "stream.wakeup", "kind": "typing", "conversation_id": conversation_id},
+        )
+    except Exception:
+        logger.error("SSE typing wakeup for conversation %s failed", conversation_id, exc_info=True)
@@ -0,0 +1,281 @@
+"""
+Кэш колокольчика (базовый шаблон, /notifications/poll/).
+
+Данные держатся в кэше событиями, а не коротким TTL:
+- непрочитанные: счётчик bell_unread:{user_id} (атомарный incr/decr) и первые
+  10 уведомлений bell_notifs:{user_id}; создание уведомления (notify,
+  notify_many) дописывает их, прочтение — вычитает;
+- напоминания bell_reminders:{user_id}: задачи и договоры на текущий день.
+  Граница «просрочено» считается при чтении по сохранённым due_at, поэтому
+  запись живёт до смены дня; сбрасывается сигналами Task/Company/ContractType
+  (notifications/signals.py).
+
+Длинный TTL — только страховка от событий в обход сигналов (queryset.update()).
+При промахе пересобирается только недостающая часть.
+"""
+
+from __future__ import annotations
+
+from collections import defaultdict
+from collections.abc import Iterable
+from datetime import datetime, timedelta
+
+from django.core.cache import cache
+from django.db import transaction
+from django.utils import timezone
+
+from notifications.models import Notification
+
+UNREAD_KEY = "bell_unread:{user_id}"
+ITEMS_KEY = "bell_notifs:{user_id}"
+REMINDERS_KEY = "bell_reminders:{user_id}"
+POLL_KEY = "notif_poll:{user_id}"
+# Версия справочника ContractType: смена порогов сбрасывает напоминания всех
+CONTRACT_TYPES_VERSION_KEY = "bell_contract_types_version"
+
+BELL_CACHE_TTL = 6 * 3600
+ITEMS_LIMIT = 10
+
+
+def _keys(user_id: int) -> tuple[str, str, str]:
+    return (
+        UNREAD_KEY.format(user_id=user_id),
+        ITEMS_KEY.format(user_id=user_id),
+        REMINDERS_KEY.format(user_id=user_id),
+    )
+
+
+# ---------------------------------------------------------------------------
+# Чтение
+# ---------------------------------------------------------------------------
+
+
+def _unread_items(user_id: int) -> list[Notification]:
+    return list(
+        Notification.objects.filter(user_id=user_id, is_read=False).order_by("-created_at")[
+            :ITEMS_LIMIT
+        ]
+    )
+
+
+def _day(now: datetime) -> tuple:
+    # «Сегодня» задач считается по now.date(), граница дня — по локальному времени
+    return (now.date(), timezone.localdate(now))
+
+
+def _build_reminders(user, now: datetime, version) -> dict:
+    """Задачи (просроченные/на сегодня) и договоры пользователя на текущий день."""
+    from companies.models import Company
+    from tasksapp.models import Task
+
+    reminders_qs = (
+        Task.objects.filter(assigned_to=user)
+        .exclude(status__in=[Task.Status.DONE, Task.Status.CANCELLED])
+        .select_related("company")
+    )
+    # Кандидаты в «просрочено» на весь день: срок до конца текущих суток.
+    # Просроченные на момент чтения — их префикс (список упорядочен по due_at).
+    day_end = timezone.localtime(now).replace(hour=0, minute=0, second=0, microsecond=0)
+    day_end += timedelta(days=1)
+    overdue = list(reminders_qs.filter(due_at__lt=day_end).order_by("due_at")[:ITEMS_LIMIT])
+    today = list(reminders_qs.filter(due_at__date=now.date()).order_by("due_at")[:ITEMS_LIMIT])
+
+    def _task(t):
+        return {
+            "title": t.title,
+            "subtitle": (t.company.name if t.company else ""),
+            "due_at": t.due_at,
+        }
+
+    contracts = []
+    try:
+        today_date = timezone.localdate(now)
+        contract_qs = (
+            Company.objects.filter(responsible=user, contract_until__isnull=False)
+            .select_related("contract_type")
+            .only("id", "name", "contract_until", "contract_type")
+        )
+        max_warning_days = 30
+        try:
+            from django.db.models import Max
+
+            from companies.models import ContractType
+
+            max_warning = ContractType.objects.aggregate(max_warning=Max("warning_days"))
+            if max_warning["max_warning"]:
+                max_warning_days = max(max_warning["max_warning"], 30)
+        except Exception:
+            pass
+        soon_until = today_date + timedelta(days=max_warning_days)
+        soon = list(
+            contract_qs.filter(contract_until__lte=soon_until).order_by("contract_until")[:10]
+        )
+        for c in soon:
+            days_left = (c.contract_until - today_date).days if c.contract_until else None
+            if days_left is not None and c.contract_type:
+                danger_days = c.contract_type.danger_days
+                prefix = "Срочно: " if days_left <= danger_days else ""
+            else:
+                prefix = "Срочно: " if (days_left is not None and days_left < 14) else ""
+            contracts.append(
+                {
+                    "title": f"{prefix}Договор до {c.contract_until.strftime('%d.%m.%Y')}",
+                    "subtitle": c.name,
+                    "url": f"/companies/{c.id}/",
+                    "kind": "contract",
+                }
+            )
+    except Exception:
+        pass
+
+    return {
+        "day": _day(now),
+        "version": version,
+        "overdue": [_task(t) for t in overdue],
+        "today": [_task(t) for t in today],
+        "contracts": contracts,
+    }
+
+
+def _reminder_items(data: dict, now: datetime) -> list[dict]:
+    items = [
+        {
+            "title": f"Просрочено: {t['title']}",
+            "subtitle": t["subtitle"],
+            "url": "/tasks/?overdue=1",
+            "kind": "overdue",
+        }
+        for t in data["overdue"]
+        if t["due_at"] < now
+    ]
+    items.extend(
+        {
+            "title": f"На сегодня: {t['title']}",
+            "subtitle": t["subtitle"],
+            "url": "/tasks/?today=1",
+            "kind": "today",
+        }
+        for t in data["today"]
+    )
+    items.extend(data["contracts"])
+    return items
+
+
+def get_bell_data(user, now: datetime) -> dict:
+    """Данные колокольчика; при тёплом кэше — без запросов к БД."""
+    unread_key, items_key, reminders_key = _keys(user.pk)
+    cached = cache.get_many([unread_key, items_key, reminders_key, CONTRACT_TYPES_VERSION_KEY])
+    version = cached.get(CONTRACT_TYPES_VERSION_KEY, 0)
+
+    unread = cached.get(unread_key)
+    if unread is None:
+        unread = Notification.objects.filter(user=user, is_read=False).count()
+        cache.set(unread_key, unread, BELL_CACHE_TTL)
+
+    items = cached.get(items_key)
+    if items is None:
+        items = _unread_items(user.pk)
+        cache.set(items_key, items, BELL_CACHE_TTL)
+
+    reminders = cached.get(reminders_key)
+    if reminders is None or reminders["day"] != _day(now) or reminders["version"] != version:
+        reminders = _build_reminders(user, now, version)
+        cache.set(reminders_key, reminders, BELL_CACHE_TTL)
+    reminder_items = _reminder_items(reminders, now)
+
+    return {
+        "notif_unread_count": max(0, unread),
+        "notif_items": items,
+        "reminder_count": len(reminder_items),
+        "reminder_items": reminder_items,
+    }
+
+
+# ---------------------------------------------------------------------------
+# События
+# ---------------------------------------------------------------------------
+
+
+def _snapshot(n: Notification) -> Notification:
+    # Без закэшированных связей (user и т.п.) — в кэш кладём только поля
+    return Notification(
+        id=n.id,
+        user_id=n.user_id,
+        kind=n.kind,
+        title=n.title,
+        body=n.body,
+        url=n.url,
+        is_read=n.is_read,
+        created_at=n.created_at,
+        payload=n.payload,
+    )
+
+
+def _patch_created(notifications: list[Notification]) -> None:
+    by_user: dict[int, list[Notification]] = defaultdict(list)
+    for n in notifications:
+        by_user[n.user_id].append(_snapshot(n))
+
+    items_keys = {ITEMS_KEY.format(user_id=user_id): user_id for user_id in by_user}
+    cached_items = cache.get_many(list(items_keys))
+    patched = {}
+    for key, items in cached_items.items():
+        fresh = sorted(by_user[items_keys[key]], key=lambda n: n.created_at, reverse=True)
+        patched[key] = (fresh + items)[:ITEMS_LIMIT]
+    if patched:
+        cache.set_many(patched, BELL_CACHE_TTL)
+
+    for user_id, created in by_user.items():
+        try:
+            cache.incr(UNREAD_KEY.format(user_id=user_id), len(created))
+        except ValueError:
+            pass  # Счётчика нет — посчитается при чтении
+    cache.delete_many([POLL_KEY.format(user_id=user_id) for user_id in by_user])
+
+
+def notifications_created(notifications: Iterable[Notification]) -> None:
+    """Дописать новые уведомления в кэш колокольчика после коммита."""
+    notifications = [n for n in notifications if n.pk and not n.is_read]
+    if notifications:
+        transaction.on_commit(lambda: _patch_created(notifications))
+
+
+def notifications_read(user_id: int, notification_ids: Iterable[int] | None = None) -> None:
+    """Учесть прочтение: все непрочитанные (ids=None) или указанные."""
+    unread_key, items_key, _ = _keys(user_id)
+    poll_key = POLL_KEY.format(user_id=user_id)
+    if notification_ids is None:
+        cache.set_many({unread_key: 0, items_key: []}, BELL_CACHE_TTL)
+        cache.delete(poll_key)
+        return
+
+    ids = set(notification_ids)
+    items = cache.get(items_key)
+    try:
+        unread = cache.decr(unread_key, len(ids))
+    except ValueError:
+        unread = None
+    if items is not None:
+        items = [n for n in items if n.pk not in ids]
+        if unread is None or len(items) < min(unread, ITEMS_LIMIT):
+            # Хвост списка неизвестен — соберём заново при чтении
+            cache.delete(items_key)
+        else:
+            cache.set(items_key, items, BELL_CACHE_TTL)
+    cache.delete(poll_key)
+
+
+def reminders_changed(*user_ids: int | None) -> None:
+    """Сбросить напоминания пользователей (задача или договор изменились)."""
+    keys = [REMINDERS_KEY.format(user_id=user_id) for user_id in set(user_ids) if user_id]
+    keys += [POLL_KEY.format(user_id=user_id) for user_id in set(user_ids) if user_id]
+    if keys:
+        cache.delete_many(keys)
+
+
+def contract_types_changed() -> None:
+    """Пороги договоров изменились — напоминания всех пользователей устарели."""
+    try:
+        cache.incr(CONTRACT_TYPES_VERSION_KEY)
+    except ValueError:
+        cache.set(CONTRACT_TYPES_VERSION_KEY, 1, None)
@@ -1,9 +1,11 @@
 from __future__ import annotations
 
+from collections.abc import Iterable
 from datetime import timedelta
 
 from django.utils import timezone
 
+from notifications import bell
 from notifications.models import Notification
 
 
@@ -50,3 +52,86 @@ def notify(
     return Notification.objects.create(
         user=user, title=t, body=b, url=u, kind=kind, payload=payload or {}
     )
+
+
+def notify_many(
+    *,
+    users: Iterable,
+    title: str,
+    body: str = "",
+    url: str = "",
+    kind: str = Notification.Kind.INFO,
+    dedupe_seconds: int = 0,
+    payload: dict | None = None,
+) -> list[Notification]:
+    """
+    Одно и то же уведомление нескольким пользователям (users — объекты или id).
+
+    Дедупликация — как у notify(), но одним запросом на всех. Возвращает только
+    созданные уведомления.
+    """
+    notifications = [
+        Notification(
+            user_id=getattr(user, "pk", user),
+            kind=kind,
+            title=title,
+            body=body,
+            url=url,
+            payload=payload,
+        )
+        for user in users
+    ]
+    return bulk_notify(notifications, dedupe_seconds=dedupe_seconds)
+
+
+def bulk_notify(
+    notifications: Iterable[Notification], *, dedupe_seconds: int = 0
+) -> list[Notification]:
+    """
+    Создать подготовленные (несохранённые) уведомления одним INSERT.
+
+    dedupe_seconds > 0: пропускаются уведомления, для которых у пользователя
+    в окне уже есть непрочитанное с теми же (kind, title, url); их payload
+    обновляется, если задан. bulk_create не шлёт post_save — колокольчики
+    получателей дописываются здесь же (после коммита).
+    """
+    batch = []
+    for n in notifications:
+        n.title = (n.title or "")[:200]
+        n.url = (n.url or "")[:300]
+        n.body = n.body or ""
+        batch.append(n)
+    if not batch:
+        return []
+
+    if dedupe_seconds and dedupe_seconds > 0:
+        pending: dict[tuple, Notification] = {}
+        for n in batch:
+            pending.setdefault((n.user_id, n.kind, n.title, n.url), n)
+        since = timezone.now() - timedelta(seconds=int(dedupe_seconds))
+        existing = (
+            Notification.objects.filter(
+                user_id__in={key[0] for key in pending},
+                title__in={key[2] for key in pending},
+                is_read=False,
+                created_at__gte=since,
+            )
+            .order_by("-created_at")
+            .values_list("id", "user_id", "kind", "title", "url")
+        )
+        # payload дублей обновляем одним UPDATE на каждый payload
+        refresh: dict[int, tuple[dict, list[int]]] = {}
+        for pk, *key in existing:
+            n = pending.pop(tuple(key), None)
+            if n is not None and n.payload is not None:
+                refresh.setdefault(id(n.payload), (n.payload, []))[1].append(pk)
+        for payload, pks in refresh.values():
+            Notification.objects.filter(pk__in=pks).update(payload=payload)
+        batch = list(pending.values())
+
+    for n in batch:
+        if n.payload is None:
+            n.payload = {}
+    created = Notification.objects.bulk_create(batch)
+    bell.notifications_created(created)
+    return created
@@ -0,0 +1,64 @@
+"""
+Кэш колокольчика (notifications/bell.py) по событиям моделей.
+
+- Notification: новое уведомление дописывается в кэш получателя (bulk_notify — сам);
+- Task: смена статуса/срока/исполнителя — напоминания прежнего и нового исполнителя;
+- Company: договор или ответственный — напоминания прежнего и нового ответственного;
+- ContractType: пороги предупреждений — напоминания всех (версия справочника).
+"""
+
+from __future__ import annotations
+
+from django.db.models.signals import post_delete, post_init, post_save
+from django.dispatch import receiver
+
+from companies.models import Company, ContractType
+from tasksapp.models import Task
+
+from . import bell
+from .models import Notification
+
+
+@receiver(post_save, sender=Notification)
+def _notification_created(sender, instance: Notification, created: bool, **kwargs):
+    if created:
+        bell.notifications_created([instance])
+
+
+@receiver(post_init, sender=Task)
+def _remember_task_assignee(sender, instance: Task, **kwargs):
+    # Исполнитель на момент загрузки: при переназначении сбрасываем обоих
+    instance._bell_assignee_id = instance.assigned_to_id
+
+
+@receiver(post_save, sender=Task)
+@receiver(post_delete, sender=Task)
+def _task_changed(sender, instance: Task, **kwargs):
+    previous = getattr(instance, "_bell_assignee_id", None)
+    bell.reminders_changed(instance.assigned_to_id, previous)
+    instance._bell_assignee_id = instance.assigned_to_id
+
+
+@receiver(post_init, sender=Company)
+def _remember_company_responsible(sender, instance: Company, **kwargs):
+    # Ответственный на момент загрузки: при передаче сбрасываем обоих
+    instance._bell_responsible_id = instance.responsible_id
+
+
+@receiver(post_save, sender=Company)
+@receiver(post_delete, sender=Company)
+def _company_changed(sender, instance: Company, **kwargs):
+    update_fields = kwargs.get("update_fields")
+    if update_fields and not {"contract_until", "contract_type", "responsible"} & set(
+        update_fields
+    ):
+        return
+    previous = getattr(instance, "_bell_responsible_id", None)
+    bell.reminders_changed(instance.responsible_id, previous)
+    instance._bell_responsible_id = instance.responsible_id
+
+
+@receiver(post_save, sender=ContractType)
+@receiver(post_delete, sender=ContractType)
+def _contract_type_changed(sender, **kwargs):
+    bell.contract_types_changed()
@@ -0,0 +1,112 @@
+"""
+Тесты событийного кэша колокольчика (notifications/bell.py) и notify_many.
+
+Покрытие:
+  1. тёплый кэш — рендер колокольчика без запросов к БД
+  2. notify_many — один INSERT, дедупликация одним запросом, дописывание кэша
+  3. прочтение — счётчик вычитается без пересборки
+  4. напоминания — сброс по изменению задачи и передаче компании (прежнему и новому),
+     «просрочено» считается при чтении
+"""
+
+from __future__ import annotations
+
+from datetime import timedelta
+
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from accounts.models import User
+from companies.models import Company
+from notifications import bell
+from notifications.models import Notification
+from notifications.service import notify, notify_many
+from tasksapp.models import Task
+
+
+@override_settings(SECURE_SSL_REDIRECT=False)
+class BellCacheTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username="bell_mgr", password="pass")
+        self.other = User.objects.create_user(username="bell_other", password="pass")
+
+    def test_warm_bell_skips_db(self):
+        bell.get_bell_data(self.user, timezone.now())
+        with self.assertNumQueries(0):
+            data = bell.get_bell_data(self.user, timezone.now())
+        self.assertEqual(data["notif_unread_count"], 0)
+
+    def test_notify_many_bulk_dedupe_and_patch(self):
+        bell.get_bell_data(self.user, timezone.now())
+        with self.captureOnCommitCallbacks(execute=True):
+            notify(user=self.user, title="Сбор", url="/x/", dedupe_seconds=60)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            with self.assertNumQueries(2):  # дубли + INSERT
+                created = notify_many(
+                    users=[self.user, self.other], title="Сбор", url="/x/", dedupe_seconds=60
+                )
+        self.assertEqual([n.user_id for n in created], [self.other.id])
+        self.assertEqual(Notification.objects.filter(title="Сбор").count(), 2)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            notify_many(users=[self.user.id], title="Второе")
+        with self.assertNumQueries(0):
+            data = bell.get_bell_data(self.user, timezone.now())
+        self.assertEqual(data["notif_unread_count"], 2)
+        self.assertEqual([n.title for n in data["notif_items"]], ["Второе", "Сбор"])
+
+    def test_mark_read_patches_count(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            first, second = notify_many(users=[self.user, self.user], title="Раз")
+        bell.get_bell_data(self.user, timezone.now())
+
+        self.client.force_login(self.user)
+        self.client.post(reverse("notifications_mark_read", args=[first.id]))
+        data = bell.get_bell_data(self.user, timezone.now())
+        self.assertEqual(data["notif_unread_count"], 1)
+        self.assertEqual([n.id for n in data["notif_items"]], [second.id])
+
+        self.client.post(reverse("notifications_mark_all_read"))
+        with self.assertNumQueries(0):
+            data = bell.get_bell_data(self.user, timezone.now())
+        self.assertEqual((data["notif_unread_count"], data["notif_items"]), (0, []))
+
+    def test_task_change_resets_reminders(self):
+        now = timezone.now()
+        task = Task.objects.create(
+            title="Позвонить", assigned_to=self.user, due_at=now - timedelta(minutes=5)
+        )
+        data = bell.get_bell_data(self.user, now)
+        self.assertIn("Просрочено: Позвонить", [r["title"] for r in data["reminder_items"]])
+
+        task.status = Task.Status.DONE
+        task.save()
+        data = bell.get_bell_data(self.user, now)
+        self.assertEqual(data["reminder_items"], [])
+
+    def test_company_transfer_resets_both_responsibles(self):
+        company = Company.objects.create(name="ООО Договор", responsible=self.user)
+        company = Company.objects.get(pk=company.pk)
+        now = timezone.now()
+        bell.get_bell_data(self.user, now)
+        bell.get_bell_data(self.other, now)
+
+        company.responsible = self.other
+        company.save()
+        self.assertIsNone(cache.get(bell.REMINDERS_KEY.format(user_id=self.user.id)))
+        self.assertIsNone(cache.get(bell.REMINDERS_KEY.format(user_id=self.other.id)))
+
+    def test_overdue_boundary_evaluated_on_read(self):
+        now = timezone.now()
+        Task.objects.create(title="Позже", assigned_to=self.user, due_at=now + timedelta(seconds=1))
+        before = bell.get_bell_data(self.user, now)
+        self.assertNotIn("Просрочено: Позже", [r["title"] for r in before["reminder_items"]])
+        if timezone.localdate(now + timedelta(seconds=2)) != timezone.localdate(now):
+            return  # Полночь: напоминания пересоберутся, проверять нечего
+        with self.assertNumQueries(0):
+            after = bell.get_bell_data(self.user, now + timedelta(seconds=2))
+        self.assertIn("Просрочено: Позже", [r["title"] for r in after["reminder_items"]])
@@ -11,6 +11,7 @@
 
 from __future__ import annotations
 
+from django.core.cache import cache
 from django.test import TestCase, override_settings
 from django.urls import reverse
 from django.utils import timezone
@@ -116,6 +117,8 @@ class MarkReadViewTest(TestCase):
 @override_settings(SECURE_SSL_REDIRECT=False)
 class PollViewTest(TestCase):
     def setUp(self):
+        # Кэш колокольчика живёт дольше теста, а id пользователей между тестами повторяются
+        cache.clear()
         self.user = _make_user("mgr")
 
     def test_requires_login(self):
@@ -297,10 +297,77 @@ class DeviceHeartbeatView(APIView):
         )
 
 
+def device_seen_key(user_id: int, device_id: str) -> str:
+    return f"phonebridge:device_seen:{user_id}:{device_id}"
+
+
+def _touch_device(user, device_id: str) -> bool:
+    """
+    Проверить, что устройство принадлежит пользователю, и обновить last_seen_at.
+
+    UPDATE одновременно служит проверкой принадлежности (0 строк — чужое/нет).
+    Дальше PHONEBRIDGE_LAST_SEEN_THROTTLE_SECONDS устройство считается известным
+    по кэшу: холостой pull не пишет в БД.
+    """
+    from django.conf import settings
+    from django.core.cache import cache
+
+    cache_key = device_seen_key(user.id, device_id)
+    if cache.get(cache_key):
+        return True
+    updated = PhoneDevice.objects.filter(user=user, device_id=device_id).update(
+        last_seen_at=timezone.now()
+    )
+    if updated:
+        cache.set(
+            cache_key, 1, timeout=getattr(settings, "PHONEBRIDGE_LAST_SEEN_THROTTLE_SECONDS", 30)
+        )
+    return bool(updated)
+
+
+def _claim_next_call(user) -> CallRequest | None:
+    """Выдать самую старую PENDING-команду пользователя ровно одному устройству."""
+    # ВАЖНО: используем select_for_update(skip_locked=True), чтобы один и тот же звонок
+    # не был выдан одновременно двум устройствам при конкурентных запросах.
+    with transaction.atomic():
+        call = (
+            CallRequest.objects.select_for_update(skip_locked=True)
+            .filter(user=user, status=CallRequest.Status.PENDING)
+            .order_by("created_at")
+            .first()
+        )
+        if not call:
+            return None
+
+        now = timezone.now()
+        call.status = CallRequest.Status.CONSUMED
+        call.delivered_at = now
+        call.consumed_at = now
+        call.save(update_fields=["status", "delivered_at", "consumed_at"])
+    return call
+
+
+def _pull_wait_seconds(request) -> float:
+    """wait_seconds из запроса, ограниченный настройками (под WSGI — отдельный потолок)."""
+    from django.conf import settings
+    from django.core.handlers.asgi import ASGIRequest
+
+    try:
+        requested = float(request.query_params.get("wait_seconds") or 0)
+    except (TypeError, ValueError):
+        return 0.0
+    limit = getattr(settings, "PHONEBRIDGE_PULL_MAX_WAIT_SECONDS", 25)
+    if not isinstance(request._request, ASGIRequest):
+        limit = min(limit, getattr(settings, "PHONEBRIDGE_PULL_WSGI_MAX_WAIT_SECONDS", 0))
+    return max(0.0, min(requested, float(limit)))
+
+
 class PullCallView(APIView):
     """
-    MVP: polling.
-    Клиент вызывает этот endpoint раз в 1-3 секунды и получает следующую команду "позвонить".
+    Выдача следующей команды "позвонить" устройству.
+
+    Без wait_seconds — обычный опрос (ответ сразу). С wait_seconds=N — long-poll:
+    запрос ждёт создания команды до N секунд (phonebridge.wakeup), 204 по таймауту.
     """
 
     authentication_classes = [JWTAuthentication]
@@ -311,6 +378,8 @@ class PullCallView(APIView):
     def get(self, request):
         import logging
 
+        from .wakeup import claim_with_wait
+
         logger = logging.getLogger(__name__)
         enforce(
             user=request.user,
@@ -325,43 +394,16 @@ class PullCallView(APIView):
             return Response({"detail": "device_id is required"}, status=400)
 
         # Проверяем, что device_id принадлежит текущему пользователю (безопасность)
-        device_exists = PhoneDevice.objects.filter(user=request.user, device_id=device_id).exists()
-        if not device_exists:
+        if not _touch_device(request.user, device_id):
             logger.warning(
                 f"PullCallView: device_id {device_id} not found for user {request.user.id}"
             )
             return Response({"detail": "Device not found or access denied"}, status=403)
 
-        # обновим last_seen
-        PhoneDevice.objects.filter(user=request.user, device_id=device_id).update(
-            last_seen_at=timezone.now()
-        )
-
-        # Проверяем наличие pending запросов для этого пользователя (для логов/диагностики)
-        pending_count = CallRequest.objects.filter(
-            user=request.user, status=CallRequest.Status.PENDING
-        ).count()
-        logger.debug(
-            f"PullCallView: user {request.user.id}, device {device_id}, pending calls: {pending_count}"
-        )
-
-        # ВАЖНО: используем select_for_update(skip_locked=True), чтобы один и тот же звонок
-        # не был выдан одновременно двум устройствам при конкурентных запросах.
-        with transaction.atomic():
-            call = (
-                CallRequest.objects.select_for_update(skip_locked=True)
-                .filter(user=request.user, status=CallRequest.Status.PENDING)
-                .order_by("created_at")
-                .first()
-            )
-            if not call:
-                return Response(status=204)
-
-            now = timezone.now()
-            call.status = CallRequest.Status.CONSUMED
-            call.delivered_at = now
-            call.consumed_at = now
-            call.save(update_fields=["status", "delivered_at", "consumed_at"])
+        user = request.user
+        call = claim_with_wait(user.id, lambda: _claim_next_call(user), _pull_wait_seconds(request))
+        if not call:
+            return Response(status=204)
 
         logger.info(
             f"PullCallView: delivered call {call.id} to user {request.user.id}, phone {mask_phone(call.phone_raw)}"
@@ -616,6 +658,8 @@ class PhoneTelemetryView(APIView):
     """
     Принимает батч телеметрии от Android-приложения.
     Минимальный, неблокирующий endpoint: лишние поля тихо игнорируются.
+    Батч только валидируется и уходит в буфер (phonebridge.telemetry) — запись
+    в БД, привязка к устройству и агрегаты делаются пакетно воркером.
     """
 
     authentication_classes = [JWTAuthentication]
@@ -624,9 +668,8 @@ class PhoneTelemetryView(APIView):
     permission_classes = [IsAuthenticated]
 
     def post(self, request):
-        import logging
+        from . import telemetry
 
-        logger = logging.getLogger(__name__)
         enforce(
             user=request.user,
             resource_type="action",
@@ -637,48 +680,55 @@ class PhoneTelemetryView(APIView):
         s = TelemetryBatchSerializer(data=request.data)
         s.is_valid(raise_exception=True)
         device_id = (s.validated_data.get("device_id") or "").strip()
-        items = s.validated_data["items"]
+        accepted = telemetry.enqueue(request.user.id, device_id, s.validated_data["items"])
+        return Response({"ok": True, "saved": accepted})
 
-        device = None
-        if device_id:
-            device = (
-                PhoneDevice.objects.filter(user=request.user, device_id=device_id)
-                .order_by("-created_at")
-                .first()
-            )
 
-        to_create: list[PhoneTelemetry] = []
-        now = timezone.now()
-        for item in items:
-            ts = item.get("ts") or now
-            type_val = item.get("type") or PhoneTelemetry.Type.OTHER
-            endpoint = (item.get("endpoint") or "").strip()
-            http_code = item.get("http_code")
-            value_ms = item.get("value_ms")
-            extra = item.get("extra") or {}
-
-            to_create.append(
-                PhoneTelemetry(
-                    device=device,
-                    user=request.user,
-                    ts=ts,
-                    type=type_val,
-                    endpoint=endpoint,
-                    http_code=http_code,
-                    value_ms=value_ms,
-                    extra=extra,
-                )
-            )
+class PhoneLatencyView(APIView):
+    """
+    Перцентили latency устройства по часовым агрегатам (PhoneLatencyRollup).
 
-        if to_create:
-            # Убрали ignore_conflicts - дедупликация телеметрии не требуется,
-            # все записи уникальны по времени и контексту
-            PhoneTelemetry.objects.bulk_create(to_create)
-            logger.debug(
-                f"PhoneTelemetry: user={request.user.id}, device={device_id}, count={len(to_create)}"
-            )
+    GET ?device=<PhoneDevice.id>&hours=24 (максимум 30 суток). Администратор
+    видит любое устройство, остальные — только свои.
+    """
 
-        return Response({"ok": True, "saved": len(to_create)})
+    authentication_classes = [JWTAuthentication]
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request):
+        from datetime import timedelta
+
+        from django.core.exceptions import ValidationError
+
+        from accounts.permissions import require_admin
+
+        from . import telemetry
+
+        enforce(
+            user=request.user,
+            resource_type="action",
+            resource="phone:telemetry:latency",
+            context={"path": request.path},
+        )
+        try:
+            hours = min(max(int(request.query_params.get("hours") or 24), 1), 30 * 24)
+            devices = PhoneDevice.objects.all()
+            if not require_admin(request.user):
+                devices = devices.filter(user=request.user)
+            device = devices.filter(pk=request.query_params.get("device")).first()
+        except (TypeError, ValueError, ValidationError):
+            return Response({"detail": "Invalid device or hours"}, status=400)
+        if device is None:
+            return Response({"detail": "Device not found"}, status=404)
+
+        since = timezone.now() - timedelta(hours=hours)
+        return Response(
+            {
+                "device": str(device.id),
+                "hours": hours,
+                **telemetry.latency_percentiles(device, since),
+            }
+        )
 
 
 class PhoneLogBundleSerializer(serializers.Serializer):
@@ -5,3 +5,7 @@ class PhonebridgeConfig(AppConfig):
     default_auto_field = "django.db.models.BigAutoField"
     name = "phonebridge"
     verbose_name = "Phone bridge"
+
+    def ready(self):
+        # Пробуждение long-poll pull при создании команды (phonebridge.wakeup)
+        from phonebridge import signals
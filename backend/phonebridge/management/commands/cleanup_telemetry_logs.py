@@ -5,7 +5,7 @@ Management команда для очистки старых телеметри
     python manage.py cleanup_telemetry_logs
 
 Политика TTL:
-    - Телеметрия: 30 дней
+    - Телеметрия: 30 дней (в PostgreSQL — удаление дневных секций целиком)
     - Логи: 14 дней (или только ошибочные bundle'ы старше 7 дней)
 """
 
@@ -14,6 +14,7 @@ from datetime import timedelta
 from django.core.management.base import BaseCommand
 from django.utils import timezone
 
+from phonebridge import telemetry
 from phonebridge.models import PhoneLogBundle, PhoneTelemetry
 
 
@@ -49,25 +50,44 @@ class Command(BaseCommand):
         logs_cutoff = now - timedelta(days=logs_days)
 
         # Очистка телеметрии
-        telemetry_qs = PhoneTelemetry.objects.filter(ts__lt=telemetry_cutoff)
-        telemetry_count = telemetry_qs.count()
-
-        if telemetry_count > 0:
-            if dry_run:
+        if telemetry.is_partitioned():
+            partitions = telemetry.expired_partitions(telemetry_days)
+            if not partitions:
+                self.stdout.write("Нет телеметрии для удаления")
+            elif dry_run:
                 self.stdout.write(
                     self.style.WARNING(
-                        f"[DRY RUN] Будет удалено {telemetry_count} записей телеметрии старше {telemetry_days} дней"
+                        f"[DRY RUN] Будет удалено {len(partitions)} секций телеметрии: "
+                        f"{', '.join(partitions)}"
                     )
                 )
             else:
-                deleted_telemetry = telemetry_qs.delete()[0]
+                dropped = telemetry.drop_expired_partitions(telemetry_days)
                 self.stdout.write(
                     self.style.SUCCESS(
-                        f"Удалено {deleted_telemetry} записей телеметрии старше {telemetry_days} дней"
+                        f"Удалено {dropped} секций телеметрии старше {telemetry_days} дней"
                     )
                 )
         else:
-            self.stdout.write("Нет телеметрии для удаления")
+            telemetry_qs = PhoneTelemetry.objects.filter(ts__lt=telemetry_cutoff)
+            telemetry_count = telemetry_qs.count()
+
+            if telemetry_count > 0:
+                if dry_run:
+                    self.stdout.write(
+                        self.style.WARNING(
+                            f"[DRY RUN] Будет удалено {telemetry_count} записей телеметрии старше {telemetry_days} дней"
+                        )
+                    )
+                else:
+                    deleted_telemetry = telemetry_qs.delete()[0]
+                    self.stdout.write(
+                        self.style.SUCCESS(
+                            f"Удалено {deleted_telemetry} записей телеметрии старше {telemetry_days} дней"
+                        )
+                    )
+            else:
+                self.stdout.write("Нет телеметрии для удаления")
 
         # Очистка логов
         logs_qs = PhoneLogBundle.objects.filter(ts__lt=logs_cutoff)
@@ -0,0 +1,164 @@
+"""
+Нагрузочный тест /api/phone/calls/pull/: стоимость простаивающих устройств.
+
+Поднимает N временных пользователей с устройствами и гоняет PullCallView
+в потоках (по потоку на устройство) в двух режимах:
+  poll     — прежний опрос раз в --interval секунд;
+  longpoll — wait_seconds=--wait, ожидание пробуждения из channel layer.
+Параллельно создаёт команды на звонок (--calls-per-minute) и меряет задержку
+доставки. Отчёт: запросов/с и запросов к БД/с на устройство.
+
+  python manage.py loadtest_phone_pull --devices 60 --seconds 60
+
+Нужен channel layer (Redis) и БД с конкурентным доступом (PostgreSQL).
+Временные пользователи и устройства удаляются после прогона.
+"""
+
+from __future__ import annotations
+
+import json
+import random
+import threading
+import time
+import uuid
+from functools import partial
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import AsyncRequestFactory
+from rest_framework.test import force_authenticate
+
+from phonebridge.api import PullCallView
+from phonebridge.models import CallRequest, PhoneDevice
+
+MODES = ("poll", "longpoll")
+
+
+def _count_query(counter, execute, sql, params, many, context):
+    counter["queries"] += 1
+    return execute(sql, params, many, context)
+
+
+class Command(BaseCommand):
+    help = "Нагрузочный тест pull-команд телефонов: опрос против long-poll."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--devices", type=int, default=60, help="Число устройств.")
+        parser.add_argument("--seconds", type=float, default=60.0, help="Длительность режима.")
+        parser.add_argument("--mode", choices=(*MODES, "both"), default="both")
+        parser.add_argument("--interval", type=float, default=2.0, help="Период опроса (poll).")
+        parser.add_argument("--wait", type=int, default=25, help="wait_seconds (longpoll).")
+        parser.add_argument(
+            "--calls-per-minute", type=float, default=6.0, help="Команд в минуту на всех."
+        )
+        parser.add_argument("--json", action="store_true", help="Вывести отчёт в JSON.")
+
+    def handle(self, *args, **options):
+        devices = int(options["devices"])
+        if devices <= 0 or options["seconds"] <= 0:
+            raise CommandError("--devices и --seconds должны быть > 0.")
+        modes = MODES if options["mode"] == "both" else (options["mode"],)
+
+        tag = uuid.uuid4().hex[:8]
+        User = get_user_model()
+        users = [
+            User.objects.create_user(f"pull_load_{tag}_{i}", password=None) for i in range(devices)
+        ]
+        for user in users:
+            PhoneDevice.objects.create(user=user, device_id=f"load-{tag}-{user.id}")
+        try:
+            reports = [self._run(mode, users, tag, options) for mode in modes]
+        finally:
+            User.objects.filter(pk__in=[u.pk for u in users]).delete()
+
+        if options["json"]:
+            self.stdout.write(json.dumps(reports, ensure_ascii=False, indent=2))
+            return
+        for r in reports:
+            self.stdout.write(
+                f"{r['mode']:<8} устройств={r['devices']} за {r['seconds']:.0f} с: "
+                f"{r['requests_per_device_per_sec']:.3f} запр/с и "
+                f"{r['queries_per_device_per_sec']:.3f} SQL/с на устройство, "
+                f"SQL на холостой запрос {r['queries_per_idle_request']:.2f}; "
+                f"доставлено {r['delivered']}/{r['created']}, "
+                f"задержка p50={r['latency_p50_ms']} мс"
+            )
+
+    def _run(self, mode, users, tag, options):
+        seconds = float(options["seconds"])
+        wait = int(options["wait"]) if mode == "longpoll" else 0
+        factory = AsyncRequestFactory()
+        view = PullCallView.as_view()
+        deadline = time.monotonic() + seconds
+        lock = threading.Lock()
+        totals = {"requests": 0, "idle_requests": 0, "queries": 0, "idle_queries": 0}
+        created_at: dict[str, float] = {}
+        latencies: list[float] = []
+
+        def device_loop(user):
+            path = f"/api/phone/calls/pull/?device_id=load-{tag}-{user.id}"
+            if wait:
+                path += f"&wait_seconds={wait}"
+            stats = {"requests": 0, "idle_requests": 0, "queries": 0, "idle_queries": 0}
+            try:
+                while time.monotonic() < deadline:
+                    request = factory.get(path)
+                    force_authenticate(request, user=user)
+                    counter = {"queries": 0}
+                    with connection.execute_wrapper(partial(_count_query, counter)):
+                        response = view(request)
+                    stats["requests"] += 1
+                    stats["queries"] += counter["queries"]
+                    if response.status_code == 200:
+                        delivered = time.monotonic()
+                        with lock:
+                            started = created_at.pop(response.data["id"], None)
+                            if started is not None:
+                                latencies.append(delivered - started)
+                    else:
+                        stats["idle_requests"] += 1
+                        stats["idle_queries"] += counter["queries"]
+                    if not wait:
+                        time.sleep(options["interval"])
+            finally:
+                connection.close()
+                with lock:
+                    for key, value in stats.items():
+                        totals[key] += value
+
+        threads = [threading.Thread(target=device_loop, args=(u,), daemon=True) for u in users]
+        for thread in threads:
+            thread.start()
+
+        created = 0
+        rate = float(options["calls_per_minute"]) / 60.0
+        rng = random.Random(42)
+        while rate > 0 and time.monotonic() < deadline:
+            time.sleep(min(rng.expovariate(rate), max(deadline - time.monotonic(), 0)))
+            if time.monotonic() >= deadline:
+                break
+            user = rng.choice(users)
+            call = CallRequest.objects.create(user=user, created_by=user, phone_raw="+70000000000")
+            with lock:
+                created_at[str(call.id)] = time.monotonic()
+            created += 1
+
+        for thread in threads:
+            thread.join(timeout=wait + 5)
+
+        devices = len(users)
+        latencies.sort()
+        return {
+            "mode": mode,
+            "devices": devices,
+            "seconds": seconds,
+            "requests_per_device_per_sec": totals["requests"] / devices / seconds,
+            "queries_per_device_per_sec": totals["queries"] / devices / seconds,
+            "queries_per_idle_request": (
+                totals["idle_queries"] / totals["idle_requests"] if totals["idle_requests"] else 0
+            ),
+            "created": created,
+            "delivered": len(latencies),
+            "latency_p50_ms": (round(latencies[len(latencies) // 2] * 1000) if latencies else None),
+        }
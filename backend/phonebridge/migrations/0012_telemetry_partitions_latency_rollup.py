@@ -0,0 +1,101 @@
+# Generated by Django 5.2.18 on 2026-10-16 20:16
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+TABLE = "phonebridge_phonetelemetry"
+LEGACY = "phonebridge_phonetelemetry_legacy"
+RETENTION_DAYS = 30
+DAYS_AHEAD = 7
+
+
+def _partition_telemetry(apps, schema_editor):
+    """
+    PostgreSQL-only: пересоздать phonebridge_phonetelemetry как секционированную
+    по дням (RANGE по ts) и перенести строки за последние RETENTION_DAYS дней.
+
+    PK становится (id, ts) — ключ секционирования обязан входить в PK; id
+    остаётся уникальным (identity). Имена индексов совпадают с состоянием модели.
+    Секция DEFAULT ловит строки вне созданных дней. Дальше секции ведёт
+    phonebridge.tasks.maintain_telemetry_partitions.
+    """
+    if schema_editor.connection.vendor != "postgresql":
+        return
+    import datetime
+
+    run = schema_editor.execute
+    run(f"ALTER TABLE {TABLE} RENAME TO {LEGACY}")
+    run(f"ALTER TABLE {LEGACY} RENAME CONSTRAINT {TABLE}_pkey TO {LEGACY}_pkey")
+    run("DROP INDEX IF EXISTS phonebridge_user_id_76c561_idx")
+    run("DROP INDEX IF EXISTS phonebridge_endpoin_eecea4_idx")
+
+    run(f"CREATE TABLE {TABLE} (LIKE {LEGACY} INCLUDING DEFAULTS) PARTITION BY RANGE (ts)")
+    run(f"ALTER TABLE {TABLE} ALTER COLUMN id ADD GENERATED BY DEFAULT AS IDENTITY")
+    run(f"ALTER TABLE {TABLE} ADD PRIMARY KEY (id, ts)")
+    run(
+        f"ALTER TABLE {TABLE} ADD CONSTRAINT {TABLE}_device_fk FOREIGN KEY (device_id) "
+        "REFERENCES phonebridge_phonedevice (id) DEFERRABLE INITIALLY DEFERRED"
+    )
+    user_table = apps.get_model(settings.AUTH_USER_MODEL)._meta.db_table
+    run(
+        f"ALTER TABLE {TABLE} ADD CONSTRAINT {TABLE}_user_fk FOREIGN KEY (user_id) "
+        f"REFERENCES {user_table} (id) DEFERRABLE INITIALLY DEFERRED"
+    )
+    run(f"CREATE INDEX phonebridge_user_id_76c561_idx ON {TABLE} (user_id, ts)")
+    run(f"CREATE INDEX phonebridge_endpoin_eecea4_idx ON {TABLE} (endpoint, ts)")
+    run(f"CREATE INDEX {TABLE}_device_id_idx ON {TABLE} (device_id)")
+    run(f"CREATE TABLE {TABLE}_default PARTITION OF {TABLE} DEFAULT")
+
+    today = datetime.datetime.now(datetime.UTC).date()
+    day = today - datetime.timedelta(days=RETENTION_DAYS)
+    while day <= today + datetime.timedelta(days=DAYS_AHEAD):
+        upper = day + datetime.timedelta(days=1)
+        run(
+            f"CREATE TABLE {TABLE}_p{day:%Y%m%d} PARTITION OF {TABLE} "
+            f"FOR VALUES FROM ('{day.isoformat()} 00:00+00') TO ('{upper.isoformat()} 00:00+00')"
+        )
+        day = upper
+
+    cutoff = today - datetime.timedelta(days=RETENTION_DAYS)
+    run(
+        f"INSERT INTO {TABLE} SELECT * FROM {LEGACY} WHERE ts >= %s",
+        [f"{cutoff.isoformat()} 00:00+00"],
+    )
+    run(
+        f"SELECT setval(pg_get_serial_sequence('{TABLE}', 'id'), "
+        f"COALESCE((SELECT MAX(id) FROM {LEGACY}), 0) + 1, false)"
+    )
+    run(f"DROP TABLE {LEGACY}")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('phonebridge', '0011_remove_duplicate_qr_indexes'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PhoneLatencyRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('hour', models.DateTimeField(verbose_name='Час (начало)')),
+                ('endpoint', models.CharField(blank=True, default='', max_length=128, verbose_name='Endpoint')),
+                ('count', models.IntegerField(default=0, verbose_name='Замеров')),
+                ('errors', models.IntegerField(default=0, verbose_name='Ответов с HTTP ≥ 400')),
+                ('total_ms', models.BigIntegerField(default=0, verbose_name='Сумма (мс)')),
+                ('sketch', models.JSONField(blank=True, default=dict, verbose_name='DDSketch значений')),
+                ('device', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='+', to='phonebridge.phonedevice')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name': 'Агрегат latency телефона (час)',
+                'verbose_name_plural': 'Агрегаты latency телефонов (по часам)',
+                'indexes': [models.Index(fields=['device', 'hour'], name='phonebridge_lat_device_idx'), models.Index(fields=['hour'], name='phonebridge_lat_hour_idx')],
+                'constraints': [models.UniqueConstraint(condition=models.Q(('device__isnull', False)), fields=('hour', 'user', 'device', 'endpoint'), name='phonebridge_lat_key_uniq'), models.UniqueConstraint(condition=models.Q(('device__isnull', True)), fields=('hour', 'user', 'endpoint'), name='phonebridge_lat_key_nodev_uniq')],
+            },
+        ),
+        migrations.RunPython(_partition_telemetry, migrations.RunPython.noop),
+    ]
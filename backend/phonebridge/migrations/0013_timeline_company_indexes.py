@@ -0,0 +1,23 @@
+"""Индекс (company, created_at) для ленты карточки компании.
+
+Запросы на звонок компании читаются keyset-выборкой по created_at.
+"""
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('companies', '0057_timeline_company_indexes'),
+        ('phonebridge', '0012_telemetry_partitions_latency_rollup'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='callrequest',
+            index=models.Index(fields=['company', 'created_at'], name='phonebridge_call_company_idx'),
+        ),
+    ]
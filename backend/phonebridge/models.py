@@ -184,6 +184,8 @@ class CallRequest(models.Model):
     class Meta:
         indexes = [
             models.Index(fields=["user", "status", "created_at"]),
+            # Лента карточки компании
+            models.Index(fields=["company", "created_at"], name="phonebridge_call_company_idx"),
         ]
 
     def __str__(self) -> str:
@@ -191,6 +193,14 @@ class CallRequest(models.Model):
 
 
 class PhoneTelemetry(models.Model):
+    """
+    Сырая телеметрия Android-приложения.
+
+    В PostgreSQL таблица секционирована по дням (RANGE по ts, миграция 0012):
+    хранение ограничивается удалением старых секций, а не DELETE.
+    Запись — пакетами из буфера (phonebridge/telemetry.py).
+    """
+
     class Type(models.TextChoices):
         LATENCY = "latency", "Latency"
         ERROR = "error", "Error"
@@ -222,6 +232,51 @@ class PhoneTelemetry(models.Model):
         return f"Telemetry({self.user_id}, {self.type}, {self.endpoint}, {self.http_code})"
 
 
+class PhoneLatencyRollup(models.Model):
+    """
+    Часовой агрегат latency-телеметрии по (устройство, endpoint): число, сумма,
+    ошибки и DDSketch значений (messenger/sketch.py) для перцентилей.
+
+    Пишется воркером телеметрии (phonebridge/telemetry.py) при слиянии буфера
+    и синхронной записью; ключ (час, пользователь, устройство, endpoint)
+    уникален — device бывает NULL, поэтому ограничений два (частичных).
+    """
+
+    hour = models.DateTimeField("Час (начало)")
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name="+")
+    device = models.ForeignKey(
+        PhoneDevice, null=True, blank=True, on_delete=models.CASCADE, related_name="+"
+    )
+    endpoint = models.CharField("Endpoint", max_length=128, blank=True, default="")
+    count = models.IntegerField("Замеров", default=0)
+    errors = models.IntegerField("Ответов с HTTP ≥ 400", default=0)
+    total_ms = models.BigIntegerField("Сумма (мс)", default=0)
+    sketch = models.JSONField("DDSketch значений", default=dict, blank=True)
+
+    class Meta:
+        verbose_name = "Агрегат latency телефона (час)"
+        verbose_name_plural = "Агрегаты latency телефонов (по часам)"
+        constraints = [
+            models.UniqueConstraint(
+                fields=["hour", "user", "device", "endpoint"],
+                condition=models.Q(device__isnull=False),
+                name="phonebridge_lat_key_uniq",
+            ),
+            models.UniqueConstraint(
+                fields=["hour", "user", "endpoint"],
+                condition=models.Q(device__isnull=True),
+                name="phonebridge_lat_key_nodev_uniq",
+            ),
+        ]
+        indexes = [
+            models.Index(fields=["device", "hour"], name="phonebridge_lat_device_idx"),
+            models.Index(fields=["hour"], name="phonebridge_lat_hour_idx"),
+        ]
+
+    def __str__(self) -> str:
+        return f"Latency({self.device_id}, {self.endpoint}) @ {self.hour:%Y-%m-%d %H}: {self.count}"
+
+
 class PhoneLogBundle(models.Model):
     device = models.ForeignKey(
         PhoneDevice, null=True, blank=True, on_delete=models.SET_NULL, related_name="log_bundles"
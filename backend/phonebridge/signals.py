@@ -0,0 +1,22 @@
+"""Сигналы phonebridge: пробуждение long-poll pull при новой команде на звонок."""
+
+from django.core.cache import cache
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from phonebridge.models import CallRequest, PhoneDevice
+from phonebridge.wakeup import notify_call_pending
+
+
+@receiver(post_save, sender=CallRequest)
+def wake_pull_on_new_call(sender, instance: CallRequest, created: bool, **kwargs):
+    if instance.status == CallRequest.Status.PENDING:
+        notify_call_pending(instance.user_id)
+
+
+@receiver(post_delete, sender=PhoneDevice)
+def forget_deleted_device(sender, instance: PhoneDevice, **kwargs):
+    """Удалённое устройство не должно проходить pull по кэшу last_seen."""
+    from phonebridge.api import device_seen_key
+
+    cache.delete(device_seen_key(instance.user_id, instance.device_id))
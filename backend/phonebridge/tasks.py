@@ -8,6 +8,8 @@ import logging
 from datetime import timedelta
 
 from celery import shared_task
+from django.conf import settings
+from django.core.cache import cache
 from django.utils import timezone
 
 from phonebridge.models import CallRequest
@@ -31,3 +33,42 @@ def clean_old_call_requests(days_old: int = 30):
     except Exception as exc:
         logger.error(f"Error cleaning old call requests: {exc}", exc_info=True)
         raise
+
+
+@shared_task(name="phonebridge.tasks.drain_telemetry_buffer", ignore_result=True)
+def drain_telemetry_buffer():
+    """
+    Слить буфер телеметрии в БД (beat, каждые несколько секунд).
+
+    Один воркер за раз (cache-лок): пересекающиеся запуски beat просто выходят.
+    """
+    from phonebridge import telemetry
+
+    if getattr(settings, "PHONEBRIDGE_TELEMETRY_BUFFER", "sync") != "redis":
+        return
+    lock_key = "lock:phonebridge:drain_telemetry_buffer"
+    if not cache.add(lock_key, "1", timeout=10 * 60):
+        return
+    try:
+        written = telemetry.drain_buffer()
+        if written:
+            logger.info("drain_telemetry_buffer: записано %s замеров", written)
+    finally:
+        cache.delete(lock_key)
+
+
+@shared_task(name="phonebridge.tasks.maintain_telemetry_partitions")
+def maintain_telemetry_partitions():
+    """Создать секции телеметрии вперёд, удалить просроченные и старые агрегаты."""
+    from phonebridge import telemetry
+
+    created = telemetry.ensure_partitions()
+    dropped = telemetry.drop_expired_partitions()
+    rollups = telemetry.purge_rollups()
+    logger.info(
+        "maintain_telemetry_partitions: создано секций %s, удалено %s, агрегатов %s",
+        len(created),
+        dropped,
+        rollups,
+    )
+    return {"created": len(created), "dropped": dropped, "rollups_deleted": rollups}
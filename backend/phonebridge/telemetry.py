@@ -0,0 +1,489 @@
+"""
+Приём телеметрии Android-приложения: буфер → пакетная запись → часовые агрегаты.
+
+- PhoneTelemetryView только валидирует батч и кладёт его в буфер: Redis stream
+  STREAM_KEY (PHONEBRIDGE_TELEMETRY_BUFFER="redis"). Без Redis ("sync") или при
+  его недоступности батч пишется сразу тем же ingest_batches().
+- drain_buffer() (Celery beat, один воркер за раз) читает stream группой
+  потребителей, одним запросом сопоставляет device_id → PhoneDevice и пишет
+  строки одним COPY (PostgreSQL) или multi-row INSERT, затем подтверждает
+  записи. Доставка «хотя бы раз»: после падения между записью и XACK батч
+  запишется повторно — для телеметрии это допустимо. Если пачка не пишется
+  (например, пользователь удалён), батчи пишутся по одному, а сбойные уходят
+  в DEAD_LETTER_KEY — иначе неподтверждённая запись блокировала бы буфер.
+- В PostgreSQL phonebridge_phonetelemetry секционирована по дням (миграция
+  0012): ensure_partitions() создаёт секции вперёд, drop_expired_partitions()
+  удаляет секции старше срока хранения вместо DELETE по строкам.
+- Latency-замеры параллельно сливаются в PhoneLatencyRollup (DDSketch),
+  latency_percentiles() отвечает по ним без чтения сырых строк.
+"""
+
+from __future__ import annotations
+
+import datetime
+import json
+import logging
+import re
+from collections.abc import Iterable
+
+from django.conf import settings
+from django.db import IntegrityError, connection, transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from messenger.sketch import DDSketch
+
+from .models import PhoneDevice, PhoneLatencyRollup, PhoneTelemetry
+
+logger = logging.getLogger("phonebridge.telemetry")
+
+STREAM_KEY = "phonebridge:telemetry"
+STREAM_GROUP = "ingest"
+STREAM_CONSUMER = "drain"
+# Страховка от бесконечного роста stream, если воркер остановлен (~1 млн батчей)
+STREAM_MAXLEN = 1_000_000
+# Батчей (запросов клиента, до 100 замеров в каждом) за одно чтение stream
+DRAIN_READ_COUNT = 500
+DRAIN_MAX_ROUNDS = 20
+# Батчи, которые не удалось записать даже поштучно (для разбора вручную)
+DEAD_LETTER_KEY = "phonebridge:telemetry:dead"
+DEAD_LETTER_MAXLEN = 10_000
+
+TABLE = PhoneTelemetry._meta.db_table
+PARTITION_RE = re.compile(rf"^{TABLE}_p(\d{{8}})$")
+COPY_COLUMNS = ("ts", "type", "endpoint", "http_code", "value_ms", "extra", "device_id", "user_id")
+# Часы телефона бывают неточны: замер «из будущего» записываем текущим временем
+MAX_CLOCK_SKEW = datetime.timedelta(hours=1)
+
+
+def _retention_days() -> int:
+    return int(getattr(settings, "PHONEBRIDGE_TELEMETRY_RETENTION_DAYS", 30))
+
+
+def _redis():
+    from django_redis import get_redis_connection
+
+    return get_redis_connection("default")
+
+
+# ---------------------------------------------------------------------------
+# Буфер
+# ---------------------------------------------------------------------------
+
+
+def enqueue(user_id: int, device_id: str, items: Iterable[dict]) -> int:
+    """Положить провалидированный батч в буфер. Возвращает число принятых замеров."""
+    batch = {
+        "u": user_id,
+        "d": device_id,
+        "i": [
+            {
+                "ts": item["ts"].isoformat() if item.get("ts") else None,
+                "type": item.get("type") or PhoneTelemetry.Type.OTHER,
+                "endpoint": (item.get("endpoint") or "").strip()[:128],
+                "http_code": item.get("http_code"),
+                "value_ms": item.get("value_ms"),
+                "extra": item.get("extra") or {},
+            }
+            for item in items
+        ],
+    }
+    if not batch["i"]:
+        return 0
+    if getattr(settings, "PHONEBRIDGE_TELEMETRY_BUFFER", "sync") == "redis":
+        try:
+            _redis().xadd(
+                STREAM_KEY, {"b": json.dumps(batch)}, maxlen=STREAM_MAXLEN, approximate=True
+            )
+            return len(batch["i"])
+        except Exception:
+            logger.warning("Telemetry buffer unavailable, writing batch directly", exc_info=True)
+    ingest_batches([batch])
+    return len(batch["i"])
+
+
+def _ensure_group(client) -> None:
+    from redis.exceptions import ResponseError
+
+    try:
+        client.xgroup_create(STREAM_KEY, STREAM_GROUP, id="0", mkstream=True)
+    except ResponseError as exc:
+        if "BUSYGROUP" not in str(exc):
+            raise
+
+
+def drain_buffer() -> int:
+    """
+    Слить буфер в БД. Сначала — неподтверждённые записи прошлого прогона
+    (воркер упал), затем новые. Возвращает число записанных замеров.
+    """
+    client = _redis()
+    _ensure_group(client)
+    written = 0
+    start_id = "0"  # собственные неподтверждённые записи
+    for _ in range(DRAIN_MAX_ROUNDS):
+        response = client.xreadgroup(
+            STREAM_GROUP, STREAM_CONSUMER, {STREAM_KEY: start_id}, count=DRAIN_READ_COUNT
+        )
+        entries = response[0][1] if response else []
+        if not entries:
+            if start_id == ">":
+                break
+            start_id = ">"
+            continue
+        batches = []
+        for _entry_id, fields in entries:
+            raw = fields.get(b"b") or fields.get("b")
+            try:
+                batches.append(json.loads(raw))
+            except (TypeError, ValueError):
+                logger.warning("Skipping malformed telemetry batch in buffer")
+        try:
+            written += ingest_batches(batches)
+        except Exception:
+            # Одна «ядовитая» запись (например, пользователь удалён) не должна
+            # вечно блокировать буфер: пишем по одному, сбойные — в DEAD_LETTER_KEY.
+            logger.warning("Telemetry batch write failed, retrying entry by entry", exc_info=True)
+            written += _ingest_one_by_one(client, batches)
+        ids = [entry_id for entry_id, _fields in entries]
+        client.xack(STREAM_KEY, STREAM_GROUP, *ids)
+        client.xdel(STREAM_KEY, *ids)
+    return written
+
+
+def _ingest_one_by_one(client, batches: list[dict]) -> int:
+    written = 0
+    for batch in batches:
+        try:
+            written += ingest_batches([batch])
+        except Exception:
+            logger.exception("Telemetry batch of user %s moved to dead letter", batch.get("u"))
+            client.xadd(
+                DEAD_LETTER_KEY,
+                {"b": json.dumps(batch)},
+                maxlen=DEAD_LETTER_MAXLEN,
+                approximate=True,
+            )
+    return written
+
+
+def buffer_stats() -> dict[str, int]:
+    """Длина буфера и число неподтверждённых записей (для мониторинга)."""
+    if getattr(settings, "PHONEBRIDGE_TELEMETRY_BUFFER", "sync") != "redis":
+        return {"length": 0, "pending": 0, "dead": 0}
+    client = _redis()
+    _ensure_group(client)
+    return {
+        "length": client.xlen(STREAM_KEY),
+        "pending": client.xpending(STREAM_KEY, STREAM_GROUP)["pending"],
+        "dead": client.xlen(DEAD_LETTER_KEY),
+    }
+
+
+# ---------------------------------------------------------------------------
+# Запись
+# ---------------------------------------------------------------------------
+
+
+def _resolve_devices(batches: list[dict]) -> dict[tuple[int, str], object]:
+    pairs = {(b["u"], b["d"]) for b in batches if b.get("d")}
+    if not pairs:
+        return {}
+    condition = Q()
+    for user_id, device_id in pairs:
+        condition |= Q(user_id=user_id, device_id=device_id)
+    return {
+        (user_id, device_id): pk
+        for pk, user_id, device_id in PhoneDevice.objects.filter(condition).values_list(
+            "pk", "user_id", "device_id"
+        )
+    }
+
+
+def _rows(batches: list[dict]) -> list[dict]:
+    devices = _resolve_devices(batches)
+    now = timezone.now()
+    oldest = now - datetime.timedelta(days=_retention_days())
+    rows = []
+    for batch in batches:
+        device_pk = devices.get((batch["u"], batch.get("d") or ""))
+        for item in batch["i"]:
+            ts = datetime.datetime.fromisoformat(item["ts"]) if item.get("ts") else now
+            if timezone.is_naive(ts):
+                ts = timezone.make_aware(ts)
+            ts = ts.astimezone(datetime.UTC)
+            if ts > now + MAX_CLOCK_SKEW:
+                ts = now
+            elif ts < oldest:
+                continue  # всё равно ушло бы со следующим удалением секций
+            rows.append(
+                {
+                    "ts": ts,
+                    "type": item["type"],
+                    "endpoint": item["endpoint"],
+                    "http_code": item.get("http_code"),
+                    "value_ms": item.get("value_ms"),
+                    "extra": item.get("extra") or {},
+                    "device_id": device_pk,
+                    "user_id": batch["u"],
+                }
+            )
+    return rows
+
+
+def _insert_rows(rows: list[dict]) -> None:
+    if connection.vendor == "postgresql":
+        columns = ", ".join(COPY_COLUMNS)
+        with connection.cursor() as cursor:
+            with cursor.cursor.copy(f"COPY {TABLE} ({columns}) FROM STDIN") as copy:
+                for row in rows:
+                    copy.write_row(
+                        [
+                            json.dumps(row[column]) if column == "extra" else row[column]
+                            for column in COPY_COLUMNS
+                        ]
+                    )
+        return
+    PhoneTelemetry.objects.bulk_create([PhoneTelemetry(**row) for row in rows], batch_size=1000)
+
+
+def _hour(moment: datetime.datetime) -> datetime.datetime:
+    return moment.replace(minute=0, second=0, microsecond=0)
+
+
+def _merge_rollup(row: PhoneLatencyRollup, fresh: PhoneLatencyRollup, sketch: DDSketch) -> None:
+    row.count += fresh.count
+    row.total_ms += fresh.total_ms
+    row.errors += fresh.errors
+    row.sketch = DDSketch.from_dict(row.sketch).merge(sketch).to_dict()
+
+
+def _upsert_rollup(key: tuple, fresh: PhoneLatencyRollup, sketch: DDSketch) -> None:
+    """Слить один ключ под блокировкой строки (insert → при гонке повторное слияние)."""
+    hour, user_id, device_id, endpoint = key
+    qs = PhoneLatencyRollup.objects.filter(
+        hour=hour, user_id=user_id, device_id=device_id, endpoint=endpoint
+    )
+    row = qs.select_for_update().first()
+    if row is None:
+        try:
+            with transaction.atomic():
+                fresh.sketch = sketch.to_dict()
+                fresh.save(force_insert=True)
+            return
+        except IntegrityError:
+            # Строку ключа только что вставил параллельный запрос — сливаемся в неё.
+            row = qs.select_for_update().first()
+            if row is None:
+                raise
+    _merge_rollup(row, fresh, sketch)
+    row.save(update_fields=["count", "total_ms", "errors", "sketch"])
+
+
+def _update_rollups(rows: list[dict]) -> int:
+    """
+    Слить latency-замеры в PhoneLatencyRollup: одна выборка и два bulk-запроса.
+
+    Вызывается в транзакции ingest_batches. Существующие строки блокируются
+    (SELECT FOR UPDATE), новые ключи защищены уникальным ограничением: если
+    параллельная запись (синхронный режим, Redis недоступен) успела вставить
+    тот же ключ, пачка откатывается до savepoint и ключи сливаются по одному.
+    """
+    merged: dict[tuple, PhoneLatencyRollup] = {}
+    sketches: dict[tuple, DDSketch] = {}
+    for row in rows:
+        if row["type"] != PhoneTelemetry.Type.LATENCY or row["value_ms"] is None:
+            continue
+        key = (_hour(row["ts"]), row["user_id"], row["device_id"], row["endpoint"])
+        rollup = merged.get(key)
+        if rollup is None:
+            rollup = merged[key] = PhoneLatencyRollup(
+                hour=key[0], user_id=key[1], device_id=key[2], endpoint=key[3]
+            )
+            sketches[key] = DDSketch()
+        value = max(row["value_ms"], 0)
+        rollup.count += 1
+        rollup.total_ms += value
+        rollup.errors += int((row["http_code"] or 0) >= 400)
+        sketches[key].add(value)
+    if not merged:
+        return 0
+    written = len(merged)
+
+    existing = (
+        PhoneLatencyRollup.objects.select_for_update()
+        .filter(hour__in={key[0] for key in merged}, user_id__in={key[1] for key in merged})
+        .order_by("id")
+    )
+    to_update = []
+    for row in existing:
+        key = (row.hour, row.user_id, row.device_id, row.endpoint)
+        fresh = merged.pop(key, None)
+        if fresh is None:
+            continue
+        _merge_rollup(row, fresh, sketches[key])
+        to_update.append(row)
+    PhoneLatencyRollup.objects.bulk_update(to_update, ["count", "total_ms", "errors", "sketch"])
+    if not merged:
+        return written
+    for key, rollup in merged.items():
+        rollup.sketch = sketches[key].to_dict()
+    try:
+        with transaction.atomic():
+            PhoneLatencyRollup.objects.bulk_create(merged.values(), batch_size=500)
+    except IntegrityError:
+        for key, rollup in merged.items():
+            rollup.pk = None
+            _upsert_rollup(key, rollup, sketches[key])
+    return written
+
+
+def ingest_batches(batches: list[dict]) -> int:
+    """Записать батчи одной транзакцией. Возвращает число записанных замеров."""
+    if not batches:
+        return 0
+    rows = _rows(batches)
+    if not rows:
+        return 0
+    with transaction.atomic():
+        _insert_rows(rows)
+        _update_rollups(rows)
+    return len(rows)
+
+
+# ---------------------------------------------------------------------------
+# Секции и срок хранения
+# ---------------------------------------------------------------------------
+
+
+def is_partitioned() -> bool:
+    if connection.vendor != "postgresql":
+        return False
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT 1 FROM pg_partitioned_table p JOIN pg_class c ON c.oid = p.partrelid "
+            "WHERE c.relname = %s",
+            [TABLE],
+        )
+        return cursor.fetchone() is not None
+
+
+def _partitions() -> dict[datetime.date, str]:
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT c.relname FROM pg_inherits i "
+            "JOIN pg_class c ON c.oid = i.inhrelid "
+            "JOIN pg_class p ON p.oid = i.inhparent WHERE p.relname = %s",
+            [TABLE],
+        )
+        names = [name for (name,) in cursor.fetchall()]
+    result = {}
+    for name in names:
+        match = PARTITION_RE.match(name)
+        if match:
+            result[datetime.datetime.strptime(match.group(1), "%Y%m%d").date()] = name
+    return result
+
+
+def ensure_partitions(days_ahead: int = 7) -> list[str]:
+    """Создать дневные секции на сегодня и days_ahead дней вперёд (UTC)."""
+    if not is_partitioned():
+        return []
+    existing = _partitions()
+    today = timezone.now().astimezone(datetime.UTC).date()
+    created = []
+    with connection.cursor() as cursor:
+        for offset in range(days_ahead + 1):
+            day = today + datetime.timedelta(days=offset)
+            if day in existing:
+                continue
+            name = f"{TABLE}_p{day:%Y%m%d}"
+            upper = day + datetime.timedelta(days=1)
+            cursor.execute(
+                f"CREATE TABLE IF NOT EXISTS {name} PARTITION OF {TABLE} "
+                f"FOR VALUES FROM ('{day.isoformat()} 00:00+00') "
+                f"TO ('{upper.isoformat()} 00:00+00')"
+            )
+            created.append(name)
+    return created
+
+
+def expired_partitions(retention_days: int | None = None) -> list[str]:
+    """Секции, целиком старше срока хранения."""
+    if not is_partitioned():
+        return []
+    retention_days = _retention_days() if retention_days is None else retention_days
+    cutoff = timezone.now().astimezone(datetime.UTC).date() - datetime.timedelta(
+        days=retention_days
+    )
+    return [name for day, name in sorted(_partitions().items()) if day < cutoff]
+
+
+def drop_expired_partitions(retention_days: int | None = None) -> int:
+    """
+    Удалить телеметрию старше срока хранения.
+
+    PostgreSQL: DROP секций целиком (+ DELETE из DEFAULT-секции, она почти пуста).
+    Прочие БД: обычный DELETE. Возвращает число удалённых секций или строк.
+    """
+    retention_days = _retention_days() if retention_days is None else retention_days
+    cutoff = timezone.now() - datetime.timedelta(days=retention_days)
+    if not is_partitioned():
+        return PhoneTelemetry.objects.filter(ts__lt=cutoff).delete()[0]
+    names = expired_partitions(retention_days)
+    with connection.cursor() as cursor:
+        for name in names:
+            cursor.execute(f"DROP TABLE IF EXISTS {name}")
+        cursor.execute("DELETE FROM phonebridge_phonetelemetry_default WHERE ts < %s", [cutoff])
+    return len(names)
+
+
+def purge_rollups(retention_days: int | None = None) -> int:
+    if retention_days is None:
+        retention_days = int(getattr(settings, "PHONEBRIDGE_TELEMETRY_ROLLUP_RETENTION_DAYS", 180))
+    cutoff = timezone.now() - datetime.timedelta(days=retention_days)
+    return PhoneLatencyRollup.objects.filter(hour__lt=cutoff).delete()[0]
+
+
+# ---------------------------------------------------------------------------
+# Чтение
+# ---------------------------------------------------------------------------
+
+
+def _summary(count: int, total_ms: int, errors: int, sketch: DDSketch) -> dict:
+    def quantile(q):
+        value = sketch.quantile(q)
+        return round(value) if value is not None else None
+
+    return {
+        "count": count,
+        "errors": errors,
+        "avg_ms": round(total_ms / count) if count else None,
+        "p50_ms": quantile(0.5),
+        "p90_ms": quantile(0.9),
+        "p99_ms": quantile(0.99),
+    }
+
+
+def latency_percentiles(device: PhoneDevice, since: datetime.datetime) -> dict:
+    """Перцентили latency устройства с начала часа since: итог и по endpoint."""
+    endpoints: dict[str, list] = {}
+    overall = [0, 0, 0, DDSketch()]
+    rows = PhoneLatencyRollup.objects.filter(device=device, hour__gte=_hour(since)).values_list(
+        "endpoint", "count", "total_ms", "errors", "sketch"
+    )
+    for endpoint, count, total_ms, errors, raw in rows.iterator(chunk_size=1000):
+        sketch = DDSketch.from_dict(raw)
+        stats = endpoints.setdefault(endpoint, [0, 0, 0, DDSketch()])
+        for acc in (stats, overall):
+            acc[0] += count
+            acc[1] += total_ms
+            acc[2] += errors
+            acc[3].merge(sketch)
+    return {
+        "overall": _summary(*overall),
+        "endpoints": [
+            {"endpoint": endpoint, **_summary(*stats)}
+            for endpoint, stats in sorted(endpoints.items(), key=lambda kv: -kv[1][0])
+        ],
+    }
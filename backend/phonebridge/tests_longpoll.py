@@ -0,0 +1,164 @@
+"""
+Тесты long-poll выдачи команд (PullCallView с wait_seconds, phonebridge.wakeup).
+
+Покрывает:
+- пробуждение ожидающего pull по сигналу о новой команде
+- таймаут ожидания → 204; под WSGI ожидание отключено потолком настроек
+- троттлинг записи last_seen_at: холостой pull не пишет в БД
+- однократная выдача команды при нескольких pull
+"""
+
+import asyncio
+import time
+from io import StringIO
+
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection
+from django.test import AsyncRequestFactory, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from rest_framework import status
+from rest_framework.test import force_authenticate
+
+from phonebridge.api import PullCallView
+from phonebridge.models import CallRequest, PhoneDevice
+from phonebridge.tests import _jwt_client
+from phonebridge.wakeup import _claim_with_wait, call_group
+
+User = get_user_model()
+
+
+class ClaimWithWaitTest(TestCase):
+    """Ожидание пробуждения в phonebridge.wakeup."""
+
+    def test_wakeup_triggers_second_claim(self):
+        attempts = []
+
+        def claim():
+            attempts.append(time.monotonic())
+            return "call" if len(attempts) > 1 else None
+
+        async def scenario():
+            layer = get_channel_layer()
+
+            async def wake():
+                await asyncio.sleep(0.05)
+                await layer.group_send(call_group(7), {"type": "call.pending"})
+
+            waker = asyncio.ensure_future(wake())
+            started = time.monotonic()
+            result = await _claim_with_wait(7, claim, 5)
+            await waker
+            return result, time.monotonic() - started
+
+        result, elapsed = async_to_sync(scenario)()
+        self.assertEqual(result, "call")
+        self.assertEqual(len(attempts), 2)
+        self.assertLess(elapsed, 2)
+
+    def test_timeout_makes_final_claim(self):
+        attempts = []
+
+        def claim():
+            attempts.append(1)
+
+        result = async_to_sync(_claim_with_wait)(8, claim, 0.1)
+        self.assertIsNone(result)
+        self.assertEqual(len(attempts), 2)
+
+
+@override_settings(SECURE_SSL_REDIRECT=False, PHONEBRIDGE_LAST_SEEN_THROTTLE_SECONDS=30)
+class PullLongPollViewTest(TestCase):
+    """PullCallView в режиме long-poll."""
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username="longpoll_user", password="pass")
+        self.device = PhoneDevice.objects.create(
+            user=self.user, device_id="lp-device", platform="android"
+        )
+        self.client = _jwt_client(self.user)
+
+    def _async_pull(self, wait):
+        request = AsyncRequestFactory().get(
+            f"/api/phone/calls/pull/?device_id=lp-device&wait_seconds={wait}"
+        )
+        force_authenticate(request, user=self.user)
+        return PullCallView.as_view()(request)
+
+    def test_asgi_wait_times_out_with_204(self):
+        started = time.monotonic()
+        response = self._async_pull(0.2)
+        self.assertEqual(response.status_code, status.HTTP_204_NO_CONTENT)
+        self.assertGreaterEqual(time.monotonic() - started, 0.2)
+
+    def test_wsgi_wait_capped(self):
+        started = time.monotonic()
+        response = self.client.get("/api/phone/calls/pull/?device_id=lp-device&wait_seconds=25")
+        self.assertEqual(response.status_code, status.HTTP_204_NO_CONTENT)
+        self.assertLess(time.monotonic() - started, 1)
+
+    def test_pending_call_published_on_commit(self):
+        with self.captureOnCommitCallbacks() as callbacks:
+            CallRequest.objects.create(user=self.user, phone_raw="+79990001122")
+        self.assertEqual(len(callbacks), 1)
+
+        with self.captureOnCommitCallbacks() as callbacks:
+            CallRequest.objects.create(
+                user=self.user, phone_raw="+79990001122", status=CallRequest.Status.CANCELLED
+            )
+        self.assertEqual(callbacks, [])
+
+    def test_idle_pull_skips_last_seen_write(self):
+        self.client.get("/api/phone/calls/pull/?device_id=lp-device")
+        self.device.refresh_from_db()
+        first_seen = self.device.last_seen_at
+        self.assertIsNotNone(first_seen)
+
+        # Устройство известно по кэшу: только попытка забрать команду
+        with CaptureQueriesContext(connection) as ctx:
+            response = self._async_pull(0)
+        self.assertEqual(response.status_code, status.HTTP_204_NO_CONTENT)
+        statements = [q["sql"] for q in ctx.captured_queries if "SAVEPOINT" not in q["sql"]]
+        self.assertEqual(len(statements), 1)
+        self.assertIn("phonebridge_callrequest", statements[0])
+        self.device.refresh_from_db()
+        self.assertEqual(self.device.last_seen_at, first_seen)
+
+    def test_deleted_device_rejected(self):
+        self.client.get("/api/phone/calls/pull/?device_id=lp-device")
+        self.device.delete()
+        response = self.client.get("/api/phone/calls/pull/?device_id=lp-device")
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
+    def test_call_delivered_once(self):
+        PhoneDevice.objects.create(user=self.user, device_id="lp-device-2", platform="android")
+        call = CallRequest.objects.create(user=self.user, phone_raw="+79995554433")
+        first = self.client.get("/api/phone/calls/pull/?device_id=lp-device")
+        second = self.client.get("/api/phone/calls/pull/?device_id=lp-device-2")
+        self.assertEqual(first.data["id"], str(call.id))
+        self.assertEqual(second.status_code, status.HTTP_204_NO_CONTENT)
+
+
+class LoadtestCommandTest(TestCase):
+    def test_smoke(self):
+        out = StringIO()
+        call_command(
+            "loadtest_phone_pull",
+            "--devices",
+            "2",
+            "--seconds",
+            "0.3",
+            "--mode",
+            "poll",
+            "--interval",
+            "0.1",
+            "--calls-per-minute",
+            "0",
+            stdout=out,
+        )
+        self.assertIn("poll", out.getvalue())
+        self.assertFalse(User.objects.filter(username__startswith="pull_load_").exists())
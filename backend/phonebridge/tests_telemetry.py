@@ -0,0 +1,189 @@
+"""
+Тесты приёма телеметрии (phonebridge.telemetry) и API перцентилей latency.
+
+Покрывает:
+- POST /api/phone/telemetry/: запись батча, привязка к устройству, агрегаты
+- слияние часовых агрегатов и перцентили по ним, гонка вставки одного ключа
+- откат на прямую запись, если буфер (Redis) недоступен
+- слив буфера: «ядовитый» батч уходит в dead letter, остальные записываются
+- срок хранения: удаление просроченной телеметрии
+"""
+
+import json
+from datetime import timedelta
+from io import StringIO
+from unittest import mock
+
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from phonebridge import telemetry
+from phonebridge.models import PhoneDevice, PhoneLatencyRollup, PhoneTelemetry
+from phonebridge.tests import _jwt_client
+
+User = get_user_model()
+
+
+def _latency(value_ms, endpoint="/api/phone/calls/pull/", **extra):
+    return {"type": "latency", "endpoint": endpoint, "value_ms": value_ms, **extra}
+
+
+@override_settings(SECURE_SSL_REDIRECT=False, PHONEBRIDGE_TELEMETRY_BUFFER="sync")
+class TelemetryIngestTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username="telemetry_user", password="pass")
+        self.device = PhoneDevice.objects.create(user=self.user, device_id="tel-device")
+        self.client = _jwt_client(self.user)
+
+    def _post(self, items, device_id="tel-device"):
+        return self.client.post(
+            "/api/phone/telemetry/", {"device_id": device_id, "items": items}, format="json"
+        )
+
+    def test_batch_written_with_device_and_rollup(self):
+        response = self._post(
+            [_latency(120), _latency(480, http_code=502), {"type": "auth", "http_code": 401}]
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data["saved"], 3)
+        self.assertEqual(PhoneTelemetry.objects.filter(device=self.device).count(), 3)
+
+        rollup = PhoneLatencyRollup.objects.get(device=self.device)
+        self.assertEqual((rollup.count, rollup.errors, rollup.total_ms), (2, 1, 600))
+
+    def test_unknown_device_kept_without_link(self):
+        self._post([_latency(50)], device_id="other-device")
+        row = PhoneTelemetry.objects.get(user=self.user)
+        self.assertIsNone(row.device_id)
+
+    def test_batches_merge_into_one_rollup(self):
+        telemetry.enqueue(self.user.id, "tel-device", [_latency(v) for v in range(1, 51)])
+        with self.assertNumQueries(6):
+            # устройства, INSERT, выборка агрегатов, bulk_update + SAVEPOINT/RELEASE
+            telemetry.enqueue(self.user.id, "tel-device", [_latency(v) for v in range(51, 101)])
+        rollup = PhoneLatencyRollup.objects.get(device=self.device)
+        self.assertEqual(rollup.count, 100)
+
+        result = telemetry.latency_percentiles(self.device, timezone.now() - timedelta(hours=1))
+        self.assertEqual(result["overall"]["count"], 100)
+        self.assertAlmostEqual(result["overall"]["p50_ms"], 50, delta=2)
+        self.assertAlmostEqual(result["overall"]["p99_ms"], 99, delta=2)
+
+    def test_concurrent_insert_of_same_key_is_merged(self):
+        telemetry.enqueue(self.user.id, "tel-device", [_latency(10)])
+        # Параллельная запись: строка ключа появилась после выборки агрегатов
+        with mock.patch.object(
+            PhoneLatencyRollup.objects,
+            "select_for_update",
+            return_value=PhoneLatencyRollup.objects.none(),
+        ):
+            telemetry.enqueue(self.user.id, "tel-device", [_latency(30), _latency(50)])
+        rollup = PhoneLatencyRollup.objects.get(device=self.device)
+        self.assertEqual((rollup.count, rollup.total_ms), (3, 90))
+        self.assertEqual(rollup.sketch["n"], 3)
+
+    def test_clock_skew_clamped_and_stale_dropped(self):
+        now = timezone.now()
+        accepted = telemetry.enqueue(
+            self.user.id,
+            "tel-device",
+            [
+                _latency(10, ts=now + timedelta(days=2)),
+                _latency(10, ts=now - timedelta(days=90)),
+            ],
+        )
+        self.assertEqual(accepted, 2)
+        row = PhoneTelemetry.objects.get()
+        self.assertLessEqual(row.ts, timezone.now())
+
+    @override_settings(PHONEBRIDGE_TELEMETRY_BUFFER="redis")
+    def test_buffer_unavailable_falls_back_to_direct_write(self):
+        # В тестах кэш — LocMem: Redis-буфера нет, батч пишется сразу
+        response = self._post([_latency(70)])
+        self.assertEqual(response.data["saved"], 1)
+        self.assertEqual(PhoneTelemetry.objects.count(), 1)
+
+    def test_drain_moves_poison_batch_to_dead_letter(self):
+        good = {"u": self.user.id, "d": "tel-device", "i": [_latency(40)]}
+        bad = {"u": self.user.id, "d": "tel-device", "i": [_latency(40, ts="not-a-date")]}
+        client = mock.MagicMock()
+        client.xreadgroup.side_effect = [
+            [
+                [
+                    telemetry.STREAM_KEY,
+                    [(b"1-0", {b"b": json.dumps(good)}), (b"2-0", {b"b": json.dumps(bad)})],
+                ]
+            ],
+            [],
+            [],
+        ]
+        with mock.patch.object(telemetry, "_redis", return_value=client):
+            self.assertEqual(telemetry.drain_buffer(), 1)
+
+        self.assertEqual(PhoneTelemetry.objects.count(), 1)
+        client.xack.assert_called_once_with(
+            telemetry.STREAM_KEY, telemetry.STREAM_GROUP, b"1-0", b"2-0"
+        )
+        dead_key, fields = client.xadd.call_args.args
+        self.assertEqual(dead_key, telemetry.DEAD_LETTER_KEY)
+        self.assertEqual(json.loads(fields["b"]), bad)
+
+    def test_retention_deletes_expired_rows(self):
+        telemetry.enqueue(self.user.id, "tel-device", [_latency(10)])
+        PhoneTelemetry.objects.create(
+            user=self.user, ts=timezone.now() - timedelta(days=40), type="latency"
+        )
+        self.assertEqual(telemetry.drop_expired_partitions(30), 1)
+        self.assertEqual(PhoneTelemetry.objects.count(), 1)
+
+        out = StringIO()
+        call_command("cleanup_telemetry_logs", "--telemetry-days", "0", stdout=out)
+        self.assertIn("Удалено 1 записей телеметрии", out.getvalue())
+
+
+@override_settings(SECURE_SSL_REDIRECT=False, PHONEBRIDGE_TELEMETRY_BUFFER="sync")
+class PhoneLatencyViewTest(TestCase):
+    url = "/api/phone/telemetry/latency/"
+
+    def setUp(self):
+        self.owner = User.objects.create_user(username="latency_owner", password="pass")
+        self.other = User.objects.create_user(username="latency_other", password="pass")
+        self.admin = User.objects.create_user(
+            username="latency_admin", password="pass", role=User.Role.ADMIN
+        )
+        self.device = PhoneDevice.objects.create(user=self.owner, device_id="lat-device")
+        telemetry.enqueue(self.owner.id, "lat-device", [_latency(100), _latency(300)])
+
+    def _get(self, user, **params):
+        client = APIClient()
+        client.force_authenticate(user)
+        return client.get(self.url, {"device": str(self.device.id), **params})
+
+    def test_owner_sees_percentiles(self):
+        response = self._get(self.owner, hours=6)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data["overall"]["count"], 2)
+        self.assertEqual(response.data["overall"]["avg_ms"], 200)
+        self.assertEqual(response.data["endpoints"][0]["endpoint"], "/api/phone/calls/pull/")
+
+    def test_jwt_only(self):
+        response = _jwt_client(self.owner).get(self.url, {"device": str(self.device.id)})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        session = APIClient()
+        session.force_login(self.owner)
+        response = session.get(self.url, {"device": str(self.device.id)})
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_foreign_device_hidden_admin_allowed(self):
+        self.assertEqual(self._get(self.other).status_code, status.HTTP_404_NOT_FOUND)
+        self.assertEqual(self._get(self.admin).status_code, status.HTTP_200_OK)
+
+    def test_invalid_params(self):
+        client = APIClient()
+        client.force_authenticate(self.owner)
+        response = client.get(self.url, {"device": "not-a-uuid"})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
@@ -0,0 +1,91 @@
+"""
+Long-poll доставка команд на звонок (/api/phone/calls/pull/?wait_seconds=N).
+
+Раньше каждое устройство опрашивало pull раз в 1–3 секунды, и каждый
+холостой запрос ходил в БД. Теперь:
+
+- при создании PENDING CallRequest (сигнал post_save) после коммита
+  публикуется пробуждение в группу channel layer пользователя;
+- pull подписывается на группу, пытается забрать команду и, если её нет,
+  ждёт пробуждения до wait_seconds; после пробуждения или таймаута —
+  ещё одна попытка (страховка от потерянного сообщения брокера);
+- сама выдача по-прежнему через select_for_update(skip_locked=True):
+  при нескольких устройствах пользователя команду получит ровно одно.
+
+Без channel layer ожидание не выполняется — ответ сразу, как при опросе.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import logging
+from collections.abc import Callable
+from typing import Any
+
+from asgiref.sync import async_to_sync, sync_to_async
+from channels.layers import get_channel_layer
+from django.db import transaction
+
+logger = logging.getLogger("phonebridge.wakeup")
+
+
+def call_group(user_id: int) -> str:
+    return f"phone_calls_user_{user_id}"
+
+
+def _publish(user_id: int) -> None:
+    layer = get_channel_layer()
+    if layer is None:
+        return
+    try:
+        async_to_sync(layer.group_send)(call_group(user_id), {"type": "call.pending"})
+    except Exception:
+        logger.warning("Phone call wakeup for user %s failed", user_id, exc_info=True)
+
+
+def notify_call_pending(user_id: int) -> None:
+    """Разбудить long-poll запросы устройств пользователя после коммита."""
+    transaction.on_commit(lambda: _publish(user_id))
+
+
+async def _claim_with_wait(user_id: int, claim: Callable[[], Any], timeout: float):
+    claim_async = sync_to_async(claim)
+    layer = get_channel_layer()
+    if layer is None or timeout <= 0:
+        return await claim_async()
+
+    group = call_group(user_id)
+    channel = await layer.new_channel("phone")
+    # Подписка до первой попытки: команда, созданная между попыткой и
+    # ожиданием, не потеряется — её пробуждение уже в канале.
+    await layer.group_add(group, channel)
+    try:
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + timeout
+        while True:
+            item = await claim_async()
+            remaining = deadline - loop.time()
+            if item is not None or remaining <= 0:
+                return item
+            try:
+                await asyncio.wait_for(layer.receive(channel), remaining)
+            except TimeoutError:
+                # Последняя попытка по таймауту
+                return await claim_async()
+    finally:
+        try:
+            await layer.group_discard(group, channel)
+        except Exception:
+            logger.warning("Phone call group_discard %s failed", group, exc_info=True)
+
+
+def claim_with_wait(user_id: int, claim: Callable[[], Any], timeout: float) -> Any:
+    """
+    Забрать команду через claim(); если пусто — ждать пробуждения до timeout секунд.
+
+    claim() выполняется в синхронном контексте (ORM) и должна сама
+    обеспечивать однократную выдачу (skip_locked).
+    """
+    if timeout <= 0:
+        return claim()
+    return async_to_sync(_claim_with_wait)(user_id, claim, timeout)
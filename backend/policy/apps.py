@@ -5,3 +5,6 @@ class PolicyConfig(AppConfig):
     default_auto_field = "django.db.models.BigAutoField"
     name = "policy"
     verbose_name = "Политики доступа"
+
+    def ready(self):
+        from . import signals
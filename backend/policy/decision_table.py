@@ -0,0 +1,193 @@
+"""
+Скомпилированная таблица решений policy engine.
+
+Раньше каждый decide() делал 3 запроса (PolicyConfig.load() + user/role правила),
+а {% policy_can %} в сайдбаре вызывается десятки раз на страницу. Теперь все
+включённые PolicyRule и режим читаются одним проходом в in-memory таблицу:
+
+- role-правила: (role, resource_type, resource) → первое правило по (priority, id);
+- user-правила: оверлей (user_id, resource_type, resource) → первое правило;
+- решения без контекстной логики мемоизируются в самой таблице.
+
+Таблица живёт в процессе и версионируется счётчиком в кэше (POLICY_VERSION_CACHE_KEY),
+который инкрементят сигналы сохранения/удаления PolicyRule и PolicyConfig (policy/signals.py).
+В пределах одного HTTP-запроса таблица закрепляется на request — повторные
+policy_can не ходят даже в кэш.
+
+Незакоммиченные изменения правил видны только своему потоку: пока транзакция,
+в которой меняли правила, не завершилась, таблица строится заново при каждой смене
+atomic-блока и не попадает в общий кэш процесса (иначе откат оставил бы «фантомные» правила).
+"""
+
+from __future__ import annotations
+
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import Any
+
+from django.core.cache import cache
+from django.db import transaction
+
+from .models import PolicyConfig, PolicyRule
+
+POLICY_VERSION_CACHE_KEY = "policy:decision_table:version"
+# Если кэш недоступен (Redis лежит, IGNORE_EXCEPTIONS) — перестраиваем таблицу по TTL.
+FALLBACK_TTL_SECONDS = 10
+# Ограничение мемоизации решений: пользователи × ресурсы, с запасом.
+MAX_MEMOIZED_DECISIONS = 20_000
+
+REQUEST_ATTR = "_policy_decision_table"
+
+_lock = threading.Lock()
+_table: DecisionTable | None = None
+_generation = 0  # локальные изменения правил в этом процессе
+_state = threading.local()  # pending: внешний atomic-блок с незакоммиченными изменениями
+
+
+@dataclass(frozen=True)
+class CompiledRule:
+    id: int
+    effect: str
+
+
+@dataclass
+class DecisionTable:
+    version: Any
+    generation: int
+    mode: str
+    role_rules: dict[tuple[str, str, str], CompiledRule]
+    user_rules: dict[tuple[int, str, str], CompiledRule]
+    atomic_blocks: tuple = ()
+    decisions: dict[tuple, Any] = field(default_factory=dict)
+
+    def match(self, *, user_id: int, role: str, resource_type: str, resource: str):
+        """Первое правило: сначала user-specific, затем role (как в прежнем decide())."""
+        rule = self.user_rules.get((user_id, resource_type, resource))
+        if rule is None:
+            rule = self.role_rules.get((role, resource_type, resource))
+        return rule
+
+    def remember(self, key: tuple, decision: Any) -> None:
+        if len(self.decisions) >= MAX_MEMOIZED_DECISIONS:
+            self.decisions.clear()
+        self.decisions[key] = decision
+
+
+def _current_version() -> Any:
+    version = cache.get(POLICY_VERSION_CACHE_KEY)
+    if version is None:
+        # Сид от времени: после потери ключа версия не совпадёт ни с одной прежней.
+        cache.add(POLICY_VERSION_CACHE_KEY, time.time_ns(), None)
+        version = cache.get(POLICY_VERSION_CACHE_KEY)
+    if version is None:
+        return ("ttl", int(time.monotonic() // FALLBACK_TTL_SECONDS))
+    return version
+
+
+def _incr_version() -> None:
+    try:
+        cache.incr(POLICY_VERSION_CACHE_KEY)
+    except ValueError:
+        cache.set(POLICY_VERSION_CACHE_KEY, time.time_ns(), None)
+    except Exception:
+        # Кэш недоступен — другие процессы перестроят таблицу по FALLBACK_TTL_SECONDS.
+        pass
+
+
+def _pending_block():
+    """Внешний atomic-блок с незакоммиченными изменениями правил (или None)."""
+    block = getattr(_state, "pending", None)
+    if block is None:
+        return None
+    if block not in transaction.get_connection().atomic_blocks:
+        _state.pending = None
+        return None
+    return block
+
+
+def bump_policy_version() -> None:
+    """
+    Инвалидировать таблицу решений во всех процессах.
+
+    Версия увеличивается сразу (свой процесс и поток видят изменение немедленно)
+    и ещё раз после коммита — процессы, успевшие перестроиться до коммита,
+    прочитали старые правила.
+    """
+    global _table, _generation
+    with _lock:
+        _generation += 1
+        _table = None
+    connection = transaction.get_connection()
+    if connection.in_atomic_block:
+        _state.pending = connection.atomic_blocks[0]
+        transaction.on_commit(_incr_version)
+    _incr_version()
+
+
+def _build(version: Any, atomic_blocks: tuple = ()) -> DecisionTable:
+    mode = (
+        PolicyConfig.objects.filter(id=1).values_list("mode", flat=True).first()
+        or PolicyConfig.Mode.OBSERVE_ONLY
+    )
+    role_rules: dict[tuple[str, str, str], CompiledRule] = {}
+    user_rules: dict[tuple[int, str, str], CompiledRule] = {}
+    rows = (
+        PolicyRule.objects.filter(enabled=True)
+        .order_by("priority", "id")
+        .values_list("id", "subject_type", "role", "user_id", "resource_type", "resource", "effect")
+    )
+    for rule_id, subject_type, role, user_id, resource_type, resource, effect in rows:
+        compiled = CompiledRule(id=rule_id, effect=effect)
+        if subject_type == PolicyRule.SubjectType.USER:
+            if user_id is not None:
+                user_rules.setdefault((user_id, resource_type, resource), compiled)
+        elif subject_type == PolicyRule.SubjectType.ROLE:
+            role_rules.setdefault((role or "", resource_type, resource), compiled)
+    return DecisionTable(
+        version=version,
+        generation=_generation,
+        mode=mode,
+        role_rules=role_rules,
+        user_rules=user_rules,
+        atomic_blocks=atomic_blocks,
+    )
+
+
+def get_decision_table(request=None) -> DecisionTable:
+    """
+    Актуальная таблица решений.
+
+    request — опционально: таблица закрепляется на нём до конца запроса
+    (если в этом процессе правила не менялись).
+    """
+    global _table
+    if request is not None:
+        pinned = getattr(request, REQUEST_ATTR, None)
+        if pinned is not None and pinned.generation == _generation:
+            return pinned
+
+    version = _current_version()
+    if _pending_block() is not None:
+        blocks = tuple(transaction.get_connection().atomic_blocks)
+        table = getattr(_state, "table", None)
+        if (
+            table is None
+            or table.version != version
+            or table.generation != _generation
+            or table.atomic_blocks != blocks
+        ):
+            table = _build(version, blocks)
+            _state.table = table
+    else:
+        _state.table = None
+        table = _table
+        if table is None or table.version != version or table.generation != _generation:
+            table = _build(version)
+            with _lock:
+                if table.generation == _generation:
+                    _table = table
+
+    if request is not None:
+        setattr(request, REQUEST_ATTR, table)
+    return table
@@ -10,6 +10,7 @@ from companies.policy import can_view_company_id
 from core.input_cleaners import clean_int_id
 from tasksapp.policy import can_view_task_id
 
+from .decision_table import DecisionTable, get_decision_table
 from .models import PolicyConfig, PolicyRule
 from .resources import RESOURCE_INDEX, PolicyResource
 
@@ -326,13 +327,22 @@ def _baseline_allowed(*, user: User, resource_type: str, resource_key: str) -> b
 
 
 def decide(
-    *, user: User, resource_type: str, resource: str, context: dict[str, Any] | None = None
+    *,
+    user: User,
+    resource_type: str,
+    resource: str,
+    context: dict[str, Any] | None = None,
+    table: DecisionTable | None = None,
 ) -> PolicyDecision:
     """
     Возвращает решение политики (без побочных эффектов).
+
+    Правила и режим берутся из скомпилированной таблицы (policy/decision_table.py);
+    table можно передать явно — например, закреплённую на request.
     """
-    cfg = PolicyConfig.load()
-    mode = cfg.mode
+    if table is None:
+        table = get_decision_table()
+    mode = table.mode
 
     # Неавторизованный — запрещаем (но снаружи это обычно уже отфильтровано @login_required / IsAuthenticated)
     if not user or not user.is_authenticated or not user.is_active:
@@ -358,41 +368,28 @@ def decide(
             resource_type=resource_type,
         )
 
-    qs = PolicyRule.objects.filter(
-        enabled=True, resource_type=resource_type, resource=resource
-    ).order_by("priority", "id")
+    role = getattr(user, "role", "") or ""
+    memo_key = (user.id, role, resource_type, resource)
+    decision = table.decisions.get(memo_key)
+    if decision is not None:
+        return decision
 
     # Сначала user-specific, затем role
-    user_rules = qs.filter(subject_type=PolicyRule.SubjectType.USER, user_id=user.id)
-    role_rules = qs.filter(
-        subject_type=PolicyRule.SubjectType.ROLE, role=(getattr(user, "role", "") or "")
-    )
-
-    for rule in list(user_rules) + list(role_rules):
-        if rule.effect == PolicyRule.Effect.ALLOW:
-            return PolicyDecision(
-                allowed=True,
-                mode=mode,
-                matched_rule_id=rule.id,
-                matched_effect=rule.effect,
-                default_allowed=_baseline_allowed(
-                    user=user, resource_type=resource_type, resource_key=resource
-                ),
-                resource=resource,
-                resource_type=resource_type,
-            )
-        if rule.effect == PolicyRule.Effect.DENY:
-            return PolicyDecision(
-                allowed=False,
-                mode=mode,
-                matched_rule_id=rule.id,
-                matched_effect=rule.effect,
-                default_allowed=_baseline_allowed(
-                    user=user, resource_type=resource_type, resource_key=resource
-                ),
-                resource=resource,
-                resource_type=resource_type,
-            )
+    rule = table.match(user_id=user.id, role=role, resource_type=resource_type, resource=resource)
+    if rule is not None and rule.effect in (PolicyRule.Effect.ALLOW, PolicyRule.Effect.DENY):
+        decision = PolicyDecision(
+            allowed=rule.effect == PolicyRule.Effect.ALLOW,
+            mode=mode,
+            matched_rule_id=rule.id,
+            matched_effect=rule.effect,
+            default_allowed=_baseline_allowed(
+                user=user, resource_type=resource_type, resource_key=resource
+            ),
+            resource=resource,
+            resource_type=resource_type,
+        )
+        table.remember(memo_key, decision)
+        return decision
 
     # Нет правил — применяем дефолт по ресурсу
     default_allowed = _baseline_allowed(
@@ -401,12 +398,16 @@ def decide(
 
     # Для ui:tasks:detail и ui:companies:detail используем "умный" дефолт,
     # основанный на видимости задач/компаний и override-ролях.
+    # Он зависит от context, поэтому не мемоизируется.
+    dynamic = False
     if resource_type == PolicyRule.ResourceType.PAGE:
         if resource == TASK_DETAIL_RESOURCE:
             default_allowed = _default_allowed_for_task_detail(user=user, context=context)
+            dynamic = True
         elif resource == COMPANY_DETAIL_RESOURCE:
             default_allowed = _default_allowed_for_company_detail(user=user, context=context)
-    return PolicyDecision(
+            dynamic = True
+    decision = PolicyDecision(
         allowed=default_allowed,
         mode=mode,
         matched_rule_id=None,
@@ -415,6 +416,9 @@ def decide(
         resource=resource,
         resource_type=resource_type,
     )
+    if not dynamic:
+        table.remember(memo_key, decision)
+    return decision
 
 
 def _log_decision(
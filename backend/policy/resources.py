@@ -570,6 +570,7 @@ RESOURCES: tuple[PolicyResource, ...] = (
     PolicyResource("phone:calls:pull", "action", "Phone API: получить команду звонка"),
     PolicyResource("phone:calls:update", "action", "Phone API: обновить информацию о звонке"),
     PolicyResource("phone:telemetry", "action", "Phone API: телеметрия"),
+    PolicyResource("phone:telemetry:latency", "action", "Phone API: перцентили latency"),
     PolicyResource("phone:logs:upload", "action", "Phone API: загрузка логов", sensitive=True),
     PolicyResource("phone:qr:create", "action", "Phone API: создать QR токен", sensitive=True),
     PolicyResource("phone:qr:exchange", "action", "Phone API: обмен QR токена"),
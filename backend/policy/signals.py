@@ -0,0 +1,16 @@
+from __future__ import annotations
+
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .decision_table import bump_policy_version
+from .models import PolicyConfig, PolicyRule
+
+
+@receiver(post_save, sender=PolicyRule)
+@receiver(post_delete, sender=PolicyRule)
+@receiver(post_save, sender=PolicyConfig)
+@receiver(post_delete, sender=PolicyConfig)
+def _policy_changed(sender, **kwargs):
+    """Любое изменение правил/режима — новая версия таблицы решений (policy/decision_table.py)."""
+    bump_policy_version()
@@ -2,6 +2,7 @@ from __future__ import annotations
 
 from django import template
 
+from policy.decision_table import get_decision_table
 from policy.engine import decide
 
 register = template.Library()
@@ -13,12 +14,19 @@ def policy_can(context, resource: str, resource_type: str = "page") -> bool:
     Использование в шаблонах:
       {% load policy_tags %}
       {% if policy_can 'ui:analytics' %} ... {% endif %}
+
+    Таблица решений закрепляется на request: десятки вызовов на странице
+    после первого не ходят ни в БД, ни в кэш.
     """
     request = context.get("request")
     user = getattr(request, "user", None) if request is not None else None
     try:
         d = decide(
-            user=user, resource_type=resource_type, resource=resource, context={"template": True}
+            user=user,
+            resource_type=resource_type,
+            resource=resource,
+            context={"template": True},
+            table=get_decision_table(request),
         )
         return bool(d.allowed)
     except Exception:
@@ -0,0 +1,118 @@
+"""
+Тесты скомпилированной таблицы решений (policy/decision_table.py).
+
+Покрывает:
+- повторные decide()/policy_can после прогрева не делают запросов
+- сохранение/удаление PolicyRule и смена режима PolicyConfig инвалидируют таблицу
+- откат транзакции не оставляет «фантомных» правил
+"""
+
+from __future__ import annotations
+
+from django.db import transaction
+from django.template import Context, Template
+from django.test import RequestFactory, TestCase
+
+from accounts.models import User
+from policy.decision_table import get_decision_table
+from policy.engine import decide
+from policy.models import PolicyConfig, PolicyRule
+
+
+def _rule(*, role, resource, effect, resource_type=PolicyRule.ResourceType.PAGE, priority=100):
+    return PolicyRule.objects.create(
+        subject_type=PolicyRule.SubjectType.ROLE,
+        role=role,
+        resource_type=resource_type,
+        resource=resource,
+        effect=effect,
+        enabled=True,
+        priority=priority,
+    )
+
+
+class DecisionTableTest(TestCase):
+    def setUp(self):
+        self.manager = User.objects.create_user(
+            username="dt_mgr", password="pass", role=User.Role.MANAGER
+        )
+
+    def _decide(self, resource="ui:analytics"):
+        return decide(
+            user=self.manager, resource_type=PolicyRule.ResourceType.PAGE, resource=resource
+        )
+
+    def test_warm_decide_makes_no_queries(self):
+        _rule(role=User.Role.MANAGER, resource="ui:analytics", effect=PolicyRule.Effect.ALLOW)
+        self.assertTrue(self._decide().allowed)
+        with self.assertNumQueries(0):
+            for _ in range(30):
+                self.assertTrue(self._decide().allowed)
+                self.assertTrue(self._decide("ui:dashboard").allowed)
+
+    def test_rule_save_and_delete_invalidate_table(self):
+        self.assertFalse(self._decide().allowed)
+        rule = _rule(
+            role=User.Role.MANAGER, resource="ui:analytics", effect=PolicyRule.Effect.ALLOW
+        )
+        self.assertTrue(self._decide().allowed)
+        self.assertEqual(self._decide().matched_rule_id, rule.id)
+
+        rule.effect = PolicyRule.Effect.DENY
+        rule.save()
+        self.assertFalse(self._decide().allowed)
+
+        rule.delete()
+        decision = self._decide()
+        self.assertFalse(decision.allowed)
+        self.assertIsNone(decision.matched_rule_id)
+
+    def test_priority_order_is_preserved(self):
+        _rule(
+            role=User.Role.MANAGER,
+            resource="ui:analytics",
+            effect=PolicyRule.Effect.DENY,
+            priority=200,
+        )
+        allow = _rule(
+            role=User.Role.MANAGER,
+            resource="ui:analytics",
+            effect=PolicyRule.Effect.ALLOW,
+            priority=10,
+        )
+        self.assertEqual(self._decide().matched_rule_id, allow.id)
+
+    def test_mode_change_is_visible(self):
+        cfg = PolicyConfig.load()
+        cfg.mode = PolicyConfig.Mode.ENFORCE
+        cfg.save()
+        self.assertEqual(self._decide().mode, PolicyConfig.Mode.ENFORCE)
+
+        cfg.mode = PolicyConfig.Mode.OBSERVE_ONLY
+        cfg.save(update_fields=["mode"])
+        self.assertEqual(self._decide().mode, PolicyConfig.Mode.OBSERVE_ONLY)
+
+    def test_rolled_back_rule_is_forgotten(self):
+        try:
+            with transaction.atomic():
+                _rule(
+                    role=User.Role.MANAGER, resource="ui:analytics", effect=PolicyRule.Effect.ALLOW
+                )
+                self.assertTrue(self._decide().allowed)
+                raise RuntimeError("rollback")
+        except RuntimeError:
+            pass
+        self.assertFalse(self._decide().allowed)
+
+    def test_policy_can_pins_table_on_request(self):
+        _rule(role=User.Role.MANAGER, resource="ui:analytics", effect=PolicyRule.Effect.ALLOW)
+        request = RequestFactory().get("/")
+        request.user = self.manager
+        template = Template(
+            "{% load policy_tags %}"
+            "{% policy_can 'ui:analytics' as a %}{% policy_can 'ui:settings' as s %}{{ a }}{{ s }}"
+        )
+        get_decision_table(request)
+        with self.assertNumQueries(0):
+            for _ in range(30):
+                self.assertEqual(template.render(Context({"request": request})), "TrueFalse")
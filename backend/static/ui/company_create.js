@@ -77,6 +77,8 @@
   var innEl    = document.querySelector('textarea[name="inn"], input[name="inn"]');
   var kppEl    = document.querySelector('input[name="kpp"]');
   var addrEl   = document.querySelector('textarea[name="address"], input[name="address"]');
+  var phoneEl  = document.querySelector('input[name="phone"]');
+  var emailEl  = document.querySelector('input[name="email"]');
 
   var dupTimer = null;
   var dupAbort = null;
@@ -92,8 +94,10 @@
     var inn     = normalizeIdent(innEl  && innEl.value  || '');
     var kpp     = normalizeIdent(kppEl  && kppEl.value  || '');
     var address = (addrEl  && addrEl.value  || '').trim();
+    var phone   = (phoneEl && phoneEl.value || '').trim();
+    var email   = (emailEl && emailEl.value || '').trim();
 
-    if (!name && !inn && !kpp && !address) {
+    if (!name && !inn && !kpp && !address && !phone && !email) {
       if (box) box.style.display = 'none';
       showSpinner(false);
       setDupState(false);
@@ -104,7 +108,7 @@
     if (dupAbort) dupAbort.abort();
     dupAbort = new AbortController();
 
-    var qs = new URLSearchParams({ name: name, inn: inn, kpp: kpp, address: address });
+    var qs = new URLSearchParams({ name: name, inn: inn, kpp: kpp, address: address, phone: phone, email: email });
     var data;
     try {
       var res = await fetch('/companies/duplicates/?' + qs.toString(), {
@@ -207,7 +211,7 @@
     dupTimer = setTimeout(runDupCheck, 400);
   }
 
-  [nameEl, innEl, kppEl, addrEl].filter(Boolean).forEach(function (el) {
+  [nameEl, innEl, kppEl, addrEl, phoneEl, emailEl].filter(Boolean).forEach(function (el) {
     el.addEventListener('input', scheduleDupCheck);
   });
 
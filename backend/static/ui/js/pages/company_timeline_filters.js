@@ -99,16 +99,18 @@
       var listSel = loadBtn.getAttribute("data-target") || "#companyTimelineClassicList";
       var list = document.querySelector(listSel);
       if (!list || !cid) return;
-      var offset = parseInt(list.getAttribute("data-timeline-offset") || "0", 10);
+      var cursor = list.getAttribute("data-timeline-cursor") || "";
       loadBtn.disabled = true;
       loadBtn.textContent = "Загрузка…";
 
-      fetch("/companies/" + cid + "/timeline/items/?offset=" + offset + "&limit=50", {
+      fetch("/companies/" + cid + "/timeline/items/?cursor=" + encodeURIComponent(cursor) + "&limit=50", {
         headers: { "X-Requested-With": "XMLHttpRequest" },
         credentials: "same-origin",
       })
         .then(function (r) {
           if (!r.ok) throw new Error("HTTP " + r.status);
+          // Курсор следующей страницы; пустой — лента закончилась
+          list.setAttribute("data-timeline-cursor", r.headers.get("X-Timeline-Next-Cursor") || "");
           return r.text();
         })
         .then(function (html) {
@@ -120,11 +122,11 @@
           var newCount = list.querySelectorAll(".company-timeline-entry").length;
           list.setAttribute("data-timeline-offset", String(newCount));
           var total = parseInt(list.getAttribute("data-timeline-total") || "0", 10);
-          if (newCount >= total) {
+          if (!list.getAttribute("data-timeline-cursor")) {
             loadBtn.style.display = "none";
           } else {
             loadBtn.disabled = false;
-            loadBtn.textContent = "Показать ещё (" + (total - newCount) + ")";
+            loadBtn.textContent = "Показать ещё (" + Math.max(0, total - newCount) + ")";
           }
         })
         .catch(function () {
@@ -0,0 +1,28 @@
+"""Индексы (company, created_at) и (company, completed_at) для ленты карточки.
+
+Созданные и выполненные задачи компании — два источника ленты, каждый
+читается keyset-выборкой по своей дате.
+"""
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('companies', '0057_timeline_company_indexes'),
+        ('tasksapp', '0015_task_assignee_updated_idx'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='task',
+            index=models.Index(fields=['company', 'created_at'], name='task_company_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='task',
+            index=models.Index(fields=['company', 'completed_at'], name='task_company_completed_idx'),
+        ),
+    ]
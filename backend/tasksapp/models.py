@@ -123,6 +123,9 @@ class Task(models.Model):
             models.Index(fields=["status", "due_at"], name="task_status_due_idx"),
             # Для dashboard_poll: EXISTS(assigned_to=user, updated_at>since)
             models.Index(fields=["assigned_to", "updated_at"], name="task_assignee_updated_idx"),
+            # Лента карточки компании: созданные и выполненные задачи
+            models.Index(fields=["company", "created_at"], name="task_company_created_idx"),
+            models.Index(fields=["company", "completed_at"], name="task_company_completed_idx"),
         ]
         constraints = [
             # Защита от race в generate_recurring_tasks: параллельные воркеры
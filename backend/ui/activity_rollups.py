@@ -0,0 +1,348 @@
+"""
+UserActivityDaily: дневные счётчики активности сотрудников.
+
+Аналитика руководителя, отчёты по холодным звонкам и ролевые дашборды раньше
+пересчитывали всё из сырых CallRequest / Task / отметок холодного звонка на
+каждый просмотр страницы. Теперь счётчики копятся по (user, branch, day):
+
+- *_contribution() — вклад одной записи (звонок, задача, ручная отметка);
+- apply_change() — применить разницу «было → стало» (вызывается из ui/signals.py);
+- transfer_company_marks() / reassign_tasks() — то же для массовых update() во вьюхах,
+  которые обходят сигналы (передача компаний, переназначение задач);
+- rebuild_activity_rollups() — пересчитать диапазон дней из сырых данных (backfill);
+- activity_by_user() / activity_by_day() / activity_by_branch() — чтение.
+
+Правила учёта совпадают с прежними запросами отчётов:
+- calls / cold_calls — CallRequest с note="UI click", не отменённые, по created_by
+  и локальной дате created_at; cold_calls — из них is_cold_call;
+- manual_cold_marks — отметки на компании / контакте / телефонах, по ответственному
+  компании и локальной дате отметки;
+- tasks_done / tasks_done_on_time — DONE-задачи по assigned_to и локальной дате
+  updated_at; «в срок» — due_at пуст или due_at ≥ updated_at.
+"""
+
+from __future__ import annotations
+
+import datetime
+import logging
+from collections import defaultdict
+from typing import Iterable
+
+from django.apps import apps as django_apps
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import F, Sum
+from django.utils import timezone
+
+from ui.models import UserActivityDaily
+
+logger = logging.getLogger(__name__)
+
+COUNTERS = ("calls", "cold_calls", "manual_cold_marks", "tasks_done", "tasks_done_on_time")
+
+# Звонки, инициированные кнопкой «Позвонить с телефона»
+CALL_NOTE_UI_CLICK = "UI click"
+
+# {(user_id, day): {counter: n}}
+Contribution = dict[tuple[int, datetime.date], dict[str, int]]
+
+
+def _local_day(value: datetime.datetime | None) -> datetime.date | None:
+    return timezone.localdate(value) if value else None
+
+
+def call_contribution(
+    *, created_by_id, created_at, note: str, status: str, is_cold_call: bool
+) -> Contribution:
+    from phonebridge.models import CallRequest
+
+    day = _local_day(created_at)
+    if not created_by_id or day is None:
+        return {}
+    if note != CALL_NOTE_UI_CLICK or status == CallRequest.Status.CANCELLED:
+        return {}
+    counters = {"calls": 1}
+    if is_cold_call:
+        counters["cold_calls"] = 1
+    return {(created_by_id, day): counters}
+
+
+def task_contribution(*, assigned_to_id, status: str, updated_at, due_at) -> Contribution:
+    from tasksapp.models import Task
+
+    day = _local_day(updated_at)
+    if not assigned_to_id or day is None or status != Task.Status.DONE:
+        return {}
+    counters = {"tasks_done": 1}
+    if due_at is None or due_at >= updated_at:
+        counters["tasks_done_on_time"] = 1
+    return {(assigned_to_id, day): counters}
+
+
+def mark_contribution(*, responsible_id, marked_at) -> Contribution:
+    day = _local_day(marked_at)
+    if not responsible_id or day is None:
+        return {}
+    return {(responsible_id, day): {"manual_cold_marks": 1}}
+
+
+def marks_contribution(responsible_id, marked_ats: Iterable) -> Contribution:
+    """Несколько отметок одного ответственного (перенос при смене responsible)."""
+    result: Contribution = {}
+    for marked_at in marked_ats:
+        _merge(result, mark_contribution(responsible_id=responsible_id, marked_at=marked_at))
+    return result
+
+
+def _merge(target: Contribution, other: Contribution, sign: int = 1) -> Contribution:
+    for key, counters in other.items():
+        bucket = target.setdefault(key, {})
+        for name, value in counters.items():
+            bucket[name] = bucket.get(name, 0) + sign * value
+    return target
+
+
+def _branch_ids(user_ids: Iterable[int], registry=django_apps) -> dict[int, int | None]:
+    User = registry.get_model(settings.AUTH_USER_MODEL)
+    return dict(User.objects.filter(id__in=set(user_ids)).values_list("id", "branch_id"))
+
+
+def _bump(user_id: int, branch_id, day: datetime.date, counters: dict[str, int]) -> None:
+    """Атомарный инкремент строки (update F() → при отсутствии строки insert)."""
+    qs = UserActivityDaily.objects.filter(user_id=user_id, branch_id=branch_id, day=day)
+    increments = {name: F(name) + value for name, value in counters.items()}
+    if qs.update(**increments):
+        return
+    try:
+        with transaction.atomic():
+            UserActivityDaily.objects.create(
+                user_id=user_id, branch_id=branch_id, day=day, **counters
+            )
+    except IntegrityError:
+        # Строку только что вставил параллельный запрос — повторяем инкремент.
+        qs.update(**increments)
+
+
+def apply_change(before: Contribution, after: Contribution) -> None:
+    """
+    Применить разницу вкладов записи до и после изменения.
+
+    Выполняется в транзакции вызывающего кода (откат записи откатывает и счётчики);
+    ошибка счётчиков не ломает сохранение — расхождение исправит rebuild_activity_rollups.
+    """
+    delta = _merge(_merge({}, after), before, sign=-1)
+    delta = {
+        key: {name: value for name, value in counters.items() if value}
+        for key, counters in delta.items()
+    }
+    delta = {key: counters for key, counters in delta.items() if counters}
+    if not delta:
+        return
+    try:
+        with transaction.atomic():
+            branches = _branch_ids(user_id for user_id, _ in delta)
+            for (user_id, day), counters in sorted(delta.items()):
+                if user_id in branches:
+                    _bump(user_id, branches[user_id], day, counters)
+    except Exception:
+        logger.exception("activity rollups: failed to apply delta")
+
+
+def company_marks(company_ids: Iterable) -> dict:
+    """{company_id: [даты отметок контактов и телефонов]} — 3 запроса на пачку компаний."""
+    from companies.models import CompanyPhone, Contact, ContactPhone
+
+    ids = list(company_ids)
+    result: dict = defaultdict(list)
+    sources = (
+        Contact.objects.filter(company_id__in=ids).values_list("company_id", "cold_marked_at"),
+        ContactPhone.objects.filter(contact__company_id__in=ids).values_list(
+            "contact__company_id", "cold_marked_at"
+        ),
+        CompanyPhone.objects.filter(company_id__in=ids).values_list("company_id", "cold_marked_at"),
+    )
+    for rows in sources:
+        for company_id, marked_at in rows.filter(cold_marked_at__isnull=False):
+            result[company_id].append(marked_at)
+    return result
+
+
+def transfer_company_marks(rows: Iterable[tuple], new_responsible_id) -> None:
+    """
+    Перенести ручные отметки компаний к новому ответственному после массового update().
+
+    rows — (company_id, responsible_id, primary_cold_marked_at) до обновления.
+    """
+    moved = [row for row in rows if row[1] != new_responsible_id]
+    if not moved:
+        return
+    children = company_marks(company_id for company_id, _, _ in moved)
+    before: Contribution = {}
+    after: Contribution = {}
+    for company_id, old_responsible_id, primary_marked_at in moved:
+        marks = [primary_marked_at, *children.get(company_id, [])]
+        _merge(before, marks_contribution(old_responsible_id, marks))
+        _merge(after, marks_contribution(new_responsible_id, marks))
+    apply_change(before, after)
+
+
+def reassign_tasks(rows: Iterable[tuple], new_assigned_id, updated_at) -> None:
+    """
+    Учесть массовое переназначение задач (update() без сигналов).
+
+    rows — (assigned_to_id, status, updated_at, due_at) до обновления.
+    """
+    before: Contribution = {}
+    after: Contribution = {}
+    for assigned_to_id, status, old_updated_at, due_at in rows:
+        _merge(
+            before,
+            task_contribution(
+                assigned_to_id=assigned_to_id,
+                status=status,
+                updated_at=old_updated_at,
+                due_at=due_at,
+            ),
+        )
+        _merge(
+            after,
+            task_contribution(
+                assigned_to_id=new_assigned_id, status=status, updated_at=updated_at, due_at=due_at
+            ),
+        )
+    apply_change(before, after)
+
+
+def _day_bounds(start: datetime.date, end: datetime.date):
+    tz = timezone.get_current_timezone()
+    return (
+        timezone.make_aware(datetime.datetime.combine(start, datetime.time.min), tz),
+        timezone.make_aware(datetime.datetime.combine(end, datetime.time.min), tz),
+    )
+
+
+def collect_contributions(
+    start: datetime.date, end: datetime.date, registry=django_apps
+) -> Contribution:
+    """
+    Вклады всех сырых записей за дни [start, end) — основа backfill.
+
+    registry — реестр моделей (apps миграции для backfill в 0015_user_activity_daily).
+    """
+    from phonebridge.models import CallRequest  # константы статусов
+    from tasksapp.models import Task
+
+    Company = registry.get_model("companies", "Company")
+    CompanyPhone = registry.get_model("companies", "CompanyPhone")
+    Contact = registry.get_model("companies", "Contact")
+    ContactPhone = registry.get_model("companies", "ContactPhone")
+    CallRequestModel = registry.get_model("phonebridge", "CallRequest")
+    TaskModel = registry.get_model("tasksapp", "Task")
+
+    since, until = _day_bounds(start, end)
+    result: Contribution = {}
+
+    calls = (
+        CallRequestModel.objects.filter(
+            created_at__gte=since,
+            created_at__lt=until,
+            note=CALL_NOTE_UI_CLICK,
+            created_by__isnull=False,
+        )
+        .exclude(status=CallRequest.Status.CANCELLED)
+        .values_list("created_by_id", "created_at", "is_cold_call")
+    )
+    for created_by_id, created_at, is_cold_call in calls.iterator(chunk_size=2000):
+        _merge(
+            result,
+            call_contribution(
+                created_by_id=created_by_id,
+                created_at=created_at,
+                note=CALL_NOTE_UI_CLICK,
+                status="",
+                is_cold_call=is_cold_call,
+            ),
+        )
+
+    tasks = TaskModel.objects.filter(
+        status=Task.Status.DONE,
+        updated_at__gte=since,
+        updated_at__lt=until,
+        assigned_to__isnull=False,
+    ).values_list("assigned_to_id", "updated_at", "due_at")
+    for assigned_to_id, updated_at, due_at in tasks.iterator(chunk_size=2000):
+        _merge(
+            result,
+            task_contribution(
+                assigned_to_id=assigned_to_id,
+                status=Task.Status.DONE,
+                updated_at=updated_at,
+                due_at=due_at,
+            ),
+        )
+
+    marks = (
+        (Company, "responsible_id", "primary_cold_marked_at"),
+        (Contact, "company__responsible_id", "cold_marked_at"),
+        (CompanyPhone, "company__responsible_id", "cold_marked_at"),
+        (ContactPhone, "contact__company__responsible_id", "cold_marked_at"),
+    )
+    for model, responsible_path, marked_field in marks:
+        rows = model.objects.filter(
+            **{
+                f"{marked_field}__gte": since,
+                f"{marked_field}__lt": until,
+                f"{responsible_path.removesuffix('_id')}__isnull": False,
+            }
+        ).values_list(responsible_path, marked_field)
+        for responsible_id, marked_at in rows.iterator(chunk_size=2000):
+            _merge(result, mark_contribution(responsible_id=responsible_id, marked_at=marked_at))
+    return result
+
+
+def rebuild_activity_rollups(start: datetime.date, end: datetime.date, registry=django_apps) -> int:
+    """
+    Пересчитать счётчики за дни [start, end) из сырых данных (идемпотентно).
+
+    Строки диапазона заменяются целиком; подразделение берётся текущее.
+    Возвращает число записанных строк.
+    """
+    Daily = registry.get_model("ui", "UserActivityDaily")
+    contributions = collect_contributions(start, end, registry)
+    branches = _branch_ids((user_id for user_id, _ in contributions), registry)
+    rows = [
+        Daily(user_id=user_id, branch_id=branches[user_id], day=day, **counters)
+        for (user_id, day), counters in sorted(contributions.items())
+        if user_id in branches
+    ]
+    with transaction.atomic():
+        Daily.objects.filter(day__gte=start, day__lt=end).delete()
+        Daily.objects.bulk_create(rows, batch_size=1000)
+    return len(rows)
+
+
+def _summed(qs, key: str) -> dict:
+    result: dict = defaultdict(lambda: dict.fromkeys(COUNTERS, 0))
+    rows = qs.values(key).annotate(**{f"sum_{name}": Sum(name) for name in COUNTERS})
+    for row in rows:
+        result[row[key]] = {name: int(row[f"sum_{name}"] or 0) for name in COUNTERS}
+    return result
+
+
+def _range(start: datetime.date, end: datetime.date):
+    return UserActivityDaily.objects.filter(day__gte=start, day__lt=end)
+
+
+def activity_by_user(user_ids: Iterable[int], start: datetime.date, end: datetime.date) -> dict:
+    """{user_id: {counter: n}} за дни [start, end); отсутствующие — нули."""
+    return _summed(_range(start, end).filter(user_id__in=list(user_ids)), "user_id")
+
+
+def activity_by_day(user_id: int, start: datetime.date, end: datetime.date) -> dict:
+    """{day: {counter: n}} одного сотрудника за дни [start, end)."""
+    return _summed(_range(start, end).filter(user_id=user_id), "day")
+
+
+def activity_by_branch(start: datetime.date, end: datetime.date) -> dict:
+    """{branch_id: {counter: n}} за дни [start, end)."""
+    return _summed(_range(start, end), "branch_id")
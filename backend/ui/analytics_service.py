@@ -20,12 +20,18 @@ from dataclasses import dataclass
 from datetime import date, datetime, timedelta
 from typing import Any
 
-from django.db.models import Count, F, Q
+from django.db.models import Count, Q, Sum
+from django.db.models.functions import Coalesce
 from django.utils import timezone
 
 from accounts.models import User
 from companies.models import Company
 from tasksapp.models import Task
+from ui.activity_rollups import (
+    CALL_NOTE_UI_CLICK,
+    activity_by_branch,
+    activity_by_user,
+)
 
 
 @dataclass(frozen=True)
@@ -64,14 +70,18 @@ def period_this_month() -> Period:
     return Period(start=start, end=end, label="За месяц")
 
 
+def _period_days(period: Period) -> tuple[date, date]:
+    """Период как диапазон локальных дат [start, end) для дневных счётчиков."""
+    return period.start.date(), period.end.date()
+
+
+def _user_activity(user: User, period: Period) -> dict:
+    return activity_by_user([user.id], *_period_days(period))[user.id]
+
+
 def _count_user_tasks_done(user: User, period: Period) -> int:
-    """DONE-задачи менеджера, закрытые в периоде."""
-    return Task.objects.filter(
-        assigned_to=user,
-        status=Task.Status.DONE,
-        updated_at__gte=period.start,
-        updated_at__lt=period.end,
-    ).count()
+    """DONE-задачи менеджера, закрытые в периоде (дневные счётчики UserActivityDaily)."""
+    return _user_activity(user, period)["tasks_done"]
 
 
 def _tasks_on_time_ratio(user: User, period: Period) -> dict:
@@ -79,17 +89,12 @@ def _tasks_on_time_ratio(user: User, period: Period) -> dict:
 
     Возвращает {'total': int, 'on_time': int, 'ratio': int (%) | None}.
     """
-    done_qs = Task.objects.filter(
-        assigned_to=user,
-        status=Task.Status.DONE,
-        updated_at__gte=period.start,
-        updated_at__lt=period.end,
-    )
-    total = done_qs.count()
+    activity = _user_activity(user, period)
+    total = activity["tasks_done"]
     if total == 0:
         return {"total": 0, "on_time": 0, "ratio": None}
 
-    on_time = done_qs.filter(Q(due_at__isnull=True) | Q(due_at__gte=F("updated_at"))).count()
+    on_time = activity["tasks_done_on_time"]
     return {
         "total": total,
         "on_time": on_time,
@@ -116,8 +121,8 @@ def _companies_workload(user: User) -> dict:
 def _cold_calls_summary(user: User, period: Period) -> dict:
     """Холодные звонки менеджера за период.
 
-    Источник: phonebridge.CallRequest где is_cold_call=True OR note
-    помечена как cold-click. Success — звонок связан с последующей
+    Источник: дневные счётчики (CallRequest «Позвонить с телефона» с
+    is_cold_call=True). Success — звонок связан с последующей
     задачей в пределах 24 ч (эвристика, см. аудит).
     """
     try:
@@ -125,14 +130,17 @@ def _cold_calls_summary(user: User, period: Period) -> dict:
     except Exception:
         return {"total": 0, "success": 0, "ratio": None}
 
+    total = _user_activity(user, period)["cold_calls"]
+    if total == 0:
+        return {"total": 0, "success": 0, "ratio": None}
+
     calls = CallRequest.objects.filter(
         created_by=user,
         created_at__gte=period.start,
         created_at__lt=period.end,
-    )
-    total = calls.count()
-    if total == 0:
-        return {"total": 0, "success": 0, "ratio": None}
+        note=CALL_NOTE_UI_CLICK,
+        is_cold_call=True,
+    ).exclude(status=CallRequest.Status.CANCELLED)
 
     # Успех: существует задача менеджера, созданная в течение 24 ч после
     # звонка (простая эвристика). Для P0 достаточно — точный маппинг
@@ -223,7 +231,7 @@ def get_manager_dashboard(user: User) -> dict[str, Any]:
 
 
 def _managers_leaderboard(branch=None, period: Period = None, limit: int = 10) -> list[dict]:
-    """Рейтинг менеджеров по числу выполненных задач за период.
+    """Рейтинг менеджеров по числу выполненных задач за период (дневные счётчики).
 
     branch=None → все филиалы (для GROUP_MANAGER).
     """
@@ -232,15 +240,14 @@ def _managers_leaderboard(branch=None, period: Period = None, limit: int = 10) -
     qs = User.objects.filter(role=User.Role.MANAGER, is_active=True)
     if branch is not None:
         qs = qs.filter(branch=branch)
+    start, end = _period_days(period)
     rows = qs.annotate(
-        done_count=Count(
-            "assigned_tasks",
-            filter=Q(
-                assigned_tasks__status=Task.Status.DONE,
-                assigned_tasks__updated_at__gte=period.start,
-                assigned_tasks__updated_at__lt=period.end,
+        done_count=Coalesce(
+            Sum(
+                "activity_days__tasks_done",
+                filter=Q(activity_days__day__gte=start, activity_days__day__lt=end),
             ),
-            distinct=True,
+            0,
         )
     ).order_by("-done_count", "username")[:limit]
     result = []
@@ -356,14 +363,10 @@ def get_branch_director_dashboard(user: User) -> dict[str, Any]:
     # Рейтинг всех подразделений по выполненным задачам за месяц.
     from accounts.models import Branch
 
+    by_branch = activity_by_branch(*_period_days(month_p))
     branches_rank = []
     for b in Branch.objects.all():
-        done = Task.objects.filter(
-            assigned_to__branch=b,
-            status=Task.Status.DONE,
-            updated_at__gte=month_p.start,
-            updated_at__lt=month_p.end,
-        ).count()
+        done = by_branch[b.id]["tasks_done"]
         branches_rank.append(
             {
                 "id": b.id,
@@ -400,13 +403,9 @@ def get_group_manager_dashboard(user: User) -> dict[str, Any]:
     total_done = 0
     total_online = 0
     total_managers = 0
+    by_branch = activity_by_branch(*_period_days(month_p))
     for b in branches:
-        done = Task.objects.filter(
-            assigned_to__branch=b,
-            status=Task.Status.DONE,
-            updated_at__gte=month_p.start,
-            updated_at__lt=month_p.end,
-        ).count()
+        done = by_branch[b.id]["tasks_done"]
         online_stats = _online_count(branch=b)
         new_companies = Company.objects.filter(branch=b, created_at__gte=month_p.start).count()
         per_branch.append(
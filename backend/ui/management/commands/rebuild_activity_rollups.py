@@ -0,0 +1,44 @@
+from __future__ import annotations
+
+from datetime import date, timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from ui.activity_rollups import rebuild_activity_rollups
+
+
+class Command(BaseCommand):
+    help = (
+        "Пересчитать дневные счётчики активности (UserActivityDaily) из звонков, "
+        "задач и ручных отметок холодного звонка."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--days", type=int, default=400, help="Сколько последних дней (по умолчанию 400)."
+        )
+        parser.add_argument("--since", help="Начальная дата YYYY-MM-DD (вместо --days).")
+        parser.add_argument(
+            "--chunk-days", type=int, default=31, help="Дней в одной транзакции (по умолчанию 31)."
+        )
+
+    def handle(self, *args, **options):
+        end = timezone.localdate() + timedelta(days=1)
+        if options.get("since"):
+            try:
+                start = date.fromisoformat(options["since"])
+            except ValueError as exc:
+                raise CommandError("--since: ожидается дата YYYY-MM-DD") from exc
+        else:
+            start = end - timedelta(days=max(1, int(options.get("days") or 400)))
+        chunk = max(1, int(options.get("chunk_days") or 31))
+
+        rows = 0
+        cursor = start
+        while cursor < end:
+            chunk_end = min(cursor + timedelta(days=chunk), end)
+            rows += rebuild_activity_rollups(cursor, chunk_end)
+            self.stdout.write(f"Готово: {cursor.isoformat()} — {chunk_end.isoformat()}")
+            cursor = chunk_end
+        self.stdout.write(self.style.SUCCESS(f"Строк записано: {rows}"))
@@ -0,0 +1,103 @@
+"""UserActivityDaily — дневные счётчики активности сотрудников.
+
+Таблица заполняется инкрементально сигналами. Аналитика и отчёты читают только
+её, поэтому окно отчётов (BACKFILL_DAYS) заполняется здесь же; более давнюю
+историю — `manage.py rebuild_activity_rollups --days N`.
+"""
+
+from __future__ import annotations
+
+from datetime import timedelta
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.utils import timezone
+
+BACKFILL_DAYS = 90
+BACKFILL_CHUNK_DAYS = 31
+
+
+def backfill_activity_rollups(apps, schema_editor):
+    from ui.activity_rollups import rebuild_activity_rollups
+
+    end = timezone.localdate() + timedelta(days=1)
+    cursor = end - timedelta(days=BACKFILL_DAYS)
+    while cursor < end:
+        chunk_end = min(cursor + timedelta(days=BACKFILL_CHUNK_DAYS), end)
+        rebuild_activity_rollups(cursor, chunk_end, apps)
+        cursor = chunk_end
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("accounts", "0017_w2_admin_totp"),
+        ("ui", "0014_delete_amoapiconfig"),
+        ("companies", "0056_company_contact_key"),
+        ("phonebridge", "0011_remove_duplicate_qr_indexes"),
+        ("tasksapp", "0015_task_assignee_updated_idx"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="UserActivityDaily",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True, primary_key=True, serialize=False, verbose_name="ID"
+                    ),
+                ),
+                ("day", models.DateField(verbose_name="День")),
+                (
+                    "calls",
+                    models.IntegerField(default=0, verbose_name="Звонки («Позвонить с телефона»)"),
+                ),
+                ("cold_calls", models.IntegerField(default=0, verbose_name="Холодные звонки")),
+                (
+                    "manual_cold_marks",
+                    models.IntegerField(default=0, verbose_name="Ручные отметки холодного звонка"),
+                ),
+                ("tasks_done", models.IntegerField(default=0, verbose_name="Выполнено задач")),
+                (
+                    "tasks_done_on_time",
+                    models.IntegerField(default=0, verbose_name="Выполнено задач в срок"),
+                ),
+                (
+                    "branch",
+                    models.ForeignKey(
+                        blank=True,
+                        null=True,
+                        on_delete=django.db.models.deletion.SET_NULL,
+                        related_name="+",
+                        to="accounts.branch",
+                        verbose_name="Подразделение",
+                    ),
+                ),
+                (
+                    "user",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="activity_days",
+                        to=settings.AUTH_USER_MODEL,
+                        verbose_name="Сотрудник",
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "Активность сотрудника за день",
+                "verbose_name_plural": "Активность сотрудников по дням",
+                "indexes": [
+                    models.Index(fields=["day", "branch"], name="ui_activity_day_branch_idx")
+                ],
+                "constraints": [
+                    models.UniqueConstraint(
+                        fields=("user", "day", "branch"), name="ui_activity_user_day_branch_uniq"
+                    )
+                ],
+            },
+        ),
+        migrations.RunPython(backfill_activity_rollups, migrations.RunPython.noop),
+    ]
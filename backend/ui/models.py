@@ -151,3 +151,47 @@ class UiUserPreference(models.Model):
             return float(self.font_scale or Decimal("1.00"))
         except Exception:
             return 1.0
+
+
+class UserActivityDaily(models.Model):
+    """
+    Дневные счётчики активности сотрудника для аналитики и отчётов по холодным звонкам.
+
+    Ведутся инкрементально сигналами (ui/signals.py → ui/activity_rollups.py),
+    пересчитываются командой rebuild_activity_rollups. Строк на (user, day)
+    может быть несколько (смена подразделения, гонка при создании) — читатели
+    всегда суммируют.
+    """
+
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        related_name="activity_days",
+        verbose_name="Сотрудник",
+    )
+    branch = models.ForeignKey(
+        "accounts.Branch",
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name="+",
+        verbose_name="Подразделение",
+    )
+    day = models.DateField("День")
+    calls = models.IntegerField("Звонки («Позвонить с телефона»)", default=0)
+    cold_calls = models.IntegerField("Холодные звонки", default=0)
+    manual_cold_marks = models.IntegerField("Ручные отметки холодного звонка", default=0)
+    tasks_done = models.IntegerField("Выполнено задач", default=0)
+    tasks_done_on_time = models.IntegerField("Выполнено задач в срок", default=0)
+
+    class Meta:
+        verbose_name = "Активность сотрудника за день"
+        verbose_name_plural = "Активность сотрудников по дням"
+        constraints = [
+            models.UniqueConstraint(
+                fields=["user", "day", "branch"], name="ui_activity_user_day_branch_uniq"
+            ),
+        ]
+        indexes = [
+            models.Index(fields=["day", "branch"], name="ui_activity_day_branch_idx"),
+        ]
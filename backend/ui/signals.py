@@ -1,14 +1,17 @@
 """
-Signals для инвалидации кэша dashboard при изменении задач и компаний.
+Signals для инвалидации кэша dashboard при изменении задач и компаний
+и для ведения дневных счётчиков активности (ui/activity_rollups.py).
 """
 
 from django.core.cache import cache
-from django.db.models.signals import post_delete, post_save
+from django.db.models.signals import post_delete, post_save, pre_delete, pre_save
 from django.dispatch import receiver
 from django.utils import timezone
 
-from companies.models import Company
+from companies.models import Company, CompanyPhone, Contact, ContactPhone
+from phonebridge.models import CallRequest
 from tasksapp.models import Task
+from ui import activity_rollups
 
 
 def invalidate_dashboard_cache(user_id: int):
@@ -49,3 +52,226 @@ def invalidate_dashboard_on_company_change(sender, instance, **kwargs):
         invalidate_dashboard_cache(instance.responsible_id)
     # Инвалидируем кэш общего количества компаний
     cache.delete("companies_total_count")
+
+
+# ---------------------------------------------------------------------------
+# Дневные счётчики активности (UserActivityDaily)
+# ---------------------------------------------------------------------------
+# pre_save запоминает вклад записи в счётчики до изменения, post_save применяет
+# разницу. Сохранения с update_fields, не задевающими учитываемые поля
+# (например, результат звонка от приложения), счётчики не трогают.
+
+_TASK_PATHS = ("assigned_to_id", "status", "updated_at", "due_at")
+_CALL_PATHS = ("created_by_id", "created_at", "note", "status", "is_cold_call")
+
+
+def _task_contribution(assigned_to_id, status, updated_at, due_at):
+    return activity_rollups.task_contribution(
+        assigned_to_id=assigned_to_id, status=status, updated_at=updated_at, due_at=due_at
+    )
+
+
+def _call_contribution(created_by_id, created_at, note, status, is_cold_call):
+    return activity_rollups.call_contribution(
+        created_by_id=created_by_id,
+        created_at=created_at,
+        note=note,
+        status=status,
+        is_cold_call=is_cold_call,
+    )
+
+
+def _mark_contribution(responsible_id, marked_at):
+    return activity_rollups.mark_contribution(responsible_id=responsible_id, marked_at=marked_at)
+
+
+def _is_tracked(update_fields, fields: set) -> bool:
+    return update_fields is None or bool(fields.intersection(update_fields))
+
+
+def _capture_before(sender, instance, update_fields, fields: set, paths: tuple, contribution):
+    """Вклад записи в БД до сохранения (None — сохранение счётчики не задевает)."""
+    if not _is_tracked(update_fields, fields):
+        instance._activity_before = None
+        return
+    if instance._state.adding:
+        instance._activity_before = {}
+        return
+    row = sender.objects.filter(pk=instance.pk).values_list(*paths).first()
+    instance._activity_before = contribution(*row) if row else {}
+
+
+def _apply_after(instance, after) -> None:
+    before = getattr(instance, "_activity_before", None)
+    if before is None:
+        return
+    instance._activity_before = None
+    activity_rollups.apply_change(before, after)
+
+
+def _deleted_with_company(origin) -> bool:
+    """Удаление каскадом от компании: её отметки и отметки детей снимает сама компания."""
+    return isinstance(origin, Company) or getattr(origin, "model", None) is Company
+
+
+def _responsible_of(company_id):
+    if not company_id:
+        return None
+    return Company.objects.filter(pk=company_id).values_list("responsible_id", flat=True).first()
+
+
+def _company_child_marks(company_id) -> list:
+    """Даты ручных отметок контактов и телефонов компании (атрибутируются ответственному)."""
+    marks = list(
+        Contact.objects.filter(company_id=company_id, cold_marked_at__isnull=False).values_list(
+            "cold_marked_at", flat=True
+        )
+    )
+    marks += ContactPhone.objects.filter(
+        contact__company_id=company_id, cold_marked_at__isnull=False
+    ).values_list("cold_marked_at", flat=True)
+    marks += CompanyPhone.objects.filter(
+        company_id=company_id, cold_marked_at__isnull=False
+    ).values_list("cold_marked_at", flat=True)
+    return marks
+
+
+@receiver(pre_save, sender=Task)
+def _activity_task_before(sender, instance, update_fields=None, **kwargs):
+    _capture_before(
+        sender,
+        instance,
+        update_fields,
+        {"assigned_to", "status", "updated_at", "due_at"},
+        _TASK_PATHS,
+        _task_contribution,
+    )
+
+
+@receiver(post_save, sender=Task)
+def _activity_task_after(sender, instance, **kwargs):
+    _apply_after(instance, _task_contribution(*(getattr(instance, p) for p in _TASK_PATHS)))
+
+
+@receiver(post_delete, sender=Task)
+def _activity_task_deleted(sender, instance, **kwargs):
+    before = _task_contribution(*(getattr(instance, p) for p in _TASK_PATHS))
+    activity_rollups.apply_change(before, {})
+
+
+@receiver(pre_save, sender=CallRequest)
+def _activity_call_before(sender, instance, update_fields=None, **kwargs):
+    _capture_before(
+        sender,
+        instance,
+        update_fields,
+        {"created_by", "note", "status", "is_cold_call"},
+        _CALL_PATHS,
+        _call_contribution,
+    )
+
+
+@receiver(post_save, sender=CallRequest)
+def _activity_call_after(sender, instance, **kwargs):
+    _apply_after(instance, _call_contribution(*(getattr(instance, p) for p in _CALL_PATHS)))
+
+
+@receiver(post_delete, sender=CallRequest)
+def _activity_call_deleted(sender, instance, **kwargs):
+    before = _call_contribution(*(getattr(instance, p) for p in _CALL_PATHS))
+    activity_rollups.apply_change(before, {})
+
+
+@receiver(pre_save, sender=Company)
+def _activity_company_before(sender, instance, update_fields=None, **kwargs):
+    instance._activity_before = None
+    if not _is_tracked(update_fields, {"responsible", "primary_cold_marked_at"}):
+        return
+    responsible_id = marked_at = None
+    if not instance._state.adding:
+        row = (
+            sender.objects.filter(pk=instance.pk)
+            .values_list("responsible_id", "primary_cold_marked_at")
+            .first()
+        )
+        responsible_id, marked_at = row or (None, None)
+    instance._activity_responsible_before = responsible_id
+    instance._activity_before = _mark_contribution(responsible_id, marked_at)
+
+
+@receiver(post_save, sender=Company)
+def _activity_company_after(sender, instance, created=False, **kwargs):
+    before = getattr(instance, "_activity_before", None)
+    if before is None:
+        return
+    after = _mark_contribution(instance.responsible_id, instance.primary_cold_marked_at)
+    old_responsible = instance._activity_responsible_before
+    if not created and old_responsible != instance.responsible_id:
+        # Отметки контактов и телефонов считаются ответственному компании —
+        # при передаче компании переносим их вместе с ней.
+        marks = _company_child_marks(instance.pk)
+        activity_rollups._merge(before, activity_rollups.marks_contribution(old_responsible, marks))
+        activity_rollups._merge(
+            after, activity_rollups.marks_contribution(instance.responsible_id, marks)
+        )
+    _apply_after(instance, after)
+
+
+@receiver(pre_delete, sender=Company)
+def _activity_company_deleted(sender, instance, **kwargs):
+    # Телефоны компании удаляются каскадом (их pre_delete пропускается), контакты
+    # отвязываются (SET_NULL, без сигналов) — снимаем все отметки здесь.
+    marks = [instance.primary_cold_marked_at, *_company_child_marks(instance.pk)]
+    before = activity_rollups.marks_contribution(instance.responsible_id, marks)
+    activity_rollups.apply_change(before, {})
+
+
+def _child_mark_handlers(model, responsible_path: str, parent_field: str, responsible_from):
+    """pre_save/post_save/pre_delete для отметок Contact / CompanyPhone / ContactPhone."""
+    paths = (responsible_path, "cold_marked_at")
+
+    def before_save(sender, instance, update_fields=None, **kwargs):
+        _capture_before(
+            sender,
+            instance,
+            update_fields,
+            {"cold_marked_at", parent_field},
+            paths,
+            _mark_contribution,
+        )
+
+    def after_save(sender, instance, **kwargs):
+        if getattr(instance, "_activity_before", None) is None:
+            return
+        marked_at = instance.cold_marked_at
+        responsible_id = responsible_from(instance) if marked_at else None
+        _apply_after(instance, _mark_contribution(responsible_id, marked_at))
+
+    def before_delete(sender, instance, origin=None, **kwargs):
+        if _deleted_with_company(origin) or not instance.cold_marked_at:
+            return
+        before = _mark_contribution(responsible_from(instance), instance.cold_marked_at)
+        activity_rollups.apply_change(before, {})
+
+    pre_save.connect(before_save, sender=model, weak=False)
+    post_save.connect(after_save, sender=model, weak=False)
+    pre_delete.connect(before_delete, sender=model, weak=False)
+
+
+def _contact_phone_responsible(phone):
+    return (
+        Contact.objects.filter(pk=phone.contact_id)
+        .values_list("company__responsible_id", flat=True)
+        .first()
+    )
+
+
+_child_mark_handlers(
+    Contact, "company__responsible_id", "company", lambda c: _responsible_of(c.company_id)
+)
+_child_mark_handlers(
+    CompanyPhone, "company__responsible_id", "company", lambda p: _responsible_of(p.company_id)
+)
+_child_mark_handlers(
+    ContactPhone, "contact__company__responsible_id", "contact", _contact_phone_responsible
+)
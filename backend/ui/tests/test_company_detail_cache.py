@@ -0,0 +1,129 @@
+"""
+Версионный кэш секций карточки компании (companies/card_cache.py).
+
+Покрытые сценарии:
+1. Повторный просмотр неизменной карточки не читает таблицы секций
+2. Запись через сигналы (заметка, задача, контакт) сдвигает версию
+3. Массовый update() без сигналов — через bump_company_cards
+4. Набор секций зависит от профиля прав (тендерист не видит задачи)
+5. Блок «Организация» филиала следит за головной карточкой
+6. Просроченная со временем задача перестраивает секцию задач
+"""
+
+from datetime import timedelta
+from unittest import mock
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import connection
+from django.test import Client, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from companies.card_cache import bump_company_cards, card_version
+from companies.models import Company, CompanyNote, Contact
+from tasksapp.models import Task
+
+User = get_user_model()
+
+SECTION_TABLES = (
+    "companies_contact",
+    "companies_companynote",
+    "companies_companydeal",
+    "companies_companyhistoryevent",
+    "tasksapp_task",
+    "phonebridge_callrequest",
+)
+
+
+@override_settings(SECURE_SSL_REDIRECT=False)
+class CompanyDetailCacheTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.addCleanup(cache.clear)
+        self.client = Client()
+        self.user = User.objects.create_user(
+            username="cache_manager", password="testpass123", role=User.Role.MANAGER
+        )
+        self.client.force_login(self.user)
+        self.company = Company.objects.create(
+            name="Кэш компания", inn="7701234567", responsible=self.user
+        )
+        self.url = reverse("company_detail", kwargs={"company_id": self.company.id})
+
+    def _get(self, client=None):
+        response = (client or self.client).get(self.url)
+        self.assertEqual(response.status_code, 200)
+        return response
+
+    def test_repeat_view_skips_section_queries(self):
+        self._get()
+        with CaptureQueriesContext(connection) as ctx:
+            self._get()
+        section_queries = [
+            q["sql"]
+            for q in ctx.captured_queries
+            if any(f'"{table}"' in q["sql"] for table in SECTION_TABLES)
+        ]
+        self.assertEqual(section_queries, [])
+
+    def test_signal_writes_invalidate_card(self):
+        self._get()
+        CompanyNote.objects.create(company=self.company, author=self.user, text="Свежая заметка")
+        Contact.objects.create(company=self.company, first_name="Пётр", last_name="Новиков")
+        response = self._get()
+        self.assertContains(response, "Свежая заметка")
+        self.assertContains(response, "Новиков")
+
+    def test_bulk_update_bumps_version(self):
+        before = card_version(self.company.id)
+        Company.objects.filter(id=self.company.id).update(name="Переименована")
+        bump_company_cards([self.company.id])
+        self.assertNotEqual(card_version(self.company.id), before)
+        self.assertContains(self._get(), "Переименована")
+
+    def test_tenderist_profile_has_no_tasks(self):
+        Task.objects.create(
+            title="Позвонить по кэшу",
+            company=self.company,
+            assigned_to=self.user,
+            created_by=self.user,
+            due_at=timezone.now() + timedelta(days=1),
+        )
+        self.assertEqual(len(self._get().context["tasks"]), 1)
+
+        tenderist = User.objects.create_user(
+            username="cache_tenderist", password="x", role=User.Role.TENDERIST
+        )
+        client = Client()
+        client.force_login(tenderist)
+        self.assertEqual(list(self._get(client).context["tasks"]), [])
+
+    def test_branch_org_block_follows_head(self):
+        branch = Company.objects.create(
+            name="Филиал", responsible=self.user, head_company=self.company
+        )
+        branch_url = reverse("company_detail", kwargs={"company_id": branch.id})
+        self.client.get(branch_url)
+
+        self.company.name = "Головная переименована"
+        self.company.save()
+        response = self.client.get(branch_url)
+        self.assertEqual(response.context["org_head"].name, "Головная переименована")
+
+    def test_task_becoming_overdue_rebuilds_tasks_section(self):
+        Task.objects.create(
+            title="Скоро срок",
+            company=self.company,
+            assigned_to=self.user,
+            created_by=self.user,
+            due_at=timezone.now() + timedelta(minutes=5),
+        )
+        self.assertEqual([t.is_overdue for t in self._get().context["tasks"]], [0])
+
+        # Срок прошёл без единой записи — секция не должна отдаваться из кэша
+        later = timezone.now() + timedelta(minutes=10)
+        with mock.patch("django.utils.timezone.now", return_value=later):
+            tasks = self._get().context["tasks"]
+        self.assertEqual([t.is_overdue for t in tasks], [1])
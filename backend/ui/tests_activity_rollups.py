@@ -0,0 +1,291 @@
+"""Дневные счётчики активности (ui/activity_rollups.py + сигналы ui/signals.py)."""
+
+from __future__ import annotations
+
+from datetime import datetime, timedelta
+from io import StringIO
+
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from accounts.models import Branch
+from companies.models import Company, CompanyPhone, Contact, ContactPhone
+from companies.services import ColdCallService
+from phonebridge.models import CallRequest
+from tasksapp.models import Task
+from ui.activity_rollups import (
+    activity_by_branch,
+    activity_by_day,
+    activity_by_user,
+    collect_contributions,
+    reassign_tasks,
+    transfer_company_marks,
+)
+from ui.models import UserActivityDaily
+from ui.views._base import _add_months, _month_start
+
+User = get_user_model()
+
+
+class _RollupBase(TestCase):
+    def setUp(self):
+        self.branch = Branch.objects.create(code="rollup", name="Rollup")
+        self.mgr = User.objects.create_user(
+            username="rollup_mgr", password="p", role=User.Role.MANAGER, branch=self.branch
+        )
+        self.today = timezone.localdate()
+        self.tomorrow = self.today + timedelta(days=1)
+
+    def _today(self, user=None):
+        user = user or self.mgr
+        return activity_by_user([user.id], self.today, self.tomorrow)[user.id]
+
+    def _call(self, **kwargs):
+        params = {
+            "user": self.mgr,
+            "created_by": self.mgr,
+            "phone_raw": "+79990000000",
+            "note": "UI click",
+        }
+        params.update(kwargs)
+        return CallRequest.objects.create(**params)
+
+    def _assert_matches_rebuild(self):
+        """Инкрементальные счётчики совпадают с пересчётом из сырых данных."""
+        expected = {
+            key: {k: v for k, v in counters.items() if v}
+            for key, counters in collect_contributions(self.today, self.tomorrow).items()
+        }
+        stored = {}
+        for row in UserActivityDaily.objects.filter(day=self.today):
+            counters = {
+                name: getattr(row, name)
+                for name in ("calls", "cold_calls", "manual_cold_marks", "tasks_done")
+                if getattr(row, name)
+            }
+            if row.tasks_done_on_time:
+                counters["tasks_done_on_time"] = row.tasks_done_on_time
+            if counters:
+                stored[(row.user_id, row.day)] = counters
+        self.assertEqual(stored, expected)
+
+
+class CallAndTaskRollupTests(_RollupBase):
+    def test_calls_counted_on_write_paths(self):
+        call = self._call()
+        self._call(is_cold_call=True)
+        self._call(note="")  # не клик из UI
+        self.assertEqual(self._today()["calls"], 2)
+        self.assertEqual(self._today()["cold_calls"], 1)
+
+        ColdCallService._link_call(call)
+        self.assertEqual(self._today()["cold_calls"], 2)
+
+        call.status = CallRequest.Status.CANCELLED
+        call.save(update_fields=["status"])
+        self.assertEqual(self._today()["calls"], 1)
+        self.assertEqual(self._today()["cold_calls"], 1)
+        self._assert_matches_rebuild()
+
+    def test_delivery_keeps_call_counted(self):
+        call = self._call()
+        call.status = CallRequest.Status.CONSUMED
+        call.save(update_fields=["status", "delivered_at", "consumed_at"])
+        call.save(update_fields=["consumed_at"])
+        self.assertEqual(self._today()["calls"], 1)
+        self.assertEqual(UserActivityDaily.objects.get().calls, 1)
+
+    def test_task_done_reopen_and_delete(self):
+        task = Task.objects.create(
+            assigned_to=self.mgr, title="t", due_at=timezone.now() + timedelta(hours=1)
+        )
+        self.assertEqual(self._today()["tasks_done"], 0)
+        task.status = Task.Status.DONE
+        task.save()
+        self.assertEqual(self._today()["tasks_done"], 1)
+        self.assertEqual(self._today()["tasks_done_on_time"], 1)
+
+        late = Task.objects.create(
+            assigned_to=self.mgr,
+            title="late",
+            status=Task.Status.DONE,
+            due_at=timezone.now() - timedelta(days=1),
+        )
+        self.assertEqual(self._today()["tasks_done"], 2)
+        self.assertEqual(self._today()["tasks_done_on_time"], 1)
+        self._assert_matches_rebuild()
+
+        task.status = Task.Status.IN_PROGRESS
+        task.save()
+        late.delete()
+        self.assertEqual(self._today()["tasks_done"], 0)
+        self.assertEqual(self._today()["tasks_done_on_time"], 0)
+        self._assert_matches_rebuild()
+
+    def test_reassigned_task_moves_to_new_user(self):
+        other = User.objects.create_user(username="rollup_other", password="p")
+        task = Task.objects.create(assigned_to=self.mgr, title="t", status=Task.Status.DONE)
+        task.assigned_to = other
+        task.save()
+        self.assertEqual(self._today()["tasks_done"], 0)
+        self.assertEqual(self._today(other)["tasks_done"], 1)
+        self.assertEqual(activity_by_branch(self.today, self.tomorrow)[None]["tasks_done"], 1)
+
+    def test_bulk_reassign_moves_done_tasks(self):
+        other = User.objects.create_user(username="rollup_bulk_task", password="p")
+        Task.objects.create(assigned_to=self.mgr, title="t", status=Task.Status.DONE)
+        Task.objects.create(assigned_to=self.mgr, title="open")
+        qs = Task.objects.all()
+        rows = list(qs.values_list("assigned_to_id", "status", "updated_at", "due_at"))
+        now = timezone.now()
+        qs.update(assigned_to=other, updated_at=now)  # как task_bulk_reassign
+        reassign_tasks(rows, other.id, now)
+        self.assertEqual(self._today()["tasks_done"], 0)
+        self.assertEqual(self._today(other)["tasks_done"], 1)
+        self._assert_matches_rebuild()
+
+
+class ManualMarkRollupTests(_RollupBase):
+    def setUp(self):
+        super().setUp()
+        self.company = Company.objects.create(
+            name="ООО Холод", phone="+7 999 111-22-33", responsible=self.mgr
+        )
+        self.contact = Contact.objects.create(company=self.company, first_name="Иван")
+        self.contact_phone = ContactPhone.objects.create(contact=self.contact, value="+79990001122")
+        self.company_phone = CompanyPhone.objects.create(company=self.company, value="+79990003344")
+
+    def _mark_all(self):
+        ColdCallService.mark_company(company=self.company, user=self.mgr)
+        ColdCallService.mark_contact(contact=self.contact, user=self.mgr)
+        ColdCallService.mark_contact_phone(contact_phone=self.contact_phone, user=self.mgr)
+        ColdCallService.mark_company_phone(company_phone=self.company_phone, user=self.mgr)
+
+    def test_mark_and_reset(self):
+        self._mark_all()
+        self.assertEqual(self._today()["manual_cold_marks"], 4)
+        self._assert_matches_rebuild()
+
+        ColdCallService.reset_contact(contact=self.contact, user=self.mgr)
+        ColdCallService.reset_company_phone(company_phone=self.company_phone, user=self.mgr)
+        self.assertEqual(self._today()["manual_cold_marks"], 2)
+        self._assert_matches_rebuild()
+
+    def test_transfer_moves_marks_to_new_responsible(self):
+        self._mark_all()
+        other = User.objects.create_user(username="rollup_new", password="p", branch=self.branch)
+        self.company.responsible = other
+        self.company.save()
+        self.assertEqual(self._today()["manual_cold_marks"], 0)
+        self.assertEqual(self._today(other)["manual_cold_marks"], 4)
+        self._assert_matches_rebuild()
+
+    def test_bulk_transfer_moves_marks(self):
+        self._mark_all()
+        other = User.objects.create_user(username="rollup_bulk", password="p", branch=self.branch)
+        qs = Company.objects.filter(id=self.company.id)
+        rows = list(qs.values_list("id", "responsible_id", "primary_cold_marked_at"))
+        qs.update(responsible=other)  # как company_bulk_transfer — без сигналов
+        transfer_company_marks(rows, other.id)
+        self.assertEqual(self._today()["manual_cold_marks"], 0)
+        self.assertEqual(self._today(other)["manual_cold_marks"], 4)
+        self._assert_matches_rebuild()
+
+    def test_company_delete_drops_all_marks(self):
+        self._mark_all()
+        self.company.delete()
+        self.assertEqual(self._today()["manual_cold_marks"], 0)
+        self._assert_matches_rebuild()
+
+    def test_contact_delete_drops_its_marks(self):
+        self._mark_all()
+        self.contact.delete()
+        self.assertEqual(self._today()["manual_cold_marks"], 2)
+        self._assert_matches_rebuild()
+
+
+class BackfillTests(_RollupBase):
+    def test_command_rebuilds_history(self):
+        call = self._call(is_cold_call=True)
+        past = timezone.now() - timedelta(days=3)
+        CallRequest.objects.filter(pk=call.pk).update(created_at=past)
+        UserActivityDaily.objects.all().delete()
+
+        call_command("rebuild_activity_rollups", "--days", "10", stdout=StringIO())
+
+        days = activity_by_day(self.mgr.id, self.today - timedelta(days=7), self.tomorrow)
+        self.assertEqual(days[timezone.localdate(past)]["cold_calls"], 1)
+        self.assertEqual(self._today()["calls"], 0)
+        row = UserActivityDaily.objects.get()
+        self.assertEqual(row.branch_id, self.branch.id)
+
+
+@override_settings(SECURE_SSL_REDIRECT=False)
+class RollupViewsTests(_RollupBase):
+    def setUp(self):
+        super().setUp()
+        company = Company.objects.create(name="ООО Вью", responsible=self.mgr)
+        Company.objects.filter(pk=company.pk).update(
+            primary_cold_marked_at=timezone.now() - timedelta(days=1)
+        )
+        self._call(is_cold_call=True)
+        self._call()
+        call_command("rebuild_activity_rollups", "--days", "3", stdout=StringIO())
+
+    def test_last_7_days_reads_rollups(self):
+        self.client.force_login(self.mgr)
+        with CaptureQueriesContext(connection) as ctx:
+            resp = self.client.get("/reports/cold-calls/last-7-days/")
+        # Сырые звонки и отметки не читаются — только дневные счётчики.
+        tables = " ".join(q["sql"] for q in ctx.captured_queries)
+        self.assertNotIn("phonebridge_callrequest", tables)
+        self.assertNotIn("companies_", tables)
+        data = resp.json()
+        self.assertEqual(data["total"], 2)
+        counts = {d["date"]: d["count"] for d in data["days"]}
+        self.assertEqual(counts[self.today.isoformat()], 1)
+        self.assertEqual(counts[(self.today - timedelta(days=1)).isoformat()], 1)
+
+    def test_analytics_page_counts(self):
+        admin = User.objects.create_user(
+            username="rollup_admin", password="p", role=User.Role.ADMIN, is_superuser=True
+        )
+        self.client.force_login(admin)
+        resp = self.client.get("/analytics/", {"period": "day"})
+        self.assertEqual(resp.status_code, 200)
+        rows = [row for group in resp.context["groups"] for row in group["rows"]]
+        mine = next(row for row in rows if row["user"].id == self.mgr.id)
+        self.assertEqual((mine["calls_total"], mine["cold_calls"]), (2, 1))
+
+    def test_month_picker_skips_months_with_unconfirmed_marks_only(self):
+        base = _month_start(self.today)
+        prev_month = _add_months(base, -1)
+        two_back = _add_months(base, -2)
+
+        # Прошлый месяц: клик «холодный» без подтверждающей отметки.
+        unconfirmed = self._call(is_cold_call=True)
+        CallRequest.objects.filter(pk=unconfirmed.pk).update(
+            created_at=timezone.make_aware(
+                datetime.combine(prev_month + timedelta(days=3), datetime.min.time())
+            )
+        )
+        # Позапрошлый месяц: звонок, подтверждённый отметкой компании.
+        confirmed = self._call(is_cold_call=True)
+        CallRequest.objects.filter(pk=confirmed.pk).update(
+            created_at=timezone.make_aware(
+                datetime.combine(two_back + timedelta(days=3), datetime.min.time())
+            )
+        )
+        Company.objects.create(
+            name="ООО Подтверждено", responsible=self.mgr, primary_cold_marked_call=confirmed
+        )
+        call_command("rebuild_activity_rollups", "--days", "100", stdout=StringIO())
+
+        self.client.force_login(self.mgr)
+        resp = self.client.get("/reports/cold-calls/month/", HTTP_X_REQUESTED_WITH="XMLHttpRequest")
+        keys = [m["key"] for m in resp.json()["available_months"]]
+        self.assertEqual(keys, [two_back.strftime("%Y-%m")])
@@ -19,6 +19,7 @@ from django.utils import timezone
 from accounts.models import Branch
 from companies.models import Company
 from tasksapp.models import Task
+from ui.activity_rollups import rebuild_activity_rollups
 from ui.analytics_service import (
     get_branch_director_dashboard,
     get_group_manager_dashboard,
@@ -59,8 +60,12 @@ class ManagerDashboardServiceTests(TestCase):
             status=status,
             due_at=due,
         )
-        # updated_at — auto_now; обойдём через update.
+        # updated_at — auto_now; обойдём через update. update() идёт мимо сигналов,
+        # поэтому дневные счётчики пересчитываем как backfill.
         Task.objects.filter(pk=t.pk).update(updated_at=updated)
+        rebuild_activity_rollups(
+            timezone.localdate(updated), timezone.localdate() + timedelta(days=1)
+        )
         return t
 
     def test_tasks_counters_today_week_month(self):
@@ -2,6 +2,9 @@ from __future__ import annotations
 
 import logging
 
+from companies.card_cache import bump_company_cards
+from notifications import bell
+from ui import activity_rollups
 from ui.views._base import (
     UUID,
     ActivityEvent,
@@ -119,10 +122,13 @@ def company_list(request: HttpRequest) -> HttpResponse:
     filter_params_wo_search.pop("q", None)
     f = _apply_company_filters(qs=qs, params=filter_params_wo_search, default_responsible_id=None)
     qs = f["qs"]
+    search_truncated = False
     if q:
         from companies.search_service import get_company_search_backend
 
-        qs = get_company_search_backend().apply(qs=qs, query=q)
+        search_backend = get_company_search_backend()
+        qs = search_backend.apply(qs=qs, query=q)
+        search_truncated = search_backend.truncated
 
     # Sorting (asc/desc) — как в задачах
     sort_raw = (request.GET.get("sort") or "").strip()
@@ -303,6 +309,7 @@ def company_list(request: HttpRequest) -> HttpResponse:
             "task_filter": f.get("task_filter", ""),
             "companies_total": companies_total,
             "companies_filtered": companies_filtered,
+            "search_truncated": search_truncated,
             "filter_active": filter_active,
             "sort": sort,
             "dir": direction,
@@ -875,14 +882,20 @@ def company_bulk_transfer(request: HttpRequest) -> HttpResponse:
         }
 
     # Собираем данные ДО обновления (нужен старый ответственный для истории)
-    _hist_items = list(qs_to_update.values_list("id", "responsible_id"))
-    _old_resp_ids = list({rid for _, rid in _hist_items if rid})
+    _hist_items = list(qs_to_update.values_list("id", "responsible_id", "primary_cold_marked_at"))
+    _old_resp_ids = list({rid for _, rid, _ in _hist_items if rid})
     _old_resp_map = (
         {str(u.id): u for u in User.objects.filter(id__in=_old_resp_ids)} if _old_resp_ids else {}
     )
 
     updated = qs_to_update.update(responsible=new_resp, branch=new_resp.branch, updated_at=now_ts)
     _invalidate_company_count_cache()  # Инвалидируем кэш при массовом переназначении
+    # .update() обходит save()-сигналы — версии кэша карточек сдвигаем сами
+    bump_company_cards(cid for cid, _, _ in _hist_items)
+    # Ручные отметки холодного звонка считаются ответственному — переносим их в счётчиках
+    activity_rollups.transfer_company_marks(_hist_items, new_resp.id)
+    # Напоминания о договорах переехали — колокольчик прежних и нового ответственного
+    bell.reminders_changed(new_resp.id, *_old_resp_ids)
 
     # FTS reindex: .update() обходит save()-сигналы, поэтому CompanySearchIndex
     # остаётся рассинхронизированным. Переиндексируем изменённые компании
@@ -925,7 +938,7 @@ def company_bulk_transfer(request: HttpRequest) -> HttpResponse:
                 to_user_name=str(new_resp),
                 occurred_at=_hist_now,
             )
-            for comp_id, old_resp_id in _hist_items
+            for comp_id, old_resp_id, _ in _hist_items
         ],
         ignore_conflicts=True,
     )
@@ -1569,8 +1582,10 @@ def company_autocomplete(request: HttpRequest) -> JsonResponse:
 def company_duplicates(request: HttpRequest) -> HttpResponse:
     """
     JSON: подсказки дублей при создании компании.
-    Проверяем по ИНН/КПП/названию/адресу и возвращаем только то, что пользователь может видеть.
+    Проверяем по ИНН/КПП/названию/адресу/телефону/домену почты и возвращаем только то,
+    что пользователь может видеть.
     ИНН нормализуем через normalize_inn, чтобы совпадали и "901000327", и "901 000 327".
+    Телефон и домен — точечные поиски по CompanyContactKey (companies/contact_keys.py).
     """
     user: User = request.user
     inn_raw = (request.GET.get("inn") or "").strip()
@@ -1580,6 +1595,15 @@ def company_duplicates(request: HttpRequest) -> HttpResponse:
     kpp = (request.GET.get("kpp") or "").strip()
     name = (request.GET.get("name") or "").strip()
     address = (request.GET.get("address") or "").strip()
+    from companies.contact_keys import (
+        company_ids_by_email_domain,
+        company_ids_by_phone_tail,
+        email_domain,
+        phone_tail,
+    )
+
+    tail = phone_tail(request.GET.get("phone"))
+    domain = email_domain(request.GET.get("email"))
 
     q = Q()
     reasons = []
@@ -1595,6 +1619,14 @@ def company_duplicates(request: HttpRequest) -> HttpResponse:
     if address:
         q |= Q(address__icontains=address)
         reasons.append("Адрес")
+    phone_ids = company_ids_by_phone_tail(tail, limit=50) if tail else set()
+    if phone_ids:
+        q |= Q(id__in=phone_ids)
+        reasons.append("Телефон")
+    domain_ids = company_ids_by_email_domain(domain, limit=50) if domain else set()
+    if domain_ids:
+        q |= Q(id__in=domain_ids)
+        reasons.append("Домен почты")
 
     if not q:
         return JsonResponse({"items": [], "hidden_count": 0, "reasons": []})
@@ -1607,6 +1639,10 @@ def company_duplicates(request: HttpRequest) -> HttpResponse:
     items = []
     for c in visible:
         match = _dup_reasons(c=c, inn=inn, kpp=kpp, name=name, address=address)
+        if c.id in phone_ids:
+            match.append("Телефон")
+        if c.id in domain_ids:
+            match.append("Домен почты")
         items.append(
             {
                 "id": str(c.id),
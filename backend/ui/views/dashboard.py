@@ -6,6 +6,7 @@ from django.utils.http import url_has_allowed_host_and_scheme
 
 from audit.service import log_event
 from phonebridge.models import CallRequest
+from ui.activity_rollups import activity_by_user
 from ui.views._base import (
     ActivityEvent,
     Branch,
@@ -675,69 +676,17 @@ def analytics(request: HttpRequest) -> HttpResponse:
     users_list = list(users_qs)
     user_ids = [u.id for u in users_list]
 
-    # Звонки за период (лимит на страницу, чтобы не убить UI)
-    # Для консистентности с аналитикой сотрудника считаем только клики "Позвонить с телефона" (note="UI click").
-    calls_qs_base = (
-        CallRequest.objects.filter(
-            created_by_id__in=user_ids, created_at__gte=start, created_at__lt=end, note="UI click"
-        )
-        .exclude(status=CallRequest.Status.CANCELLED)
-        .select_related("company", "contact", "created_by")
-    )
-
-    # Полный QS для вычисления холодных звонков (без среза)
-    # Учитываем все звонки с is_cold_call=True (включая ручные отметки)
-    cold_call_ids = set(calls_qs_base.filter(is_cold_call=True).values_list("id", flat=True))
-
-    # Ограничиваем только отображаемый список
-    calls_qs = calls_qs_base.order_by("-created_at")[:5000]
-
-    stats = {uid: {"calls_total": 0, "cold_calls": 0} for uid in user_ids}
-
-    for call in calls_qs:
-        uid = call.created_by_id
-        if uid not in stats:
-            continue
-        stats[uid]["calls_total"] += 1
-        if call.id in cold_call_ids:
-            stats[uid]["cold_calls"] += 1
-
-    # Добавляем ручные отметки в статистику холодных звонков
-    # Ручные отметки на компаниях
-    manual_companies = Company.objects.filter(
-        responsible_id__in=user_ids,
-        primary_cold_marked_at__gte=start,
-        primary_cold_marked_at__lt=end,
-    ).values_list("responsible_id", flat=True)
-    for uid in manual_companies:
-        if uid in stats:
-            stats[uid]["cold_calls"] += 1
-
-    # Ручные отметки на контактах
-    manual_contacts = Contact.objects.filter(
-        company__responsible_id__in=user_ids, cold_marked_at__gte=start, cold_marked_at__lt=end
-    ).values_list("company__responsible_id", flat=True)
-    for uid in manual_contacts:
-        if uid and uid in stats:
-            stats[uid]["cold_calls"] += 1
-
-    # Ручные отметки на телефонах компаний
-    manual_company_phones = CompanyPhone.objects.filter(
-        company__responsible_id__in=user_ids, cold_marked_at__gte=start, cold_marked_at__lt=end
-    ).values_list("company__responsible_id", flat=True)
-    for uid in manual_company_phones:
-        if uid and uid in stats:
-            stats[uid]["cold_calls"] += 1
-
-    # Ручные отметки на телефонах контактов
-    manual_contact_phones = ContactPhone.objects.filter(
-        contact__company__responsible_id__in=user_ids,
-        cold_marked_at__gte=start,
-        cold_marked_at__lt=end,
-    ).values_list("contact__company__responsible_id", flat=True)
-    for uid in manual_contact_phones:
-        if uid and uid in stats:
-            stats[uid]["cold_calls"] += 1
+    # Звонки и холодные звонки — из дневных счётчиков (UserActivityDaily): только клики
+    # "Позвонить с телефона" (note="UI click"), холодные = звонки с is_cold_call=True
+    # + ручные отметки на компаниях/контактах/телефонах (по ответственному).
+    activity = activity_by_user(user_ids, start.date(), end.date())
+    stats = {
+        uid: {
+            "calls_total": row["calls"],
+            "cold_calls": row["cold_calls"] + row["manual_cold_marks"],
+        }
+        for uid, row in activity.items()
+    }
 
     # Группировка по филиалу (для управляющего) + карточки для шаблона
     groups_map = {}
@@ -12,11 +12,12 @@ from django.db.models.functions import Coalesce
 from django.utils import timezone
 
 from accounts.models import User
+from companies.card_cache import bump_company_cards
 from companies.models import Company, Contact
 from companies.permissions import can_edit_company as can_edit_company_perm
 from companies.permissions import editable_company_qs as editable_company_qs_perm
 from notifications.models import Notification
-from notifications.service import notify
+from notifications.service import notify_many
 from tasksapp.models import Task
 
 
@@ -72,11 +73,14 @@ def _notify_branch_leads(*, branch_id, title: str, body: str, url: str, exclude_
     )
     if exclude_user_id:
         qs = qs.exclude(id=exclude_user_id)
-    sent = 0
-    for u in qs.iterator():
-        notify(user=u, kind=Notification.Kind.COMPANY, title=title, body=body, url=url)
-        sent += 1
-    return sent
+    created = notify_many(
+        users=qs.values_list("id", flat=True),
+        kind=Notification.Kind.COMPANY,
+        title=title,
+        body=body,
+        url=url,
+    )
+    return len(created)
 
 
 def _detach_client_branches(*, head_company: Company) -> list[Company]:
@@ -96,6 +100,7 @@ def _detach_client_branches(*, head_company: Company) -> list[Company]:
         Company.objects.filter(head_company_id=head_company.id).update(
             head_company=None, updated_at=now_ts
         )
+        bump_company_cards([head_company.id, *(c.id for c in children)])
     return children
 
 
@@ -12,7 +12,7 @@ from __future__ import annotations
 from django.contrib import messages as django_messages
 from django.contrib.auth.decorators import login_required
 from django.core.paginator import Paginator
-from django.db.models import Count, F, OuterRef, Q, Subquery
+from django.db.models import Case, Count, F, IntegerField, OuterRef, Q, Subquery, Value, When
 from django.http import HttpRequest, HttpResponse
 from django.shortcuts import redirect, render
 from django.urls import reverse
@@ -21,6 +21,7 @@ from accounts.models import Branch, User
 from accounts.permissions import get_effective_user
 from companies.models import Region
 from companies.permissions import get_users_for_lists
+from messenger import presence
 from messenger.models import AgentProfile, Conversation, Message
 from messenger.selectors import visible_conversations_qs
 from messenger.utils import ensure_messenger_enabled_view
@@ -70,21 +71,14 @@ def messenger_conversations_unified(request: HttpRequest) -> HttpResponse:
     # Счётчик непрочитанных (только для назначенных диалогов текущему пользователю)
     if user.id:
         qs = qs.annotate(
-            unread_count=Count(
-                "messages__id",
-                filter=Q(
-                    messages__direction=Message.Direction.IN,
-                    assignee_id=user.id,
-                )
-                & (
-                    Q(assignee_last_read_at__isnull=True)
-                    | Q(messages__created_at__gt=F("assignee_last_read_at"))
-                ),
-                distinct=True,
+            unread_count=Case(
+                When(assignee_id=user.id, then=F("assignee_unread_count")),
+                default=Value(0),
+                output_field=IntegerField(),
             )
         )
     else:
-        qs = qs.annotate(unread_count=Count("id", filter=Q(id__isnull=True)))
+        qs = qs.annotate(unread_count=Value(0, output_field=IntegerField()))
 
     # --- Фильтры ---
     q = (request.GET.get("q") or "").strip()
@@ -244,6 +238,7 @@ def messenger_agent_status(request: HttpRequest) -> HttpResponse:
     profile, _ = AgentProfile.objects.get_or_create(user=user)
     profile.status = status
     profile.save(update_fields=["status", "updated_at"])
+    presence.set_status(user.id, status)
 
     next_url = _safe_redirect_url(
         request,
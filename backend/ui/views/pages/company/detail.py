@@ -6,7 +6,7 @@ Extracted из `backend/ui/views/company_detail.py` в W1.2 — финальны
 Endpoints:
 - `company_detail` — GET /companies/<uuid>/
 - `company_tasks_history` — GET /companies/<uuid>/tasks-history/
-- `company_timeline_items` — GET /companies/<uuid>/timeline/items/?offset=&limit=
+- `company_timeline_items` — GET /companies/<uuid>/timeline/items/?cursor=&limit=
 """
 
 from __future__ import annotations
@@ -19,6 +19,7 @@ from ui.views._base import (
     CompanyContractForm,
     CompanyDeal,
     CompanyDeletionRequest,
+    CompanyHistoryEvent,
     CompanyNote,
     CompanyNoteForm,
     CompanyPhone,
@@ -52,13 +53,9 @@ from ui.views._base import (
 logger = logging.getLogger(__name__)
 
 
-@login_required
-@policy_required(resource_type="page", resource="ui:companies:detail")
-@require_can_view_company
-def company_detail(request: HttpRequest, company_id) -> HttpResponse:
-    user: User = request.user
+def _load_company(company_id):
     # Загружаем компанию с связанными объектами, включая поля для истории холодных звонков
-    company = get_object_or_404(
+    return get_object_or_404(
         Company.objects.select_related(
             "responsible",
             "branch",
@@ -78,40 +75,34 @@ def company_detail(request: HttpRequest, company_id) -> HttpResponse:
         ),
         id=company_id,
     )
-    can_edit_company = _can_edit_company(user, company)
-    can_view_activity = bool(
-        user.is_superuser
-        or user.role
-        in (
-            User.Role.ADMIN,
-            User.Role.GROUP_MANAGER,
-            User.Role.BRANCH_DIRECTOR,
-            User.Role.SALES_HEAD,
-        )
-    )
-    can_delete_company = _can_delete_company(user, company)
-    can_request_delete = bool(user.role == User.Role.MANAGER and company.responsible_id == user.id)
-    delete_req = (
+
+
+def _load_delete_request(company_id):
+    return (
         CompanyDeletionRequest.objects.filter(
-            company=company, status=CompanyDeletionRequest.Status.PENDING
+            company_id=company_id, status=CompanyDeletionRequest.Status.PENDING
         )
         .select_related("requested_by", "decided_by")
         .order_by("-created_at")
         .first()
     )
 
+
+def _load_org(head_id):
     # "Организация" (головная карточка) и "филиалы" (дочерние карточки клиента)
-    head = company.head_company or company
-    org_head = Company.objects.select_related("responsible", "branch").filter(id=head.id).first()
-    org_branches = (
+    org_head = Company.objects.select_related("responsible", "branch").filter(id=head_id).first()
+    org_branches = list(
         Company.objects.select_related("responsible", "branch")
-        .filter(head_company_id=head.id)
+        .filter(head_company_id=head_id)
         .order_by("name")[:200]
     )
+    return org_head, org_branches
+
 
+def _load_contacts(company_id):
     # Загружаем контакты с связанными объектами для истории холодных звонков
-    contacts = (
-        Contact.objects.filter(company=company)
+    return list(
+        Contact.objects.filter(company_id=company_id)
         .select_related("cold_marked_by", "cold_marked_call")
         .prefetch_related(
             "emails",
@@ -123,40 +114,176 @@ def company_detail(request: HttpRequest, company_id) -> HttpResponse:
         .order_by("last_name", "first_name")[:200]
     )
 
-    # Новая логика: любой звонок может быть холодным, без ограничений по времени
-    # Кнопка доступна только если контакт еще не отмечен как холодный
-    for c in contacts:
-        # Кнопка доступна только если контакт еще не отмечен
-        c.cold_mark_available = not c.is_cold_call  # type: ignore[attr-defined]
 
-    # Основной контакт (company.phone)
-    # Кнопка доступна только если основной контакт еще не отмечен
-    primary_cold_available = not company.primary_contact_is_cold_call
-
-    # Проверка прав администратора для отката
-    is_admin = require_admin(user)
-    is_group_manager = user.role == User.Role.GROUP_MANAGER
+def _load_notes(company_id):
     pinned_note = (
         CompanyNote.objects.filter(
-            company=company, is_pinned=True, note_type=CompanyNote.NoteType.NOTE
+            company_id=company_id, is_pinned=True, note_type=CompanyNote.NoteType.NOTE
         )
         .select_related("author", "pinned_by")
         .prefetch_related("note_attachments")
         .order_by("-pinned_at", "-created_at")
         .first()
     )
-    notes = (
-        CompanyNote.objects.filter(company=company, note_type=CompanyNote.NoteType.NOTE)
+    notes = list(
+        CompanyNote.objects.filter(company_id=company_id, note_type=CompanyNote.NoteType.NOTE)
         .select_related("author", "pinned_by")
         .prefetch_related("note_attachments")
         .order_by("-is_pinned", "-pinned_at", "-created_at")[:60]
     )
-    deals = (
-        CompanyDeal.objects.filter(company=company)
+    return pinned_note, notes
+
+
+def _load_deals(company_id):
+    return list(
+        CompanyDeal.objects.filter(company_id=company_id)
         .select_related("created_by")
         .order_by("-created_at")[:50]
     )
-    # Сортируем задачи: сначала просроченные (по дедлайну, старые сначала), потом по дедлайну (ближайшие сначала), потом по дате создания (новые сначала)
+
+
+def _load_tasks(company_id) -> dict:
+    """
+    Открытые задачи: сначала просроченные (по дедлайну, старые сначала), потом
+    по дедлайну (ближайшие сначала), потом по дате создания (новые сначала).
+
+    valid_until — дедлайн первой ещё не просроченной задачи: после него порядок
+    меняется без всякой записи, и закэшированная секция считается устаревшей.
+    """
+    now = timezone.now()
+    tasks = list(
+        Task.objects.filter(company_id=company_id)
+        .exclude(status=Task.Status.DONE)  # Исключаем выполненные задачи
+        .select_related("assigned_to", "type", "created_by")
+        .annotate(
+            is_overdue=models.Case(
+                models.When(
+                    models.Q(due_at__lt=now)
+                    & ~models.Q(status__in=[Task.Status.DONE, Task.Status.CANCELLED]),
+                    then=models.Value(1),
+                ),
+                default=models.Value(0),
+                output_field=models.IntegerField(),
+            )
+        )
+        .order_by("-is_overdue", "due_at", "-created_at")[:25]
+    )
+    valid_until = next(
+        (t.due_at for t in tasks if not t.is_overdue and t.due_at is not None),  # type: ignore[attr-defined]
+        None,
+    )
+    return {"tasks": tasks, "valid_until": valid_until}
+
+
+def _load_timeline(company_id) -> dict:
+    # ===== ТАЙМЛАЙН: первая страница ленты из 7 источников (companies.services.timeline) =====
+    # F4 R2 (2026-04-18): пагинация timeline — первые 50, остальное по AJAX.
+    # Лента читается keyset-выборками по источникам и k-way merge: страница
+    # стоит по запросу LIMIT 51 на источник, независимо от длины истории.
+    # Дальше «Показать ещё» идёт по курсору timeline_next_cursor.
+    from companies.services.timeline import company_timeline_page, count_company_timeline
+
+    TIMELINE_INITIAL = 50
+    company = Company(id=company_id)
+    page = company_timeline_page(company=company, limit=TIMELINE_INITIAL)
+    return {
+        "items": page.items,
+        "has_more": page.has_more,
+        "total_count": (
+            count_company_timeline(company=company) if page.has_more else len(page.items)
+        ),
+        "next_cursor": page.next_cursor or "",
+    }
+
+
+def _tasks_section_fresh(section: str, value) -> bool:
+    if section != "tasks" or value["valid_until"] is None:
+        return True
+    return timezone.now() < value["valid_until"]
+
+
+@login_required
+@policy_required(resource_type="page", resource="ui:companies:detail")
+@require_can_view_company
+def company_detail(request: HttpRequest, company_id) -> HttpResponse:
+    from companies.card_cache import card_sections, card_version
+
+    user: User = request.user
+    can_view_activity = bool(
+        user.is_superuser
+        or user.role
+        in (
+            User.Role.ADMIN,
+            User.Role.GROUP_MANAGER,
+            User.Role.BRANCH_DIRECTOR,
+            User.Role.SALES_HEAD,
+        )
+    )
+    # ROLE: Тендерист не работает с задачами — только заметки.
+    # Раньше задачи по компании ему показывались в карточке (баг из аудита).
+    can_view_tasks = user.role != User.Role.TENDERIST
+
+    # Данные секций — из версионного кэша (companies/card_cache.py): повторный
+    # просмотр неизменной карточки не ходит в БД, кроме проверок прав выше.
+    # Профиль прав — в ключе: набор секций зависит от роли.
+    profile = (
+        "+".join(
+            name for name, on in (("tasks", can_view_tasks), ("activity", can_view_activity)) if on
+        )
+        or "base"
+    )
+    builders = {
+        "company": lambda: _load_company(company_id),
+        "delete_req": lambda: _load_delete_request(company_id),
+        "contacts": lambda: _load_contacts(company_id),
+        "notes": lambda: _load_notes(company_id),
+        "deals": lambda: _load_deals(company_id),
+        "history": lambda: list(
+            CompanyHistoryEvent.objects.filter(company_id=company_id)
+            .select_related("actor", "from_user", "to_user")
+            .order_by("occurred_at")[:50]
+        ),
+        "timeline": lambda: _load_timeline(company_id),
+    }
+    if can_view_tasks:
+        builders["tasks"] = lambda: _load_tasks(company_id)
+    if can_view_activity:
+        builders["activity"] = lambda: list(
+            ActivityEvent.objects.filter(company_id=company_id).select_related("actor")[:50]
+        )
+    version = card_version(company_id)
+    sections = card_sections(company_id, version, profile, builders, is_fresh=_tasks_section_fresh)
+    company = sections["company"]
+
+    # Блок «Организация» общий для головной карточки и всех её филиалов —
+    # кэшируется под версией головной (её сдвигает запись любого филиала).
+    head_id = company.head_company_id or company.id
+    head_version = version if head_id == company.id else card_version(head_id)
+    org_head, org_branches = card_sections(
+        head_id, head_version, "base", {"org": lambda: _load_org(head_id)}
+    )["org"]
+
+    can_edit_company = _can_edit_company(user, company)
+    can_delete_company = _can_delete_company(user, company)
+    can_request_delete = bool(user.role == User.Role.MANAGER and company.responsible_id == user.id)
+    delete_req = sections["delete_req"]
+
+    contacts = sections["contacts"]
+    # Новая логика: любой звонок может быть холодным, без ограничений по времени
+    # Кнопка доступна только если контакт еще не отмечен как холодный
+    for c in contacts:
+        # Кнопка доступна только если контакт еще не отмечен
+        c.cold_mark_available = not c.is_cold_call  # type: ignore[attr-defined]
+
+    # Основной контакт (company.phone)
+    # Кнопка доступна только если основной контакт еще не отмечен
+    primary_cold_available = not company.primary_contact_is_cold_call
+
+    # Проверка прав администратора для отката
+    is_admin = require_admin(user)
+    is_group_manager = user.role == User.Role.GROUP_MANAGER
+    pinned_note, notes = sections["notes"]
+    deals = sections["deals"]
     # Исключаем выполненные задачи из списка "Последние задачи"
     now = timezone.now()
     local_now = timezone.localtime(now)
@@ -165,60 +292,21 @@ def company_detail(request: HttpRequest, company_id) -> HttpResponse:
 
     worktime = get_worktime_status(company)
 
-    # ROLE: Тендерист не работает с задачами — только заметки.
-    # Раньше задачи по компании ему показывались в карточке (баг из аудита).
-    if user.role == User.Role.TENDERIST:
-        tasks = Task.objects.none()
-    else:
-        tasks = (
-            Task.objects.filter(company=company)
-            .exclude(status=Task.Status.DONE)  # Исключаем выполненные задачи
-            .select_related("assigned_to", "type", "created_by")
-            .annotate(
-                is_overdue=models.Case(
-                    models.When(
-                        models.Q(due_at__lt=now)
-                        & ~models.Q(status__in=[Task.Status.DONE, Task.Status.CANCELLED]),
-                        then=models.Value(1),
-                    ),
-                    default=models.Value(0),
-                    output_field=models.IntegerField(),
-                )
-            )
-            .order_by("-is_overdue", "due_at", "-created_at")[:25]
-        )
+    tasks = sections["tasks"]["tasks"] if can_view_tasks else []
     for t in tasks:
         t.can_manage_status = _can_manage_task_status_ui(user, t)  # type: ignore[attr-defined]
         t.can_edit_task = _can_edit_task_ui(user, t)  # type: ignore[attr-defined]
         t.can_delete_task = _can_delete_task_ui(user, t)  # type: ignore[attr-defined]
 
     note_form = CompanyNoteForm()
-    activity = []
-    if can_view_activity:
-        activity = ActivityEvent.objects.filter(company_id=company.id).select_related("actor")[:50]
+    activity = sections["activity"] if can_view_activity else []
 
-    history_events = list(
-        company.history_events.select_related("actor", "from_user", "to_user").order_by(
-            "occurred_at"
-        )[:50]
-    )
-
-    # ===== ПОЛНЫЙ ТАЙМЛАЙН (2026-04-20 Refactor phase 1): вынесено в service =====
-    # Эта 50-строчная сборка из 7 источников была продублирована в
-    # `company_timeline_items`. Теперь обе функции используют `build_company_timeline()`.
-    from companies.services.timeline import build_company_timeline
+    history_events = sections["history"]
 
-    _all_timeline = build_company_timeline(company=company)
-    # F4 R2 (2026-04-18): пагинация timeline — первые 50, остальное по AJAX.
-    # Без пагинации на компаниях с длинной историей (~4600 items) страница
-    # раздувалась до >2 МБ HTML и тормозила первый paint.
-    TIMELINE_INITIAL = 50
-    timeline_total_count = len(_all_timeline)
-    timeline_items = _all_timeline[:TIMELINE_INITIAL]
-    timeline_has_more = timeline_total_count > TIMELINE_INITIAL
-    # Сохраняем полный список в request.session для AJAX-подгрузки.
-    # (альтернатива — повторный запрос БД, но это дороже при 4600 items)
-    # Пока же endpoint сам пересчитывает — session не раздуваем.
+    timeline = sections["timeline"]
+    timeline_items = timeline["items"]
+    timeline_has_more = timeline["has_more"]
+    timeline_total_count = timeline["total_count"]
 
     quick_form = CompanyQuickEditForm(instance=company)
     contract_form = CompanyContractForm(instance=company)
@@ -318,6 +406,9 @@ def company_detail(request: HttpRequest, company_id) -> HttpResponse:
             ],  # Контакты с 6-го для кнопки «Показать всех» в Modern
             "history_events": history_events,  # История передвижений карточки
             "timeline_items": timeline_items,  # Единая лента: звонки + письма + передвижения
+            "timeline_has_more": timeline_has_more,
+            "timeline_total_count": timeline_total_count,
+            "timeline_next_cursor": timeline["next_cursor"],
         },
     )
 
@@ -362,37 +453,42 @@ def company_timeline_items(request: HttpRequest, company_id) -> HttpResponse:
     resource — same page scope). @require_can_view_company остаётся
     (defense-in-depth, visibility check same as parent company_detail view).
 
-    GET /companies/<company_id>/timeline/items/?offset=50&limit=50 →
+    GET /companies/<company_id>/timeline/items/?cursor=<курсор>&limit=50 →
     HTML-фрагмент с <li> элементами из _company_timeline_items.html.
-    Используется кнопкой «Показать ещё» на карточке компании.
+    Курсор следующей страницы — в заголовке X-Timeline-Next-Cursor (пустой,
+    если лента закончилась). Используется кнопкой «Показать ещё».
 
-    2026-04-20 Refactor phase 1: сборка timeline вынесена в
-    `companies.services.timeline.build_company_timeline()` — раньше код
-    был продублирован с `company_detail` view (~50 строк одинаковой логики).
+    Старый параметр ?offset= поддерживается: лента проматывается потоково
+    (без материализации), но дороже курсора на глубоких страницах.
     """
-    try:
-        offset = max(0, int(request.GET.get("offset", 50)))
-    except (TypeError, ValueError):
-        offset = 50
+    from companies.services.timeline import company_timeline_page
+
     try:
         limit = max(1, min(100, int(request.GET.get("limit", 50))))
     except (TypeError, ValueError):
         limit = 50
+    cursor = request.GET.get("cursor") or None
+    offset = 0
+    if cursor is None:
+        try:
+            offset = max(0, int(request.GET.get("offset", 0)))
+        except (TypeError, ValueError):
+            offset = 0
 
     company = get_object_or_404(Company, id=company_id)
 
-    from companies.services.timeline import build_company_timeline
+    page = company_timeline_page(company=company, cursor=cursor, limit=limit, offset=offset)
+    next_cursor = page.next_cursor
+    items = page.items
 
-    all_items = build_company_timeline(company=company)
-    items_slice = all_items[offset : offset + limit]
-    has_more = len(all_items) > offset + limit
-    return render(
+    response = render(
         request,
         "ui/_partials/_company_timeline_items.html",
         {
-            "items": items_slice,
-            "has_more": has_more,
-            "next_offset": offset + limit,
-            "total": len(all_items),
+            "items": items,
+            "has_more": next_cursor is not None,
+            "next_cursor": next_cursor or "",
         },
     )
+    response["X-Timeline-Next-Cursor"] = next_cursor or ""
+    return response
@@ -3,6 +3,7 @@ from __future__ import annotations
 import logging
 
 from phonebridge.models import CallRequest
+from ui.activity_rollups import activity_by_day, activity_by_user
 from ui.views._base import (
     Company,
     CompanyPhone,
@@ -13,7 +14,6 @@ from ui.views._base import (
     HttpResponse,
     JsonResponse,
     Q,
-    Task,
     User,
     _add_months,
     _can_view_cold_call_reports,
@@ -220,13 +220,10 @@ def cold_calls_report_day(request: HttpRequest) -> HttpResponse:
         company__responsible=user, created_at__gte=day_start, created_at__lt=day_end
     ).count()
 
-    # 4. Выполненные задачи за день
-    tasks_done_count = Task.objects.filter(
-        assigned_to=user,
-        status=Task.Status.DONE,
-        updated_at__gte=day_start,
-        updated_at__lt=day_end,
-    ).count()
+    # 4. Выполненные задачи за день (дневные счётчики)
+    tasks_done_count = activity_by_user([user.id], target_date, target_date + timedelta(days=1))[
+        user.id
+    ]["tasks_done"]
 
     # Считаем количество до итерации, чтобы ниже пройти qs через .iterator()
     # без повторного SQL-запроса на каждой итерации.
@@ -383,20 +380,23 @@ def cold_calls_report_month(request: HttpRequest) -> HttpResponse:
     base = _month_start(today)
     candidates = [_month_start(_add_months(base, -2)), _month_start(_add_months(base, -1)), base]
 
-    available = []
-    for ms in candidates:
-        me = _add_months(ms, 1)
-        exists = (
-            CallRequest.objects.filter(
-                created_by=user, created_at__date__gte=ms, created_at__date__lt=me, note="UI click"
-            )
-            .exclude(status=CallRequest.Status.CANCELLED)
-            .filter(is_cold_call=True)
-            .filter(_cold_call_confirm_q())
-            .exists()
+    # Месяцы с подтверждёнными холодными звонками. Дневные счётчики здесь не
+    # годятся: cold_calls учитывает и неподтверждённые клики, а по таким месяцам
+    # отчёт был бы пустым. Один запрос на все три месяца вместо трёх exists().
+    active_months = {
+        _month_start(timezone.localtime(dt).date())
+        for dt in CallRequest.objects.filter(
+            created_by=user,
+            created_at__date__gte=candidates[0],
+            created_at__date__lt=_add_months(base, 1),
+            note="UI click",
         )
-        if exists:
-            available.append(ms)
+        .exclude(status=CallRequest.Status.CANCELLED)
+        .filter(is_cold_call=True)
+        .filter(_cold_call_confirm_q())
+        .datetimes("created_at", "month")
+    }
+    available = [ms for ms in candidates if ms in active_months]
 
     # Если вообще нет данных — показываем текущий месяц (пустой отчёт), чтобы кнопка не была "мертвой"
     if not available:
@@ -519,13 +519,8 @@ def cold_calls_report_month(request: HttpRequest) -> HttpResponse:
         company__responsible=user, created_at__gte=month_start_aware, created_at__lt=month_end_aware
     ).count()
 
-    # 4. Выполненные задачи за месяц
-    tasks_done_count = Task.objects.filter(
-        assigned_to=user,
-        status=Task.Status.DONE,
-        updated_at__gte=month_start_aware,
-        updated_at__lt=month_end_aware,
-    ).count()
+    # 4. Выполненные задачи за месяц (дневные счётчики)
+    tasks_done_count = activity_by_user([user.id], selected, month_end)[user.id]["tasks_done"]
 
     # Сохраняем count до итерации — в цикле ниже qs проходится через .iterator().
     qs_count = qs.count()
@@ -693,37 +688,15 @@ def cold_calls_report_last_7_days(request: HttpRequest) -> JsonResponse:
 
     today = timezone.localdate(timezone.now())
     start_date = today - timedelta(days=6)
+    # Один запрос к дневным счётчикам вместо 7 × 5 COUNT по сырым данным.
+    activity = activity_by_day(user.id, start_date, today + timedelta(days=1))
     days = []
     total = 0
     for i in range(7):
         d = start_date + timedelta(days=i)
-        day_start = timezone.make_aware(datetime.combine(d, datetime.min.time()))
-        day_end = day_start + timedelta(days=1)
-        # Все звонки с is_cold_call=True
-        qs_base = CallRequest.objects.filter(
-            created_by=user, created_at__gte=day_start, created_at__lt=day_end, note="UI click"
-        ).exclude(status=CallRequest.Status.CANCELLED)
-        cnt_calls = qs_base.filter(is_cold_call=True).distinct().count()
-        # Ручные отметки
-        cnt_manual = (
-            Company.objects.filter(
-                responsible=user,
-                primary_cold_marked_at__gte=day_start,
-                primary_cold_marked_at__lt=day_end,
-            ).count()
-            + Contact.objects.filter(
-                company__responsible=user, cold_marked_at__gte=day_start, cold_marked_at__lt=day_end
-            ).count()
-            + CompanyPhone.objects.filter(
-                company__responsible=user, cold_marked_at__gte=day_start, cold_marked_at__lt=day_end
-            ).count()
-            + ContactPhone.objects.filter(
-                contact__company__responsible=user,
-                cold_marked_at__gte=day_start,
-                cold_marked_at__lt=day_end,
-            ).count()
-        )
-        cnt = cnt_calls + cnt_manual
+        row = activity.get(d)
+        # Звонки с is_cold_call=True + ручные отметки
+        cnt = (row["cold_calls"] + row["manual_cold_marks"]) if row else 0
         total += cnt
         days.append(
             {
@@ -2,6 +2,8 @@ from __future__ import annotations
 
 import logging
 
+from notifications import bell
+from ui import activity_rollups
 from ui.views._base import (
     STRONG_CONFIRM_THRESHOLD,
     UUID,
@@ -1165,7 +1167,14 @@ def task_bulk_reassign(request: HttpRequest) -> HttpResponse:
     now_ts = timezone.now()
     with transaction.atomic():
         qs_to_update = Task.objects.filter(id__in=ids)
+        before_rows = list(
+            qs_to_update.values_list("assigned_to_id", "status", "updated_at", "due_at")
+        )
         updated = qs_to_update.update(assigned_to=new_assigned, updated_at=now_ts)
+        # update() обходит сигналы — дневные счётчики выполненных задач переносим сами
+        activity_rollups.reassign_tasks(before_rows, new_assigned.id, now_ts)
+    # Напоминания по задачам — у прежних исполнителей и у нового (update() без сигналов)
+    bell.reminders_changed(new_assigned.id, *{row[0] for row in before_rows})
 
     messages.success(
         request, f"Переназначено задач: {updated}. Новый ответственный: {new_assigned}."